@@ -0,0 +1,80 @@
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Benchmark of drawing frames of a L{twisted.conch.insults.window} dashboard,
+one line of which changes in each frame, either directly on an
+L{insults.ServerProtocol} or on a L{helper.ScreenBuffer} which is flushed to
+one after each frame.  The whole dashboard is drawn in each frame, as it is
+when a window is resized or redrawn.
+"""
+
+from time import time
+
+from twisted.test.proto_helpers import StringTransport
+from twisted.conch.insults import insults, helper, window
+
+
+
+class Transport(StringTransport):
+    """
+    A transport which counts the writes made to it.
+    """
+    writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        StringTransport.write(self, data)
+
+
+
+def dashboard(width, height):
+    """
+    Make a dashboard of C{height} lines of text, with a border.
+    """
+    lines = [window.TextOutput((width - 2, 1)) for i in range(height - 2)]
+    box = window.VBox()
+    for line in lines:
+        line.setText('%-20s %10d' % ('counter', 0))
+        box.addChild(line)
+    return lines, window.Border(box)
+
+
+
+def benchmark(buffered, width, height, frames):
+    """
+    Draw C{frames} frames and report the time taken and bytes and writes made
+    for each.
+    """
+    transport = Transport()
+    terminal = insults.ServerProtocol()
+    terminal.makeConnection(transport)
+    transport.clear()
+    transport.writes = 0
+    if buffered:
+        screen = helper.ScreenBuffer(terminal, width, height)
+    else:
+        screen = terminal
+    lines, root = dashboard(width, height)
+    before = time()
+    for i in xrange(frames):
+        lines[i % len(lines)].setText('%-20s %10d' % ('counter', i))
+        root.redraw(width, height, screen)
+        if buffered:
+            screen.flush()
+    after = time()
+    print '%-10s %6.1f bytes/frame %5.1f writes/frame %7.1f frames/sec' % (
+        'buffered' if buffered else 'direct',
+        float(len(transport.value())) / frames,
+        float(transport.writes) / frames, frames / (after - before))
+
+
+
+def main():
+    benchmark(False, 80, 24, 1000)
+    benchmark(True, 80, 24, 1000)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Benchmark of transferring files with L{twisted.conch.ssh.filetransfer}: a
+L{FileTransferClient} and a L{FileTransferServer} serving files from memory
+are connected by transports which deliver each write after a delay, and files
+are read and written one chunk at a time and with
+L{FileTransferClient.downloadFile} and L{FileTransferClient.uploadFile}, which
+keep several requests outstanding.
+"""
+
+from time import time
+from StringIO import StringIO
+
+from zope.interface import implementer
+
+from twisted.conch.interfaces import ISFTPServer
+from twisted.conch.ssh.filetransfer import (
+    FileTransferClient, FileTransferServer, FXF_READ, FXF_WRITE, FXF_CREAT,
+    FXF_TRUNC)
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks, Deferred
+from twisted.web.client import FileBodyProducer
+
+
+SIZE = 2 ** 22
+CHUNK_SIZE = 2 ** 15
+
+
+
+class DelayedTransport(object):
+    """
+    A transport which delivers the writes made to it to C{protocol} after
+    C{latency} seconds.
+    """
+    def __init__(self, protocol, latency):
+        self.protocol = protocol
+        self.latency = latency
+
+
+    def write(self, data):
+        reactor.callLater(self.latency, self.protocol.dataReceived, data)
+
+
+
+class MemoryFile(object):
+    """
+    A file whose contents are a C{bytearray}.
+    """
+    def __init__(self, contents):
+        self.contents = contents
+
+
+    def readChunk(self, offset, length):
+        return str(self.contents[offset:offset + length])
+
+
+    def writeChunk(self, offset, data):
+        self.contents[offset:offset + len(data)] = data
+
+
+    def close(self):
+        pass
+
+
+
+@implementer(ISFTPServer)
+class MemoryServer(object):
+    """
+    An SFTP server which keeps its files in a C{dict}, and only opens them.
+    """
+    def __init__(self):
+        self.files = {}
+
+
+    def gotVersion(self, otherVersion, extData):
+        return {}
+
+
+    def openFile(self, filename, flags, attrs):
+        if flags & FXF_TRUNC or filename not in self.files:
+            self.files[filename] = bytearray()
+        return MemoryFile(self.files[filename])
+
+
+
+class Consumer(object):
+    """
+    A consumer which counts the bytes written to it.
+    """
+    written = 0
+
+    def registerProducer(self, producer, streaming):
+        pass
+
+
+    def unregisterProducer(self):
+        pass
+
+
+    def write(self, data):
+        self.written += len(data)
+
+
+
+def connect(latency):
+    """
+    Connect a L{FileTransferClient} to a L{FileTransferServer} serving a
+    L{MemoryServer} with a file called C{'file'} of C{SIZE} bytes.
+    """
+    server = MemoryServer()
+    server.files['file'] = bytearray('x' * SIZE)
+    serverProtocol = FileTransferServer(avatar=server)
+    client = FileTransferClient()
+    connected = Deferred()
+    client.gotServerVersion = lambda version, extData: connected.callback(
+        client)
+    client.makeConnection(DelayedTransport(serverProtocol, latency))
+    serverProtocol.makeConnection(DelayedTransport(client, latency))
+    return connected
+
+
+
+@inlineCallbacks
+def readChunks(client):
+    remote = yield client.openFile('file', FXF_READ, {})
+    offset = 0
+    while True:
+        try:
+            data = yield remote.readChunk(offset, CHUNK_SIZE)
+        except EOFError:
+            break
+        offset += len(data)
+    yield remote.close()
+
+
+
+@inlineCallbacks
+def writeChunks(client):
+    remote = yield client.openFile('file', FXF_WRITE | FXF_CREAT | FXF_TRUNC,
+                                   {})
+    chunk = 'x' * CHUNK_SIZE
+    for offset in xrange(0, SIZE, CHUNK_SIZE):
+        yield remote.writeChunk(offset, chunk)
+    yield remote.close()
+
+
+
+def download(client):
+    return client.downloadFile('file', Consumer(), CHUNK_SIZE)
+
+
+
+def upload(client):
+    return client.uploadFile(
+        'file', FileBodyProducer(StringIO('x' * SIZE)), CHUNK_SIZE)
+
+
+
+@inlineCallbacks
+def benchmark(name, transfer, latency):
+    """
+    Transfer C{SIZE} bytes with C{transfer} over a connection with a one way
+    delay of C{latency} seconds and report the rate.
+    """
+    client = yield connect(latency)
+    before = time()
+    yield transfer(client)
+    after = time()
+    print '%-15s %5.1f ms latency %8.2f MB/sec' % (
+        name, latency * 1000, SIZE / (after - before) / 2 ** 20)
+
+
+
+@inlineCallbacks
+def main():
+    try:
+        for latency in [0, 0.001, 0.01]:
+            for name, transfer in [('readChunk', readChunks),
+                                   ('downloadFile', download),
+                                   ('writeChunk', writeChunks),
+                                   ('uploadFile', upload)]:
+                yield benchmark(name, transfer, latency)
+    finally:
+        reactor.stop()
+
+
+
+if __name__ == '__main__':
+    reactor.callWhenRunning(main)
+    reactor.run()
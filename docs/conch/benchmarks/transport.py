@@ -0,0 +1,97 @@
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Benchmark of the packet layer of L{twisted.conch.ssh.transport}: packets are
+sent with L{SSHTransportBase.sendPacket} and the bytes it writes are delivered
+to another L{SSHTransportBase} in 64KiB segments, as a socket would, for each
+of the supported ciphers.  Large packets are the size of the channel data
+packets used by SFTP and port forwarding, and small ones are like those of an
+interactive session.
+"""
+
+from time import time
+
+from twisted.conch.ssh.transport import SSHTransportBase, SSHCiphers
+
+
+
+class Transport(object):
+    """
+    A transport which keeps the writes made to it.
+    """
+    def __init__(self):
+        self.written = []
+
+
+    def write(self, data):
+        self.written.append(data)
+
+
+    def writeSequence(self, data):
+        self.written.extend(data)
+
+
+
+class Receiver(SSHTransportBase):
+    """
+    Count the bytes of the packets received instead of dispatching them.
+    """
+    gotVersion = True
+    received = 0
+
+    def dispatchMessage(self, messageNum, payload):
+        self.received += len(payload)
+
+
+
+def connect(cipher, mac):
+    """
+    Make a sending and a receiving transport which share keys for C{cipher}
+    and C{mac}.
+    """
+    iv = key = integrity = '\x2a' * 64
+    sender = SSHTransportBase()
+    sender.transport = Transport()
+    sender.currentEncryptions = SSHCiphers(cipher, 'none', mac, 'none')
+    sender.currentEncryptions.setKeys(iv, key, '', '', integrity, '')
+    receiver = Receiver()
+    receiver.currentEncryptions = SSHCiphers('none', cipher, 'none', mac)
+    receiver.currentEncryptions.setKeys('', '', iv, key, '', integrity)
+    return sender, receiver
+
+
+
+def benchmark(cipher, mac, size, count):
+    """
+    Send C{count} packets with C{size} byte payloads, deliver them and report
+    the rate.
+    """
+    sender, receiver = connect(cipher, mac)
+    payload = 'x' * size
+    before = time()
+    for i in xrange(count):
+        sender.sendPacket(94, payload)
+    data = ''.join(sender.transport.written)
+    for i in xrange(0, len(data), 2 ** 16):
+        receiver.dataReceived(data[i:i + 2 ** 16])
+    after = time()
+    assert receiver.received == size * count, (receiver.received, size, count)
+    print '%-30s %-10s %6d bytes %8.2f MB/sec' % (
+        cipher, mac, size, size * count / (after - before) / 2 ** 20)
+
+
+
+def main():
+    for cipher in SSHTransportBase.supportedCiphers:
+        if cipher in SSHCiphers.aeadMap:
+            mac = 'none'
+        else:
+            mac = SSHTransportBase.supportedMACs[0]
+        benchmark(cipher, mac, 32768, 500)
+        benchmark(cipher, mac, 100, 10000)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Benchmark of L{twisted.protocols.tls.TLSMemoryBIOProtocol} over an in-memory
+connection, for a request/response protocol which answers each request with
+many small writes, for many small writes made outside of C{dataReceived},
+either one at a time or with C{writeSequence}, and for bulk transfers in large
+writes.
+
+The number of writes to the underlying transport is reported along with the
+rate, since each of them costs a system call on a real connection.
+"""
+
+from time import time
+
+from OpenSSL import crypto
+
+from twisted.internet.protocol import Factory, Protocol
+from twisted.internet.ssl import (
+    Certificate, CertificateOptions, optionsForClientTLS)
+from twisted.protocols.tls import TLSMemoryBIOFactory
+
+
+
+def certificate():
+    """
+    Make a self-signed certificate for C{example.com}.
+    """
+    key = crypto.PKey()
+    key.generate_key(crypto.TYPE_RSA, 2048)
+    cert = crypto.X509()
+    cert.get_subject().CN = b'example.com'
+    cert.set_serial_number(1)
+    cert.gmtime_adj_notBefore(0)
+    cert.gmtime_adj_notAfter(3600)
+    cert.set_issuer(cert.get_subject())
+    cert.set_pubkey(key)
+    cert.sign(key, 'sha256')
+    return key, cert
+
+
+
+class Transport(object):
+    """
+    A transport which keeps and counts the writes made to it.
+    """
+    disconnecting = False
+
+    def __init__(self):
+        self.writes = 0
+        self.written = []
+
+
+    def write(self, data):
+        self.writes += 1
+        self.written.append(data)
+
+
+    def writeSequence(self, data):
+        self.writes += 1
+        self.written.extend(data)
+
+
+
+class Responder(Protocol):
+    """
+    Answer each request with C{count} writes of C{size} bytes.
+    """
+    count = 0
+    size = 0
+
+    def dataReceived(self, data):
+        for i in xrange(self.count):
+            self.transport.write(b'x' * self.size)
+
+
+
+class Sink(Protocol):
+    """
+    Count the bytes received.
+    """
+    received = 0
+
+    def dataReceived(self, data):
+        self.received += len(data)
+
+
+
+def connect(key, cert):
+    """
+    Connect a TLS client and server, and complete their handshake.
+    """
+    serverOptions = CertificateOptions(privateKey=key, certificate=cert)
+    clientOptions = optionsForClientTLS(
+        u'example.com', trustRoot=Certificate(cert))
+    server = TLSMemoryBIOFactory(
+        serverOptions, False, Factory.forProtocol(Responder)
+    ).buildProtocol(None)
+    client = TLSMemoryBIOFactory(
+        clientOptions, True, Factory.forProtocol(Sink)
+    ).buildProtocol(None)
+    server.makeConnection(Transport())
+    client.makeConnection(Transport())
+    pump(server, client)
+    return server, client
+
+
+
+def pump(server, client):
+    """
+    Move bytes between the two sides until neither has anything to send,
+    delivering them in segments of at most 64KiB as a socket would.
+    """
+    while server.transport.written or client.transport.written:
+        for source, destination in [(client, server), (server, client)]:
+            data = b''.join(source.transport.written)
+            del source.transport.written[:]
+            for i in xrange(0, len(data), 2 ** 16):
+                destination.dataReceived(data[i:i + 2 ** 16])
+
+
+
+def measure(name, key, cert, send, size):
+    """
+    Call C{send} with a connected server and client, then deliver everything
+    it wrote and report the throughput.
+    """
+    server, client = connect(key, cert)
+    server.transport.writes = 0
+    before = time()
+    send(server, client)
+    pump(server, client)
+    after = time()
+    assert client.wrappedProtocol.received == size, (
+        client.wrappedProtocol.received, size)
+    print '%-36s %8.2f MB/sec %8d writes' % (
+        name, size / (after - before) / 2 ** 20, server.transport.writes)
+
+
+
+def requests(count, size, iterations):
+    """
+    Send C{iterations} requests, each answered by C{count} writes of C{size}
+    bytes.
+    """
+    def send(server, client):
+        server.wrappedProtocol.count = count
+        server.wrappedProtocol.size = size
+        for i in xrange(iterations):
+            client.write(b'request')
+            pump(server, client)
+    return send
+
+
+
+def writes(count, size):
+    """
+    Make C{count} writes of C{size} bytes.
+    """
+    def send(server, client):
+        data = b'x' * size
+        for i in xrange(count):
+            server.write(data)
+    return send
+
+
+
+def sequences(count, size, length):
+    """
+    Make C{count} calls to C{writeSequence}, each with C{length} strings of
+    C{size} bytes.
+    """
+    def send(server, client):
+        data = [b'x' * size] * length
+        for i in xrange(count):
+            server.writeSequence(data)
+    return send
+
+
+
+def main():
+    key, cert = certificate()
+    measure('100 x 64 byte responses', key, cert,
+            requests(100, 64, 200), 100 * 64 * 200)
+    measure('10 x 1KiB responses', key, cert,
+            requests(10, 1024, 200), 10 * 1024 * 200)
+    measure('64 byte writes', key, cert,
+            writes(20000, 64), 20000 * 64)
+    measure('100 x 64 byte writeSequence', key, cert,
+            sequences(200, 64, 100), 200 * 64 * 100)
+    measure('64KiB writes', key, cert,
+            writes(512, 2 ** 16), 512 * 2 ** 16)
+    measure('1MiB writes', key, cert,
+            writes(32, 2 ** 20), 32 * 2 ** 20)
+
+
+
+if __name__ == '__main__':
+    main()
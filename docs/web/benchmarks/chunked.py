@@ -0,0 +1,66 @@
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Benchmark of decoding I{chunked} bodies with
+L{twisted.web.http._ChunkedTransferDecoder}, as used by both
+L{twisted.web.http.HTTPChannel} and the HTTP client, for segment sizes which
+are hard on it: many tiny chunks in one large segment, large chunks in tiny
+segments, and long chunk length lines delivered a byte at a time.
+"""
+
+from time import time
+
+from twisted.web.http import _ChunkedTransferDecoder
+
+
+def encode(chunks, extension=b''):
+    """
+    Encode a body made of the given chunks.
+    """
+    return b''.join(
+        b'%x%s\r\n%s\r\n' % (len(chunk), extension, chunk)
+        for chunk in chunks) + b'0\r\n\r\n'
+
+
+
+def segments(body, size):
+    """
+    Split a body into segments of the given size.
+    """
+    return [body[i:i + size] for i in xrange(0, len(body), size)]
+
+
+
+def benchmark(name, body, size, iterations):
+    """
+    Decode C{body}, delivered in segments of C{size} bytes, C{iterations}
+    times and report the rate in megabytes of encoded body per second.
+    """
+    pieces = segments(body, size)
+    received = []
+    before = time()
+    for i in xrange(iterations):
+        decoder = _ChunkedTransferDecoder(received.append, received.append)
+        for piece in pieces:
+            decoder.dataReceived(piece)
+        del received[:]
+    after = time()
+    print '%-36s %10.2f MB/sec' % (
+        name, len(body) * iterations / (after - before) / 2 ** 20)
+
+
+
+def main():
+    tiny = encode([b'x'] * 20000)
+    benchmark('tiny chunks, 64KiB segments', tiny, 65536, 10)
+    large = encode([b'x' * 65536] * 16)
+    benchmark('64KiB chunks, 64KiB segments', large, 65536, 100)
+    benchmark('64KiB chunks, 7 byte segments', large, 7, 2)
+    long = encode([b'x' * 16] * 50, b';' + b'e' * 4000)
+    benchmark('4KiB length lines, 1 byte segments', long, 1, 1)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Benchmark of L{twisted.web.template.flattenString} rendering a realistic page,
+both with the template compiled by its loader (as L{Element.render} does) and
+with the uncompiled document the loader parsed.
+"""
+
+from time import time
+
+from twisted.web.template import (
+    Element, XMLString, TagLoader, renderer, tags, flattenString)
+
+
+TEMPLATE = """\
+<html xmlns:t="http://twistedmatrix.com/ns/twisted.web.template/0.1">
+  <head>
+    <title><t:slot name="title" /></title>
+    <link rel="stylesheet" type="text/css" href="/static/site.css" />
+    <script type="text/javascript" src="/static/site.js"></script>
+  </head>
+  <body>
+    <div id="header" class="banner">
+      <h1>Example &amp; Co.</h1>
+      <ul class="navigation">
+        <li><a href="/">Home</a></li>
+        <li><a href="/products">Products</a></li>
+        <li><a href="/about">About us</a></li>
+        <li><a href="/contact">Contact</a></li>
+      </ul>
+    </div>
+    <div id="content">
+      <h2><t:slot name="title" /></h2>
+      <table class="listing">
+        <tr><th>Name</th><th>Price</th><th>Description</th></tr>
+        <tr t:render="rows">
+          <td><a><t:attr name="href"><t:slot name="link" /></t:attr>
+            <t:slot name="name" /></a></td>
+          <td class="price"><t:slot name="price" /></td>
+          <td><t:slot name="description" /></td>
+        </tr>
+      </table>
+    </div>
+    <div id="footer">
+      <p>Copyright &#169; Example &amp; Co.  All rights reserved.</p>
+      <p>Served by <a href="http://twistedmatrix.com/">Twisted</a>.</p>
+    </div>
+  </body>
+</html>
+"""
+
+
+
+class Page(Element):
+    """
+    A product listing page.
+    """
+
+    def __init__(self, loader, count):
+        Element.__init__(self, loader)
+        self.count = count
+
+
+    @renderer
+    def rows(self, request, tag):
+        for i in xrange(self.count):
+            yield tag.clone().fillSlots(
+                link='/products/%d' % (i,), name='Product <%d>' % (i,),
+                price='%d.99' % (i,), description='A fine product & more.')
+
+
+
+def benchmark(name, loader, rows, iterations):
+    """
+    Flatten a L{Page} using C{loader} C{iterations} times and report the rate.
+    """
+    page = tags.transparent(Page(loader, rows)).fillSlots(title='Products')
+    results = []
+    before = time()
+    for i in xrange(iterations):
+        flattenString(None, page).addCallback(results.append)
+    after = time()
+    assert len(results) == iterations
+    print '%-10s rows: %4d  %8.1f pages/sec  (%d bytes/page)' % (
+        name, rows, iterations / (after - before), len(results[0]))
+
+
+
+def main():
+    compiled = XMLString(TEMPLATE)
+    uncompiled = TagLoader(tags.transparent(compiled.load()))
+    for rows in (0, 10, 100):
+        iterations = 20000 // (rows + 10)
+        benchmark('compiled', compiled, rows, iterations)
+        benchmark('uncompiled', uncompiled, rows, iterations)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Benchmark of HTTP header handling: parsing the headers of requests received
+by L{twisted.web.http.HTTPChannel}, and emitting the status line and headers
+of responses from L{twisted.web.http.Request.write}.
+"""
+
+from time import time
+
+from twisted.test.proto_helpers import StringTransport
+from twisted.web.http import HTTPChannel, Request
+
+
+REQUEST = (
+    b'GET /static/style.css?v=12 HTTP/1.1\r\n'
+    b'Host: www.example.com\r\n'
+    b'User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:38.0) Gecko/20100101 '
+    b'Firefox/38.0\r\n'
+    b'Accept: text/css,*/*;q=0.1\r\n'
+    b'Accept-Language: en-US,en;q=0.5\r\n'
+    b'Accept-Encoding: gzip, deflate\r\n'
+    b'Referer: http://www.example.com/index.html\r\n'
+    b'Cookie: session=0123456789abcdef; theme=dark\r\n'
+    b'Connection: keep-alive\r\n'
+    b'If-Modified-Since: Sat, 16 May 2015 10:20:30 GMT\r\n'
+    b'Cache-Control: max-age=0\r\n'
+    b'\r\n')
+
+RESPONSE_HEADERS = [
+    (b'content-type', [b'text/css']),
+    (b'content-length', [b'1024']),
+    (b'last-modified', [b'Sat, 16 May 2015 10:20:30 GMT']),
+    (b'etag', [b'"5557196e-400"']),
+    (b'cache-control', [b'public, max-age=3600']),
+    (b'server', [b'TwistedWeb/15.1.0']),
+    (b'date', [b'Sun, 17 May 2015 08:00:00 GMT']),
+    (b'vary', [b'Accept-Encoding']),
+    (b'x-frame-options', [b'DENY']),
+    ]
+
+
+
+class QuietRequest(Request):
+    """
+    A request which does nothing once it is received.
+    """
+    def process(self):
+        pass
+
+
+
+class Channel(object):
+    """
+    Just enough of an L{HTTPChannel} for a L{Request} to write a response.
+    """
+    def __init__(self):
+        self.transport = StringTransport()
+
+
+
+def benchmark(name, operation, iterations):
+    """
+    Call C{operation} C{iterations} times and report the rate.
+    """
+    before = time()
+    for i in xrange(iterations):
+        operation()
+    after = time()
+    print '%-28s %10.1f operations/sec' % (
+        name, iterations / (after - before))
+
+
+
+def parseRequest():
+    channel = HTTPChannel()
+    channel.requestFactory = QuietRequest
+    channel.timeOut = None
+    channel.makeConnection(StringTransport())
+    channel.dataReceived(REQUEST)
+
+
+
+def emitResponse():
+    request = Request(Channel(), False)
+    request.clientproto = b'HTTP/1.1'
+    request.method = b'GET'
+    for name, values in RESPONSE_HEADERS:
+        request.responseHeaders.setRawHeaders(name, values[:])
+    request.write(b'body')
+
+
+
+def main():
+    benchmark('parse request headers', parseRequest, 50000)
+    benchmark('emit response headers', emitResponse, 50000)
+
+
+
+if __name__ == '__main__':
+    main()
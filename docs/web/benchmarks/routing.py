@@ -0,0 +1,98 @@
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Benchmark of finding the resource for a request in a deep hierarchy of static
+resources, with L{twisted.web.resource.getChildForRequest} and with a
+L{twisted.web.resource.RoutingIndex}.
+"""
+
+from time import time
+
+from twisted.web.resource import Resource, RoutingIndex, getChildForRequest
+from twisted.web.vhost import NameVirtualHost
+
+
+
+class Request(object):
+    """
+    Just enough of a request for resource traversal.
+    """
+    def __init__(self, path):
+        self.prepath = []
+        self.postpath = path[:]
+
+    def getHeader(self, name):
+        return 'example.com'
+
+
+
+def buildTree(depth, width):
+    """
+    Build a hierarchy of static resources C{depth} levels deep, each with
+    C{width} children.
+
+    @return: The root resource and a list of paths to the deepest resources.
+    """
+    root = Resource()
+    paths = []
+    level = [(root, [])]
+    for i in xrange(depth):
+        nextLevel = []
+        for parent, path in level[:width]:
+            for j in xrange(width):
+                child = Resource()
+                name = 'segment%d' % (j,)
+                parent.putChild(name, child)
+                nextLevel.append((child, path + [name]))
+        level = nextLevel
+    paths = [path for (resource, path) in level]
+    return root, paths
+
+
+
+def benchmark(name, lookup, paths, iterations):
+    """
+    Look up each of C{paths} with C{lookup} C{iterations} times and report the
+    rate.
+    """
+    before = time()
+    for i in xrange(iterations):
+        for path in paths:
+            lookup(Request(path))
+    after = time()
+    print '%-28s %10.1f lookups/sec' % (
+        name, iterations * len(paths) / (after - before))
+
+
+
+def main():
+    for depth in (2, 4, 8):
+        root, paths = buildTree(depth, 10)
+        index = RoutingIndex(root)
+        iterations = 10000 // len(paths) + 1
+        benchmark(
+            'depth %d getChildForRequest' % (depth,),
+            lambda request: getChildForRequest(root, request),
+            paths, iterations)
+        benchmark('depth %d RoutingIndex' % (depth,),
+                  index.getChildForRequest, paths, iterations)
+
+    root, paths = buildTree(4, 10)
+    vhost = NameVirtualHost()
+    vhost.addHost('example.com', root)
+    top = Resource()
+    top.putChild('site', vhost)
+    paths = [['site'] + path for path in paths]
+    index = RoutingIndex(top)
+    iterations = 10000 // len(paths) + 1
+    benchmark(
+        'vhost getChildForRequest',
+        lambda request: getChildForRequest(top, request), paths, iterations)
+    benchmark('vhost RoutingIndex', index.getChildForRequest, paths,
+              iterations)
+
+
+
+if __name__ == '__main__':
+    main()
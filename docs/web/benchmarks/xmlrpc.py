@@ -0,0 +1,104 @@
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Benchmark of L{twisted.web.xmlrpc.XMLRPC}: serializing a large array, and the
+latency of small calls made while a large call is being handled, with and
+without a thread pool for parsing and serialization.
+"""
+
+import xmlrpclib
+from time import time
+
+from twisted.internet import reactor, defer
+from twisted.python.threadpool import ThreadPool
+from twisted.web import client, server, xmlrpc
+
+
+LARGE = 500000
+
+
+
+class Echo(xmlrpc.XMLRPC):
+    """
+    Return the argument of each call, or a list of integers.
+    """
+    def xmlrpc_echo(self, value):
+        return value
+
+
+    def xmlrpc_range(self, count):
+        return range(count)
+
+
+
+def benchmark(name, operation, iterations):
+    """
+    Call C{operation} C{iterations} times and report the rate.
+    """
+    before = time()
+    for i in xrange(iterations):
+        operation()
+    after = time()
+    print '%-36s %10.1f operations/sec' % (
+        name, iterations / (after - before))
+
+
+
+@defer.inlineCallbacks
+def concurrentLatency(name, threadpool):
+    """
+    Make one call returning a list of L{LARGE} integers and, until it
+    completes, make small calls one after another.  Report the mean and
+    maximum latency of the small calls.
+    """
+    port = reactor.listenTCP(
+        0, server.Site(Echo(threadpool=threadpool)), interface='127.0.0.1')
+    url = 'http://127.0.0.1:%d/' % (port.getHost().port,)
+    done = []
+    # Fetch the large response without parsing it, so the client does not
+    # block the reactor shared with the server.
+    large = client.getPage(
+        url, method='POST', postdata=xmlrpclib.dumps((LARGE,), 'range'))
+    large.addCallback(done.append)
+    latencies = []
+    proxy = xmlrpc.Proxy(url)
+    while not done:
+        before = time()
+        yield proxy.callRemote('echo', len(latencies))
+        latencies.append(time() - before)
+    yield port.stopListening()
+    print '%-36s %8.2f ms mean %8.2f ms max' % (
+        name, sum(latencies) / len(latencies) * 1000, max(latencies) * 1000)
+
+
+
+@defer.inlineCallbacks
+def concurrent():
+    try:
+        yield concurrentLatency('small calls, no thread pool', None)
+        pool = ThreadPool()
+        pool.start()
+        try:
+            yield concurrentLatency('small calls, thread pool', pool)
+        finally:
+            pool.stop()
+    finally:
+        reactor.stop()
+
+
+
+def main():
+    benchmark(
+        'xmlrpclib.dumps large array',
+        lambda: xmlrpclib.dumps((range(LARGE),), methodresponse=True), 5)
+    benchmark(
+        'xmlrpc._dumpResponse large array',
+        lambda: xmlrpc._dumpResponse((range(LARGE),), False), 5)
+    reactor.callWhenRunning(concurrent)
+    reactor.run()
+
+
+
+if __name__ == '__main__':
+    main()
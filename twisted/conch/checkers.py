@@ -121,16 +121,45 @@ class UNIXPasswordDatabase:
 
 
 
+def _fileVersion(filepath):
+    """
+    Get something which changes whenever the file at C{filepath} is
+    replaced, written to or has its permissions changed.
+
+    @type filepath: L{FilePath}
+
+    @return: A C{tuple} of the inode number, size, modification time and
+        status change time of the file, or C{None} if it does not exist.
+    """
+    try:
+        filepath.restat()
+    except OSError:
+        return None
+    s = filepath.statinfo
+    return (s.st_ino, s.st_size, s.st_mtime, s.st_ctime)
+
+
+
 @implementer(ICredentialsChecker)
 class SSHPublicKeyDatabase:
     """
     Checker that authenticates SSH public keys, based on public keys listed in
     authorized_keys and authorized_keys2 files in user .ssh/ directories.
+
+    The keys in each file are kept, and the file is only read again when
+    L{_fileVersion} says it has changed.
+
+    @ivar _blobs: A C{dict} mapping the paths of authorized keys files to
+        their L{_fileVersion} and the C{set} of the key blobs in them.
     """
     credentialInterfaces = (ISSHPrivateKey,)
 
     _userdb = pwd
 
+    def __init__(self):
+        self._blobs = {}
+
+
     def requestAvatarId(self, credentials):
         d = defer.maybeDeferred(self.checkKey, credentials)
         d.addCallback(self._cbRequestAvatarId, credentials)
@@ -202,25 +231,45 @@ class SSHPublicKeyDatabase:
         """
         ouid, ogid = self._userdb.getpwnam(credentials.username)[2:4]
         for filepath in self.getAuthorizedKeysFiles(credentials):
-            if not filepath.exists():
+            version = _fileVersion(filepath)
+            if version is None:
                 continue
-            try:
-                lines = filepath.open()
-            except IOError, e:
-                if e.errno == errno.EACCES:
-                    lines = runAsEffectiveUser(ouid, ogid, filepath.open)
-                else:
-                    raise
+            cached = self._blobs.get(filepath.path)
+            if cached is not None and cached[0] == version:
+                blobs = cached[1]
+            else:
+                blobs = self._readBlobs(filepath, ouid, ogid)
+                self._blobs[filepath.path] = (version, blobs)
+            if credentials.blob in blobs:
+                return True
+        return False
+
+
+    def _readBlobs(self, filepath, ouid, ogid):
+        """
+        Read the key blobs from an authorized keys file, as the user with the
+        given uid and gid if the file cannot be read otherwise.
+
+        @return: A C{set} of the key blobs in the file.
+        """
+        try:
+            lines = filepath.open()
+        except IOError, e:
+            if e.errno == errno.EACCES:
+                lines = runAsEffectiveUser(ouid, ogid, filepath.open)
+            else:
+                raise
+        blobs = set()
+        with lines:
             for l in lines:
                 l2 = l.split()
                 if len(l2) < 2:
                     continue
                 try:
-                    if base64.decodestring(l2[1]) == credentials.blob:
-                        return True
+                    blobs.add(base64.decodestring(l2[1]))
                 except binascii.Error:
                     continue
-        return False
+        return blobs
 
     def _ebRequestAvatarId(self, f):
         if not f.check(UnauthorizedLogin):
@@ -368,32 +417,29 @@ def readAuthorizedKeyFile(fileobj, parseKey=keys.Key.fromString):
 
 
 
-def _keysFromFilepaths(filepaths, parseKey):
+class _AuthorizedKeys(object):
     """
-    Helper function that turns an iterable of filepaths into a generator of
-    keys.  If any file cannot be read, a message is logged but it is
-    otherwise ignored.
+    The keys read from authorized keys files, which can be checked for a key
+    by its blob without comparing it with each of them.
 
-    @param filepaths: iterable of L{twisted.python.filepath.FilePath}.
-    @type filepaths: iterable
+    @ivar _keys: A C{list} of the keys.
+    @ivar _blobs: A C{set} of the blobs of the keys which are
+        L{twisted.conch.ssh.keys.Key}s.
+    """
+    def __init__(self, authorizedKeys):
+        self._keys = list(authorizedKeys)
+        self._blobs = set(key.blob() for key in self._keys
+                          if isinstance(key, keys.Key))
 
-    @param parseKey: a callable that takes a string and returns a
-        L{twisted.conch.ssh.keys.Key}
-    @type parseKey: L{callable}
 
-    @return: generator of L{twisted.conch.ssh.keys.Key}
-    @rtype: generator
+    def __iter__(self):
+        return iter(self._keys)
 
-    @since: 15.0
-    """
-    for fp in filepaths:
-        if fp.exists():
-            try:
-                with fp.open() as f:
-                    for key in readAuthorizedKeyFile(f, parseKey):
-                        yield key
-            except (IOError, OSError) as e:
-                log.msg("Unable to read {0}: {1!s}".format(fp.path, e))
+
+    def __contains__(self, key):
+        if isinstance(key, keys.Key):
+            return key.blob() in self._blobs
+        return key in self._keys
 
 
 
@@ -430,6 +476,15 @@ class UNIXAuthorizedKeysFiles(object):
     If any of the files cannot be read, a message is logged but that file is
     otherwise ignored.
 
+    The keys parsed from a user's files are kept, and are only parsed again
+    when L{_fileVersion} says one of the files has changed.  They are
+    returned as an iterable which can also be checked for a key by its blob
+    with C{in}, without comparing it with each of them.
+
+    @ivar _keys: A C{dict} mapping the paths of users' C{.ssh} directories to
+        the L{_fileVersion}s of the authorized keys files in them and the
+        L{_AuthorizedKeys} read from those files.
+
     @since: 15.0
     """
     def __init__(self, userdb=None, parseKey=keys.Key.fromString):
@@ -449,6 +504,7 @@ class UNIXAuthorizedKeysFiles(object):
         self._parseKey = parseKey
         if userdb is None:
             self._userdb = pwd
+        self._keys = {}
 
 
     def getAuthorizedKeys(self, username):
@@ -459,8 +515,31 @@ class UNIXAuthorizedKeysFiles(object):
 
         root = FilePath(passwd.pw_dir).child('.ssh')
         files = ['authorized_keys', 'authorized_keys2']
-        return _keysFromFilepaths((root.child(f) for f in files),
-                                  self._parseKey)
+        filepaths = [root.child(f) for f in files]
+        versions = [_fileVersion(fp) for fp in filepaths]
+        cached = self._keys.get(root.path)
+        if cached is not None and cached[0] == versions:
+            return cached[1]
+
+        authorizedKeys = []
+        complete = True
+        for fp, version in zip(filepaths, versions):
+            if version is None:
+                continue
+            try:
+                with fp.open() as f:
+                    authorizedKeys.extend(
+                        readAuthorizedKeyFile(f, self._parseKey))
+            except (IOError, OSError) as e:
+                log.msg("Unable to read {0}: {1!s}".format(fp.path, e))
+                complete = False
+        authorizedKeys = _AuthorizedKeys(authorizedKeys)
+        # Files which could not be read are tried again next time.
+        if complete:
+            self._keys[root.path] = (versions, authorizedKeys)
+        else:
+            self._keys.pop(root.path, None)
+        return authorizedKeys
 
 
 
@@ -535,8 +614,7 @@ class SSHPublicKeyChecker(object):
         @return: C{pubKey} if the key is authorized
         @rtype: L{twisted.conch.ssh.keys.Key}
         """
-        if any(key == pubKey for key in
-               self._keydb.getAuthorizedKeys(credentials.username)):
+        if pubKey in self._keydb.getAuthorizedKeys(credentials.username):
             return pubKey
 
         raise UnauthorizedLogin("Key not authorized")
@@ -7,7 +7,8 @@ Endpoint implementations of various SSH interactions.
 """
 
 __all__ = [
-    'AuthenticationFailed', 'SSHCommandAddress', 'SSHCommandClientEndpoint']
+    'AuthenticationFailed', 'SSHCommandAddress', 'SSHCommandClientEndpoint',
+    'SSHConnectionPool']
 
 from struct import unpack
 from os.path import expanduser
@@ -112,9 +113,15 @@ class _CommandChannel(SSHChannel):
     @ivar _protocolFactory:  See L{__init__}
     @ivar _commandConnected:  See L{__init__}
     @ivar _protocol: An L{IProtocol} provider created using C{_protocolFactory}
-        which is hooked up to the running command's input and output streams.
+        which is hooked up to the running command's input and output streams,
+        or C{None} until the command is running.
+    @ivar _cancelled: Whether running the command has been cancelled through
+        C{_commandConnected}, so that the channel is closed as soon as it is
+        open.
     """
     name = b'session'
+    _protocol = None
+    _cancelled = False
 
     def __init__(self, creator, command, protocolFactory, commandConnected):
         """
@@ -146,14 +153,19 @@ class _CommandChannel(SSHChannel):
         When the request to open a new channel to run this command in fails,
         fire the C{commandConnected} deferred with a failure indicating that.
         """
-        self._commandConnected.errback(reason)
+        if not self._cancelled:
+            self._commandConnected.errback(reason)
 
 
     def channelOpen(self, ignored):
         """
         When the request to open a new channel to run this command in succeeds,
-        issue an C{"exec"} request to run the command.
+        issue an C{"exec"} request to run the command, or close the channel if
+        running the command has been cancelled meanwhile.
         """
+        if self._cancelled:
+            self.conn.sendClose(self)
+            return
         command = self.conn.sendRequest(
             self, 'exec', NS(self._command), wantReply=True)
         command.addCallbacks(self._execSuccess, self._execFailure)
@@ -162,12 +174,28 @@ class _CommandChannel(SSHChannel):
     def _execFailure(self, reason):
         """
         When the request to execute the command in this channel fails, fire the
-        C{commandConnected} deferred with a failure indicating this.
+        C{commandConnected} deferred with a failure indicating this, and close
+        the channel, which is of no further use.
 
         @param reason: The cause of the command execution failure.
         @type reason: L{Failure}
         """
+        if self._cancelled:
+            # Closing the channel after cancellation fails the request.
+            return
         self._commandConnected.errback(reason)
+        self.conn.sendClose(self)
+
+
+    def _cancel(self):
+        """
+        Give up on running the command, when C{commandConnected} is
+        cancelled: close the channel if it is open, or as soon as it is.
+        C{commandConnected} is not fired again.
+        """
+        self._cancelled = True
+        if self.conn is not None:
+            self.conn.sendClose(self)
 
 
     def _execSuccess(self, ignored):
@@ -182,11 +210,13 @@ class _CommandChannel(SSHChannel):
 
         @param ignored: The (ignored) result of the execute request
         """
+        if self._cancelled:
+            return
         self._protocol = self._protocolFactory.buildProtocol(
             SSHCommandAddress(
                 self.conn.transport.transport.getPeer(),
                 self.conn.transport.creator.username,
-                self.conn.transport.creator.command))
+                self._command))
         self._protocol.makeConnection(self)
         self._commandConnected.callback(self._protocol)
 
@@ -232,9 +262,11 @@ class _CommandChannel(SSHChannel):
     def closed(self):
         """
         When the channel closes, deliver disconnection notification to the
-        protocol.
+        protocol, if the command was running.
         """
         self._creator.cleanupConnection(self.conn, False)
+        if self._protocol is None:
+            return
         if self._reason is None:
             reason = ConnectionDone("ssh channel closed")
         else:
@@ -364,6 +396,10 @@ class _CommandTransport(SSHClientTransport):
 
     _hostKeyFailure = None
 
+    # Called with no arguments when the connection to the SSH server is lost,
+    # so that an SSHConnectionPool can forget it.
+    _lostCallback = None
+
 
     def __init__(self, creator):
         """
@@ -472,6 +508,8 @@ class _CommandTransport(SSHClientTransport):
         When the underlying connection to the SSH server is lost, if there were
         any connection setup errors, propagate them.
         """
+        if self._lostCallback is not None:
+            self._lostCallback()
         if self._state == b'RUNNING' or self.connectionReady is None:
             return
         if self._state == b'SECURING' and self._hostKeyFailure is not None:
@@ -523,7 +561,7 @@ class SSHCommandClientEndpoint(object):
     @classmethod
     def newConnection(cls, reactor, command, username, hostname, port=None,
                       keys=None, password=None, agentEndpoint=None,
-                      knownHosts=None, ui=None):
+                      knownHosts=None, ui=None, pool=None):
         """
         Create and return a new endpoint which will try to create a new
         connection to an SSH server and run a command over it.  It will also
@@ -531,6 +569,12 @@ class SSHCommandClientEndpoint(object):
         being executed, after the command finishes, or if the connection
         L{Deferred} is cancelled.
 
+        If C{pool} is given, the command is instead run in a new channel on a
+        connection from the pool, which is only made if the pool has no
+        connection to spare which was made to the same server as the same user
+        with the same credentials, C{knownHosts} and C{ui}, and which is left
+        for the pool to close.
+
         @param reactor: The reactor to use to establish the connection.
         @type reactor: L{IReactorTCP} provider
 
@@ -571,12 +615,18 @@ class SSHCommandClientEndpoint(object):
             object which answers C{b"no"} to all prompts will be used.
         @type ui: L{NoneType} or L{ConsoleUI}
 
+        @param pool: The pool of connections to run the command over, or
+            C{None} to run it over a connection of its own.
+        @type pool: L{SSHConnectionPool} or L{NoneType}
+
         @return: A new instance of C{cls} (probably
             L{SSHCommandClientEndpoint}).
         """
         helper = _NewConnectionHelper(
             reactor, hostname, port, command, username, keys, password,
             agentEndpoint, knownHosts, ui)
+        if pool is not None:
+            helper = _PooledConnectionHelper(pool, helper, knownHosts, ui)
         return cls(helper, command)
 
 
@@ -636,7 +686,7 @@ class SSHCommandClientEndpoint(object):
 
         @return: See L{SSHCommandClientEndpoint.connect}'s return value.
         """
-        commandConnected = Deferred()
+        commandConnected = Deferred(lambda d: channel._cancel())
         def disconnectOnFailure(passthrough):
             # Close the connection immediately in case of cancellation, since
             # that implies user wants it gone immediately (e.g. a timeout):
@@ -830,3 +880,265 @@ class _ExistingConnectionHelper(object):
         @param immediate: An argument which will be ignored.
         @type immediate: L{bool}.
         """
+
+
+
+class SSHConnectionPool(object):
+    """
+    A pool of authenticated SSH connections, which the commands run by
+    L{SSHCommandClientEndpoint}s created with the same pool share by each
+    running in a channel of its own.
+
+    Connections are stored using keys of the hostname and port of the SSH
+    server, the username, the credentials used to authenticate and the
+    objects used to verify the server's host key, so a connection is only
+    used for commands which would have made the same connection themselves.
+
+    A connection which is lost is not handed out again, so the next command
+    run as that user on that server makes a new connection.
+
+    @ivar maxChannelsPerConnection: The maximum number of channels which the
+        pool has open on one connection at once.  When each connection for a
+        key has that many, a new connection is made.  SSH servers limit the
+        number of sessions on a connection; the default is that of OpenSSH.
+    @type maxChannelsPerConnection: C{int}
+
+    @ivar idleTimeout: Number of seconds a connection with no open channels
+        will stay open before disconnecting.
+
+    @ivar _connections: Map connection keys to lists of authenticated
+        L{SSHConnection} instances.
+
+    @ivar _pending: Map connection keys to a list for each connection being
+        set up, of the L{Deferred}s waiting for it.
+
+    @ivar _timeouts: Map L{SSHConnection} instances to a C{IDelayedCall}
+        instance of their timeout.
+
+    @ivar _generation: The number of times L{closeConnections} has been
+        called.  Connections being set up when it is called are closed as soon
+        as they are ready, instead of being added to the pool.
+
+    @since: 15.2
+    """
+    maxChannelsPerConnection = 10
+    idleTimeout = 240
+
+    def __init__(self, reactor):
+        self._reactor = reactor
+        self._connections = {}
+        self._pending = {}
+        self._timeouts = {}
+        self._generation = 0
+
+
+    def getConnection(self, key, creator):
+        """
+        Supply a connection, newly created or retrieved from the pool, on which
+        to open one channel.
+
+        The channel must be opened as soon as the connection is supplied, and
+        L{releaseConnection} called when it is closed.
+
+        @param key: A unique key identifying connections that can be used
+            interchangeably.
+
+        @param creator: An L{_ISSHConnectionCreator} provider which can be used
+            to create a new connection if there is none to spare in the pool.
+
+        @return: A L{Deferred} that will fire with an authenticated
+            L{SSHConnection}.
+        """
+        for connection in self._connections.get(key, ()):
+            if len(connection.channels) < self.maxChannelsPerConnection:
+                self._cancelTimeout(connection)
+                return succeed(connection)
+
+        for waiting in self._pending.get(key, ()):
+            if len(waiting) < self.maxChannelsPerConnection:
+                break
+        else:
+            waiting = []
+            self._pending.setdefault(key, []).append(waiting)
+            d = creator.secureConnection()
+            d.addBoth(self._connected, key, waiting, self._generation)
+
+        d = Deferred(lambda d: waiting.remove(d))
+        waiting.append(d)
+        return d
+
+
+    def _connected(self, result, key, waiting, generation):
+        """
+        Give a newly created connection, or the reason one could not be
+        created, to the L{Deferred}s waiting for it, unless the pool has been
+        closed since it was started.
+        """
+        if generation != self._generation:
+            if not isinstance(result, Failure):
+                result.transport.loseConnection()
+            return None
+
+        pending = self._pending[key]
+        pending.remove(waiting)
+        if not pending:
+            del self._pending[key]
+        if isinstance(result, Failure):
+            for d in waiting:
+                d.errback(result)
+            return None
+
+        self._connections.setdefault(key, []).append(result)
+        result.transport._lostCallback = (
+            lambda: self._connectionLost(key, result))
+        if not waiting:
+            self._startTimeout(key, result)
+        for d in waiting:
+            d.callback(result)
+
+
+    def releaseConnection(self, key, connection):
+        """
+        Note that a channel opened on a connection supplied by
+        L{getConnection} has been closed.  If the connection has no more open
+        channels, it will be closed after L{idleTimeout} seconds unless it is
+        used again.
+
+        @param key: The key the connection was supplied for.
+
+        @param connection: The L{SSHConnection} the channel was opened on.
+        """
+        if (connection in self._connections.get(key, ()) and
+            not connection.channels and connection not in self._timeouts):
+            self._startTimeout(key, connection)
+
+
+    def _startTimeout(self, key, connection):
+        """
+        Close an idle connection in L{idleTimeout} seconds.
+        """
+        self._timeouts[connection] = self._reactor.callLater(
+            self.idleTimeout, self._closeConnection, key, connection)
+
+
+    def _cancelTimeout(self, connection):
+        """
+        Keep a connection which is about to be used open.
+        """
+        timeout = self._timeouts.pop(connection, None)
+        if timeout is not None:
+            timeout.cancel()
+
+
+    def _removeConnection(self, key, connection):
+        """
+        Remove a connection from the pool.
+        """
+        self._cancelTimeout(connection)
+        connections = self._connections[key]
+        connections.remove(connection)
+        if not connections:
+            del self._connections[key]
+
+
+    def _connectionLost(self, key, connection):
+        """
+        Remove a connection which has been lost from the pool, so that it is
+        not handed out again.
+        """
+        if connection in self._connections.get(key, ()):
+            self._removeConnection(key, connection)
+
+
+    def _closeConnection(self, key, connection):
+        """
+        Remove a connection from the pool and disconnect it.
+        """
+        del self._timeouts[connection]
+        self._removeConnection(key, connection)
+        connection.transport.loseConnection()
+
+
+    def closeConnections(self):
+        """
+        Close all the connections in the pool, and remove them from it.
+        Commands running over them are disconnected, and commands waiting for
+        a connection to be set up fail with L{ConnectionDone}.  The
+        connections being set up are closed once they are ready.
+        """
+        self._generation += 1
+        pending, self._pending = self._pending, {}
+        for waitings in pending.values():
+            for waiting in waitings:
+                while waiting:
+                    waiting.pop(0).errback(
+                        ConnectionDone("The connection pool was closed"))
+        for connections in self._connections.values():
+            for connection in connections:
+                connection.transport.loseConnection()
+        self._connections = {}
+        for timeout in self._timeouts.values():
+            timeout.cancel()
+        self._timeouts = {}
+
+
+
+@implementer(_ISSHConnectionCreator)
+class _PooledConnectionHelper(object):
+    """
+    L{_PooledConnectionHelper} implements L{_ISSHConnectionCreator} by handing
+    out connections from an L{SSHConnectionPool}, which are made when
+    necessary with a L{_NewConnectionHelper}.
+
+    @ivar key: The key of the connections in the pool which can be used: the
+        hostname, port and username, the credentials, and the C{knownHosts}
+        and C{ui} given to L{SSHCommandClientEndpoint.newConnection}.  Keys
+        are compared by their public key blobs.
+    """
+
+    def __init__(self, pool, creator, knownHosts=None, ui=None):
+        """
+        @param pool: See L{SSHCommandClientEndpoint.newConnection}'s C{pool}
+            parameter.
+        @type pool: L{SSHConnectionPool}
+
+        @param creator: The creator of new connections for the pool.
+        @type creator: L{_NewConnectionHelper}
+
+        @param knownHosts: See L{SSHCommandClientEndpoint.newConnection}'s
+            C{knownHosts} parameter.  Unlike C{creator.knownHosts}, C{None}
+            is not replaced with a new L{KnownHostsFile}, so that connections
+            using the default one can be shared.
+
+        @param ui: See L{SSHCommandClientEndpoint.newConnection}'s C{ui}
+            parameter, which is kept as it is given for the same reason.
+        """
+        self.pool = pool
+        self.creator = creator
+        self.key = (
+            creator.hostname, creator.port, creator.username,
+            creator.password, tuple(key.blob() for key in creator.keys or ()),
+            creator.agentEndpoint, knownHosts, ui)
+
+
+    def secureConnection(self):
+        """
+        @return: A L{Deferred} which fires with a connection from the pool.
+        """
+        return self.pool.getConnection(self.key, self.creator)
+
+
+    def cleanupConnection(self, connection, immediate):
+        """
+        Give the connection back to the pool rather than closing it, since
+        other commands may be running over it.
+
+        @param connection: The L{SSHConnection} the command ran over.
+        @type connection: L{SSHConnection}
+
+        @param immediate: An argument which will be ignored: a cancelled
+            command closes its own channel, and the connection is left open
+            for the other commands using it.
+        @type immediate: L{bool}.
+        """
+        self.pool.releaseConnection(self.key, connection)
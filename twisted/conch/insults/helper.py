@@ -409,6 +409,355 @@ class TerminalBuffer(protocol.Protocol):
             lines.append(''.join(buf[:length]))
         return '\n'.join(lines)
 
+
+
+class ScreenBuffer(TerminalBuffer):
+    """
+    An in-memory screen which is drawn on like a terminal, and which writes
+    only what has changed since it was last flushed to a real terminal.
+
+    Anything which draws on an L{insults.ITerminalTransport}, such as the
+    widgets in L{twisted.conch.insults.window}, can draw a frame on a
+    L{ScreenBuffer} and then call L{flush}.  The lines drawn on since the last
+    frame are compared with what was last written, and the characters which
+    differ are written with as few cursor movements and graphic rendition
+    changes as possible, in a single C{write}.  Redrawing parts of the screen
+    which have not changed writes nothing.
+
+    Raw graphic rendition escape sequences written to a L{ScreenBuffer} are
+    interpreted, and L{saveCursor} and L{restoreCursor} also save and restore
+    the graphic rendition and character sets, as they do on a VT102.  The
+    character set of each character is kept as the character set itself, such
+    as L{insults.CS_DRAWING}, rather than the slot it was selected into.
+
+    @ivar terminal: The L{insults.ITerminalTransport} provider frames are
+        written to.
+
+    @ivar _front: The lines as last written to C{terminal}, or C{None} if the
+        screen is to be cleared and written in full.
+
+    @ivar _damaged: A C{set} of the indexes of the lines which may have changed
+        since the last frame.
+
+    @ivar _cursor: The position of the cursor of C{terminal} as an C{(x, y)}
+        C{tuple}, or C{None} if it is not known.
+
+    @ivar _state: The L{_FormattingState} C{terminal} is drawing characters
+        with.
+
+    @ivar _charset: The character set selected into G0 on C{terminal}.
+
+    @ivar _states: A C{dict} of the L{_FormattingState}s characters have been
+        drawn with, so that the same one is used for all the characters with
+        the same attributes and they can be compared by identity.
+
+    @since: 15.2
+    """
+    _front = None
+    _cursor = None
+    _state = None
+    _charset = None
+
+    def __init__(self, terminal, width=80, height=24):
+        """
+        @param terminal: See L{ScreenBuffer.terminal}.
+
+        @param width: The number of columns of the screen.
+        @type width: L{int}
+
+        @param height: The number of lines of the screen.
+        @type height: L{int}
+        """
+        self.terminal = terminal
+        self.width = width
+        self.height = height
+        self._damaged = set()
+        self._states = {}
+        self.reset()
+
+
+    def resize(self, width, height):
+        """
+        Change the size of the screen.  Its contents are erased, and the next
+        frame is written in full.
+        """
+        self.width = width
+        self.height = height
+        self.reset()
+
+
+    def reset(self):
+        TerminalBuffer.reset(self)
+        self._front = None
+
+
+    def flush(self):
+        """
+        Write the changes to the screen since the last frame to C{terminal}.
+        """
+        out = []
+        if self._front is None:
+            self._state = self._currentFormattingState(default=True)
+            out.append(
+                self._rendition(self._state) + '\x1b(' +
+                _CHARSET_FINALS[self._state.charset] + '\x1b[2J')
+            self._charset = self._state.charset
+            self._cursor = None
+            blank = [(self.void, self._state)] * self.width
+            self._front = [list(blank) for i in xrange(self.height)]
+            self._damaged.update(xrange(self.height))
+
+        for y in sorted(self._damaged):
+            self._flushLine(y, out)
+        self._damaged.clear()
+
+        self._moveCursor(min(self.x, self.width - 1), self.y, out)
+        if out:
+            self.terminal.write(''.join(out))
+
+
+    def _flushLine(self, y, out):
+        """
+        Add the bytes to write the changes to one line to C{out}.
+        """
+        line = self.lines[y]
+        front = self._front[y]
+        if line == front:
+            return
+        self._front[y] = list(line)
+
+        changed = [x for x in xrange(self.width) if line[x] != front[x]]
+        start = end = changed[0]
+        for x in changed[1:] + [None]:
+            # Rewrite short runs of unchanged characters rather than move the
+            # cursor over them.
+            if x is not None and x - end - 1 <= _MAX_REWRITE:
+                end = x
+                continue
+            self._moveCursor(start, y, out)
+            for ch, state in line[start:end + 1]:
+                if state.charset != self._charset:
+                    out.append('\x1b(' + _CHARSET_FINALS[state.charset])
+                    self._charset = state.charset
+                if state is not self._state:
+                    rendition = self._rendition(state)
+                    if rendition != self._rendition(self._state):
+                        out.append(rendition)
+                    self._state = state
+                if ch is self.void:
+                    ch = self.fill
+                out.append(ch)
+            if end + 1 < self.width:
+                self._cursor = (end + 1, y)
+            else:
+                # Whether the cursor is still in the last column or has
+                # wrapped to the next line depends on the terminal.
+                self._cursor = None
+            start = end = x
+
+
+    def _moveCursor(self, x, y, out):
+        """
+        Add the shortest bytes to move the cursor of C{terminal} to C{(x, y)}
+        to C{out}.
+        """
+        if self._cursor == (x, y):
+            return
+        move = '\x1b[%d;%dH' % (y + 1, x + 1)
+        if self._cursor is not None and self._cursor[1] == y:
+            if x == 0:
+                move = '\r'
+            elif x > self._cursor[0]:
+                forward = '\x1b[%dC' % (x - self._cursor[0],)
+                if len(forward) < len(move):
+                    move = forward
+        out.append(move)
+        self._cursor = (x, y)
+
+
+    def _rendition(self, state):
+        """
+        Get the bytes to change the graphic rendition of C{terminal} to that of
+        C{state}, whatever it was.
+        """
+        attributes = state.toVT102()
+        if attributes:
+            return '\x1b[0;' + attributes[2:]
+        return '\x1b[0m'
+
+
+    def _currentFormattingState(self, default=False):
+        """
+        Get the L{_FormattingState} for characters drawn now.
+
+        @param default: If C{True}, get the one for characters drawn in the
+            initial graphic rendition and character set instead.
+        """
+        if default:
+            key = (insults.CS_US, False, False, False, False, WHITE, BLACK)
+        else:
+            rendition = self.graphicRendition
+            key = (self.charsets[self.activeCharset], rendition['bold'],
+                   rendition['underline'], rendition['blink'],
+                   rendition['reverseVideo'], rendition['foreground'],
+                   rendition['background'])
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = _FormattingState(*key)
+        return state
+
+
+    def _damageAll(self):
+        self._damaged.update(xrange(self.height))
+
+
+    def write(self, bytes):
+        """
+        Add the given bytes to the screen, interpreting any graphic rendition
+        escape sequences in them.
+        """
+        parts = _GRAPHIC_RENDITION.split(bytes)
+        self._writeText(parts[0])
+        for i in xrange(1, len(parts), 2):
+            self.selectGraphicRendition(*(parts[i] or '0').split(';'))
+            self._writeText(parts[i + 1])
+
+
+    def _writeText(self, bytes):
+        """
+        Add the given bytes to the screen a line at a time, rather than a
+        character at a time with L{insertAtCursor}, unless characters are
+        being inserted or a single shift is pending.
+        """
+        if (self.modes.get(insults.modes.IRM) or
+            'insertAtCursor' in self.__dict__):
+            TerminalBuffer.write(self, bytes)
+            return
+        state = self._currentFormattingState()
+        for part in _LINE_BREAK.split(bytes.replace('\n', '\r\n')):
+            if part == '\r':
+                self.x = 0
+            elif part == '\n':
+                self._scrollDown()
+            else:
+                part = part.translate(None, _NON_PRINTABLE)
+                while part:
+                    if self.x >= self.width:
+                        self.nextLine()
+                    n = min(len(part), self.width - self.x)
+                    self.lines[self.y][self.x:self.x + n] = [
+                        (b, state) for b in part[:n]]
+                    part = part[n:]
+                    self.x += n
+                    self._damaged.add(self.y)
+
+
+    def insertAtCursor(self, b):
+        TerminalBuffer.insertAtCursor(self, b)
+        self._damaged.add(self.y)
+
+
+    def selectGraphicRendition(self, *attributes):
+        TerminalBuffer.selectGraphicRendition(
+            self, *[int(a) if isinstance(a, str) and a.isdigit() else a
+                    for a in attributes])
+
+
+    def saveCursor(self):
+        self._savedCursor = (
+            self.x, self.y, dict(self.graphicRendition), self.activeCharset,
+            dict(self.charsets))
+
+
+    def restoreCursor(self):
+        (self.x, self.y, self.graphicRendition, self.activeCharset,
+         self.charsets) = self._savedCursor
+        del self._savedCursor
+
+
+    def _scrollDown(self):
+        if self.y + 1 >= self.height:
+            self._damageAll()
+        TerminalBuffer._scrollDown(self)
+
+
+    def _scrollUp(self):
+        if self.y < 1:
+            self._damageAll()
+        TerminalBuffer._scrollUp(self)
+
+
+    def eraseLine(self):
+        TerminalBuffer.eraseLine(self)
+        self._damaged.add(self.y)
+
+
+    def eraseToLineEnd(self):
+        TerminalBuffer.eraseToLineEnd(self)
+        self._damaged.add(self.y)
+
+
+    def eraseToLineBeginning(self):
+        TerminalBuffer.eraseToLineBeginning(self)
+        self._damaged.add(self.y)
+
+
+    def eraseDisplay(self):
+        TerminalBuffer.eraseDisplay(self)
+        self._damageAll()
+
+
+    def eraseToDisplayEnd(self):
+        TerminalBuffer.eraseToDisplayEnd(self)
+        self._damageAll()
+
+
+    def eraseToDisplayBeginning(self):
+        TerminalBuffer.eraseToDisplayBeginning(self)
+        self._damageAll()
+
+
+    def deleteCharacter(self, n=1):
+        TerminalBuffer.deleteCharacter(self, n)
+        self._damaged.add(self.y)
+
+
+    def insertLine(self, n=1):
+        TerminalBuffer.insertLine(self, n)
+        self._damageAll()
+
+
+    def deleteLine(self, n=1):
+        TerminalBuffer.deleteLine(self, n)
+        self._damageAll()
+
+
+
+# The final bytes of the escape sequences which select each character set.
+_CHARSET_FINALS = {
+    insults.CS_UK: 'A',
+    insults.CS_US: 'B',
+    insults.CS_DRAWING: '0',
+    insults.CS_ALTERNATE: '1',
+    insults.CS_ALTERNATE_SPECIAL: '2'}
+
+# Graphic rendition escape sequences, with their parameters grouped.
+_GRAPHIC_RENDITION = re.compile('\x1b\\[([0-9;]*)m')
+
+# Carriage returns and line feeds, which ScreenBuffer.write splits text at.
+_LINE_BREAK = re.compile('([\r\n])')
+
+# The bytes TerminalBuffer.insertAtCursor ignores.
+_NON_PRINTABLE = ''.join(
+    chr(i) for i in xrange(256) if chr(i) not in string.printable)
+
+# The longest run of unchanged characters ScreenBuffer.flush will write again
+# rather than move the cursor over; moving it forward takes at least four
+# bytes.
+_MAX_REWRITE = 3
+
+
+
 class ExpectationTimeout(Exception):
     pass
 
@@ -459,4 +808,5 @@ class ExpectableBuffer(TerminalBuffer):
         return d
 
 __all__ = [
-    'CharacterAttribute',  'TerminalBuffer', 'ExpectableBuffer']
+    'CharacterAttribute',  'TerminalBuffer', 'ExpectableBuffer',
+    'ScreenBuffer']
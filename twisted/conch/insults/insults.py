@@ -995,7 +995,20 @@ class ClientProtocol(protocol.Protocol):
                 handler.unhandledControlSequence('\x1b[' + buf + 'K')
 
         def H(self, proto, handler, buf):
-            handler.cursorHome()
+            if not buf:
+                handler.cursorHome()
+                return
+            try:
+                position = [int(n or '1') for n in buf.split(';')]
+            except ValueError:
+                position = []
+            if len(position) == 1:
+                position.append(1)
+            if len(position) != 2:
+                handler.unhandledControlSequence('\x1b[' + buf + 'H')
+            else:
+                line, column = position
+                handler.cursorPosition(column - 1, line - 1)
 
         def J(self, proto, handler, buf):
             if not buf:
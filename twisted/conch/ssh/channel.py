@@ -16,7 +16,8 @@ from twisted.python import log
 from twisted.internet import interfaces
 
 
-@implementer(interfaces.ITransport)
+@implementer(interfaces.ITransport, interfaces.IConsumer,
+             interfaces.IPushProducer)
 class SSHChannel(log.Logger):
     """
     A class that represents a multiplexed channel over an SSH connection.
@@ -48,9 +49,26 @@ class SSHChannel(log.Logger):
     @type localClosed: C{bool}
     @ivar remoteClosed: True if the other size isn't accepting more data.
     @type remoteClosed: C{bool}
+    @ivar producer: the producer registered with L{registerProducer}, or
+        C{None}.
+    @ivar streamingProducer: True if C{producer} is a push producer.
+    @type streamingProducer: C{bool}
+    @ivar highWaterMark: the number of bytes which may be buffered while the
+        remote window is full before C{producer} is paused.
+    @type highWaterMark: C{int}
+    @ivar receivingPaused: True if the channel has been paused with
+        L{pauseProducing}, so that nothing is added to the local window.
+    @type receivingPaused: C{bool}
     """
 
     name = None # only needed for client channels
+    producer = None
+    streamingProducer = False
+    highWaterMark = 2 ** 16
+    receivingPaused = False
+    _producerPaused = False
+    _pullingProducer = False
+    _pullAgain = False
 
     def __init__(self, localWindow = 0, localMaxPacket = 0,
                        remoteWindow = 0, remoteMaxPacket = 0,
@@ -110,15 +128,26 @@ class SSHChannel(log.Logger):
         if not self.areWriting and not self.closing:
             self.areWriting = True
             self.startWriting()
-        if self.buf:
-            b = self.buf
-            self.buf = ''
-            self.write(b)
-        if self.extBuf:
-            b = self.extBuf
-            self.extBuf = []
-            for (type, data) in b:
-                self.writeExtended(type, data)
+        # Only ask a pull producer for more once both buffers are flushed.
+        pulling, self._pullingProducer = self._pullingProducer, True
+        try:
+            if self.buf:
+                b = self.buf
+                self.buf = ''
+                self.write(b)
+            if self.extBuf:
+                b = self.extBuf
+                self.extBuf = []
+                for (type, data) in b:
+                    self.writeExtended(type, data)
+        finally:
+            self._pullingProducer = pulling
+        if self.producer is not None and self.areWriting:
+            if not self.streamingProducer:
+                self._resumePullProducer()
+            elif self._producerPaused:
+                self._producerPaused = False
+                self.producer.resumeProducing()
 
     def requestReceived(self, requestType, data):
         """
@@ -186,6 +215,7 @@ class SSHChannel(log.Logger):
         """
         if self.buf:
             self.buf += data
+            self._pauseProducer()
             return
         top = len(data)
         if top > self.remoteWindowLeft:
@@ -193,6 +223,7 @@ class SSHChannel(log.Logger):
                 data[self.remoteWindowLeft:])
             self.areWriting = 0
             self.stopWriting()
+            self._pauseProducer()
             top = self.remoteWindowLeft
         rmp = self.remoteMaxPacket
         write = self.conn.sendData
@@ -202,6 +233,7 @@ class SSHChannel(log.Logger):
         self.remoteWindowLeft -= top
         if self.closing and not self.buf:
             self.loseConnection() # try again
+        self._resumePullProducer()
 
     def writeExtended(self, dataType, data):
         """
@@ -217,12 +249,14 @@ class SSHChannel(log.Logger):
                 self.extBuf[-1][1] += data
             else:
                 self.extBuf.append([dataType, data])
+            self._pauseProducer()
             return
         if len(data) > self.remoteWindowLeft:
             data, self.extBuf = (data[:self.remoteWindowLeft],
                                 [[dataType, data[self.remoteWindowLeft:]]])
             self.areWriting = 0
             self.stopWriting()
+            self._pauseProducer()
         while len(data) > self.remoteMaxPacket:
             self.conn.sendExtendedData(self, dataType,
                                              data[:self.remoteMaxPacket])
@@ -233,6 +267,7 @@ class SSHChannel(log.Logger):
             self.remoteWindowLeft -= len(data)
         if self.closing:
             self.loseConnection() # try again
+        self._resumePullProducer()
 
     def writeSequence(self, data):
         """
@@ -243,6 +278,93 @@ class SSHChannel(log.Logger):
         """
         self.write(''.join(data))
 
+    def registerProducer(self, producer, streaming):
+        """
+        Register a producer to write to the channel.  A push producer is
+        paused once more than C{highWaterMark} bytes are buffered because the
+        remote window is full, and resumed when the remote side has added
+        enough to the window for all of them to be sent.  A pull producer is
+        asked for more data as soon as everything it has written has been
+        sent, and otherwise once the remote side has made room in the window
+        for all of it.  The producer is stopped when the channel is closed.
+
+        @type streaming: C{bool}
+        """
+        if self.producer is not None:
+            raise RuntimeError(
+                "Cannot register producer %s, because producer %s was never "
+                "unregistered." % (producer, self.producer))
+        self.producer = producer
+        self.streamingProducer = streaming
+        self._producerPaused = False
+        if not streaming:
+            self._resumePullProducer()
+
+    def unregisterProducer(self):
+        """
+        Unregister the producer registered with L{registerProducer}.
+        """
+        self.producer = None
+
+    def _resumePullProducer(self):
+        """
+        Ask the registered pull producer, if there is one, for more data for
+        as long as everything it writes is sent without being buffered.
+        """
+        if self._pullingProducer:
+            # The producer wrote while being asked for more, so the loop
+            # below asks it again.
+            self._pullAgain = True
+            return
+        self._pullingProducer = True
+        try:
+            while (self.producer is not None and not self.streamingProducer
+                   and self.areWriting and not self.closing
+                   and not self.buf and not self.extBuf):
+                self._pullAgain = False
+                self.producer.resumeProducing()
+                if not self._pullAgain:
+                    break
+        finally:
+            self._pullingProducer = False
+
+    def _pauseProducer(self):
+        """
+        Pause the registered push producer, if there is one, if more than
+        C{highWaterMark} bytes are buffered.
+        """
+        if (self.producer is None or not self.streamingProducer
+                or self._producerPaused):
+            return
+        buffered = len(self.buf or '')
+        for (type, data) in self.extBuf:
+            buffered += len(data)
+        if buffered > self.highWaterMark:
+            self._producerPaused = True
+            self.producer.pauseProducing()
+
+    def pauseProducing(self):
+        """
+        Stop adding to the local window, so that the remote side stops
+        sending data once it has used up what is left of it.  Whatever is
+        consuming the data from this channel can pause it when it has more
+        than it can handle.
+        """
+        self.receivingPaused = True
+
+    def resumeProducing(self):
+        """
+        Add to the local window again, if enough of it has been used.
+        """
+        self.receivingPaused = False
+        self.conn.replenishWindow(self)
+
+    def stopProducing(self):
+        """
+        Close the channel.
+        """
+        self.loseConnection()
+
     def loseConnection(self):
         """
         Close the channel if there is no buferred data.  Otherwise, note the
@@ -234,12 +234,8 @@ class SSHConnection(service.SSHService):
             #packet = packet[:channel.localWindowLeft+4]
         data = common.getNS(packet[4:])[0]
         channel.localWindowLeft -= dataLength
-        if channel.localWindowLeft < channel.localWindowSize // 2:
-            self.adjustWindow(channel, channel.localWindowSize - \
-                                       channel.localWindowLeft)
-            #log.msg('local window left: %s/%s' % (channel.localWindowLeft,
-            #                                    channel.localWindowSize))
         log.callWithLogger(channel, channel.dataReceived, data)
+        self.replenishWindow(channel)
 
     def ssh_CHANNEL_EXTENDED_DATA(self, packet):
         """
@@ -263,10 +259,8 @@ class SSHConnection(service.SSHService):
             return
         data = common.getNS(packet[8:])[0]
         channel.localWindowLeft -= dataLength
-        if channel.localWindowLeft < channel.localWindowSize // 2:
-            self.adjustWindow(channel, channel.localWindowSize -
-                                       channel.localWindowLeft)
         log.callWithLogger(channel, channel.extReceived, typeCode, data)
+        self.replenishWindow(channel)
 
     def ssh_CHANNEL_EOF(self, packet):
         """
@@ -455,6 +449,22 @@ class SSHConnection(service.SSHService):
             channel.localWindowLeft, channel.id))
         channel.localWindowLeft += bytesToAdd
 
+    def replenishWindow(self, channel):
+        """
+        Add what the other side has used of the local window of a channel back
+        to it in one message, once less than half of the window is left,
+        unless the channel has been paused.  This is called after each data
+        message the channel receives, so that a channel which is paused while
+        handling the data is not sent more.
+
+        @type channel:      subclass of L{SSHChannel}
+        """
+        if channel.receivingPaused or channel.localClosed:
+            return
+        if channel.localWindowLeft < channel.localWindowSize // 2:
+            self.adjustWindow(channel, channel.localWindowSize -
+                                       channel.localWindowLeft)
+
     def sendData(self, channel, data):
         """
         Send data to a channel.  This should not normally be used: instead use
@@ -600,6 +610,9 @@ class SSHConnection(service.SSHService):
             for d in self.deferreds.setdefault(channel.id, []):
                 d.errback(error.ConchError("Channel closed."))
             del self.deferreds[channel.id][:]
+            if channel.producer is not None:
+                producer, channel.producer = channel.producer, None
+                producer.stopProducing()
             log.callWithLogger(channel, channel.closed)
 
 MSG_GLOBAL_REQUEST = 80
@@ -11,49 +11,84 @@ from zope.interface import implementer
 from twisted.conch.interfaces import ISFTPServer, ISFTPFile
 from twisted.conch.ssh.common import NS, getNS
 from twisted.internet import defer, protocol
+from twisted.internet.interfaces import IConsumer, IPushProducer
 from twisted.python import failure, log
 
 
 
 
 class FileTransferBase(protocol.Protocol):
+    """
+    @ivar _bufOffset: The offset in C{buf} of the first packet which has not
+        been dispatched yet.
+    @ivar _paused: Whether dispatching received packets is paused.
+    """
 
     versions = (3, )
 
     packetTypes = {}
 
+    _bufOffset = 0
+    _paused = False
+
     def __init__(self):
         self.buf = ''
         self.otherVersion = None # this gets set
 
-    def sendPacket(self, kind, data):
-        self.transport.write(struct.pack('!LB', len(data)+1, kind) + data)
+    def sendPacket(self, kind, data, header=''):
+        """
+        Send a packet to the other side.
+
+        @param kind: The type of the packet.
+        @type kind: C{int}
+
+        @param data: The payload of the packet.
+        @type data: C{str}
+
+        @param header: Bytes to send before C{data}.  Passing them separately
+            lets a large C{data} be copied only once.
+        @type header: C{str}
+        """
+        self.transport.write(''.join([
+            struct.pack('!LB', len(header) + len(data) + 1, kind),
+            header, data]))
 
     def dataReceived(self, data):
         self.buf += data
-        while len(self.buf) > 5:
-            length, kind = struct.unpack('!LB', self.buf[:5])
-            if len(self.buf) < 4 + length:
-                return
-            data, self.buf = self.buf[5:4+length], self.buf[4+length:]
-            packetType = self.packetTypes.get(kind, None)
-            if not packetType:
-                log.msg('no packet type for', kind)
-                continue
-            f = getattr(self, 'packet_%s' % packetType, None)
-            if not f:
-                log.msg('not implemented: %s' % packetType)
-                log.msg(repr(data[4:]))
-                reqId, = struct.unpack('!L', data[:4])
-                self._sendStatus(reqId, FX_OP_UNSUPPORTED,
-                                 "don't understand %s" % packetType)
-                #XXX not implemented
-                continue
-            try:
-                f(data)
-            except Exception:
-                log.err()
-                continue
+        # Packets are taken from buf by offset, so that many packets received
+        # at once are not each copied along with everything after them.
+        while not self._paused:
+            offset = self._bufOffset
+            if len(self.buf) - offset <= 5:
+                break
+            length, kind = struct.unpack('!LB', self.buf[offset:offset + 5])
+            if len(self.buf) - offset < 4 + length:
+                break
+            data = self.buf[offset + 5:offset + 4 + length]
+            self._bufOffset = offset + 4 + length
+            self._dispatchPacket(kind, data)
+        if self._bufOffset:
+            self.buf = self.buf[self._bufOffset:]
+            self._bufOffset = 0
+
+    def _dispatchPacket(self, kind, data):
+        packetType = self.packetTypes.get(kind, None)
+        if not packetType:
+            log.msg('no packet type for', kind)
+            return
+        f = getattr(self, 'packet_%s' % packetType, None)
+        if not f:
+            log.msg('not implemented: %s' % packetType)
+            log.msg(repr(data[4:]))
+            reqId, = struct.unpack('!L', data[:4])
+            self._sendStatus(reqId, FX_OP_UNSUPPORTED,
+                             "don't understand %s" % packetType)
+            #XXX not implemented
+            return
+        try:
+            f(data)
+        except Exception:
+            log.err()
 
 
     def _parseAttributes(self, data):
@@ -114,7 +149,18 @@ class FileTransferBase(protocol.Protocol):
             flags |= FILEXFER_ATTR_EXTENDED
         return struct.pack('!L', flags) + data
 
+@implementer(IPushProducer)
 class FileTransferServer(FileTransferBase):
+    """
+    An SFTP server.
+
+    If its transport is an L{IConsumer}, such as an L{SSHChannel}, the server
+    registers with it as a streaming producer and stops handling requests
+    while it is paused, so that replies are not buffered without limit when
+    the client reads them more slowly than the server can send them.  If its
+    transport is also an L{IPushProducer}, it is paused too, so that the
+    client is not given the window to send more requests in the meantime.
+    """
 
     def __init__(self, data=None, avatar=None):
         FileTransferBase.__init__(self)
@@ -122,6 +168,25 @@ class FileTransferServer(FileTransferBase):
         self.openFiles = {}
         self.openDirs = {}
 
+    def connectionMade(self):
+        if IConsumer.providedBy(self.transport):
+            self.transport.registerProducer(self, True)
+
+    def pauseProducing(self):
+        self._paused = True
+        if IPushProducer.providedBy(self.transport):
+            self.transport.pauseProducing()
+
+    def resumeProducing(self):
+        if self._paused:
+            self._paused = False
+            self.dataReceived('')
+            if not self._paused and IPushProducer.providedBy(self.transport):
+                self.transport.resumeProducing()
+
+    def stopProducing(self):
+        self._paused = True
+
     def packet_INIT(self, data):
         version ,= struct.unpack('!L', data[:4])
         self.version = min(list(self.versions) + [version])
@@ -199,7 +264,9 @@ class FileTransferServer(FileTransferBase):
     def _cbRead(self, result, requestId):
         if result == '': # python's read will return this for EOF
             raise EOFError()
-        self.sendPacket(FXP_DATA, requestId + NS(result))
+        # Pack the header on its own so that the data is only copied once.
+        self.sendPacket(FXP_DATA, result,
+                        requestId + struct.pack('!L', len(result)))
 
     def packet_WRITE(self, data):
         requestId = data[:4]
@@ -460,6 +527,8 @@ class FileTransferServer(FileTransferBase):
         for (dirObj, dirIter) in self.openDirs.values():
             dirObj.close()
         self.openDirs = {}
+        if IConsumer.providedBy(self.transport):
+            self.transport.unregisterProducer()
 
 
 
@@ -529,6 +598,59 @@ class FileTransferClient(FileTransferBase):
         self.wasAFile[d] = (1, filename) # HACK
         return d
 
+    def downloadFile(self, filename, consumer, chunkSize=32768,
+                     maxRequests=64):
+        """
+        Read a whole file and write its contents to a consumer.
+
+        Several READ requests are kept outstanding at once, so that the
+        transfer is not limited to one chunk per round trip.  The number of
+        outstanding requests starts at one and grows with each full reply up
+        to C{maxRequests}.  The download is registered with C{consumer} as a
+        streaming producer, so pausing it stops new requests being made.
+
+        This method returns a L{Deferred} that is called back with the number
+        of bytes written to C{consumer} once the file has been read and
+        closed.  Cancelling it stops the download.
+
+        @param filename: the name of the file to read as a string.
+        @param consumer: the L{IConsumer} to write the file's contents to.
+        @param chunkSize: the number of bytes to ask for with each request.
+        @param maxRequests: the most requests to have outstanding at once.
+        """
+        d = self.openFile(filename, FXF_READ, {})
+        def cbOpened(clientFile):
+            download = _Download(clientFile, consumer, chunkSize, maxRequests)
+            return _closeAfter(download.start(), clientFile)
+        return d.addCallback(cbOpened)
+
+    def uploadFile(self, filename, producer, chunkSize=32768, maxRequests=64):
+        """
+        Write the data from a producer to a file, replacing its contents.
+
+        The producer is like L{twisted.web.iweb.IBodyProducer}: its
+        C{startProducing} method is called with an L{IConsumer} and returns
+        a L{Deferred} which fires when it has written all of its data, and it
+        is paused once C{maxRequests} WRITE requests of up to C{chunkSize}
+        bytes each are outstanding.  As with L{downloadFile}, the number of
+        outstanding requests starts at one and grows with each reply.
+
+        This method returns a L{Deferred} that is called back with the number
+        of bytes written once they have all been acknowledged and the file
+        has been closed.  Cancelling it stops the producer.
+
+        @param filename: the name of the file to write as a string.
+        @param producer: the producer of the data to write.
+        @param chunkSize: the largest number of bytes to send with each
+            request.
+        @param maxRequests: the most requests to have outstanding at once.
+        """
+        d = self.openFile(filename, FXF_WRITE | FXF_CREAT | FXF_TRUNC, {})
+        def cbOpened(clientFile):
+            upload = _Upload(clientFile, chunkSize, maxRequests)
+            return _closeAfter(upload.start(producer), clientFile)
+        return d.addCallback(cbOpened)
+
     def removeFile(self, filename):
         """
         Remove the given file.
@@ -832,6 +954,342 @@ class ClientDirectory:
         return reason
 
 
+
+def _closeAfter(d, clientFile):
+    """
+    Close C{clientFile} once C{d} has fired, and pass on its result.
+
+    If closing the file fails, the result is that failure, unless C{d}
+    failed first.
+    """
+    def close(result):
+        closed = clientFile.close()
+        def ebClose(reason):
+            if isinstance(result, failure.Failure):
+                return result
+            return reason
+        return closed.addCallbacks(lambda ignored: result, ebClose)
+    return d.addBoth(close)
+
+
+
+@implementer(IPushProducer)
+class _Download(object):
+    """
+    Read the whole of a file with several READ requests outstanding at once
+    and write its contents to a consumer, in order.
+
+    Replies which arrive before those for earlier parts of the file are kept
+    until they can be written.  A short reply means the rest of that chunk is
+    asked for again, and halves the number of requests to keep outstanding.
+
+    @ivar _file: The L{ClientFile} being read.
+    @ivar _consumer: The L{IConsumer} the contents are written to, until
+        the download finishes.
+    @ivar _chunkSize: The number of bytes asked for by each new request.
+    @ivar _maxRequests: The most requests to have outstanding.
+    @ivar _window: The number of requests to have outstanding now.
+    @ivar _outstanding: The number of requests awaiting replies.
+    @ivar _nextOffset: The offset of the next new request.
+    @ivar _written: The number of bytes written to C{_consumer}.
+    @ivar _received: A C{dict} mapping offsets to the data read from them
+        which cannot be written yet.
+    @ivar _eof: The offset of the end of the file once a request has found
+        it, otherwise C{None}.
+    @ivar _paused: Whether C{_consumer} has paused the download.
+    @ivar _failure: The L{failure.Failure} which stopped the download, or
+        C{None}.
+    @ivar _finished: The L{defer.Deferred} returned by L{start}.
+    """
+
+    def __init__(self, clientFile, consumer, chunkSize, maxRequests):
+        self._file = clientFile
+        self._consumer = consumer
+        self._chunkSize = chunkSize
+        self._maxRequests = maxRequests
+        self._window = 1
+        self._outstanding = 0
+        self._nextOffset = 0
+        self._written = 0
+        self._received = {}
+        self._eof = None
+        self._paused = False
+        self._failure = None
+        self._finished = defer.Deferred(lambda d: self.stopProducing())
+
+
+    def start(self):
+        """
+        Start reading the file.
+
+        @return: A L{defer.Deferred} which fires with the number of bytes
+            written to the consumer.
+        """
+        self._consumer.registerProducer(self, True)
+        self._fill()
+        return self._finished
+
+
+    def _fill(self):
+        """
+        Make new requests until C{_window} are outstanding.
+        """
+        while (not self._paused and self._failure is None
+               and self._eof is None and self._outstanding < self._window):
+            offset = self._nextOffset
+            self._nextOffset += self._chunkSize
+            self._read(offset, self._chunkSize)
+
+
+    def _read(self, offset, length):
+        self._outstanding += 1
+        d = self._file.readChunk(offset, length)
+        d.addCallbacks(self._cbRead, self._ebRead,
+                       callbackArgs=(offset, length), errbackArgs=(offset,))
+
+
+    def _cbRead(self, data, offset, length):
+        self._outstanding -= 1
+        if not data:
+            self._foundEOF(offset)
+        else:
+            self._received[offset] = data
+            if len(data) < length:
+                self._window = max(1, self._window // 2)
+                self._read(offset + len(data), length - len(data))
+            elif self._window < self._maxRequests:
+                self._window += 1
+        self._deliver()
+        self._fill()
+        self._checkFinished()
+
+
+    def _ebRead(self, reason, offset):
+        self._outstanding -= 1
+        if reason.check(EOFError):
+            self._foundEOF(offset)
+        elif self._failure is None:
+            self._failure = reason
+        self._deliver()
+        self._checkFinished()
+
+
+    def _foundEOF(self, offset):
+        if self._eof is None or offset < self._eof:
+            self._eof = offset
+
+
+    def _deliver(self):
+        """
+        Write the data received for the offset following what has been
+        written so far, if any.
+        """
+        while self._written in self._received and self._failure is None:
+            data = self._received.pop(self._written)
+            self._written += len(data)
+            self._consumer.write(data)
+
+
+    def _checkFinished(self):
+        """
+        Fire C{_finished} once there are no outstanding requests and either
+        the whole file has been written or the download has failed.
+        """
+        if self._outstanding or self._consumer is None:
+            return
+        if self._failure is None and self._written != self._eof:
+            return
+        self._received.clear()
+        consumer, self._consumer = self._consumer, None
+        consumer.unregisterProducer()
+        if not self._finished.called:
+            if self._failure is None:
+                self._finished.callback(self._written)
+            else:
+                self._finished.errback(self._failure)
+
+
+    def pauseProducing(self):
+        self._paused = True
+
+
+    def resumeProducing(self):
+        self._paused = False
+        self._fill()
+
+
+    def stopProducing(self):
+        """
+        Stop making requests, and fail with L{defer.CancelledError} once the
+        outstanding ones have been answered.
+        """
+        if self._failure is None:
+            self._failure = failure.Failure(defer.CancelledError())
+        self._checkFinished()
+
+
+
+@implementer(IConsumer)
+class _Upload(object):
+    """
+    Write the data from a producer to a file with several WRITE requests
+    outstanding at once.
+
+    The producer is paused while C{_window} requests are outstanding, and
+    stopped if one of them fails.
+
+    @ivar _file: The L{ClientFile} being written.
+    @ivar _chunkSize: The largest number of bytes to send with each request.
+    @ivar _maxRequests: The most requests to have outstanding.
+    @ivar _window: The number of requests to have outstanding now.
+    @ivar _outstanding: The number of requests awaiting replies.
+    @ivar _offset: The offset of the next request.
+    @ivar _producer: The producer which is writing, or C{None}.
+    @ivar _streaming: Whether C{_producer} is a push producer.
+    @ivar _paused: Whether C{_producer} has been paused.
+    @ivar _producerDone: Whether the producer given to L{start} has
+        finished.
+    @ivar _failure: The L{failure.Failure} which stopped the upload, or
+        C{None}.
+    @ivar _finished: The L{defer.Deferred} returned by L{start}.
+    """
+
+    def __init__(self, clientFile, chunkSize, maxRequests):
+        self._file = clientFile
+        self._chunkSize = chunkSize
+        self._maxRequests = maxRequests
+        self._window = 1
+        self._outstanding = 0
+        self._offset = 0
+        self._producer = None
+        self._streaming = True
+        self._paused = False
+        self._producerDone = False
+        self._failure = None
+        self._finished = defer.Deferred(self._cancel)
+
+
+    def start(self, producer):
+        """
+        Start writing the data from C{producer}.
+
+        @return: A L{defer.Deferred} which fires with the number of bytes
+            written to the file.
+        """
+        self._producer = producer
+        d = producer.startProducing(self)
+        d.addCallbacks(self._producerFinished, self._producerFailed)
+        return self._finished
+
+
+    def registerProducer(self, producer, streaming):
+        self._producer = producer
+        self._streaming = streaming
+        self._paused = False
+        if not streaming:
+            producer.resumeProducing()
+
+
+    def unregisterProducer(self):
+        self._producer = None
+
+
+    def write(self, data):
+        if self._failure is not None:
+            return
+        for i in range(0, len(data), self._chunkSize):
+            self._write(data[i:i + self._chunkSize])
+        if self._outstanding >= self._window:
+            self._pause()
+
+
+    def _write(self, chunk):
+        offset = self._offset
+        self._offset += len(chunk)
+        self._outstanding += 1
+        d = self._file.writeChunk(offset, chunk)
+        d.addCallbacks(self._cbWrite, self._ebWrite)
+
+
+    def _cbWrite(self, ignored):
+        self._outstanding -= 1
+        if self._window < self._maxRequests:
+            self._window += 1
+        if self._outstanding < self._window:
+            self._resume()
+        self._checkFinished()
+
+
+    def _ebWrite(self, reason):
+        self._outstanding -= 1
+        self._stop(reason)
+        self._checkFinished()
+
+
+    def _pause(self):
+        if self._producer is not None and self._streaming and not self._paused:
+            self._paused = True
+            self._producer.pauseProducing()
+
+
+    def _resume(self):
+        if self._producer is None or self._failure is not None:
+            return
+        if not self._streaming:
+            self._producer.resumeProducing()
+        elif self._paused:
+            self._paused = False
+            self._producer.resumeProducing()
+
+
+    def _stop(self, reason):
+        """
+        Stop the producer because of C{reason}, unless it has already been
+        stopped.
+        """
+        if self._failure is None:
+            self._failure = reason
+            if self._producer is not None:
+                producer, self._producer = self._producer, None
+                producer.stopProducing()
+            # A stopped producer never fires the Deferred returned by its
+            # startProducing method.
+            self._producerDone = True
+
+
+    def _producerFinished(self, ignored):
+        self._producerDone = True
+        self._producer = None
+        self._checkFinished()
+
+
+    def _producerFailed(self, reason):
+        self._producerDone = True
+        self._producer = None
+        if self._failure is None:
+            self._failure = reason
+        self._checkFinished()
+
+
+    def _checkFinished(self):
+        """
+        Fire C{_finished} once the producer has finished and there are no
+        outstanding requests.
+        """
+        if not self._producerDone or self._outstanding:
+            return
+        if not self._finished.called:
+            if self._failure is None:
+                self._finished.callback(self._offset)
+            else:
+                self._finished.errback(self._failure)
+
+
+    def _cancel(self, d):
+        self._stop(failure.Failure(defer.CancelledError()))
+
+
+
 class SFTPError(Exception):
 
     def __init__(self, errorCode, errorMessage, lang = ''):
@@ -39,6 +39,7 @@ class SSHListenForwardingChannel(channel.SSHChannel):
             b = self.client.buf[1:]
             self.write(b)
         self.client.buf = ''
+        _connectProducers(self, self.client.transport)
 
     def openFailed(self, reason):
         self.closed()
@@ -124,6 +125,7 @@ class SSHConnectForwardingChannel(channel.SSHChannel):
         if self.client.buf[1:]:
             self.write(self.client.buf[1:])
         self.client.buf = ''
+        _connectProducers(self, self.client.transport)
 
 
     def _close(self, reason):
@@ -160,6 +162,23 @@ class SSHConnectForwardingChannel(channel.SSHChannel):
 
 
 
+def _connectProducers(channel, transport):
+    """
+    Register C{channel} and C{transport}, which each write what they receive
+    to the other, as producers with each other.  When the SSH peer reads the
+    channel more slowly than C{transport} receives data, C{transport} is
+    paused, and when C{transport} cannot send what the channel receives fast
+    enough, the channel stops adding to its window, so that neither buffers
+    the data without limit.
+
+    @type channel: L{channel.SSHChannel}
+    @type transport: L{twisted.internet.interfaces.ITCPTransport}
+    """
+    channel.registerProducer(transport, True)
+    transport.registerProducer(channel, True)
+
+
+
 def openConnectForwardingClient(remoteWindow, remoteMaxPacket, data, avatar):
     remoteHP, origHP = unpackOpen_direct_tcpip(data)
     return SSHConnectForwardingChannel(remoteHP, 
@@ -183,12 +183,14 @@ SUPPORTED_SIGNALS = ["ABRT", "ALRM", "FPE", "HUP", "ILL", "INT", "KILL",
 
 
 
-@implementer(interfaces.ITransport)
+@implementer(interfaces.ITransport, interfaces.IConsumer,
+             interfaces.IPushProducer)
 class SSHSessionProcessProtocol(protocol.ProcessProtocol):
     """I am both an L{IProcessProtocol} and an L{ITransport}.
 
     I am a transport to the remote endpoint and a process protocol to the
-    local subsystem.
+    local subsystem.  Pausing me pauses my session, so that the remote
+    endpoint is not given more window while the subsystem is not reading.
     """
 
     # once initialized, a dictionary mapping signal values to strings
@@ -299,6 +301,44 @@ class SSHSessionProcessProtocol(protocol.ProcessProtocol):
         self.session.write(''.join(seq))
 
 
+    def registerProducer(self, producer, streaming):
+        """
+        Register a producer with my session, so that it is paused while the
+        session's remote window is full.
+        """
+        self.session.registerProducer(producer, streaming)
+
+
+    def unregisterProducer(self):
+        """
+        Unregister the producer from my session.
+        """
+        self.session.unregisterProducer()
+
+
+    def pauseProducing(self):
+        """
+        Pause my session, so that no more window is given to the remote
+        endpoint until I am resumed.
+        """
+        self.session.pauseProducing()
+
+
+    def resumeProducing(self):
+        """
+        Resume my session, giving back to the remote endpoint the window it
+        used while I was paused.
+        """
+        self.session.resumeProducing()
+
+
+    def stopProducing(self):
+        """
+        Close my session.
+        """
+        self.session.loseConnection()
+
+
     def loseConnection(self):
         self.session.loseConnection()
 
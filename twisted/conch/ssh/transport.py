@@ -20,6 +20,26 @@ import hmac
 
 # external library imports
 from Crypto import Util
+from Crypto.Util import Counter
+
+try:
+    from cryptography.exceptions import InvalidSignature, InvalidTag
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:
+    AESGCM = None
+
+try:
+    from cryptography.hazmat.primitives.poly1305 import Poly1305
+except ImportError:
+    Poly1305 = None
+
+_aeadCiphers = []
+if AESGCM is not None:
+    _aeadCiphers.extend(['aes256-gcm@openssh.com', 'aes128-gcm@openssh.com'])
+    if Poly1305 is not None and default_backend().poly1305_supported():
+        _aeadCiphers.append('chacha20-poly1305@openssh.com')
 
 # twisted imports
 from twisted.internet import protocol, defer
@@ -85,8 +105,30 @@ class _MACParams(tuple):
     public APIs.
 
     @ivar key: The HMAC key which will be used.
+
+    @ivar innerHash: A digest object which has been given the inner pad, to
+        be copied for each MAC instead of setting up the HMAC again.
+
+    @ivar outerHash: Like C{innerHash}, but given the outer pad.
     """
 
+    def digest(self, seqid, data):
+        """
+        Compute the MAC of a packet.
+
+        @param seqid: the sequence ID of the packet
+        @type seqid: C{int}
+        @param data: the packet
+        @type data: C{str}
+        @rtype: C{str}
+        """
+        inner = self.innerHash.copy()
+        inner.update(struct.pack('>L', seqid))
+        inner.update(data)
+        outer = self.outerHash.copy()
+        outer.update(inner.digest())
+        return outer.digest()
+
 
 
 class SSHTransportBase(protocol.Protocol):
@@ -133,6 +175,10 @@ class SSHTransportBase(protocol.Protocol):
         version string from the other side.
 
     @ivar buf: Data we've received but hasn't been parsed into a packet.
+        Once the version string has been received this is a C{bytearray}
+        which L{dataReceived} appends to, and the packets at its start which
+        have been parsed are only removed once all of the received data has
+        been handled.
 
     @ivar outgoingPacketSequence: the sequence number of the next packet we
         will send.
@@ -188,6 +234,9 @@ class SSHTransportBase(protocol.Protocol):
         decrypting data twice, the first bytes are decrypted and stored until
         the whole packet is available.
 
+    @ivar _bufOffset: The offset in C{buf} of the first byte which has not
+        been parsed into a packet yet.
+
     @ivar _keyExchangeState: The current protocol state with respect to key
         exchange.  This is either C{_KEY_EXCHANGE_NONE} if no key exchange is
         in progress (and returns to this value after any key exchange
@@ -210,10 +259,10 @@ class SSHTransportBase(protocol.Protocol):
     comment = ''
     ourVersionString = ('SSH-' + protocolVersion + '-' + version + ' '
             + comment).strip()
-    supportedCiphers = ['aes256-ctr', 'aes256-cbc', 'aes192-ctr', 'aes192-cbc',
-                        'aes128-ctr', 'aes128-cbc', 'cast128-ctr',
-                        'cast128-cbc', 'blowfish-ctr', 'blowfish-cbc',
-                        '3des-ctr', '3des-cbc'] # ,'none']
+    supportedCiphers = _aeadCiphers + [
+        'aes256-ctr', 'aes256-cbc', 'aes192-ctr', 'aes192-cbc', 'aes128-ctr',
+        'aes128-cbc', 'cast128-ctr', 'cast128-cbc', 'blowfish-ctr',
+        'blowfish-cbc', '3des-ctr', '3des-cbc'] # ,'none']
     supportedMACs = ['hmac-sha1', 'hmac-md5'] # , 'none']
     # both of the above support 'none', but for security are disabled by
     # default.  to enable them, subclass this class and add it, or do:
@@ -227,6 +276,7 @@ class SSHTransportBase(protocol.Protocol):
     isClient = False
     gotVersion = False
     buf = ''
+    _bufOffset = 0
     outgoingPacketSequence = 0
     incomingPacketSequence = 0
     outgoingCompression = None
@@ -343,24 +393,38 @@ class SSHTransportBase(protocol.Protocol):
                 self._blockedByKeyExchange.append((messageType, payload))
                 return
 
-        payload = chr(messageType) + payload
         if self.outgoingCompression:
-            payload = (self.outgoingCompression.compress(payload)
+            payload = (self.outgoingCompression.compress(
+                           chr(messageType) + payload)
                        + self.outgoingCompression.flush(2))
+            messageTypeByte = ''
+        else:
+            # Keep the message type apart so that the payload is only copied
+            # once, into the packet.
+            messageTypeByte = chr(messageType)
+        aead = self.currentEncryptions.outAEAD
         bs = self.currentEncryptions.encBlockSize
         # 4 for the packet length and 1 for the padding length
-        totalSize = 5 + len(payload)
-        lenPad = bs - (totalSize % bs)
+        totalSize = 5 + len(messageTypeByte) + len(payload)
+        if aead is not None:
+            # The packet length is not encrypted by an AEAD cipher, so it
+            # does not count towards the block size.
+            lenPad = bs - ((totalSize - 4) % bs)
+        else:
+            lenPad = bs - (totalSize % bs)
         if lenPad < 4:
             lenPad = lenPad + bs
-        packet = (struct.pack('!LB',
-                              totalSize + lenPad - 4, lenPad) +
-                  payload + randbytes.secureRandom(lenPad))
-        encPacket = (
-            self.currentEncryptions.encrypt(packet) +
-            self.currentEncryptions.makeMAC(
-                self.outgoingPacketSequence, packet))
-        self.transport.write(encPacket)
+        packet = ''.join([
+            struct.pack('!LB', totalSize + lenPad - 4, lenPad),
+            messageTypeByte, payload, randbytes.secureRandom(lenPad)])
+        if aead is not None:
+            self.transport.write(
+                aead.encryptPacket(self.outgoingPacketSequence, packet))
+        else:
+            self.transport.writeSequence([
+                self.currentEncryptions.encrypt(packet),
+                self.currentEncryptions.makeMAC(
+                    self.outgoingPacketSequence, packet)])
         self.outgoingPacketSequence += 1
 
 
@@ -371,11 +435,40 @@ class SSHTransportBase(protocol.Protocol):
 
         @rtype: C{str}/C{None}
         """
+        packet = self._getPacket()
+        self._compactBuffer()
+        return packet
+
+
+    def _compactBuffer(self):
+        """
+        Remove the packets which have been parsed from the start of C{buf}.
+        """
+        if self._bufOffset:
+            self.buf = self.buf[self._bufOffset:]
+            self._bufOffset = 0
+
+
+    def _getPacket(self):
+        """
+        Like L{getPacket}, but leave the packet in C{buf} and only advance
+        C{_bufOffset} past it, so that many packets can be parsed out of the
+        buffer without copying the data which follows each of them.
+
+        @rtype: C{str}/C{None}
+        """
+        buf = self.buf
+        offset = self._bufOffset
+        available = len(buf) - offset
+        aead = self.currentEncryptions.inAEAD
+        if aead is not None:
+            return self._getAEADPacket(aead, buf, offset, available)
         bs = self.currentEncryptions.decBlockSize
         ms = self.currentEncryptions.verifyDigestSize
-        if len(self.buf) < bs: return # not enough data
+        if available < bs: return # not enough data
         if not hasattr(self, 'first'):
-            first = self.currentEncryptions.decrypt(self.buf[:bs])
+            first = self.currentEncryptions.decrypt(
+                str(buffer(buf, offset, bs)))
         else:
             first = self.first
             del self.first
@@ -384,7 +477,7 @@ class SSHTransportBase(protocol.Protocol):
             self.sendDisconnect(DISCONNECT_PROTOCOL_ERROR,
                                 'bad packet length %s' % packetLen)
             return
-        if len(self.buf) < packetLen + 4 + ms:
+        if available < packetLen + 4 + ms:
             self.first = first
             return # not enough packet
         if(packetLen + 4) % bs != 0:
@@ -393,19 +486,78 @@ class SSHTransportBase(protocol.Protocol):
                 'bad packet mod (%i%%%i == %i)' % (packetLen + 4, bs,
                                                    (packetLen + 4) % bs))
             return
-        encData, self.buf = self.buf[:4 + packetLen], self.buf[4 + packetLen:]
-        packet = first + self.currentEncryptions.decrypt(encData[bs:])
+        end = offset + 4 + packetLen
+        self._bufOffset = end + ms
+        # Decrypting a buffer copies the rest of the packet out of buf only
+        # once, except for the none cipher, which gives the buffer back.
+        packet = first + str(self.currentEncryptions.decrypt(
+            buffer(buf, offset + bs, end - offset - bs)))
         if len(packet) != 4 + packetLen:
             self.sendDisconnect(DISCONNECT_PROTOCOL_ERROR,
                                 'bad decryption')
             return
         if ms:
-            macData, self.buf = self.buf[:ms], self.buf[ms:]
+            macData = str(buffer(buf, end, ms))
             if not self.currentEncryptions.verify(self.incomingPacketSequence,
                                                   packet, macData):
                 self.sendDisconnect(DISCONNECT_MAC_ERROR, 'bad MAC')
                 return
-        payload = packet[5:-paddingLen]
+        return self._decompressPayload(packet[5:-paddingLen])
+
+
+    def _getAEADPacket(self, aead, buf, offset, available):
+        """
+        Parse a packet out of C{buf} which was encrypted and authenticated
+        with an AEAD cipher.  The packet length is the only part of the packet
+        which can be used before it has all been received, and there is no
+        separate MAC to check.
+
+        @param aead: The cipher, as set up by L{SSHCiphers.setKeys}.
+        @param buf: The buffer to parse the packet from.
+        @param offset: The offset of the packet in C{buf}.
+        @param available: The number of bytes in C{buf} after C{offset}.
+
+        @rtype: C{str}/C{None}
+        """
+        if available < 4:
+            return
+        seqid = self.incomingPacketSequence
+        packetLen = aead.decryptLength(seqid, str(buffer(buf, offset, 4)))
+        if packetLen > 1048576 or packetLen < aead.block_size: # 1024 ** 2
+            self.sendDisconnect(DISCONNECT_PROTOCOL_ERROR,
+                                'bad packet length %s' % packetLen)
+            return
+        if packetLen % aead.block_size != 0:
+            self.sendDisconnect(
+                DISCONNECT_PROTOCOL_ERROR,
+                'bad packet mod (%i%%%i == %i)' % (
+                    packetLen, aead.block_size, packetLen % aead.block_size))
+            return
+        end = offset + 4 + packetLen + aead.tagSize
+        if len(buf) < end:
+            return # not enough packet
+        self._bufOffset = end
+        packet = aead.decryptPacket(
+            seqid, str(buffer(buf, offset, end - offset)))
+        if packet is None:
+            self.sendDisconnect(DISCONNECT_MAC_ERROR, 'bad MAC')
+            return
+        paddingLen = ord(packet[0])
+        if paddingLen < 4 or paddingLen >= len(packet):
+            self.sendDisconnect(DISCONNECT_PROTOCOL_ERROR,
+                                'bad padding length %s' % paddingLen)
+            return
+        return self._decompressPayload(packet[1:-paddingLen])
+
+
+    def _decompressPayload(self, payload):
+        """
+        Decompress the payload of a packet which has been received and count
+        the packet.
+
+        @type payload: C{str}
+        @rtype: C{str}/C{None}
+        """
         if self.incomingCompression:
             try:
                 payload = self.incomingCompression.decompress(payload)
@@ -440,8 +592,8 @@ class SSHTransportBase(protocol.Protocol):
 
         @type data: C{str}
         """
-        self.buf = self.buf + data
         if not self.gotVersion:
+            self.buf = str(self.buf) + data
             if self.buf.find('\n', self.buf.find('SSH-')) == -1:
                 return
             lines = self.buf.split('\n')
@@ -455,11 +607,20 @@ class SSHTransportBase(protocol.Protocol):
                         return
                     i = lines.index(p)
                     self.buf = '\n'.join(lines[i + 1:])
-        packet = self.getPacket()
+        else:
+            self.buf += data
+        if not isinstance(self.buf, bytearray):
+            self.buf = bytearray(self.buf)
+        # Messages may be dispatched with parsed packets still at the start
+        # of the buffer.  Anything which delivers more data to this protocol
+        # from one of them carries on from _bufOffset, and the buffer is
+        # compacted once no more packets can be parsed.
+        packet = self._getPacket()
         while packet:
             messageNum = ord(packet[0])
             self.dispatchMessage(messageNum, packet[1:])
-            packet = self.getPacket()
+            packet = self._getPacket()
+        self._compactBuffer()
 
 
     def dispatchMessage(self, messageNum, payload):
@@ -715,16 +876,20 @@ class SSHTransportBase(protocol.Protocol):
 
     def _getKey(self, c, sharedSecret, exchangeHash):
         """
-        Get one of the keys for authentication/encryption.
+        Get one of the keys for authentication/encryption.  The key is
+        extended as described in RFC 4253, section 7.2, until it is long
+        enough for any of the supported ciphers; the longest is
+        C{chacha20-poly1305@openssh.com}, which needs 64 bytes.
 
         @type c: C{str}
         @type sharedSecret: C{str}
         @type exchangeHash: C{str}
         """
         k1 = sha1(sharedSecret + exchangeHash + c + self.sessionID)
-        k1 = k1.digest()
-        k2 = sha1(sharedSecret + exchangeHash + k1).digest()
-        return k1 + k2
+        key = k1.digest()
+        while len(key) < 64:
+            key += sha1(sharedSecret + exchangeHash + key).digest()
+        return key
 
 
     def _keySetup(self, sharedSecret, exchangeHash):
@@ -799,9 +964,11 @@ class SSHTransportBase(protocol.Protocol):
         given direction.  Direction must be one of ["out", "in", "both"].
         """
         if direction == "out":
-            return self.currentEncryptions.outMACType != 'none'
+            return (self.currentEncryptions.outAEAD is not None or
+                    self.currentEncryptions.outMACType != 'none')
         elif direction == "in":
-            return self.currentEncryptions.inMACType != 'none'
+            return (self.currentEncryptions.inAEAD is not None or
+                    self.currentEncryptions.inMACType != 'none')
         elif direction == "both":
             return self.isVerified("in")and self.isVerified("out")
         else:
@@ -1361,6 +1528,201 @@ class _DummyCipher:
     decrypt = encrypt
 
 
+
+class _AESGCMCipher(object):
+    """
+    The C{aes128-gcm@openssh.com} and C{aes256-gcm@openssh.com} ciphers: AES
+    in Galois/Counter Mode, as described in RFC 5647 and changed by OpenSSH to
+    be negotiated as a cipher only.  The packet length is sent in the clear and
+    authenticated as associated data, and the tag takes the place of the MAC.
+
+    @ivar block_size: The size of the blocks packets are padded to.
+    @ivar tagSize: The size of the authentication tag following each packet.
+    """
+    block_size = 16
+    tagSize = 16
+
+
+    def __init__(self, iv, key):
+        """
+        @param iv: The initialization vector.  Its first four bytes are the
+            fixed part of the nonce, and the next eight are the initial value
+            of the counter which makes up the rest of it.
+        @type iv: C{str}
+        @param key: The 16 or 32 byte AES key.
+        @type key: C{str}
+        """
+        self._aead = AESGCM(key)
+        self._fixed = iv[:4]
+        self._invocation = struct.unpack('>Q', iv[4:12])[0]
+
+
+    def _nonce(self):
+        """
+        Return the nonce for the next packet, and count the packet.
+        """
+        nonce = self._fixed + struct.pack('>Q', self._invocation)
+        self._invocation = (self._invocation + 1) % 2 ** 64
+        return nonce
+
+
+    def encryptPacket(self, seqid, packet):
+        """
+        Encrypt and authenticate a packet.
+
+        @param seqid: The sequence number of the packet.  This cipher keeps
+            its own count instead.
+        @type seqid: C{int}
+        @param packet: The packet, starting with its length.
+        @type packet: C{str}
+        @return: The packet as it is sent.
+        @rtype: C{str}
+        """
+        length = packet[:4]
+        return length + self._aead.encrypt(self._nonce(), packet[4:], length)
+
+
+    def decryptLength(self, seqid, data):
+        """
+        Get the length of a packet from its first four bytes.
+
+        @type seqid: C{int}
+        @type data: C{str}
+        @rtype: C{int}
+        """
+        return struct.unpack('>L', data)[0]
+
+
+    def decryptPacket(self, seqid, data):
+        """
+        Authenticate and decrypt a packet.
+
+        @param seqid: The sequence number of the packet.
+        @type seqid: C{int}
+        @param data: The packet as it was received, including its length and
+            tag.
+        @type data: C{str}
+        @return: The decrypted packet, without its length, or C{None} if it
+            was not authentic.
+        @rtype: C{str}/C{None}
+        """
+        try:
+            return self._aead.decrypt(self._nonce(), data[4:], data[:4])
+        except InvalidTag:
+            return None
+
+
+
+class _ChaCha20Poly1305Cipher(object):
+    """
+    The C{chacha20-poly1305@openssh.com} cipher, as specified in OpenSSH's
+    C{PROTOCOL.chacha20poly1305}.  The packet length is encrypted with a key of
+    its own so that it can be decrypted before the rest of the packet has
+    arrived, and a Poly1305 tag over the whole encrypted packet takes the
+    place of the MAC.  The ChaCha20 nonce is the packet sequence number.
+
+    @ivar block_size: The size of the blocks packets are padded to.
+    @ivar tagSize: The size of the authentication tag following each packet.
+    """
+    block_size = 8
+    tagSize = 16
+
+
+    def __init__(self, iv, key):
+        """
+        @param iv: Unused; the nonces are the packet sequence numbers.
+        @type iv: C{str}
+        @param key: 64 bytes of key: the key for the packet contents followed
+            by the key for the packet length.
+        @type key: C{str}
+        """
+        self._mainKey = key[:32]
+        self._lengthKey = key[32:64]
+
+
+    def _cipher(self, key, seqid, counter):
+        """
+        Make a ChaCha20 cipher for one packet.
+
+        The 64-bit block counter and 64-bit nonce of the original ChaCha20
+        fill the same sixteen bytes as the 32-bit counter and 96-bit nonce
+        which cryptography takes, as long as the counter stays below 2 ** 32.
+
+        @param key: The ChaCha20 key.
+        @param seqid: The sequence number of the packet.
+        @param counter: The block to start the key stream at.
+        """
+        nonce = struct.pack('<Q', counter) + struct.pack('>Q', seqid)
+        return Cipher(algorithms.ChaCha20(key, nonce), None, default_backend())
+
+
+    def _polyKeyAndCipher(self, seqid):
+        """
+        Make the Poly1305 key and the cipher for the contents of a packet.  The
+        key is the start of the first block of the key stream, and the
+        contents are encrypted starting at the second block.
+
+        @param seqid: The sequence number of the packet.
+        @return: A 2-tuple of the Poly1305 key and a cipher context.
+        """
+        context = self._cipher(self._mainKey, seqid, 0).encryptor()
+        return context.update('\x00' * 64)[:32], context
+
+
+    def encryptPacket(self, seqid, packet):
+        """
+        Encrypt and authenticate a packet.
+
+        @param seqid: The sequence number of the packet.
+        @type seqid: C{int}
+        @param packet: The packet, starting with its length.
+        @type packet: C{str}
+        @return: The packet as it is sent.
+        @rtype: C{str}
+        """
+        polyKey, context = self._polyKeyAndCipher(seqid)
+        encrypted = (
+            self._cipher(self._lengthKey, seqid, 0).encryptor().update(
+                packet[:4]) +
+            context.update(packet[4:]))
+        return encrypted + Poly1305.generate_tag(polyKey, encrypted)
+
+
+    def decryptLength(self, seqid, data):
+        """
+        Decrypt the length of a packet from its first four bytes.
+
+        @type seqid: C{int}
+        @type data: C{str}
+        @rtype: C{int}
+        """
+        return struct.unpack(
+            '>L', self._cipher(self._lengthKey, seqid, 0).decryptor().update(
+                data))[0]
+
+
+    def decryptPacket(self, seqid, data):
+        """
+        Authenticate and decrypt a packet.
+
+        @param seqid: The sequence number of the packet.
+        @type seqid: C{int}
+        @param data: The packet as it was received, including its length and
+            tag.
+        @type data: C{str}
+        @return: The decrypted packet, without its length, or C{None} if it
+            was not authentic.
+        @rtype: C{str}/C{None}
+        """
+        polyKey, context = self._polyKeyAndCipher(seqid)
+        try:
+            Poly1305.verify_tag(polyKey, data[:-16], data[-16:])
+        except InvalidSignature:
+            return None
+        return context.update(data[4:-16])
+
+
+
 class SSHCiphers:
     """
     SSHCiphers represents all the encryption operations that need to occur
@@ -1368,6 +1730,9 @@ class SSHCiphers:
 
     @cvar cipherMap: A dictionary mapping SSH encryption names to 3-tuples of
                      (<Crypto.Cipher.* name>, <block size>, <is counter mode>)
+    @cvar aeadMap: A dictionary mapping the names of SSH encryptions which
+        also authenticate the packets to 2-tuples of (<cipher class>, <key
+        size>).  The MACs are not used with these.
     @cvar macMap: A dictionary mapping SSH MAC names to hash modules.
 
     @ivar outCipType: the string type of the outgoing cipher.
@@ -1380,6 +1745,9 @@ class SSHCiphers:
     @ivar outMAC: a tuple of (<hash module>, <inner key>, <outer key>,
         <digest size>) representing the outgoing MAC.
     @ivar inMAc: see outMAC, but for the incoming MAC.
+    @ivar outAEAD: The outgoing cipher if it is one of C{aeadMap}, otherwise
+        C{None}.
+    @ivar inAEAD: see outAEAD, but for the incoming cipher.
     """
 
     cipherMap = {
@@ -1397,11 +1765,18 @@ class SSHCiphers:
         'cast128-ctr': ('CAST', 16, True),
         'none': (None, 0, False),
     }
+    aeadMap = {
+        'aes128-gcm@openssh.com': (_AESGCMCipher, 16),
+        'aes256-gcm@openssh.com': (_AESGCMCipher, 32),
+        'chacha20-poly1305@openssh.com': (_ChaCha20Poly1305Cipher, 64),
+    }
     macMap = {
         'hmac-sha1': sha1,
         'hmac-md5': md5,
         'none': None
      }
+    outAEAD = None
+    inAEAD = None
 
 
     def __init__(self, outCip, inCip, outMac, inMac):
@@ -1428,32 +1803,52 @@ class SSHCiphers:
         @param inInteg: the incoming integrity key.
         """
         o = self._getCipher(self.outCipType, outIV, outKey)
-        self.encrypt = o.encrypt
+        if self.outCipType in self.aeadMap:
+            self.outAEAD = o
+        else:
+            self.encrypt = o.encrypt
+            self.outMAC = self._getMAC(self.outMACType, outInteg)
         self.encBlockSize = o.block_size
         o = self._getCipher(self.inCipType, inIV, inKey)
-        self.decrypt = o.decrypt
+        if self.inCipType in self.aeadMap:
+            self.inAEAD = o
+        else:
+            self.decrypt = o.decrypt
+            self.inMAC = self._getMAC(self.inMACType, inInteg)
+            if self.inMAC:
+                self.verifyDigestSize = self.inMAC[3]
         self.decBlockSize = o.block_size
-        self.outMAC = self._getMAC(self.outMACType, outInteg)
-        self.inMAC = self._getMAC(self.inMACType, inInteg)
-        if self.inMAC:
-            self.verifyDigestSize = self.inMAC[3]
 
 
     def _getCipher(self, cip, iv, key):
         """
         Creates an initialized cipher object.
 
-        @param cip: the name of the cipher: maps into Crypto.Cipher.*
+        @param cip: the name of the cipher: maps into Crypto.Cipher.*, or
+            into C{aeadMap}
         @param iv: the initialzation vector
         @param key: the encryption key
         """
+        if cip in self.aeadMap:
+            cipherClass, keySize = self.aeadMap[cip]
+            return cipherClass(iv, key[:keySize])
         modName, keySize, counterMode = self.cipherMap[cip]
         if not modName: # no cipher
             return _DummyCipher()
         mod = __import__('Crypto.Cipher.%s'%modName, {}, {}, 'x')
         if counterMode:
+            try:
+                # PyCrypto's own counter saves calling back into Python for
+                # every block.
+                counter = Counter.new(
+                    mod.block_size * 8, allow_wraparound=True,
+                    initial_value=Util.number.bytes_to_long(
+                        iv[:mod.block_size]))
+            except TypeError:
+                # Older versions of PyCrypto have no allow_wraparound.
+                counter = _Counter(iv, mod.block_size)
             return mod.new(key[:keySize], mod.MODE_CTR, iv[:mod.block_size],
-                           counter=_Counter(iv, mod.block_size))
+                           counter=counter)
         else:
             return mod.new(key[:keySize], mod.MODE_CBC, iv[:mod.block_size])
 
@@ -1482,6 +1877,10 @@ class SSHCiphers:
         o = string.translate(key, hmac.trans_5C)
         result = _MACParams((mod,  i, o, ds))
         result.key = key
+        # Like hmac.HMAC, pad short keys out to the block size of the hash.
+        key = key + '\x00' * (64 - len(key))
+        result.innerHash = mod(string.translate(key, hmac.trans_36))
+        result.outerHash = mod(string.translate(key, hmac.trans_5C))
         return result
 
 
@@ -1517,8 +1916,7 @@ class SSHCiphers:
         """
         if not self.outMAC[0]:
             return ''
-        data = struct.pack('>L', seqid) + data
-        return hmac.HMAC(self.outMAC.key, data, self.outMAC[0]).digest()
+        return self.outMAC.digest(seqid, data)
 
 
     def verify(self, seqid, data, mac):
@@ -1536,9 +1934,7 @@ class SSHCiphers:
         """
         if not self.inMAC[0]:
             return mac == ''
-        data = struct.pack('>L', seqid) + data
-        outer = hmac.HMAC(self.inMAC.key, data, self.inMAC[0]).digest()
-        return mac == outer
+        return mac == self.inMAC.digest(seqid, data)
 
 
 class _Counter:
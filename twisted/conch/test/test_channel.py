@@ -5,6 +5,7 @@
 Test ssh/channel.py.
 """
 from twisted.conch.ssh import channel
+from twisted.test.proto_helpers import StringTransport
 from twisted.trial import unittest
 
 
@@ -207,6 +208,142 @@ class ChannelTests(unittest.TestCase):
         self.assertEqual(self.channel.buf, '6')
         self.assertEqual(self.channel.remoteWindowLeft, 0)
 
+    def test_registerProducer(self):
+        """
+        A push producer registered with the channel is paused when more than
+        C{highWaterMark} bytes are buffered because the remote window is
+        full, and resumed once the remote side has made enough room in the
+        window for the buffered data.
+        """
+        producer = StringTransport()
+        self.channel.highWaterMark = 3
+        self.channel.registerProducer(producer, True)
+        self.assertIdentical(self.channel.producer, producer)
+        self.channel.write('data')
+        self.assertEqual(producer.producerState, 'paused')
+        self.channel.addWindowBytes(2)
+        self.assertEqual(producer.producerState, 'paused')
+        self.assertEqual(self.channel.buf, 'ta')
+        self.channel.addWindowBytes(10)
+        self.assertEqual(producer.producerState, 'producing')
+        self.assertEqual(self.conn.data[self.channel], ['da', 'ta'])
+
+    def test_registerProducerExtended(self):
+        """
+        A push producer registered with the channel is also paused when
+        extended data is buffered.
+        """
+        producer = StringTransport()
+        self.channel.highWaterMark = 0
+        self.channel.registerProducer(producer, True)
+        self.channel.writeExtended(1, 'data')
+        self.assertEqual(producer.producerState, 'paused')
+        self.channel.addWindowBytes(10)
+        self.assertEqual(producer.producerState, 'producing')
+
+    def test_highWaterMark(self):
+        """
+        The producer is not paused until more than C{highWaterMark} bytes of
+        data and extended data are buffered.
+        """
+        producer = StringTransport()
+        self.channel.registerProducer(producer, True)
+        self.channel.write('a' * (self.channel.highWaterMark - 1))
+        self.channel.writeExtended(1, 'b')
+        self.assertEqual(producer.producerState, 'producing')
+        self.channel.write('c')
+        self.assertEqual(producer.producerState, 'paused')
+
+    def test_pauseProducing(self):
+        """
+        While the channel is paused, nothing is added to its local window.
+        Once it is resumed, everything the remote side has used is added
+        back in one window adjustment.
+        """
+        adjusts = []
+        class WindowConnection(MockConnection):
+            def replenishWindow(self, channel):
+                adjusts.append(channel.receivingPaused)
+        self.channel.conn = WindowConnection()
+        self.channel.pauseProducing()
+        self.assertTrue(self.channel.receivingPaused)
+        self.channel.resumeProducing()
+        self.assertFalse(self.channel.receivingPaused)
+        self.assertEqual(adjusts, [False])
+
+    def test_stopProducing(self):
+        """
+        Stopping the channel closes it.
+        """
+        self.channel.stopProducing()
+        self.assertTrue(self.channel.closing)
+        self.assertTrue(self.conn.closes.get(self.channel))
+
+    def test_registerPullProducer(self):
+        """
+        A pull producer registered with the channel is asked for data when it
+        is registered and whenever the remote side adds to the window while
+        nothing is buffered.
+        """
+        calls = []
+        class PullProducer(object):
+            def resumeProducing(self):
+                calls.append('resume')
+        self.channel.registerProducer(PullProducer(), False)
+        self.assertEqual(calls, ['resume'])
+        self.channel.write('data')
+        self.channel.addWindowBytes(2)
+        self.assertEqual(calls, ['resume'])
+        self.channel.addWindowBytes(10)
+        self.assertEqual(calls, ['resume', 'resume'])
+
+    def test_pullProducerWrites(self):
+        """
+        A pull producer registered with the channel is asked for more data
+        as soon as what it wrote has been sent, until the remote window is
+        full, and again once the remote side has made room for what was
+        buffered.
+        """
+        channel = self.channel
+        class PullProducer(object):
+            def resumeProducing(self):
+                channel.write('abc')
+        self.channel.addWindowBytes(7)
+        self.channel.registerProducer(PullProducer(), False)
+        self.assertEqual(self.conn.data[self.channel], ['abc', 'abc', 'a'])
+        self.assertEqual(self.channel.buf, 'bc')
+        self.channel.unregisterProducer()
+        self.channel.addWindowBytes(2)
+        self.assertEqual(self.conn.data[self.channel],
+                         ['abc', 'abc', 'a', 'bc'])
+        self.channel.registerProducer(PullProducer(), False)
+        self.channel.addWindowBytes(4)
+        self.assertEqual(self.conn.data[self.channel],
+                         ['abc', 'abc', 'a', 'bc', 'abc', 'a'])
+        self.assertEqual(self.channel.buf, 'bc')
+
+    def test_registerProducerTwice(self):
+        """
+        Registering a producer while another is registered raises
+        C{RuntimeError}.
+        """
+        self.channel.registerProducer(StringTransport(), True)
+        self.assertRaises(RuntimeError, self.channel.registerProducer,
+                          StringTransport(), True)
+
+    def test_unregisterProducer(self):
+        """
+        Once the producer is unregistered, it is no longer paused when the
+        remote window fills up, and another one can be registered.
+        """
+        producer = StringTransport()
+        self.channel.registerProducer(producer, True)
+        self.channel.unregisterProducer()
+        self.assertIdentical(self.channel.producer, None)
+        self.channel.write('data')
+        self.assertEqual(producer.producerState, 'producing')
+        self.channel.registerProducer(StringTransport(), True)
+
     def test_writeExtended(self):
         """
         Test that writeExtended handles data correctly.  Send extended data
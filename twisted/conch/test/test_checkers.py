@@ -273,6 +273,39 @@ class SSHPublicKeyDatabaseTests(TestCase):
         self.assertEqual(self.mockos.setegidCalls, [2, 1234])
 
 
+    def test_checkKeyReadsOnce(self):
+        """
+        L{SSHPublicKeyDatabase.checkKey} does not read an authorized keys file
+        again if it has not changed since it was last read.
+        """
+        self.sshDir.child("authorized_keys").setContent(self.content)
+        user = UsernamePassword("user", "password")
+        user.blob = "foobar"
+        self.assertTrue(self.checker.checkKey(user))
+        def open(*args):
+            self.fail("Unchanged authorized keys file read again.")
+        self.patch(FilePath, "open", open)
+        self.assertTrue(self.checker.checkKey(user))
+        user.blob = "notallowed"
+        self.assertFalse(self.checker.checkKey(user))
+
+
+    def test_checkKeyFileChanged(self):
+        """
+        L{SSHPublicKeyDatabase.checkKey} reads an authorized keys file again
+        when it changes.
+        """
+        keyFile = self.sshDir.child("authorized_keys")
+        keyFile.setContent(self.content)
+        user = UsernamePassword("user", "password")
+        user.blob = "foobar"
+        self.assertTrue(self.checker.checkKey(user))
+        keyFile.setContent("t3 %s bar\n" % (base64.encodestring("newkey"),))
+        self.assertFalse(self.checker.checkKey(user))
+        user.blob = "newkey"
+        self.assertTrue(self.checker.checkKey(user))
+
+
     def test_requestAvatarId(self):
         """
         L{SSHPublicKeyDatabase.requestAvatarId} should return the avatar id
@@ -794,6 +827,59 @@ class UNIXAuthorizedKeysFilesTests(TestCase):
                          list(keydb.getAuthorizedKeys('alice')))
 
 
+    def test_keysParsedOnce(self):
+        """
+        L{checkers.UNIXAuthorizedKeysFiles.getAuthorizedKeys} does not parse
+        the keys in the authorized keys files again if they have not changed.
+        """
+        parsed = []
+        def parseKey(line):
+            parsed.append(line)
+            return line
+        keydb = checkers.UNIXAuthorizedKeysFiles(self.userdb,
+                                                 parseKey=parseKey)
+        self.assertEqual(self.expectedKeys,
+                         list(keydb.getAuthorizedKeys('alice')))
+        self.assertEqual(self.expectedKeys,
+                         list(keydb.getAuthorizedKeys('alice')))
+        self.assertEqual(self.expectedKeys, parsed)
+
+
+    def test_keysParsedWhenChanged(self):
+        """
+        L{checkers.UNIXAuthorizedKeysFiles.getAuthorizedKeys} parses the keys
+        in an authorized keys file again when its modification time changes,
+        even if its size does not.
+        """
+        keydb = checkers.UNIXAuthorizedKeysFiles(self.userdb,
+                                                 parseKey=lambda x: x)
+        self.assertEqual(self.expectedKeys,
+                         list(keydb.getAuthorizedKeys('alice')))
+        authorizedKeys = self.sshDir.child('authorized_keys')
+        with authorizedKeys.open('w') as f:
+            f.write('key 3\nkey 4')
+        mtime = authorizedKeys.getModificationTime() + 10
+        os.utime(authorizedKeys.path, (mtime, mtime))
+        self.assertEqual(['key 3', 'key 4'],
+                         list(keydb.getAuthorizedKeys('alice')))
+
+
+    def test_containsKey(self):
+        """
+        The keys returned by
+        L{checkers.UNIXAuthorizedKeysFiles.getAuthorizedKeys} can be checked
+        for a key with C{in}.
+        """
+        self.sshDir.child('authorized_keys').setContent(
+            keydata.publicRSA_openssh + '\n')
+        keydb = checkers.UNIXAuthorizedKeysFiles(self.userdb)
+        authorizedKeys = keydb.getAuthorizedKeys('alice')
+        self.assertIn(keys.Key.fromString(keydata.publicRSA_openssh),
+                      authorizedKeys)
+        self.assertNotIn(keys.Key.fromString(keydata.publicDSA_openssh),
+                         authorizedKeys)
+
+
 
 _KeyDB = namedtuple('KeyDB', ['getAuthorizedKeys'])
 
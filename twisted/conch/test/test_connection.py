@@ -9,6 +9,7 @@ import struct
 
 from twisted.conch import error
 from twisted.conch.ssh import channel, common, connection
+from twisted.test.proto_helpers import StringTransport
 from twisted.trial import unittest
 from twisted.conch.test import test_userauth
 
@@ -424,6 +425,25 @@ class ConnectionTests(unittest.TestCase):
         self.assertEqual(self.transport.packets,
                 [(connection.MSG_CHANNEL_CLOSE, '\x00\x00\x00\xff')])
 
+    def test_CHANNEL_DATAPaused(self):
+        """
+        Nothing is added to the window of a channel which is paused, even if
+        it pauses itself while handling the data.  When it is resumed, all of
+        the data it has received is added back to the window in one message.
+        """
+        channel = TestChannel(localWindow=6, localMaxPacket=5)
+        self._openChannel(channel)
+        channel.dataReceived = lambda data: channel.pauseProducing()
+        self.conn.ssh_CHANNEL_DATA('\x00\x00\x00\x00' + common.NS('da'))
+        self.conn.ssh_CHANNEL_DATA('\x00\x00\x00\x00' + common.NS('ta'))
+        self.assertEqual(self.transport.packets, [])
+        self.assertEqual(channel.localWindowLeft, 2)
+        channel.resumeProducing()
+        self.assertEqual(self.transport.packets,
+                [(connection.MSG_CHANNEL_WINDOW_ADJUST, '\x00\x00\x00\xff'
+                    '\x00\x00\x00\x04')])
+        self.assertEqual(channel.localWindowLeft, 6)
+
     def test_CHANNEL_EXTENDED_DATA(self):
         """
         Test that channel extended data messages are passed up to the channel,
@@ -600,6 +620,36 @@ class ConnectionTests(unittest.TestCase):
                 [(connection.MSG_CHANNEL_WINDOW_ADJUST, '\x00\x00\x00\xff'
                     '\x00\x00\x00\x01')])
 
+    def test_replenishWindow(self):
+        """
+        L{SSHConnection.replenishWindow} adds what has been used of a
+        channel's window back once less than half of it is left.
+        """
+        channel = TestChannel(localWindow=6)
+        self._openChannel(channel)
+        channel.localWindowLeft = 3
+        self.conn.replenishWindow(channel)
+        self.assertEqual(self.transport.packets, [])
+        channel.localWindowLeft = 2
+        self.conn.replenishWindow(channel)
+        self.assertEqual(self.transport.packets,
+                [(connection.MSG_CHANNEL_WINDOW_ADJUST, '\x00\x00\x00\xff'
+                    '\x00\x00\x00\x04')])
+        self.assertEqual(channel.localWindowLeft, 6)
+
+    def test_channelClosedStopsProducer(self):
+        """
+        When a channel is closed, the producer registered with it is stopped
+        and unregistered.
+        """
+        channel = TestChannel()
+        self._openChannel(channel)
+        producer = StringTransport()
+        channel.registerProducer(producer, True)
+        self.conn.channelClosed(channel)
+        self.assertEqual(producer.producerState, 'stopped')
+        self.assertIdentical(channel.producer, None)
+
     def test_sendData(self):
         """
         Test that channel data messages are sent in the right format.
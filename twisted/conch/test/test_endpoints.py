@@ -48,7 +48,7 @@ if requireModule('Crypto.Cipher.AES') and requireModule('pyasn1.type'):
     from twisted.conch.endpoints import (
         _ISSHConnectionCreator, AuthenticationFailed, SSHCommandAddress,
         SSHCommandClientEndpoint, _ReadFile, _NewConnectionHelper,
-        _ExistingConnectionHelper)
+        _ExistingConnectionHelper, SSHConnectionPool, _PooledConnectionHelper)
 
     from twisted.conch.ssh.transport import SSHClientTransport
 else:
@@ -1252,6 +1252,400 @@ class ExistingConnectionTests(TestCase, SSHCommandClientEndpointTestsMixin):
 
 
 
+class PooledConnectionTests(TestCase, SSHCommandClientEndpointTestsMixin):
+    """
+    Tests for L{SSHCommandClientEndpoint} when using the C{newConnection}
+    constructor with an L{SSHConnectionPool}.
+    """
+    def setUp(self):
+        """
+        Configure an SSH server with password authentication enabled for a
+        well-known (to the tests) account, and a pool of connections to it.
+        """
+        SSHCommandClientEndpointTestsMixin.setUp(self)
+        self.knownHosts = KnownHostsFile(FilePath(self.mktemp()))
+        self.knownHosts.addHostKey(
+            self.hostname, self.factory.publicKeys['ssh-rsa'])
+        self.knownHosts.addHostKey(
+            self.serverAddress.host, self.factory.publicKeys['ssh-rsa'])
+        self.ui = FixedResponseUI(False)
+        self.pool = SSHConnectionPool(self.reactor)
+
+
+    def create(self, **kwargs):
+        """
+        Create and return a new L{SSHCommandClientEndpoint} using the
+        C{newConnection} constructor with C{self.pool}.
+
+        @param kwargs: Arguments to C{newConnection} to use instead of the
+            defaults of these tests.
+        """
+        arguments = dict(
+            password=self.password, knownHosts=self.knownHosts, ui=self.ui,
+            pool=self.pool)
+        arguments.update(kwargs)
+        return SSHCommandClientEndpoint.newConnection(
+            self.reactor, b"/bin/ls -l", self.user, self.hostname, self.port,
+            **arguments)
+
+
+    def finishConnection(self, index=0):
+        """
+        Establish an attempted TCP connection, the first by default, using the
+        SSH server which C{self.factory} can create.
+        """
+        return self.connectedServerAndClient(
+            self.factory, self.reactor.tcpClients[index][2])
+
+
+    def assertClientTransportState(self, client, immediateClose):
+        """
+        Assert that the transport for the given protocol is still connected.
+        The pool keeps connections open after the commands over them exit, so
+        that other commands can use them.
+        """
+        self.assertFalse(client.transport.disconnecting)
+        self.assertFalse(client.transport.aborted)
+
+
+    def connect(self, **kwargs):
+        """
+        Run a command using a new endpoint created by L{create}.
+
+        @param kwargs: Arguments to pass to L{create}.
+
+        @return: The L{Deferred} returned by the endpoint's C{connect}.
+        """
+        factory = Factory()
+        factory.protocol = Protocol
+        return self.create(**kwargs).connect(factory)
+
+
+    def test_interface(self):
+        """
+        L{_PooledConnectionHelper} provides L{_ISSHConnectionCreator}.
+        """
+        self.assertTrue(
+            verifyObject(_ISSHConnectionCreator, self.create()._creator))
+        self.assertIsInstance(self.create()._creator, _PooledConnectionHelper)
+
+
+    def test_shareConnection(self):
+        """
+        Commands run while the pool is setting up a connection are all run
+        over that connection.
+        """
+        self.realm.channelLookup[b'session'] = WorkingExecSession
+        first = self.connect()
+        second = self.connect()
+        self.finishConnection()
+
+        self.assertEqual(1, len(self.reactor.tcpClients))
+        self.assertIs(self.successResultOf(first).transport.conn,
+                      self.successResultOf(second).transport.conn)
+
+
+    def test_reuseConnection(self):
+        """
+        Commands run after the pool has set up a connection are run over that
+        connection.
+        """
+        self.realm.channelLookup[b'session'] = WorkingExecSession
+        first = self.connect()
+        server, client, pump = self.finishConnection()
+        second = self.connect()
+        pump.flush()
+
+        self.assertEqual(1, len(self.reactor.tcpClients))
+        self.assertIs(self.successResultOf(first).transport.conn,
+                      self.successResultOf(second).transport.conn)
+
+
+    def test_maxChannelsPerConnection(self):
+        """
+        When each of the pool's connections to a server has
+        L{SSHConnectionPool.maxChannelsPerConnection} channels, a new
+        connection is made.
+        """
+        self.realm.channelLookup[b'session'] = WorkingExecSession
+        self.pool.maxChannelsPerConnection = 1
+        first = self.connect()
+        self.finishConnection()
+        second = self.connect()
+        self.assertEqual(2, len(self.reactor.tcpClients))
+        self.finishConnection(1)
+
+        self.assertIsNot(self.successResultOf(first).transport.conn,
+                         self.successResultOf(second).transport.conn)
+
+
+    def test_idleTimeout(self):
+        """
+        A connection is closed when it has had no open channels for
+        L{SSHConnectionPool.idleTimeout} seconds.
+        """
+        self.realm.channelLookup[b'session'] = WorkingExecSession
+        connected = self.connect()
+        server, client, pump = self.finishConnection()
+        self.successResultOf(connected).transport.loseConnection()
+        pump.pump()
+        pump.pump()
+
+        self.reactor.advance(self.pool.idleTimeout - 1)
+        self.assertFalse(client.transport.disconnecting)
+        self.reactor.advance(1)
+        self.assertTrue(client.transport.disconnecting)
+
+
+    def test_reuseCancelsIdleTimeout(self):
+        """
+        A connection which is used again before it has been idle for
+        L{SSHConnectionPool.idleTimeout} seconds is kept open.
+        """
+        self.realm.channelLookup[b'session'] = WorkingExecSession
+        connected = self.connect()
+        server, client, pump = self.finishConnection()
+        self.successResultOf(connected).transport.loseConnection()
+        pump.pump()
+        pump.pump()
+
+        self.reactor.advance(self.pool.idleTimeout - 1)
+        connected = self.connect()
+        pump.flush()
+        self.successResultOf(connected)
+        self.reactor.advance(self.pool.idleTimeout)
+        self.assertFalse(client.transport.disconnecting)
+
+
+    def test_reconnect(self):
+        """
+        A connection which has been lost is not used again, and a new one is
+        made instead.
+        """
+        self.realm.channelLookup[b'session'] = WorkingExecSession
+        first = self.connect()
+        server, client, pump = self.finishConnection()
+        self.successResultOf(first)
+        server.transport.loseConnection()
+        pump.pump()
+
+        second = self.connect()
+        self.assertEqual(2, len(self.reactor.tcpClients))
+        self.finishConnection(1)
+        self.successResultOf(second)
+
+
+    def test_connectionFailed(self):
+        """
+        If a connection cannot be established, the L{Deferred}s returned by
+        L{SSHCommandClientEndpoint.connect} for all the commands waiting for it
+        fire with a L{Failure} representing the reason, and the next command
+        tries to establish a connection again.
+        """
+        first = self.connect()
+        second = self.connect()
+        factory = self.reactor.tcpClients[0][2]
+        factory.clientConnectionFailed(None, Failure(ConnectionRefusedError()))
+
+        self.failureResultOf(first).trap(ConnectionRefusedError)
+        self.failureResultOf(second).trap(ConnectionRefusedError)
+        self.connect()
+        self.assertEqual(2, len(self.reactor.tcpClients))
+
+
+    def test_cancelWaiting(self):
+        """
+        Cancelling a command which is waiting for the pool to set up a
+        connection leaves the others waiting for it.
+        """
+        self.realm.channelLookup[b'session'] = WorkingExecSession
+        first = self.connect()
+        second = self.connect()
+        first.cancel()
+        self.failureResultOf(first).trap(CancelledError)
+        self.finishConnection()
+        self.successResultOf(second)
+
+
+    def test_execFailureClosesChannel(self):
+        """
+        If execution of the command fails, its channel is closed, and the
+        connection is closed once it has been idle for
+        L{SSHConnectionPool.idleTimeout} seconds.
+        """
+        self.realm.channelLookup[b'session'] = BrokenExecSession
+        connected = self.connect()
+        server, client, pump = self.finishConnection()
+        self.failureResultOf(connected).trap(ConchError)
+        pump.flush()
+
+        self.assertEqual({}, client._wrappedProtocol.service.channels)
+        self.reactor.advance(self.pool.idleTimeout)
+        self.assertTrue(client.transport.disconnecting)
+
+
+    def test_execCancelledClosesChannel(self):
+        """
+        If execution of the command is cancelled, its channel is closed, and
+        the connection is kept open for other commands.
+        """
+        self.realm.channelLookup[b'session'] = UnsatisfiedExecSession
+        connected = self.connect()
+        server, client, pump = self.finishConnection()
+        connected.cancel()
+        self.failureResultOf(connected).trap(CancelledError)
+        pump.flush()
+
+        self.assertEqual({}, client._wrappedProtocol.service.channels)
+        self.assertFalse(client.transport.disconnecting)
+        self.reactor.advance(self.pool.idleTimeout)
+        self.assertTrue(client.transport.disconnecting)
+
+
+    def test_cancelledBeforeChannelOpen(self):
+        """
+        If running the command is cancelled before its channel is open, the
+        channel is closed as soon as it is, without running the command.
+        """
+        self.realm.channelLookup[b'session'] = WorkingExecSession
+        first = self.connect()
+        server, client, pump = self.finishConnection()
+        self.successResultOf(first)
+        second = self.connect()
+        second.cancel()
+        self.failureResultOf(second).trap(CancelledError)
+        pump.flush()
+
+        self.assertEqual(1, len(client._wrappedProtocol.service.channels))
+
+
+    def test_connectionLostRemoved(self):
+        """
+        A connection is removed from the pool as soon as it is lost.
+        """
+        self.realm.channelLookup[b'session'] = WorkingExecSession
+        connected = self.connect()
+        server, client, pump = self.finishConnection()
+        self.successResultOf(connected)
+        server.transport.loseConnection()
+        pump.pump()
+
+        self.assertEqual({}, self.pool._connections)
+
+
+    def test_closeConnections(self):
+        """
+        L{SSHConnectionPool.closeConnections} closes the connections in the
+        pool.
+        """
+        self.realm.channelLookup[b'session'] = WorkingExecSession
+        connected = self.connect()
+        server, client, pump = self.finishConnection()
+        self.successResultOf(connected)
+        self.pool.closeConnections()
+        self.assertTrue(client.transport.disconnecting)
+        self.assertEqual([], self.reactor.getDelayedCalls())
+
+
+    def test_closeConnectionsPending(self):
+        """
+        Commands waiting for a connection when
+        L{SSHConnectionPool.closeConnections} is called fail with
+        L{ConnectionDone}, and the connection is closed when it is ready
+        rather than added to the pool.
+        """
+        self.realm.channelLookup[b'session'] = WorkingExecSession
+        connected = self.connect()
+        self.pool.closeConnections()
+        self.failureResultOf(connected).trap(ConnectionDone)
+
+        server, client, pump = self.finishConnection()
+        self.assertTrue(client.transport.disconnecting)
+        self.assertEqual({}, self.pool._connections)
+        self.assertEqual({}, self.pool._pending)
+        self.assertEqual([], self.reactor.getDelayedCalls())
+
+
+    def test_usableAfterClose(self):
+        """
+        After L{SSHConnectionPool.closeConnections}, commands are run over new
+        connections which are kept in the pool.
+        """
+        self.realm.channelLookup[b'session'] = WorkingExecSession
+        first = self.connect()
+        self.pool.closeConnections()
+        self.failureResultOf(first).trap(ConnectionDone)
+        connected = self.connect()
+        self.assertEqual(2, len(self.reactor.tcpClients))
+        self.finishConnection(1)
+        self.successResultOf(connected)
+        self.assertEqual(1, len(self.pool._connections))
+
+
+    def assertNotShared(self, **kwargs):
+        """
+        Assert that a command run with C{kwargs} as arguments to
+        C{newConnection} does not share the connection made for a command
+        run with the defaults of these tests.
+        """
+        self.realm.channelLookup[b'session'] = WorkingExecSession
+        self.connect()
+        self.connect(**kwargs)
+        self.assertEqual(2, len(self.reactor.tcpClients))
+
+
+    def test_differentPasswordNotShared(self):
+        """
+        Commands authenticating with different passwords do not share
+        connections.
+        """
+        self.assertNotShared(password=self.password + b"x")
+
+
+    def test_differentKeysNotShared(self):
+        """
+        Commands authenticating with different keys do not share connections.
+        """
+        self.assertNotShared(keys=[Key.fromString(privateDSA_openssh)])
+
+
+    def test_differentAgentNotShared(self):
+        """
+        Commands authenticating with different agents do not share
+        connections.
+        """
+        self.assertNotShared(agentEndpoint=object())
+
+
+    def test_differentKnownHostsNotShared(self):
+        """
+        Commands checking the server's host key against different known hosts
+        do not share connections.
+        """
+        self.assertNotShared(
+            knownHosts=KnownHostsFile(FilePath(self.mktemp())))
+
+
+    def test_differentUINotShared(self):
+        """
+        Commands asking different user interfaces about unknown host keys do
+        not share connections.
+        """
+        self.assertNotShared(ui=FixedResponseUI(True))
+
+
+    def test_equalKeysShared(self):
+        """
+        Commands authenticating with keys which are equal but not the same
+        objects share connections.
+        """
+        self.realm.channelLookup[b'session'] = WorkingExecSession
+        self.connect(keys=[Key.fromString(privateDSA_openssh)])
+        self.connect(keys=[Key.fromString(privateDSA_openssh)])
+        self.assertEqual(1, len(self.reactor.tcpClients))
+
+
+
 class ExistingConnectionHelperTests(TestCase):
     """
     Tests for L{_ExistingConnectionHelper}.
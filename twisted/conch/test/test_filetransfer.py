@@ -22,6 +22,7 @@ from twisted.conch.ssh import common, connection, filetransfer, session
 from twisted.internet import defer
 from twisted.protocols import loopback
 from twisted.python import components
+from twisted.test.proto_helpers import StringTransport
 
 
 class TestAvatar(avatar.ConchUser):
@@ -100,6 +101,43 @@ class SFTPTestBase(unittest.TestCase):
         file(os.path.join(self.testDir, '.testHiddenFile'), 'w').write('a')
 
 
+class ChunkProducer(object):
+    """
+    A producer like L{twisted.web.iweb.IBodyProducer} which writes C{data} to
+    its consumer in C{size} byte pieces while it is not paused.
+    """
+
+    def __init__(self, data, size):
+        self.pieces = [data[i:i + size] for i in range(0, len(data), size)]
+        self.paused = False
+        self.pauses = 0
+        self.stopped = False
+
+
+    def startProducing(self, consumer):
+        self.consumer = consumer
+        self.finished = defer.Deferred()
+        self.resumeProducing()
+        return self.finished
+
+
+    def pauseProducing(self):
+        self.paused = True
+        self.pauses += 1
+
+
+    def resumeProducing(self):
+        self.paused = False
+        while self.pieces and not self.paused and not self.stopped:
+            self.consumer.write(self.pieces.pop(0))
+        if not self.pieces and not self.finished.called:
+            self.finished.callback(None)
+
+
+    def stopProducing(self):
+        self.stopped = True
+
+
 class OurServerOurClientTests(SFTPTestBase):
 
     if not unix:
@@ -471,6 +509,284 @@ class OurServerOurClientTests(SFTPTestBase):
         return self.assertFailure(d, NotImplementedError)
 
 
+    def test_serverRegistersAsProducer(self):
+        """
+        L{filetransfer.FileTransferServer} registers with its transport as a
+        producer, and unregisters when the connection is lost.
+        """
+        self.assertIdentical(self.serverTransport.producer, self.server)
+        self.server.connectionLost(None)
+        self.assertIdentical(self.serverTransport.producer, None)
+
+
+    def test_pausedServer(self):
+        """
+        L{filetransfer.FileTransferServer} does not handle requests while it
+        is paused, and handles those it received once it is resumed.
+        """
+        self.server.pauseProducing()
+        # LoopbackRelay resumes its producer whenever it is cleared.
+        self.serverTransport.unregisterProducer()
+        d = self.client.openFile("testfile1", filetransfer.FXF_READ, {})
+        self._emptyBuffers()
+        self.assertNoResult(d)
+        self.assertEqual(self.server.openFiles, {})
+
+        self.server.resumeProducing()
+        self._emptyBuffers()
+        d.addCallback(lambda openFile: self.assertEqual(
+            len(self.server.openFiles), 1))
+        return d
+
+
+    def test_readReplySentAsPacket(self):
+        """
+        L{filetransfer.FileTransferServer} sends the data read from a file
+        with L{filetransfer.FileTransferServer.sendPacket}.
+        """
+        packets = []
+        sendPacket = self.server.sendPacket
+        def recordingSendPacket(kind, data, header=''):
+            packets.append((kind, header + data))
+            sendPacket(kind, data, header)
+        self.server.sendPacket = recordingSendPacket
+
+        d = self.client.openFile("testfile1", filetransfer.FXF_READ, {})
+        self._emptyBuffers()
+        openFile = self.successResultOf(d)
+        d = openFile.readChunk(0, 5)
+        self._emptyBuffers()
+        self.assertEqual('a' * 5, self.successResultOf(d))
+        kind, data = packets[-1]
+        self.assertEqual(filetransfer.FXP_DATA, kind)
+        # The request id, then the data as a string.
+        self.assertEqual('\0\0\0\5' + 'a' * 5, data[4:])
+
+
+    def test_readAhead(self):
+        """
+        Sequential reads of a file are answered from data read ahead, which is
+        discarded when the file is written.
+        """
+        calls = []
+        runAsUser = self.avatar._runAsUser
+        def _runAsUser(f, *args, **kw):
+            calls.append(f)
+            return runAsUser(f, *args, **kw)
+        self.avatar._runAsUser = _runAsUser
+
+        d = self.client.openFile("testfile1", filetransfer.FXF_READ |
+                                 filetransfer.FXF_WRITE, {})
+        self._emptyBuffers()
+        openFile = self.successResultOf(d)
+        del calls[:]
+
+        d = openFile.readChunk(0, 10)
+        self._emptyBuffers()
+        self.assertEqual(self.successResultOf(d), 'a' * 10)
+        d = openFile.readChunk(10, 10)
+        self._emptyBuffers()
+        self.assertEqual(self.successResultOf(d), 'b' * 10)
+        self.assertEqual(len(calls), 1)
+
+        d = openFile.writeChunk(10, 'c' * 10)
+        self._emptyBuffers()
+        self.successResultOf(d)
+        d = openFile.readChunk(10, 10)
+        self._emptyBuffers()
+        self.assertEqual(self.successResultOf(d), 'c' * 10)
+        self.assertEqual(len(calls), 3)
+
+
+    def _countRequests(self):
+        """
+        Keep track of the most requests the client has had outstanding.
+
+        @return: A C{list} whose only element is that number.
+        """
+        most = [0]
+        sendRequest = self.client._sendRequest
+        def _sendRequest(msg, data):
+            d = sendRequest(msg, data)
+            most[0] = max(most[0], len(self.client.openRequests))
+            return d
+        self.client._sendRequest = _sendRequest
+        return most
+
+
+    def _limitReads(self, length):
+        """
+        Make the server read no more than C{length} bytes at a time.
+        """
+        oldOpenFile = self.server.client.openFile
+        def openFile(filename, flags, attrs):
+            openedFile = oldOpenFile(filename, flags, attrs)
+            readChunk = openedFile.readChunk
+            openedFile.readChunk = lambda offset, size: readChunk(
+                offset, min(size, length))
+            return openedFile
+        self.server.client.openFile = openFile
+
+
+    def _testFileContents(self):
+        return file(os.path.join(self.testDir, 'testfile1')).read()
+
+
+    def test_downloadFile(self):
+        """
+        L{filetransfer.FileTransferClient.downloadFile} writes the contents of
+        the file to the consumer, unregisters from it and closes the file,
+        then fires with the number of bytes written.
+        """
+        contents = self._testFileContents()
+        consumer = StringTransport()
+        d = self.client.downloadFile('testfile1', consumer, chunkSize=1000)
+        self._emptyBuffers()
+
+        def check(written):
+            self.assertEqual(written, len(contents))
+            self.assertEqual(consumer.value(), contents)
+            self.assertIdentical(consumer.producer, None)
+            self.assertEqual(self.server.openFiles, {})
+        return d.addCallback(check)
+
+
+    def test_downloadFileWindow(self):
+        """
+        The number of READ requests
+        L{filetransfer.FileTransferClient.downloadFile} keeps outstanding
+        grows up to C{maxRequests}.
+        """
+        most = self._countRequests()
+        d = self.client.downloadFile(
+            'testfile1', StringTransport(), chunkSize=1000, maxRequests=8)
+        self._emptyBuffers()
+        d.addCallback(lambda ignored: self.assertEqual(most[0], 8))
+        return d
+
+
+    def test_downloadFileShortReads(self):
+        """
+        When the server sends less data than was asked for,
+        L{filetransfer.FileTransferClient.downloadFile} asks for the rest and
+        still writes the contents of the file in order.
+        """
+        self._limitReads(300)
+        contents = self._testFileContents()
+        consumer = StringTransport()
+        d = self.client.downloadFile('testfile1', consumer, chunkSize=1000)
+        self._emptyBuffers()
+        d.addCallback(self.assertEqual, len(contents))
+        d.addCallback(lambda ignored: self.assertEqual(
+            consumer.value(), contents))
+        return d
+
+
+    def test_downloadFilePaused(self):
+        """
+        L{filetransfer.FileTransferClient.downloadFile} makes no new requests
+        while the consumer has paused it, and carries on once it is resumed.
+        """
+        contents = self._testFileContents()
+        consumer = StringTransport()
+        def write(data):
+            consumer.producer.pauseProducing()
+            StringTransport.write(consumer, data)
+        consumer.write = write
+        d = self.client.downloadFile('testfile1', consumer, chunkSize=1000)
+        self._emptyBuffers()
+        self.assertNoResult(d)
+        self.assertEqual(self.client.openRequests, {})
+        self.assertTrue(0 < len(consumer.value()) < len(contents))
+
+        del consumer.write
+        consumer.producer.resumeProducing()
+        self._emptyBuffers()
+        d.addCallback(lambda ignored: self.assertEqual(
+            consumer.value(), contents))
+        return d
+
+
+    def test_downloadFileStopped(self):
+        """
+        When the consumer stops it,
+        L{filetransfer.FileTransferClient.downloadFile} closes the file and
+        fails with L{defer.CancelledError}.
+        """
+        consumer = StringTransport()
+        def write(data):
+            consumer.producer.stopProducing()
+        consumer.write = write
+        d = self.client.downloadFile('testfile1', consumer, chunkSize=1000)
+        self._emptyBuffers()
+        self.assertIdentical(consumer.producer, None)
+        self.assertEqual(self.server.openFiles, {})
+        return self.assertFailure(d, defer.CancelledError)
+
+
+    def test_downloadFileMissing(self):
+        """
+        L{filetransfer.FileTransferClient.downloadFile} fails with
+        L{filetransfer.SFTPError} if the file cannot be opened.
+        """
+        consumer = StringTransport()
+        d = self.client.downloadFile('nonexistent', consumer)
+        self._emptyBuffers()
+        self.assertIdentical(consumer.producer, None)
+        return self.assertFailure(d, filetransfer.SFTPError)
+
+
+    def test_uploadFile(self):
+        """
+        L{filetransfer.FileTransferClient.uploadFile} replaces the contents of
+        the file with the data from the producer, pausing the producer once
+        C{maxRequests} WRITE requests are outstanding, and fires with the
+        number of bytes written once the file is closed.
+        """
+        data = os.urandom(50000)
+        producer = ChunkProducer(data, 3000)
+        most = self._countRequests()
+        d = self.client.uploadFile(
+            'testfile1', producer, chunkSize=1000, maxRequests=4)
+        self._emptyBuffers()
+
+        def check(written):
+            self.assertEqual(written, len(data))
+            self.assertEqual(self._testFileContents(), data)
+            self.assertEqual(self.server.openFiles, {})
+            self.assertTrue(producer.pauses > 0)
+            # A single write from the producer may go over the limit by all
+            # but one of the chunks it is split into.
+            self.assertTrue(most[0] <= 4 + 2)
+        return d.addCallback(check)
+
+
+    def test_uploadFileWriteFails(self):
+        """
+        If a WRITE request fails,
+        L{filetransfer.FileTransferClient.uploadFile} stops the producer,
+        closes the file and fails with the error.
+        """
+        oldOpenFile = self.server.client.openFile
+        def openFile(filename, flags, attrs):
+            openedFile = oldOpenFile(filename, flags, attrs)
+            def writeChunk(offset, data):
+                raise filetransfer.SFTPError(
+                    filetransfer.FX_PERMISSION_DENIED, 'no writing')
+            openedFile.writeChunk = writeChunk
+            return openedFile
+        self.server.client.openFile = openFile
+        producer = ChunkProducer('x' * 10000, 3000)
+        d = self.client.uploadFile('testfile1', producer, chunkSize=1000)
+        self._emptyBuffers()
+        self.assertTrue(producer.stopped)
+        self.assertEqual(self.server.openFiles, {})
+        d = self.assertFailure(d, filetransfer.SFTPError)
+        d.addCallback(lambda error: self.assertEqual(
+            error.code, filetransfer.FX_PERMISSION_DENIED))
+        return d
+
+
 class FakeConn:
     def sendClose(self, channel):
         pass
@@ -578,6 +894,79 @@ class FileTransferCloseTests(unittest.TestCase):
 
 
 
+class FileTransferSessionPausingTests(unittest.TestCase):
+    """
+    Tests for pausing a L{filetransfer.FileTransferServer} running as the
+    subsystem of an L{session.SSHSession}.
+    """
+
+    if not unix:
+        skip = "can't run on non-posix computers"
+
+    def setUp(self):
+        self.packets = []
+        self.conn = connection.SSHConnection()
+        class RecordingTransport:
+            def __init__(transport):
+                transport.transport = transport
+            def sendPacket(transport, kind, data):
+                self.packets.append((kind, data))
+            def logPrefix(transport):
+                return 'recording transport'
+        self.conn.transport = RecordingTransport()
+        self.conn.transport.avatar = TestAvatar()
+        self.conn.ssh_CHANNEL_OPEN(
+            common.NS('session') + struct.pack('>3L', 0, 2 ** 20, 2 ** 15))
+        self.session = self.conn.channels[0]
+        self.session.request_subsystem(common.NS('sftp'))
+        self.server = self.session.client.transport.proto
+        del self.packets[:]
+
+
+    def receiveData(self):
+        """
+        Deliver enough data to the session for it to use more than half of
+        its local window.
+        """
+        chunk = 'a' * self.session.localMaxPacket
+        chunks = self.session.localWindowSize // 2 // len(chunk) + 1
+        for i in range(chunks):
+            self.conn.ssh_CHANNEL_DATA(struct.pack('>L', 0) + common.NS(chunk))
+
+
+    def windowAdjustments(self):
+        """
+        Return the window adjust messages sent so far.
+        """
+        return [packet for packet in self.packets
+                if packet[0] == connection.MSG_CHANNEL_WINDOW_ADJUST]
+
+
+    def test_noWindowAdjustWhilePaused(self):
+        """
+        While the server is paused, its session does not give the client any
+        more window, and gives back what was used once the server is resumed.
+        """
+        self.server.pauseProducing()
+        self.receiveData()
+        self.assertEqual(self.windowAdjustments(), [])
+
+        self.server.resumeProducing()
+        self.assertEqual(len(self.windowAdjustments()), 1)
+        self.assertEqual(self.session.localWindowLeft,
+                         self.session.localWindowSize)
+
+
+    def test_windowAdjustWhileNotPaused(self):
+        """
+        While the server is not paused, its session gives the client more
+        window once it has used more than half of it.
+        """
+        self.receiveData()
+        self.assertEqual(len(self.windowAdjustments()), 1)
+
+
+
 class ConstantsTests(unittest.TestCase):
     """
     Tests for the constants used by the SFTP protocol implementation.
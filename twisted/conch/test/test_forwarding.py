@@ -80,3 +80,48 @@ class TestSSHConnectForwardingChannel(unittest.TestCase):
         self.assertTrue(isinstance(sut.client, forwarding.SSHForwardingClient))
         self.assertEqual(
             IPv6Address('TCP', '::1', 1234), sut.client.transport.getPeer())
+
+
+    def test_producersRegistered(self):
+        """
+        Once the forwarding destination is connected, the channel and the
+        transport of the connection to it are registered as producers with
+        each other.
+        """
+        sut = forwarding.SSHConnectForwardingChannel(
+            hostport=('fwd.example.org', 1234))
+        sut._reactor = MemoryReactorClock()
+        self.patchHostnameEndpointResolver(
+            request=('fwd.example.org', 1234),
+            response=(AF_INET6 ,'::1'),
+            )
+
+        sut.channelOpen(None)
+
+        self.makeTCPConnection(sut._reactor)
+        self.successResultOf(sut._channelOpenDeferred)
+        self.assertIdentical(sut.producer, sut.client.transport)
+        self.assertTrue(sut.streamingProducer)
+        self.assertIdentical(sut.client.transport.producer, sut)
+        self.assertTrue(sut.client.transport.streaming)
+
+
+
+class SSHListenForwardingChannelTests(unittest.TestCase):
+    """
+    Tests for L{SSHListenForwardingChannel}.
+    """
+
+    def test_producersRegistered(self):
+        """
+        Once the channel is open, it and the transport of the connection
+        being forwarded are registered as producers with each other.
+        """
+        sut = forwarding.SSHListenClientForwardingChannel()
+        sut.client = forwarding.SSHForwardingClient(sut)
+        sut.client.makeConnection(StringTransport())
+
+        sut.channelOpen('')
+
+        self.assertIdentical(sut.producer, sut.client.transport)
+        self.assertIdentical(sut.client.transport.producer, sut)
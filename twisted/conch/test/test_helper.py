@@ -2,13 +2,15 @@
 # Copyright (c) Twisted Matrix Laboratories.
 # See LICENSE for details.
 
-from twisted.conch.insults import helper
+from twisted.conch.insults import helper, window
 from twisted.conch.insults.insults import G0, G1, G2, G3
 from twisted.conch.insults.insults import modes, privateModes
 from twisted.conch.insults.insults import (
     NORMAL, BOLD, UNDERLINE, BLINK, REVERSE_VIDEO)
+from twisted.conch.insults.insults import CS_US, CS_DRAWING, ClientProtocol
 
 from twisted.trial import unittest
+from twisted.test.proto_helpers import StringTransport
 
 WIDTH = 80
 HEIGHT = 24
@@ -612,3 +614,209 @@ class CharacterAttributeTests(unittest.TestCase):
             warningsShown[0]['message'],
             'twisted.conch.insults.helper.wantOne was deprecated in '
             'Twisted 13.1.0')
+
+
+
+class ScreenBufferTests(unittest.TestCase):
+    """
+    Tests for L{helper.ScreenBuffer}.
+    """
+    def setUp(self):
+        self.transport = StringTransport()
+        self.screen = helper.ScreenBuffer(self.transport, WIDTH, HEIGHT)
+
+
+    def flush(self):
+        """
+        Flush C{self.screen} and return what it wrote.
+        """
+        self.transport.clear()
+        self.screen.flush()
+        return self.transport.value()
+
+
+    def test_firstFlush(self):
+        """
+        L{helper.ScreenBuffer.flush} first clears the screen and resets the
+        graphic rendition and character set, then writes what has been drawn
+        and moves the cursor to where it was left.
+        """
+        self.screen.cursorPosition(2, 1)
+        self.screen.write('hello')
+        self.screen.cursorPosition(0, 3)
+        self.assertEqual(
+            '\x1b[0m\x1b(B\x1b[2J\x1b[2;3Hhello\x1b[4;1H', self.flush())
+
+
+    def test_unchanged(self):
+        """
+        Drawing the same thing again writes nothing, nor does flushing with
+        nothing drawn.
+        """
+        self.screen.write('hello')
+        self.flush()
+        self.assertEqual('', self.flush())
+        self.screen.cursorPosition(0, 0)
+        self.screen.write('hello')
+        self.assertEqual('', self.flush())
+
+
+    def test_changed(self):
+        """
+        Only the characters which have changed since the last frame are
+        written, and only once each however often the frame drew them.
+        """
+        self.screen.write('hello')
+        self.flush()
+        self.screen.cursorPosition(0, 0)
+        self.screen.write('hallo')
+        self.screen.cursorPosition(0, 0)
+        self.screen.write('hullo')
+        self.assertEqual('\x1b[1;2Hu\x1b[3C', self.flush())
+
+
+    def test_shortGapRewritten(self):
+        """
+        A few unchanged characters between changed ones are written again
+        rather than moved over, and the cursor is moved over longer runs of
+        them.
+        """
+        self.screen.write('hello world')
+        self.flush()
+        self.screen.cursorPosition(0, 0)
+        self.screen.write('jellO world')
+        self.screen.cursorPosition(0, 0)
+        self.assertEqual('\rjellO\r', self.flush())
+        self.screen.write('jellO worlD')
+        self.screen.cursorPosition(0, 0)
+        self.assertEqual('\x1b[10CD\r', self.flush())
+
+
+    def test_graphicRendition(self):
+        """
+        The graphic rendition is changed when a character is drawn with
+        different attributes from the last one written.
+        """
+        self.flush()
+        self.screen.selectGraphicRendition(BOLD, 31)
+        self.screen.write('red')
+        self.screen.selectGraphicRendition(NORMAL)
+        self.screen.write('plain')
+        self.assertEqual('\x1b[0;1;31mred\x1b[0mplain', self.flush())
+
+
+    def test_rawGraphicRendition(self):
+        """
+        Graphic rendition escape sequences written to a L{helper.ScreenBuffer}
+        change the graphic rendition of the characters after them, as do
+        parameters given to C{selectGraphicRendition} as strings.
+        """
+        self.screen.write('\x1b[1;31mred\x1b[mplain')
+        self.screen.selectGraphicRendition(str(REVERSE_VIDEO))
+        self.screen.write('reverse')
+        self.assertEqual('redplainreverse', str(self.screen).strip())
+        red = self.screen.getCharacter(0, 0)[1]
+        self.assertTrue(red.bold)
+        self.assertEqual(helper.RED, red.foreground)
+        self.assertFalse(self.screen.getCharacter(3, 0)[1].bold)
+        self.assertTrue(self.screen.getCharacter(8, 0)[1].reverseVideo)
+
+
+    def test_characterSet(self):
+        """
+        The character set each character was drawn in is kept, and selected
+        when it is written.
+        """
+        self.flush()
+        self.screen.selectCharacterSet(CS_DRAWING, G0)
+        self.screen.write('qq')
+        self.screen.selectCharacterSet(CS_US, G0)
+        self.screen.write('qq')
+        self.assertEqual(CS_DRAWING, self.screen.getCharacter(0, 0)[1].charset)
+        self.assertEqual('\x1b(0qq\x1b(Bqq', self.flush())
+
+
+    def test_saveCursor(self):
+        """
+        L{helper.ScreenBuffer.restoreCursor} restores the graphic rendition
+        saved with the cursor position by L{helper.ScreenBuffer.saveCursor}.
+        """
+        self.screen.saveCursor()
+        self.screen.selectGraphicRendition(REVERSE_VIDEO)
+        self.screen.write('x')
+        self.screen.restoreCursor()
+        self.screen.cursorForward()
+        self.screen.write('y')
+        self.assertTrue(self.screen.getCharacter(0, 0)[1].reverseVideo)
+        self.assertFalse(self.screen.getCharacter(1, 0)[1].reverseVideo)
+
+
+    def test_resize(self):
+        """
+        After L{helper.ScreenBuffer.resize}, the screen is cleared and written
+        in full.
+        """
+        self.screen.write('hello')
+        self.flush()
+        self.screen.resize(40, 10)
+        self.screen.write('hello')
+        self.assertEqual('\x1b[0m\x1b(B\x1b[2J\x1b[1;1Hhello', self.flush())
+
+
+    def test_scroll(self):
+        """
+        The lines which have moved when the screen scrolls are written again.
+        """
+        self.screen.cursorPosition(0, HEIGHT - 1)
+        self.screen.write('bottom')
+        self.flush()
+        self.screen.nextLine()
+        self.assertEqual(
+            '\x1b[%d;1Hbottom\x1b[%d;1H      \r' % (HEIGHT - 1, HEIGHT),
+            self.flush())
+
+
+    def test_widgets(self):
+        """
+        A terminal which is written the frames of widgets drawn on a
+        L{helper.ScreenBuffer} shows the same characters with the same
+        graphic renditions.
+        """
+        client = ClientProtocol(helper.TerminalBuffer)
+        client.makeConnection(StringTransport())
+        self.transport.write = client.dataReceived
+
+        lines = [window.TextOutput((WIDTH - 2, 1)) for i in range(4)]
+        box = window.VBox()
+        for line in lines:
+            box.addChild(line)
+        selection = window.Selection(['one', 'two', 'three'], None)
+        box.addChild(selection)
+        root = window.Border(box)
+
+        for i in range(10):
+            lines[i % len(lines)].setText('line %d' % (i,))
+            selection.focusedIndex = selection.renderOffset = i % 3
+            root.redraw(WIDTH, HEIGHT, self.screen)
+            self.screen.flush()
+
+            for y in range(HEIGHT):
+                for x in range(WIDTH):
+                    self.assertEqual(
+                        _appearance(self.screen.getCharacter(x, y)),
+                        _appearance(client.terminal.getCharacter(x, y)),
+                        (i, x, y))
+
+
+
+def _appearance(character):
+    """
+    Get how a character from a L{helper.TerminalBuffer} looks, apart from its
+    character set.
+    """
+    ch, attributes = character
+    if ch is helper.TerminalBuffer.void:
+        ch = helper.TerminalBuffer.fill
+    return (ch, attributes.bold, attributes.underline, attributes.blink,
+            attributes.reverseVideo, attributes.foreground,
+            attributes.background)
@@ -364,6 +364,23 @@ class ClientControlSequencesTests(unittest.TestCase, MockMixin):
         self.assertEqual(result, (6, 7))
 
 
+    def test_cursorPositionControlSequence(self):
+        """
+        A cursor position control sequence with no parameters moves the
+        cursor home, and one with a line and column, either of which may be
+        omitted, moves it to that zero-based column and line.
+        """
+        self.parser.dataReceived("\x1b[H\x1b[3;7H\x1b[5H\x1b[;2H")
+        occs = occurrences(self.proto)
+
+        result = self.assertCall(occs.pop(0), "cursorHome")
+        self.assertFalse(occurrences(result))
+        for position in [(6, 2), (0, 4), (1, 0)]:
+            result = self.assertCall(occs.pop(0), "cursorPosition", position)
+            self.assertFalse(occurrences(result))
+        self.assertFalse(occs)
+
+
     def test_applicationDataBytes(self):
         """
         Contiguous non-control bytes are passed to a single call to the
@@ -1059,6 +1059,33 @@ class SSHSessionProcessProtocolTests(unittest.TestCase):
             self.session.conn.transport.getPeer(), self.pp.getPeer())
 
 
+    def test_registerProducer(self):
+        """
+        SSHSessionProcessProtocol.registerProducer and unregisterProducer
+        register and unregister the producer with its session.
+        """
+        producer = object()
+        self.pp.registerProducer(producer, True)
+        self.assertIdentical(self.session.producer, producer)
+        self.assertTrue(self.session.streamingProducer)
+        self.pp.unregisterProducer()
+        self.assertIdentical(self.session.producer, None)
+
+
+    def test_pauseProducing(self):
+        """
+        SSHSessionProcessProtocol.pauseProducing and resumeProducing pause and
+        resume its session, and resuming it replenishes the session's window.
+        """
+        replenished = []
+        self.session.conn.replenishWindow = replenished.append
+        self.pp.pauseProducing()
+        self.assertTrue(self.session.receivingPaused)
+        self.pp.resumeProducing()
+        self.assertFalse(self.session.receivingPaused)
+        self.assertEqual(replenished, [self.session])
+
+
     def test_connectionMade(self):
         """
         SSHSessionProcessProtocol.connectionMade() should check if there's a
@@ -136,6 +136,8 @@ class MockCipher(object):
     usedDecrypt = False
     outMAC = (None, '', '', 1)
     inMAC = (None, '', '', 1)
+    outAEAD = None
+    inAEAD = None
     keys = ()
 
 
@@ -580,12 +582,61 @@ class BaseSSHTransportTests(TransportTestCase):
         self.assertEqual(proto.getPacket(), 'ABCDEFG')
 
 
+    def test_dataReceivedManyPackets(self):
+        """
+        L{SSHTransportBase.dataReceived} dispatches all of the packets in the
+        data it is given, and keeps an incomplete packet which follows them
+        until the rest of it has been received.
+        """
+        proto = MockTransportBase()
+        proto.makeConnection(self.transport)
+        self.finishKeyExchange(proto)
+        proto.currentEncryptions = MockCipher()
+        proto.incomingPacketSequence = proto.outgoingPacketSequence
+        self.transport.clear()
+        for data in ['a', 'bc', 'def', 'ghij']:
+            proto.sendPacket(transport.MSG_IGNORE, data)
+        value = self.transport.value()
+        proto.dataReceived(value[:-3])
+        self.assertEqual(proto.ignoreds, ['a', 'bc', 'def'])
+        proto.dataReceived(value[-3:])
+        self.assertEqual(proto.ignoreds, ['a', 'bc', 'def', 'ghij'])
+        self.assertEqual(proto.buf, '')
+
+
+    def test_dataReceivedFromDispatch(self):
+        """
+        If handling a packet delivers more data to the transport, the packets
+        which were already received are still dispatched first, and none of
+        them twice.
+        """
+        proto = MockTransportBase()
+        proto.makeConnection(self.transport)
+        self.finishKeyExchange(proto)
+        proto.incomingPacketSequence = proto.outgoingPacketSequence
+        self.transport.clear()
+        proto.sendPacket(transport.MSG_IGNORE, 'a')
+        proto.sendPacket(transport.MSG_IGNORE, 'b')
+        first = self.transport.value()
+        self.transport.clear()
+        proto.sendPacket(transport.MSG_IGNORE, 'c')
+        second = self.transport.value()
+        def ssh_IGNORE(packet):
+            proto.ignoreds.append(packet)
+            if packet == 'a':
+                proto.dataReceived(second)
+        proto.ssh_IGNORE = ssh_IGNORE
+        proto.dataReceived(first)
+        self.assertEqual(proto.ignoreds, ['a', 'b', 'c'])
+        self.assertEqual(proto.buf, '')
+
+
     def test_ciphersAreValid(self):
         """
         Test that all the supportedCiphers are valid.
         """
         ciphers = transport.SSHCiphers('A', 'B', 'C', 'D')
-        iv = key = '\x00' * 16
+        iv = key = '\x00' * 64
         for cipName in self.proto.supportedCiphers:
             self.assertTrue(ciphers._getCipher(cipName, iv, key))
 
@@ -1046,7 +1097,9 @@ here's some other stuff
 
         k1 = sha1('AB' + 'CD' + 'K' + self.proto.sessionID).digest()
         k2 = sha1('ABCD' + k1).digest()
-        self.assertEqual(self.proto._getKey('K', 'AB', 'CD'), k1 + k2)
+        k3 = sha1('ABCD' + k1 + k2).digest()
+        k4 = sha1('ABCD' + k1 + k2 + k3).digest()
+        self.assertEqual(self.proto._getKey('K', 'AB', 'CD'), k1 + k2 + k3 + k4)
 
 
     def test_multipleClasses(self):
@@ -1993,6 +2046,227 @@ class SSHCiphersTests(unittest.TestCase):
                 "Failed HMAC test vector; key=%r data=%r" % (key, data))
 
 
+    def test_counterMode(self):
+        """
+        The counter mode ciphers count up from the initialization vector in
+        the same way as L{transport._Counter}, wrapping around to zero.
+        """
+        from Crypto.Cipher import AES
+        iv = '\xff' * 15 + '\xfe'
+        key = '\x02' * 16
+        data = '\x00' * 64
+        ciphers = transport.SSHCiphers('A', 'B', 'C', 'D')
+        cipher = ciphers._getCipher('aes128-ctr', iv, key)
+        expected = AES.new(key, AES.MODE_CTR, iv,
+                           counter=transport._Counter(iv, 16))
+        self.assertEqual(cipher.encrypt(data), expected.encrypt(data))
+
+
+
+class AEADCipherTests(unittest.TestCase):
+    """
+    Tests for the ciphers in L{SSHCiphers.aeadMap}, which authenticate the
+    packets themselves instead of using a MAC.
+    """
+    if dependencySkip:
+        skip = dependencySkip
+    elif transport.AESGCM is None:
+        skip = "cannot run without cryptography's AES-GCM"
+
+    def connect(self, cipName):
+        """
+        Make a transport which sends packets with C{cipName} and one which
+        receives them.
+
+        @return: A 2-tuple of the sending and receiving L{MockTransportBase}.
+        """
+        iv = '\x01' * 64
+        key = '\x02' * 64
+        sender = MockTransportBase()
+        sender.makeConnection(proto_helpers.StringTransport())
+        sender.currentEncryptions = transport.SSHCiphers(
+            cipName, 'none', 'none', 'none')
+        sender.currentEncryptions.setKeys(iv, key, '', '', '', '')
+        sender.transport.clear()
+        receiver = MockTransportBase()
+        receiver.makeConnection(proto_helpers.StringTransport())
+        receiver.gotVersion = True
+        receiver.incomingPacketSequence = sender.outgoingPacketSequence
+        receiver.currentEncryptions = transport.SSHCiphers(
+            'none', cipName, 'none', 'none')
+        receiver.currentEncryptions.setKeys('', '', iv, key, '', '')
+        return sender, receiver
+
+
+    def test_packets(self):
+        """
+        Packets sent with an AEAD cipher are received intact, whether they
+        arrive together or a byte at a time, and the packet length is left out
+        of the data which is padded to the block size.
+        """
+        messages = ['a', 'bc' * 100, 'def' * 10000]
+        for cipName in transport._aeadCiphers:
+            for byteAtATime in [False, True]:
+                sender, receiver = self.connect(cipName)
+                cipher = sender.currentEncryptions.outAEAD
+                for message in messages:
+                    sender.transport.clear()
+                    sender.sendPacket(transport.MSG_IGNORE, message)
+                    value = sender.transport.value()
+                    self.assertEqual(
+                        (len(value) - 4 - cipher.tagSize) % cipher.block_size,
+                        0)
+                    if byteAtATime:
+                        for byte in value:
+                            receiver.dataReceived(byte)
+                    else:
+                        receiver.dataReceived(value)
+                self.assertEqual(receiver.ignoreds, messages, cipName)
+                self.assertEqual(receiver.buf, '')
+
+
+    def test_tamperedPacket(self):
+        """
+        A packet which has been changed after it was sent with an AEAD cipher
+        is not dispatched, and the connection is closed with
+        C{DISCONNECT_MAC_ERROR}.
+        """
+        for cipName in transport._aeadCiphers:
+            sender, receiver = self.connect(cipName)
+            disconnects = []
+            receiver.sendDisconnect = lambda reason, desc: disconnects.append(
+                reason)
+            sender.sendPacket(transport.MSG_IGNORE, 'secret')
+            value = sender.transport.value()
+            receiver.dataReceived(value[:10] + chr(ord(value[10]) ^ 1) +
+                                  value[11:])
+            self.assertEqual(receiver.ignoreds, [], cipName)
+            self.assertEqual(disconnects, [transport.DISCONNECT_MAC_ERROR])
+
+
+    # An SSH_MSG_IGNORE packet carrying 'hello', with 5 bytes of zero padding.
+    knownPacket = ('\x00\x00\x00\x10\x05\x02\x00\x00\x00\x05hello' +
+                   '\x00' * 5)
+
+
+    def assertKnownAnswers(self, makeCipher, seqids, expected):
+        """
+        Assert that a cipher encrypts L{knownPacket} with each sequence
+        number in turn as the corresponding one of C{expected}, and that a
+        cipher for the other direction decrypts them.
+
+        @param makeCipher: A callable returning a new cipher.
+        @param seqids: The sequence numbers of the packets.
+        @param expected: The hex encodings of the packets as they are sent.
+        """
+        encrypting = makeCipher()
+        decrypting = makeCipher()
+        for seqid, sent in zip(seqids, expected):
+            self.assertEqual(
+                encrypting.encryptPacket(seqid, self.knownPacket).encode(
+                    'hex'),
+                sent)
+            sent = sent.decode('hex')
+            self.assertEqual(decrypting.decryptLength(seqid, sent[:4]), 16)
+            self.assertEqual(decrypting.decryptPacket(seqid, sent),
+                             self.knownPacket[4:])
+
+
+    def test_knownAnswerAESGCM(self):
+        """
+        C{aes128-gcm@openssh.com} encrypts packets as specified by RFC 5647
+        and OpenSSH's C{PROTOCOL}: the length is sent in the clear and
+        authenticated as associated data, and the invocation counter in the
+        last eight bytes of the nonce is incremented for each packet.
+        """
+        iv = ''.join(map(chr, range(0x10, 0x1c)))
+        key = ''.join(map(chr, range(16)))
+        self.assertKnownAnswers(
+            lambda: transport._AESGCMCipher(iv, key), [0, 1],
+            ['00000010c12c03af0f4ade8a7bb132f5'
+             'c727eb3ed7a4082e4a7a72942dd8cb81d69b33f3',
+             '00000010f04268d24308501de89abd9e'
+             '01d846fd23ed0e1f6101daa1b1096a91a9ba353c'])
+
+
+    def test_knownAnswerChaCha20Poly1305(self):
+        """
+        C{chacha20-poly1305@openssh.com} encrypts packets as specified by
+        OpenSSH's C{PROTOCOL.chacha20poly1305}: the length with the second
+        half of the key, the rest of the packet with the first half starting
+        at the second block of its key stream, and a Poly1305 tag keyed by the
+        first block over both, all with the sequence number as the nonce.
+        """
+        if 'chacha20-poly1305@openssh.com' not in transport._aeadCiphers:
+            raise unittest.SkipTest(
+                "cannot run without cryptography's Poly1305")
+        key = ''.join(map(chr, range(64)))
+        self.assertKnownAnswers(
+            lambda: transport._ChaCha20Poly1305Cipher('', key), [7],
+            ['a39afcba2d4415434e86423b0001d4f0'
+             'd78fd32c39bc16111d67a8b463bba33c22ede960'])
+
+
+    def sendRawPacket(self, cipName, packet):
+        """
+        Encrypt C{packet} with C{cipName} as it is, and deliver it to a
+        receiver.
+
+        @param packet: The packet, starting with its length.
+        @return: A C{list} of the reasons the receiver disconnected for.
+        """
+        sender, receiver = self.connect(cipName)
+        disconnects = []
+        receiver.sendDisconnect = lambda reason, desc: disconnects.append(
+            reason)
+        receiver.dataReceived(sender.currentEncryptions.outAEAD.encryptPacket(
+                sender.outgoingPacketSequence, packet))
+        self.assertEqual(receiver.ignoreds, [], cipName)
+        return disconnects
+
+
+    def test_packetTooShort(self):
+        """
+        A packet shorter than the block size of an AEAD cipher is not
+        dispatched, and the connection is closed with
+        C{DISCONNECT_PROTOCOL_ERROR}.
+        """
+        for cipName in transport._aeadCiphers:
+            self.assertEqual(
+                self.sendRawPacket(cipName, '\x00\x00\x00\x00'),
+                [transport.DISCONNECT_PROTOCOL_ERROR], cipName)
+
+
+    def test_badPaddingLength(self):
+        """
+        A packet sent with an AEAD cipher whose padding is shorter than four
+        bytes, or does not leave room for the padding length, is not
+        dispatched, and the connection is closed with
+        C{DISCONNECT_PROTOCOL_ERROR}.
+        """
+        for cipName in transport._aeadCiphers:
+            for paddingLen in [3, 16, 255]:
+                packet = ('\x00\x00\x00\x10' + chr(paddingLen) +
+                          '\x02\x00\x00\x00\x05hello' +
+                          '\x00' * 5)
+                self.assertEqual(
+                    self.sendRawPacket(cipName, packet),
+                    [transport.DISCONNECT_PROTOCOL_ERROR],
+                    (cipName, paddingLen))
+
+
+    def test_isVerified(self):
+        """
+        A transport using an AEAD cipher is verified even though it does not
+        use a MAC.
+        """
+        cipName = transport._aeadCiphers[0]
+        sender, receiver = self.connect(cipName)
+        self.assertTrue(sender.isVerified('out'))
+        self.assertTrue(receiver.isVerified('in'))
+        self.assertEqual(sender.currentEncryptions.outMACType, 'none')
+
+
 
 class CounterTests(unittest.TestCase):
     """
@@ -2102,6 +2376,8 @@ class TransportLoopbackTests(unittest.TestCase):
         deferreds = []
         for mac in transport.SSHTransportBase.supportedMACs + ['none']:
             def setMAC(proto):
+                # The AEAD ciphers do not use a MAC.
+                proto.supportedCiphers = ['aes256-ctr']
                 proto.supportedMACs = [mac]
                 return proto
             deferreds.append(self._runClientServer(setMAC))
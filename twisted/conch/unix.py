@@ -31,6 +31,17 @@ try:
 except ImportError:
     utmp = None
 
+try:
+    _pread = os.pread
+except AttributeError:
+    def _pread(fd, length, offset):
+        """
+        Read up to C{length} bytes from C{offset} in the file C{fd}, on
+        versions of Python without C{os.pread}.
+        """
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.read(fd, length)
+
 
 @implementer(portal.IRealm)
 class UnixSSHRealm:
@@ -388,6 +399,30 @@ class SFTPServerForUnixConchUser:
 
 @implementer(ISFTPFile)
 class UnixSFTPFile:
+    """
+    A file opened by an SFTP client.
+
+    When the client reads a file sequentially, as most clients do with
+    several requests outstanding, it is read C{readAheadSize} bytes at a time
+    and the following requests are answered from what was read, so that each
+    one does not have to switch to the user's ID and back to make its own
+    system calls.  Data read ahead is discarded when the client writes to the
+    file or reads from elsewhere in it, but changes made to the file by
+    other processes may not be seen until the next C{readAheadSize} bytes
+    are read.
+
+    @ivar readAheadSize: The number of bytes to read at a time while the file
+        is read sequentially, or C{0} not to read ahead.
+    @ivar _readAhead: The data which has been read ahead.
+    @ivar _readAheadOffset: The offset of C{_readAhead} in the file.
+    @ivar _nextOffset: The offset following the last read.
+    """
+    readAheadSize = 2 ** 18
+
+    _readAhead = ''
+    _readAheadOffset = 0
+    _nextOffset = 0
+
     def __init__(self, server, filename, flags, attrs):
         self.server = server
         openFlags = 0
@@ -419,10 +454,22 @@ class UnixSFTPFile:
         return self.server.avatar._runAsUser(os.close, self.fd)
 
     def readChunk(self, offset, length):
-        return self.server.avatar._runAsUser([ (os.lseek, (self.fd, offset, 0)),
-                                               (os.read, (self.fd, length)) ])
+        start = offset - self._readAheadOffset
+        sequential = offset == self._nextOffset
+        self._nextOffset = offset + length
+        if 0 <= start and start + length <= len(self._readAhead):
+            return self._readAhead[start:start + length]
+        if not sequential or length >= self.readAheadSize:
+            self._readAhead = ''
+            return self.server.avatar._runAsUser(_pread, self.fd, length,
+                                                 offset)
+        self._readAhead = self.server.avatar._runAsUser(
+            _pread, self.fd, self.readAheadSize, offset)
+        self._readAheadOffset = offset
+        return self._readAhead[:length]
 
     def writeChunk(self, offset, data):
+        self._readAhead = ''
         return self.server.avatar._runAsUser([(os.lseek, (self.fd, offset, 0)),
                                        (os.write, (self.fd, data))])
 
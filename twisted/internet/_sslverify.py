@@ -6,9 +6,12 @@
 from __future__ import division, absolute_import
 
 import itertools
+import threading
 import warnings
+import weakref
 
 from binascii import a2b_base64
+from collections import OrderedDict
 from hashlib import md5
 
 import OpenSSL
@@ -18,6 +21,10 @@ try:
 except ImportError:
     SSL_CB_HANDSHAKE_START = 0x10
     SSL_CB_HANDSHAKE_DONE = 0x20
+try:
+    from OpenSSL.SSL import SSL_CB_EXIT
+except ImportError:
+    SSL_CB_EXIT = 0x02
 
 from twisted.python import log
 
@@ -220,6 +227,68 @@ def _sessionCounter(counter=itertools.count()):
 
 
 
+class ClientSessionCache(object):
+    """
+    A bounded cache of the TLS sessions of client connections, which lets a
+    client which reconnects to a server resume its session instead of
+    performing a full handshake.
+
+    Pass one to L{optionsForClientTLS} as C{sessionCache}.  Any object with
+    the same C{get} and C{store} methods may be used instead, for example to
+    keep sessions somewhere else.  Sessions are stored while handshaking,
+    which happens in other threads when the
+    L{TLSMemoryBIOFactory<twisted.protocols.tls.TLSMemoryBIOFactory>} has a
+    C{handshakeThreadPool}, so C{store} must be thread-safe.
+
+    @ivar maxSessions: The number of servers for which a session is kept.
+    @type maxSessions: C{int}
+    """
+
+    def __init__(self, maxSessions=1000):
+        self.maxSessions = maxSessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+
+    def get(self, key):
+        """
+        Find the session to resume with a server.
+
+        @param key: Identifies the server and the options used to connect
+            to it.
+
+        @return: The session, or C{None}.
+        @rtype: L{OpenSSL.SSL.Session}
+        """
+        with self._lock:
+            session = self._sessions.pop(key, None)
+            if session is not None:
+                self._sessions[key] = session
+            return session
+
+
+    def store(self, key, session):
+        """
+        Remember a session established with a server.
+
+        @param key: Identifies the server and the options used to connect
+            to it.
+
+        @type session: L{OpenSSL.SSL.Session}
+        """
+        with self._lock:
+            self._sessions.pop(key, None)
+            self._sessions[key] = session
+            while len(self._sessions) > self.maxSessions:
+                self._sessions.popitem(last=False)
+
+
+
 _x509names = {
     'CN': 'commonName',
     'commonName': 'commonName',
@@ -1088,9 +1157,22 @@ class ClientTLSOptions(object):
         than working with Python's built-in (but sometimes broken) IDNA
         encoding.  ASCII values, however, will always work.
     @type _hostnameASCII: L{unicode}
+
+    @ivar _sessionCache: The L{ClientSessionCache} which sessions with the
+        server are kept in and resumed from, or C{None}.
+
+    @ivar _sessionKey: The key of the sessions of this L{ClientTLSOptions}
+        in C{_sessionCache}, shared with those connecting to the same host
+        with the same trust root, client certificate and protocol version.
+
+    @ivar _verifiedConnections: The connections whose server has been
+        verified, and whose session may be kept.  It is used by the info
+        callback, which may run in several handshake threads at once, so it
+        is guarded by C{_verifiedLock}.
+    @type _verifiedConnections: L{weakref.WeakKeyDictionary}
     """
 
-    def __init__(self, hostname, ctx):
+    def __init__(self, hostname, ctx, sessionCache=None, sessionKey=None):
         """
         Initialize L{ClientTLSOptions}.
 
@@ -1099,11 +1181,28 @@ class ClientTLSOptions(object):
 
         @param ctx: an L{SSL.Context} to use for new connections.
         @type ctx: L{SSL.Context}.
+
+        @param sessionCache: A L{ClientSessionCache} to keep sessions with
+            the server in, or C{None}.
+
+        @param sessionKey: Identifies the options C{ctx} was made with, so
+            that the sessions of connections made with equivalent options
+            are kept under the same key in C{sessionCache}.  By default, the
+            sessions are only shared by the connections made with this
+            L{ClientTLSOptions}.
         """
         self._ctx = ctx
+        self._sessionCache = sessionCache
         self._hostname = hostname
         self._hostnameBytes = _idnaBytes(hostname)
         self._hostnameASCII = self._hostnameBytes.decode("ascii")
+        # Resuming a session skips verifying the server, so sessions are
+        # only shared between connections made with equivalent options.
+        if sessionKey is None:
+            sessionKey = _sessionCounter()
+        self._sessionKey = (self._hostnameBytes, sessionKey)
+        self._verifiedConnections = weakref.WeakKeyDictionary()
+        self._verifiedLock = threading.Lock()
         ctx.set_info_callback(
             _tolerateErrors(self._identityVerifyingInfoCallback)
         )
@@ -1128,6 +1227,10 @@ class ClientTLSOptions(object):
         context = self._ctx
         connection = SSL.Connection(context, None)
         connection.set_app_data(tlsProtocol)
+        if self._sessionCache is not None:
+            session = self._sessionCache.get(self._sessionKey)
+            if session is not None:
+                connection.set_session(session)
         return connection
 
 
@@ -1156,6 +1259,37 @@ class ClientTLSOptions(object):
                 f = Failure()
                 transport = connection.get_app_data()
                 transport.failVerification(f)
+            else:
+                if self._sessionCache is not None:
+                    with self._verifiedLock:
+                        self._verifiedConnections[connection] = True
+                    self._storeSession(connection)
+        elif where & SSL_CB_EXIT and self._isVerified(connection):
+            # With TLS 1.3, the server sends the session ticket after the
+            # handshake, and the session is only resumable once it arrives.
+            self._storeSession(connection)
+
+
+    def _isVerified(self, connection):
+        """
+        Determine whether the server of a connection has been verified.
+
+        @type connection: L{OpenSSL.SSL.Connection}
+
+        @rtype: L{bool}
+        """
+        with self._verifiedLock:
+            return connection in self._verifiedConnections
+
+
+    def _storeSession(self, connection):
+        """
+        Keep the session of a connection whose server has been verified in
+        the session cache.
+
+        @type connection: L{OpenSSL.SSL.Connection}
+        """
+        self._sessionCache.store(self._sessionKey, connection.get_session())
 
 
 
@@ -1192,6 +1326,12 @@ def optionsForClientTLS(hostname, trustRoot=None, clientCertificate=None,
         will not authenticate.
     @type clientCertificate: L{PrivateCertificate}
 
+    @param sessionCache: keyword-only argument; a L{ClientSessionCache} in
+        which to keep the session established with the server, so that a
+        later connection to the same host name can resume it instead of
+        performing a full handshake.  By default sessions are not resumed.
+    @type sessionCache: L{ClientSessionCache}
+
     @param extraCertificateOptions: keyword-only argument; this is a dictionary
         of additional keyword arguments to be presented to
         L{CertificateOptions}.  Please avoid using this unless you absolutely
@@ -1207,6 +1347,7 @@ def optionsForClientTLS(hostname, trustRoot=None, clientCertificate=None,
     @rtype: L{IOpenSSLClientConnectionCreator}
     """
     extraCertificateOptions = kw.pop('extraCertificateOptions', None) or {}
+    sessionCache = kw.pop('sessionCache', None)
     if trustRoot is None:
         trustRoot = platformTrust()
     if kw:
@@ -1230,7 +1371,33 @@ def optionsForClientTLS(hostname, trustRoot=None, clientCertificate=None,
         trustRoot=trustRoot,
         **extraCertificateOptions
     )
-    return ClientTLSOptions(hostname, certificateOptions.getContext())
+    sessionKey = (_trustRootKey(trustRoot),
+                  clientCertificate and clientCertificate.dump(),
+                  extraCertificateOptions.get('method'))
+    return ClientTLSOptions(hostname, certificateOptions.getContext(),
+                            sessionCache, sessionKey)
+
+
+
+def _trustRootKey(trustRoot):
+    """
+    Identify a trust root, so that sessions are only resumed by clients
+    trusting the same certificate authorities as the client which
+    established them.
+
+    @type trustRoot: L{IOpenSSLTrustRoot}
+
+    @return: A hashable value equal for trust roots trusting the same
+        authorities.
+    """
+    if isinstance(trustRoot, Certificate):
+        return trustRoot.dump()
+    if isinstance(trustRoot, OpenSSLCertificateAuthorities):
+        return tuple(crypto.dump_certificate(crypto.FILETYPE_ASN1, cert)
+                     for cert in trustRoot._caCerts)
+    if isinstance(trustRoot, OpenSSLDefaultPaths):
+        return OpenSSLDefaultPaths
+    return trustRoot
 
 
 
@@ -1281,7 +1448,8 @@ class OpenSSLCertificateOptions(object):
                  extraCertChain=None,
                  acceptableCiphers=None,
                  dhParameters=None,
-                 trustRoot=None):
+                 trustRoot=None,
+                 sessionContext=None):
         """
         Create an OpenSSL context SSL connection context factory.
 
@@ -1372,6 +1540,15 @@ class OpenSSLCertificateOptions(object):
 
         @type trustRoot: L{IOpenSSLTrustRoot}
 
+        @param sessionContext: A name for the contexts whose sessions may be
+            resumed by each other.  By default each context gets a name of
+            its own, so sessions can only be resumed with the context which
+            established them.  Only the name can be shared: pyOpenSSL offers
+            no way to share session ticket keys or a session cache between
+            processes, so a session is still only resumed by the process
+            which established it.
+        @type sessionContext: L{bytes}
+
         @raise ValueError: when C{privateKey} or C{certificate} are set without
             setting the respective other.
         @raise ValueError: when C{verify} is L{True} but C{caCerts} doesn't
@@ -1432,6 +1609,7 @@ class OpenSSLCertificateOptions(object):
         self.fixBrokenPeers = fixBrokenPeers
         if fixBrokenPeers:
             self._options |= self._OP_ALL
+        self.sessionContext = sessionContext
         self.enableSessionTickets = enableSessionTickets
 
         if not enableSessionTickets:
@@ -1521,11 +1699,16 @@ class OpenSSLCertificateOptions(object):
             ctx.set_verify_depth(self.verifyDepth)
 
         if self.enableSessions:
-            name = "%s-%d" % (reflect.qual(self.__class__), _sessionCounter())
-            sessionName = md5(networkString(name)).hexdigest()
+            if self.sessionContext is not None:
+                name = self.sessionContext
+            else:
+                name = networkString("%s-%d" % (
+                    reflect.qual(self.__class__), _sessionCounter()))
+            sessionName = md5(name).hexdigest()
 
             ctx.set_session_id(sessionName)
 
+
         if self.dhParameters:
             ctx.load_tmp_dh(self.dhParameters._dhFile.path)
         ctx.set_cipher_list(nativeString(self._cipherString))
@@ -227,7 +227,7 @@ from twisted.internet._sslverify import (
     OpenSSLCertificateOptions as CertificateOptions,
     OpenSSLDiffieHellmanParameters as DiffieHellmanParameters,
     platformTrust, OpenSSLDefaultPaths, VerificationError,
-    optionsForClientTLS,
+    optionsForClientTLS, ClientSessionCache,
 )
 
 __all__ = [
@@ -240,4 +240,5 @@ __all__ = [
     'platformTrust', 'OpenSSLDefaultPaths',
 
     'VerificationError', 'optionsForClientTLS',
+    'ClientSessionCache',
 ]
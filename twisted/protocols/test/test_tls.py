@@ -321,6 +321,41 @@ class TLSMemoryBIOTests(TestCase):
         return handshakeDeferred
 
 
+    def test_handshakeCounted(self):
+        """
+        The L{TLSMemoryBIOFactory} of each side of a connection counts the
+        completed handshake, as a full one since neither side has a session
+        to resume.
+        """
+        tlsClient, tlsServer, handshakeDeferred, connectionDeferred = (
+            self.handshakeProtocols())
+
+        def cbHandshook(ignored):
+            tlsClient.loseConnection()
+            return connectionDeferred
+        handshakeDeferred.addCallback(cbHandshook)
+
+        def cbDisconnected(ignored):
+            for factory in [tlsClient.factory, tlsServer.factory]:
+                self.assertEqual(
+                    (1, 0), (factory.handshakes, factory.resumedHandshakes))
+        handshakeDeferred.addCallback(cbDisconnected)
+        return handshakeDeferred
+
+
+    def test_resumedHandshakeCounted(self):
+        """
+        L{TLSMemoryBIOFactory._handshakeCompleted} counts resumed handshakes
+        separately, as well as among all handshakes.
+        """
+        factory = TLSMemoryBIOFactory(ServerTLSContext(), False,
+                                      ServerFactory())
+        factory._handshakeCompleted(False)
+        factory._handshakeCompleted(True)
+        self.assertEqual(2, factory.handshakes)
+        self.assertEqual(1, factory.resumedHandshakes)
+
+
     def test_handshakeFailure(self):
         """
         L{TLSMemoryBIOProtocol} reports errors in the handshake process to the
@@ -590,6 +625,166 @@ class TLSMemoryBIOTests(TestCase):
         return connectionDeferred
 
 
+    def test_multipleRecordsDeliveredTogether(self):
+        """
+        The application bytes of all the TLS messages received in a single
+        chunk from the underlying transport are delivered to the
+        application-level protocol in a single call to its C{dataReceived}.
+        """
+        bytes = [b'a', b'b', b'c', b'd', b'e', b'f', b'g', b'h', b'i']
+        class SimpleSendingProtocol(Protocol):
+            def connectionMade(self):
+                for b in bytes:
+                    self.transport.write(b)
+
+        clientFactory = ClientFactory()
+        clientFactory.protocol = SimpleSendingProtocol
+
+        clientContextFactory = HandshakeCallbackContextFactory()
+        wrapperFactory = TLSMemoryBIOFactory(
+            clientContextFactory, True, clientFactory)
+        sslClientProtocol = wrapperFactory.buildProtocol(None)
+
+        serverProtocol = AccumulatingProtocol(sum(map(len, bytes)))
+        serverFactory = ServerFactory()
+        serverFactory.protocol = lambda: serverProtocol
+
+        serverContextFactory = ServerTLSContext()
+        wrapperFactory = TLSMemoryBIOFactory(
+            serverContextFactory, False, serverFactory)
+        sslServerProtocol = wrapperFactory.buildProtocol(None)
+
+        connectionDeferred = loopbackAsync(
+            sslServerProtocol, sslClientProtocol, collapsingPumpPolicy)
+
+        def cbConnectionDone(ignored):
+            self.assertEqual([b''.join(bytes)], serverProtocol.received)
+        connectionDeferred.addCallback(cbConnectionDone)
+        return connectionDeferred
+
+
+    def respondingTest(self, respond, check):
+        """
+        Run a test where the server responds to bytes it receives from the
+        client.
+
+        @param respond: A two-argument callable taking the server's transport
+            and the bytes it received, called from the server protocol's
+            C{dataReceived}.
+
+        @param check: A two-argument callable taking the application bytes
+            the server encrypted, one L{bytes} for each time it did, and the
+            bytes the client received, called once the connection is closed.
+
+        @return: A L{Deferred} which fires once C{check} has been called.
+        """
+        clientProtocol = AccumulatingProtocol(999999999999)
+        clientFactory = ClientFactory()
+        clientFactory.protocol = lambda: clientProtocol
+
+        clientContextFactory, handshakeDeferred = (
+            HandshakeCallbackContextFactory.factoryAndDeferred())
+        wrapperFactory = TLSMemoryBIOFactory(
+            clientContextFactory, True, clientFactory)
+        sslClientProtocol = wrapperFactory.buildProtocol(None)
+
+        class RespondingProtocol(Protocol):
+            def dataReceived(self, bytes):
+                respond(self.transport, bytes)
+
+        serverFactory = ServerFactory()
+        serverFactory.protocol = RespondingProtocol
+
+        serverContextFactory = ServerTLSContext()
+        wrapperFactory = TLSMemoryBIOFactory(
+            serverContextFactory, False, serverFactory)
+        sslServerProtocol = wrapperFactory.buildProtocol(None)
+
+        encrypted = []
+        write = sslServerProtocol._write
+        def recordingWrite(bytes):
+            encrypted.append(bytes)
+            write(bytes)
+        sslServerProtocol._write = recordingWrite
+
+        connectionDeferred = loopbackAsync(sslServerProtocol, sslClientProtocol)
+
+        def cbHandshook(ignored):
+            sslClientProtocol.write(b"request")
+            return connectionDeferred
+        handshakeDeferred.addCallback(cbHandshook)
+
+        def cbDisconnected(ignored):
+            check(encrypted, b"".join(clientProtocol.received))
+        handshakeDeferred.addCallback(cbDisconnected)
+        return handshakeDeferred
+
+
+    def test_writesDuringDeliveryCoalesced(self):
+        """
+        Bytes which the application-level protocol writes while received bytes
+        are delivered to it are encrypted together once it returns, before a
+        close alert sent because it lost the connection.
+        """
+        def respond(transport, bytes):
+            for b in iterbytes(b"response"):
+                transport.write(b)
+            transport.loseConnection()
+
+        def check(encrypted, received):
+            self.assertEqual([b"response"], encrypted)
+            self.assertEqual(b"response", received)
+        return self.respondingTest(respond, check)
+
+
+    def test_writeSequenceCoalesced(self):
+        """
+        L{TLSMemoryBIOProtocol.writeSequence} encrypts consecutive small
+        strings together, and passes along strings which fill a TLS record
+        on their own without joining them to any others.
+        """
+        large = b"x" * 2 ** 14
+        def respond(transport, bytes):
+            transport.writeSequence([b"a", b"b", large, b"c", b"d"])
+            transport.writeSequence([b"e"])
+            transport.loseConnection()
+
+        def check(encrypted, received):
+            self.assertEqual([b"ab", large, b"cde"], encrypted)
+            self.assertEqual(b"ab" + large + b"cde", received)
+        return self.respondingTest(respond, check)
+
+
+    def test_writeSequenceIterator(self):
+        """
+        L{TLSMemoryBIOProtocol.writeSequence} accepts an iterator, which can
+        only be iterated over once.
+        """
+        def respond(transport, bytes):
+            transport.writeSequence(iter([b"a", b"b"]))
+            transport.loseConnection()
+
+        def check(encrypted, received):
+            self.assertEqual(b"ab", received)
+        return self.respondingTest(respond, check)
+
+
+    def test_writeSequenceUnicodeRaisesTypeError(self):
+        """
+        Passing C{unicode} to L{TLSMemoryBIOProtocol.writeSequence} raises a
+        C{TypeError}, and none of the other strings are written.
+        """
+        def respond(transport, bytes):
+            self.assertRaises(
+                TypeError, transport.writeSequence, [b"a", u"b"])
+            transport.write(b"c")
+            transport.loseConnection()
+
+        def check(encrypted, received):
+            self.assertEqual(b"c", received)
+        return self.respondingTest(respond, check)
+
+
     def test_hugeWrite(self):
         """
         If a very long string is passed to L{TLSMemoryBIOProtocol.write}, any
@@ -1109,6 +1304,9 @@ class TLSProducerTests(TestCase):
             def recv(self, size):
                 raise WantReadError()
 
+            def get_peer_finished(self):
+                return None
+
         transport = PausingStringTransport()
         clientProtocol, tlsProtocol, producer = self.setupStreamingProducer(
             transport)
@@ -1232,6 +1430,246 @@ class TLSProducerTests(TestCase):
 
 
 
+class QueueingThreadPool(object):
+    """
+    An implementation of the part of the L{ThreadPool} interface used by
+    L{deferToThreadPool} which keeps calls until the test runs them, and
+    delivers their results synchronously.
+
+    @ivar calls: A C{list} of C{(onResult, f, a, kw)} tuples for calls which
+        have not been run yet.
+    """
+    def __init__(self):
+        self.calls = []
+
+
+    def callInThreadWithCallback(self, onResult, f, *a, **kw):
+        self.calls.append((onResult, f, a, kw))
+
+
+    def callFromThread(self, f, *a, **kw):
+        """
+        Stand in for the reactor's C{callFromThread}; C{run} is always called
+        in the reactor thread.
+        """
+        f(*a, **kw)
+
+
+    def run(self):
+        """
+        Run the oldest call which has not been run yet.
+        """
+        onResult, f, a, kw = self.calls.pop(0)
+        try:
+            result = f(*a, **kw)
+        except:
+            onResult(False, Failure())
+        else:
+            onResult(True, result)
+
+
+
+class ConnectionLostRecordingProtocol(AccumulatingProtocol):
+    """
+    An L{AccumulatingProtocol} which records why its connection was lost.
+
+    @ivar lostReason: The L{Failure} passed to C{connectionLost}, or C{None}.
+    """
+    lostReason = None
+
+    def connectionLost(self, reason):
+        self.lostReason = reason
+
+
+
+class HandshakeSchedulingTests(TestCase):
+    """
+    Tests for running the steps of handshakes in a thread pool, and for
+    limiting the number of concurrent handshakes, with the
+    C{handshakeThreadPool} and C{maxConcurrentHandshakes} arguments of
+    L{TLSMemoryBIOFactory}.
+    """
+
+    def connect(self, serverFactory):
+        """
+        Connect a new client to a server built by C{serverFactory}, each with
+        a L{StringTransport}.
+
+        @return: A two-tuple of the client and server L{TLSMemoryBIOProtocol}.
+        """
+        clientFactory = ClientFactory()
+        clientFactory.protocol = lambda: ConnectionLostRecordingProtocol(
+            999999999999)
+        client = TLSMemoryBIOFactory(
+            ClientTLSContext(), True, clientFactory).buildProtocol(None)
+        server = serverFactory.buildProtocol(None)
+        server.makeConnection(StringTransport())
+        client.makeConnection(StringTransport())
+        return client, server
+
+
+    def serverFactory(self, **kw):
+        """
+        Create a L{TLSMemoryBIOFactory} for servers which accumulate the
+        bytes they receive, and write C{b"hello"} when they are connected.
+        """
+        class GreetingProtocol(ConnectionLostRecordingProtocol):
+            def connectionMade(self):
+                ConnectionLostRecordingProtocol.connectionMade(self)
+                self.transport.write(b"hello")
+
+        serverFactory = ServerFactory()
+        serverFactory.protocol = lambda: GreetingProtocol(999999999999)
+        return TLSMemoryBIOFactory(
+            ServerTLSContext(), False, serverFactory, **kw)
+
+
+    def deliver(self, source, destination):
+        """
+        Deliver the bytes written to C{source}'s transport to
+        C{destination}.
+
+        @return: Whether there were any.
+        """
+        bytes = source.transport.value()
+        source.transport.clear()
+        if bytes:
+            destination.dataReceived(bytes)
+        return bool(bytes)
+
+
+    def pump(self, client, server, pool=None):
+        """
+        Deliver bytes between C{client} and C{server}, and run the calls
+        made to C{pool}, until there is nothing left to do.
+        """
+        while True:
+            progress = self.deliver(client, server)
+            progress = self.deliver(server, client) or progress
+            while pool is not None and pool.calls:
+                pool.run()
+                progress = True
+            if not progress:
+                break
+
+
+    def test_handshakeInThreadPool(self):
+        """
+        With a C{handshakeThreadPool}, the handshake continues in it once
+        the peer has spoken, and application bytes are held up until it is
+        finished.
+        """
+        pool = QueueingThreadPool()
+        factory = self.serverFactory(handshakeThreadPool=pool, reactor=pool)
+        client, server = self.connect(factory)
+        client.write(b"world")
+
+        self.deliver(client, server)
+        self.assertTrue(server._handshakeInThread)
+        self.assertEqual(1, len(pool.calls))
+        self.assertEqual(b"", server.transport.value())
+
+        self.pump(client, server, pool)
+        self.assertEqual(b"hello", b"".join(client.wrappedProtocol.received))
+        self.assertEqual(b"world", b"".join(server.wrappedProtocol.received))
+        self.assertEqual(1, factory.handshakes)
+
+
+    def test_receivedDuringHandshakeStep(self):
+        """
+        Bytes received while a step of the handshake is running in the thread
+        pool are handled once it returns.
+        """
+        pool = QueueingThreadPool()
+        factory = self.serverFactory(handshakeThreadPool=pool, reactor=pool)
+        client, server = self.connect(factory)
+        bytes = client.transport.value()
+        client.transport.clear()
+        server.dataReceived(bytes[:10])
+        server.dataReceived(bytes[10:])
+        self.assertEqual(1, len(pool.calls))
+        self.assertEqual([bytes[10:]], server._pendingReceived)
+
+        self.pump(client, server, pool)
+        self.assertEqual(b"hello", b"".join(client.wrappedProtocol.received))
+
+
+    def test_handshakeFailureInThreadPool(self):
+        """
+        If the handshake fails in the thread pool, the connection is lost
+        with the error once the step returns.
+        """
+        pool = QueueingThreadPool()
+        factory = self.serverFactory(handshakeThreadPool=pool, reactor=pool)
+        client, server = self.connect(factory)
+        server.dataReceived(b"not a client hello" * 10)
+        pool.run()
+        self.assertTrue(server.transport.disconnecting)
+        server.connectionLost(Failure(ConnectionLost()))
+        server.wrappedProtocol.lostReason.trap(Error)
+
+
+    def test_connectionLostDuringHandshakeStep(self):
+        """
+        If the underlying connection is lost while a step of the handshake is
+        running in the thread pool, the wrapped protocol is told once it
+        returns.
+        """
+        pool = QueueingThreadPool()
+        factory = self.serverFactory(handshakeThreadPool=pool, reactor=pool)
+        client, server = self.connect(factory)
+        self.deliver(client, server)
+        server.connectionLost(Failure(ConnectionLost()))
+        self.assertIdentical(None, server.wrappedProtocol.lostReason)
+
+        pool.run()
+        server.wrappedProtocol.lostReason.trap(ConnectionLost)
+
+
+    def test_maxConcurrentHandshakes(self):
+        """
+        With C{maxConcurrentHandshakes}, the handshakes of further connections
+        only start once one of those in progress is finished.
+        """
+        factory = self.serverFactory(maxConcurrentHandshakes=1)
+        firstClient, firstServer = self.connect(factory)
+        secondClient, secondServer = self.connect(factory)
+        self.deliver(secondClient, secondServer)
+        self.assertEqual(b"", secondServer.transport.value())
+        self.assertEqual(1, factory.handshakesInProgress)
+
+        self.pump(firstClient, firstServer)
+        self.assertEqual(
+            b"hello", b"".join(firstClient.wrappedProtocol.received))
+        self.assertNotEqual(b"", secondServer.transport.value())
+
+        self.pump(secondClient, secondServer)
+        self.assertEqual(
+            b"hello", b"".join(secondClient.wrappedProtocol.received))
+        self.assertEqual(0, factory.handshakesInProgress)
+
+
+    def test_lostWhileWaitingForHandshake(self):
+        """
+        A connection lost while its handshake waits to start stops waiting,
+        and one lost in the middle of its handshake lets the next one start.
+        """
+        factory = self.serverFactory(maxConcurrentHandshakes=1)
+        firstClient, firstServer = self.connect(factory)
+        secondClient, secondServer = self.connect(factory)
+        thirdClient, thirdServer = self.connect(factory)
+        self.deliver(thirdClient, thirdServer)
+
+        secondServer.connectionLost(Failure(ConnectionLost()))
+        self.assertEqual([thirdServer], list(factory._waitingHandshakes))
+
+        firstServer.connectionLost(Failure(ConnectionLost()))
+        self.assertEqual([], list(factory._waitingHandshakes))
+        self.assertNotEqual(b"", thirdServer.transport.value())
+        self.assertEqual(1, factory.handshakesInProgress)
+
+
+
 class NonStreamingProducer(object):
     """
     A pull producer which writes 10 times only.
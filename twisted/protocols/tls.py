@@ -48,6 +48,8 @@ except TypeError as e:
         raise
     raise ImportError("twisted.protocols.tls requires pyOpenSSL 0.10 or newer.")
 
+from collections import deque
+
 from zope.interface import implementer, providedBy, directlyProvides
 
 from twisted.python.compat import unicode
@@ -61,8 +63,71 @@ from twisted.internet.interfaces import (
 from twisted.internet.main import CONNECTION_LOST
 from twisted.internet.protocol import Protocol
 from twisted.internet.task import cooperate
+from twisted.internet.threads import deferToThreadPool
 from twisted.protocols.policies import ProtocolWrapper, WrappingFactory
 
+try:
+    from cryptography.hazmat.bindings.openssl.binding import Binding
+except ImportError:
+    _reused = None
+else:
+    _reused = getattr(Binding.lib, 'SSL_session_reused', None)
+
+
+
+def _sessionReused(connection):
+    """
+    Determine whether the handshake of a connection resumed an earlier
+    session.
+
+    pyOpenSSL has no API for this, so cryptography's OpenSSL bindings, which
+    pyOpenSSL is built on, are asked instead.
+
+    @type connection: L{OpenSSL.SSL.Connection}
+
+    @return: C{True} if it did, C{False} if it did not or the bindings cannot
+        tell.
+    @rtype: L{bool}
+    """
+    if _reused is None:
+        return False
+    return bool(_reused(connection._ssl))
+
+# The largest payload of a TLS record.
+_MAX_RECORD_PAYLOAD = 2 ** 14
+
+
+def _coalesce(chunks):
+    """
+    Join consecutive small chunks of application bytes into chunks which
+    fill a TLS record, passing along the chunks which already do.
+
+    @param chunks: The chunks to join.
+    @type chunks: iterable of L{bytes}
+
+    @return: The joined chunks.
+    @rtype: iterable of L{bytes}
+    """
+    pending = []
+    pendingSize = 0
+    for chunk in chunks:
+        if len(chunk) >= _MAX_RECORD_PAYLOAD:
+            if pending:
+                yield b"".join(pending)
+                pending = []
+                pendingSize = 0
+            yield chunk
+            continue
+        pending.append(chunk)
+        pendingSize += len(chunk)
+        if pendingSize >= _MAX_RECORD_PAYLOAD:
+            yield b"".join(pending)
+            pending = []
+            pendingSize = 0
+    if pending:
+        yield b"".join(pending)
+
+
 
 @implementer(IPushProducer)
 class _PullToPush(object):
@@ -267,14 +332,62 @@ class TLSMemoryBIOProtocol(ProtocolWrapper):
     @ivar _aborted: C{abortConnection} has been called.  No further data will
         be received to the wrapped protocol's C{dataReceived}.
     @type _aborted: L{bool}
+
+    @ivar _handshakeFinished: Whether the peer's I{Finished} message has been
+        received, which completes the handshake or is answered straight away
+        by ours.  The handshake is counted by the factory then.
+    @type _handshakeFinished: L{bool}
+
+    @ivar _awaitingHandshakeSlot: Whether the handshake has not started yet
+        because the factory's C{maxConcurrentHandshakes} other handshakes are
+        in progress.
+    @type _awaitingHandshakeSlot: L{bool}
+
+    @ivar _holdsHandshakeSlot: Whether this handshake counts towards the
+        factory's C{maxConcurrentHandshakes}.
+    @type _holdsHandshakeSlot: L{bool}
+
+    @ivar _handshakeInThread: Whether a step of the handshake is running in the
+        factory's C{handshakeThreadPool}.  The TLS connection must not be used
+        by the reactor thread until it returns.
+    @type _handshakeInThread: L{bool}
+
+    @ivar _pendingReceived: Bytes received while the handshake was not
+        started yet or a step of it was running in a thread, to be handled
+        once it has returned.
+    @type _pendingReceived: L{list} of L{bytes}
+
+    @ivar _lostDuringHandshakeStep: If the underlying transport lost its
+        connection while a step of the handshake was running in a thread, the
+        reason why, to be passed to C{connectionLost} once it has returned.
+    @type _lostDuringHandshakeStep: L{Failure}
+
+    @ivar _abortAfterHandshakeStep: Whether C{failVerification} was called
+        while a step of the handshake was running in a thread, and the
+        connection must be aborted once it has returned.
+    @type _abortAfterHandshakeStep: L{bool}
+
+    @ivar _appWriteBuffer: While received data is being delivered to the
+        wrapped protocol, the application bytes it writes, which are
+        encrypted together once it returns so that a response made of many
+        small writes is sent in as few TLS records as possible; otherwise
+        C{None}.
+    @type _appWriteBuffer: L{list} of L{bytes}
     """
 
     _reason = None
     _handshakeDone = False
+    _handshakeFinished = False
+    _awaitingHandshakeSlot = False
+    _holdsHandshakeSlot = False
+    _handshakeInThread = False
+    _lostDuringHandshakeStep = None
+    _abortAfterHandshakeStep = False
     _lostTLSConnection = False
     _writeBlockedOnRead = False
     _producer = None
     _aborted = False
+    _appWriteBuffer = None
 
     def __init__(self, factory, wrappedProtocol, _connectWrapped=True):
         ProtocolWrapper.__init__(self, factory, wrappedProtocol)
@@ -301,6 +414,7 @@ class TLSMemoryBIOProtocol(ProtocolWrapper):
         """
         self._tlsConnection = self.factory._createConnection(self)
         self._appSendBuffer = []
+        self._pendingReceived = []
 
         # Add interfaces provided by the transport we are wrapping:
         for interface in providedBy(transport):
@@ -317,7 +431,21 @@ class TLSMemoryBIOProtocol(ProtocolWrapper):
 
         # Now that we ourselves have a transport (initialized by the
         # ProtocolWrapper.makeConnection call above), kick off the TLS
-        # handshake.
+        # handshake, unless too many others are in progress.
+        if self.factory._acquireHandshakeSlot(self):
+            self._startHandshake()
+        else:
+            self._awaitingHandshakeSlot = True
+
+
+    def _startHandshake(self):
+        """
+        Start the TLS handshake, and handle any bytes received while waiting
+        to.
+        """
+        self._awaitingHandshakeSlot = False
+        self._holdsHandshakeSlot = (
+            self.factory.maxConcurrentHandshakes is not None)
         try:
             self._tlsConnection.do_handshake()
         except WantReadError:
@@ -327,20 +455,41 @@ class TLSMemoryBIOProtocol(ProtocolWrapper):
             # connection, then some bytes will be in the send buffer now; flush
             # them.
             self._flushSendBIO()
+        self._handlePendingReceived()
+
+
+    def _handlePendingReceived(self):
+        """
+        Handle the bytes received while the handshake was not started yet or
+        a step of it was running in a thread, if any.
+        """
+        if self._pendingReceived:
+            pendingReceived = self._pendingReceived
+            self._pendingReceived = []
+            self.dataReceived(b"".join(pendingReceived))
 
 
     def _flushSendBIO(self):
         """
-        Read any bytes out of the send BIO and write them to the underlying
+        Read all the bytes out of the send BIO and write them to the underlying
         transport.
         """
-        try:
-            bytes = self._tlsConnection.bio_read(2 ** 15)
-        except WantReadError:
-            # There may be nothing in the send BIO right now.
-            pass
-        else:
-            self.transport.write(bytes)
+        chunks = []
+        while True:
+            try:
+                chunk = self._tlsConnection.bio_read(2 ** 16)
+            except WantReadError:
+                # There may be nothing in the send BIO right now.
+                break
+            chunks.append(chunk)
+            if len(chunk) < 2 ** 16:
+                # A memory BIO hands out everything it has, up to the size
+                # asked for.
+                break
+        if len(chunks) == 1:
+            self.transport.write(chunks[0])
+        elif chunks:
+            self.transport.writeSequence(chunks)
 
 
     def _flushReceiveBIO(self):
@@ -354,10 +503,13 @@ class TLSMemoryBIOProtocol(ProtocolWrapper):
         # Keep trying this until an error indicates we should stop or we
         # close the connection.  Looping is necessary to make sure we
         # process all of the data which was put into the receive BIO, as
-        # there is no guarantee that a single recv call will do it all.
+        # there is no guarantee that a single recv call will do it all.  Each
+        # call returns at most one TLS record, so the application bytes are
+        # collected and delivered together.
+        received = []
         while not self._lostTLSConnection:
             try:
-                bytes = self._tlsConnection.recv(2 ** 15)
+                bytes = self._tlsConnection.recv(2 ** 14)
             except WantReadError:
                 # The newly received bytes might not have been enough to produce
                 # any application data.
@@ -365,6 +517,7 @@ class TLSMemoryBIOProtocol(ProtocolWrapper):
             except ZeroReturnError:
                 # TLS has shut down and no more TLS data will be received over
                 # this connection.
+                self._deliverReceived(received)
                 self._shutdownTLS()
                 # Passing in None means the user protocol's connnectionLost
                 # will get called with reason from underlying transport:
@@ -382,14 +535,16 @@ class TLSMemoryBIOProtocol(ProtocolWrapper):
                 else:
                     failure = Failure()
 
+                self._deliverReceived(received)
                 self._flushSendBIO()
                 self._tlsShutdownFinished(failure)
             else:
                 # If we got application bytes, the handshake must be done by
                 # now.  Keep track of this to control error reporting later.
                 self._handshakeDone = True
-                if not self._aborted:
-                    ProtocolWrapper.dataReceived(self, bytes)
+                received.append(bytes)
+
+        self._deliverReceived(received)
 
         # The received bytes might have generated a response which needs to be
         # sent now.  For example, the handshake involves several round-trip
@@ -397,13 +552,64 @@ class TLSMemoryBIOProtocol(ProtocolWrapper):
         self._flushSendBIO()
 
 
+    def _deliverReceived(self, received):
+        """
+        Deliver application bytes to the wrapped protocol, in a single call to
+        its C{dataReceived}.
+
+        @param received: The application bytes, which are removed from it.
+        @type received: L{list} of L{bytes}
+        """
+        if not received:
+            return
+        if len(received) == 1:
+            bytes = received[0]
+        else:
+            bytes = b"".join(received)
+        del received[:]
+        if not self._aborted:
+            ProtocolWrapper.dataReceived(self, bytes)
+
+
     def dataReceived(self, bytes):
         """
         Deliver any received bytes to the receive BIO and then read and deliver
         to the application any application-level data which becomes available
         as a result of this.
+
+        Application bytes written while that data is delivered are sent once
+        it has been.
+        """
+        if self._appWriteBuffer is not None:
+            self._dataReceived(bytes)
+            return
+        self._appWriteBuffer = []
+        try:
+            self._dataReceived(bytes)
+        finally:
+            self._flushAppWriteBuffer()
+
+
+    def _dataReceived(self, bytes):
         """
-        self._tlsConnection.bio_write(bytes)
+        Deliver received bytes to the receive BIO and the application-level
+        data which becomes available to the wrapped protocol.
+        """
+        if self._awaitingHandshakeSlot or self._handshakeInThread:
+            self._pendingReceived.append(bytes)
+            return
+
+        if bytes:
+            self._tlsConnection.bio_write(bytes)
+
+        if (self.factory.handshakeThreadPool is not None and
+                not self._handshakeFinished):
+            self._handshakeInThread = True
+            d = deferToThreadPool(self.factory._reactor,
+                                  self.factory.handshakeThreadPool,
+                                  self._handshakeStep)
+            d.addBoth(self._handshakeStepReturned)
+            return
 
         if self._writeBlockedOnRead:
             # A read just happened, so we might not be blocked anymore.  Try to
@@ -420,12 +626,102 @@ class TLSMemoryBIOProtocol(ProtocolWrapper):
                 self._producer.resumeProducing()
 
         self._flushReceiveBIO()
+        self._checkHandshakeFinished()
+
+
+    def _checkHandshakeFinished(self):
+        """
+        Notice when the peer's I{Finished} message has been received, count
+        the handshake and let another one start.
+        """
+        if (not self._handshakeFinished and
+                self._tlsConnection.get_peer_finished() is not None):
+            self._handshakeFinished = True
+            self.factory._handshakeCompleted(
+                _sessionReused(self._tlsConnection))
+            self._releaseHandshakeSlot()
+
+
+    def _handshakeStep(self):
+        """
+        Continue the handshake with the bytes in the receive BIO.  This runs in
+        the factory's C{handshakeThreadPool}, so that the public key
+        operations it involves do not hold up the reactor.
+
+        @raise Error: If the handshake failed.
+        """
+        try:
+            self._tlsConnection.do_handshake()
+        except WantReadError:
+            pass
+
+
+    def _handshakeStepReturned(self, result):
+        """
+        Pick up in the reactor thread where a step of the handshake running in
+        a thread left off: send what it produced, and handle the bytes
+        received meanwhile, or the application bytes the handshake held up
+        once it is finished.
+
+        @param result: C{None}, or a L{Failure} if the handshake failed.
+        """
+        self._handshakeInThread = False
+        if self._lostDuringHandshakeStep is not None:
+            reason = self._lostDuringHandshakeStep
+            self._lostDuringHandshakeStep = None
+            self.connectionLost(reason)
+            return
+        if self._abortAfterHandshakeStep:
+            self.abortConnection()
+            return
+        if self._aborted or self._lostTLSConnection:
+            return
+        if isinstance(result, Failure):
+            self._flushSendBIO()
+            self._tlsShutdownFinished(result)
+            return
+        self._flushSendBIO()
+        self._checkHandshakeFinished()
+        if self._handshakeFinished:
+            # Deliver any application bytes which followed the peer's
+            # Finished message, and send those which were held up.
+            self._pendingReceived.append(b"")
+        elif (self.disconnecting and not self._writeBlockedOnRead and
+              self._producer is None):
+            self._shutdownTLS()
+        self._handlePendingReceived()
+
+
+    def _releaseHandshakeSlot(self):
+        """
+        Stop counting this connection's handshake towards the factory's
+        C{maxConcurrentHandshakes}.
+        """
+        if self._holdsHandshakeSlot:
+            self._holdsHandshakeSlot = False
+            self.factory._releaseHandshakeSlot()
+
+
+    def _flushAppWriteBuffer(self):
+        """
+        Send the application bytes written while received data was being
+        delivered, and stop buffering them.
+        """
+        appWriteBuffer = self._appWriteBuffer
+        self._appWriteBuffer = None
+        if appWriteBuffer:
+            for bytes in _coalesce(appWriteBuffer):
+                self._write(bytes)
 
 
     def _shutdownTLS(self):
         """
         Initiate, or reply to, the shutdown handshake of the TLS layer.
         """
+        if self._appWriteBuffer:
+            # Whatever the application wrote comes before the close alert.
+            self._flushAppWriteBuffer()
+            self._appWriteBuffer = []
         try:
             shutdownSuccess = self._tlsConnection.shutdown()
         except Error:
@@ -466,6 +762,14 @@ class TLSMemoryBIOProtocol(ProtocolWrapper):
         the underlying transport going away or due to an error at the TLS
         layer) and make sure the base implementation only gets invoked once.
         """
+        if self._handshakeInThread:
+            # The TLS connection is in use by the handshake thread.
+            self._lostDuringHandshakeStep = reason
+            return
+        if self._awaitingHandshakeSlot:
+            self._awaitingHandshakeSlot = False
+            self.factory._cancelHandshake(self)
+        self._releaseHandshakeSlot()
         if not self._lostTLSConnection:
             # Tell the TLS connection that it's not going to get any more data
             # and give it a chance to finish reading.
@@ -484,7 +788,8 @@ class TLSMemoryBIOProtocol(ProtocolWrapper):
         if self.disconnecting:
             return
         self.disconnecting = True
-        if not self._writeBlockedOnRead and self._producer is None:
+        if (not self._writeBlockedOnRead and self._producer is None and
+                not self._handshakeInThread):
             self._shutdownTLS()
 
 
@@ -495,7 +800,8 @@ class TLSMemoryBIOProtocol(ProtocolWrapper):
         """
         self._aborted = True
         self.disconnecting = True
-        self._shutdownTLS()
+        if not self._handshakeInThread:
+            self._shutdownTLS()
         self.transport.abortConnection()
 
 
@@ -509,7 +815,11 @@ class TLSMemoryBIOProtocol(ProtocolWrapper):
         @type reason: L{Failure}
         """
         self._reason = reason
-        self.abortConnection()
+        if self._handshakeInThread:
+            # Called from the handshake thread, by an info callback.
+            self._abortAfterHandshakeStep = True
+        else:
+            self.abortConnection()
 
 
     def write(self, bytes):
@@ -527,7 +837,10 @@ class TLSMemoryBIOProtocol(ProtocolWrapper):
         # is unregistered:
         if self.disconnecting and self._producer is None:
             return
-        self._write(bytes)
+        if self._appWriteBuffer is not None:
+            self._appWriteBuffer.append(bytes)
+        else:
+            self._write(bytes)
 
 
     def _write(self, bytes):
@@ -542,12 +855,31 @@ class TLSMemoryBIOProtocol(ProtocolWrapper):
         if self._lostTLSConnection:
             return
 
-        # A TLS payload is 16kB max
-        bufferSize = 2 ** 16
+        if self._awaitingHandshakeSlot or (
+                self.factory.handshakeThreadPool is not None and
+                not self._handshakeFinished):
+            # Sending would start or continue the handshake in the reactor
+            # thread; wait for it to be done elsewhere.
+            self._writeBlockedOnRead = True
+            self._appSendBuffer.append(bytes)
+            if self._producer is not None:
+                self._producer.pauseProducing()
+            return
+
+        # OpenSSL returns from each send once it has written a record, so the
+        # input is handed to it a record's worth at a time, to avoid copying
+        # the rest of the input for each record.  Slicing all of a short input
+        # does not copy it.
+        bufferSize = _MAX_RECORD_PAYLOAD
 
         # How far into the input we've gotten so far
         alreadySent = 0
 
+        # How many records have been written to the send BIO since it was last
+        # flushed.  They are written to the transport a few at a time, as many
+        # as fit in what _flushSendBIO reads from it at once.
+        unflushed = 0
+
         while alreadySent < len(bytes):
             toSend = bytes[alreadySent:alreadySent + bufferSize]
             try:
@@ -570,16 +902,36 @@ class TLSMemoryBIOProtocol(ProtocolWrapper):
                 # If we sent some bytes, the handshake must be done.  Keep
                 # track of this to control error reporting behavior.
                 self._handshakeDone = True
-                self._flushSendBIO()
                 alreadySent += sent
+                unflushed += 1
+                if unflushed == 3:
+                    self._flushSendBIO()
+                    unflushed = 0
+
+        if unflushed:
+            self._flushSendBIO()
 
 
     def writeSequence(self, iovec):
         """
-        Write a sequence of application bytes by joining them into one string
-        and passing them to L{write}.
+        Write a sequence of application bytes, joining small ones together so
+        that they are sent in as few TLS records as possible, but without
+        copying large ones.
         """
-        self.write(b"".join(iovec))
+        # The sequence is iterated more than once, so it must not be a
+        # one-shot iterator.
+        iovec = list(iovec)
+        for bytes in iovec:
+            if isinstance(bytes, unicode):
+                raise TypeError(
+                    "Must write bytes to a TLS transport, not unicode.")
+        if self.disconnecting and self._producer is None:
+            return
+        if self._appWriteBuffer is not None:
+            self._appWriteBuffer.extend(iovec)
+        else:
+            for bytes in _coalesce(iovec):
+                self._write(bytes)
 
 
     def getPeerCertificate(self):
@@ -712,12 +1064,38 @@ class TLSMemoryBIOFactory(WrappingFactory):
         object.
     @type _connectionCreator: 1-argument callable taking
         L{TLSMemoryBIOProtocol} and returning L{OpenSSL.SSL.Connection}.
+
+    @ivar handshakes: The number of TLS handshakes completed by the
+        connections of this factory.
+    @type handshakes: L{int}
+
+    @ivar resumedHandshakes: How many of those handshakes resumed an earlier
+        session, rather than performing a full handshake.
+    @type resumedHandshakes: L{int}
+
+    @ivar handshakeThreadPool: See L{__init__}.
+
+    @ivar maxConcurrentHandshakes: See L{__init__}.
+
+    @ivar handshakesInProgress: The number of handshakes counting towards
+        C{maxConcurrentHandshakes}.
+    @type handshakesInProgress: L{int}
+
+    @ivar _waitingHandshakes: The connections whose handshake waits for one
+        of those to finish, in the order they were made.
+    @type _waitingHandshakes: L{deque} of L{TLSMemoryBIOProtocol}
     """
     protocol = TLSMemoryBIOProtocol
 
     noisy = False  # disable unnecessary logging.
 
-    def __init__(self, contextFactory, isClient, wrappedFactory):
+    handshakes = 0
+    resumedHandshakes = 0
+    handshakesInProgress = 0
+
+    def __init__(self, contextFactory, isClient, wrappedFactory,
+                 handshakeThreadPool=None, maxConcurrentHandshakes=None,
+                 reactor=None):
         """
         Create a L{TLSMemoryBIOFactory}.
 
@@ -758,8 +1136,32 @@ class TLSMemoryBIOFactory(WrappingFactory):
         @param wrappedFactory: A factory which will create the
             application-level protocol.
         @type wrappedFactory: L{twisted.internet.interfaces.IProtocolFactory}
+
+        @param handshakeThreadPool: If not C{None}, the thread pool in which
+            the steps of each handshake run once the peer has spoken, so that
+            the public key operations they involve do not hold up the reactor
+            and the connections which are already established.  The
+            connection does not send or receive application bytes until the
+            handshake is finished.  The caller is responsible for starting
+            and stopping the pool.
+        @type handshakeThreadPool: L{twisted.python.threadpool.ThreadPool}
+
+        @param maxConcurrentHandshakes: If not C{None}, the number of
+            connections which may be in the middle of a handshake at once.
+            The handshakes of further connections wait, in the order they
+            were made, for one of those to finish or to be lost.
+        @type maxConcurrentHandshakes: L{int}
+
+        @param reactor: The reactor in which the steps of handshakes run in
+            C{handshakeThreadPool} return.  By default, the global reactor.
         """
         WrappingFactory.__init__(self, wrappedFactory)
+        self.handshakeThreadPool = handshakeThreadPool
+        self.maxConcurrentHandshakes = maxConcurrentHandshakes
+        self._waitingHandshakes = deque()
+        if reactor is None and handshakeThreadPool is not None:
+            from twisted.internet import reactor
+        self._reactor = reactor
         if isClient:
             creatorInterface = IOpenSSLClientConnectionCreator
         else:
@@ -784,6 +1186,60 @@ class TLSMemoryBIOFactory(WrappingFactory):
         return "%s (TLS)" % (logPrefix,)
 
 
+    def _handshakeCompleted(self, resumed):
+        """
+        Count a completed handshake.
+
+        @param resumed: Whether the handshake resumed an earlier session.
+        @type resumed: L{bool}
+        """
+        self.handshakes += 1
+        if resumed:
+            self.resumedHandshakes += 1
+
+
+    def _acquireHandshakeSlot(self, tlsProtocol):
+        """
+        Let a connection start its handshake if fewer than
+        C{maxConcurrentHandshakes} are in progress, or make it wait its turn.
+
+        @param tlsProtocol: The connection.
+        @type tlsProtocol: L{TLSMemoryBIOProtocol}
+
+        @return: C{True} if the handshake may start now.  Otherwise, the
+            factory calls C{_startHandshake} on C{tlsProtocol} later.
+        @rtype: L{bool}
+        """
+        if self.maxConcurrentHandshakes is None:
+            return True
+        if self.handshakesInProgress < self.maxConcurrentHandshakes:
+            self.handshakesInProgress += 1
+            return True
+        self._waitingHandshakes.append(tlsProtocol)
+        return False
+
+
+    def _releaseHandshakeSlot(self):
+        """
+        Start the handshake of the connection which has waited the longest,
+        now that another handshake is finished.
+        """
+        if self._waitingHandshakes:
+            self._waitingHandshakes.popleft()._startHandshake()
+        else:
+            self.handshakesInProgress -= 1
+
+
+    def _cancelHandshake(self, tlsProtocol):
+        """
+        Stop a connection from waiting for its handshake to start.
+
+        @param tlsProtocol: The connection.
+        @type tlsProtocol: L{TLSMemoryBIOProtocol}
+        """
+        self._waitingHandshakes.remove(tlsProtocol)
+
+
     def _createConnection(self, tlsProtocol):
         """
         Create an OpenSSL connection and set it up good.
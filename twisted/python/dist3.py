@@ -145,6 +145,7 @@ modules = [
     "twisted.trial.unittest",
     "twisted.trial.util",
     "twisted.web",
+    "twisted.web._multipart",
     "twisted.web._newclient",
     "twisted.web._responses",
     "twisted.web._version",
@@ -264,6 +265,7 @@ testModules = [
     # The downloadPage tests weren't ported:
     "twisted.web.test.test_http",
     "twisted.web.test.test_http_headers",
+    "twisted.web.test.test_multipart",
     "twisted.web.test.test_newclient",
     "twisted.web.test.test_resource",
     "twisted.web.test.test_script",
@@ -11,6 +11,8 @@ from __future__ import division, absolute_import
 import sys
 import itertools
 
+from collections import OrderedDict
+
 from zope.interface import implementer
 
 skipSSL = None
@@ -146,7 +148,8 @@ def makeCertificate(**kw):
 
 
 
-def certificatesForAuthorityAndServer(commonName=b'example.com'):
+def certificatesForAuthorityAndServer(commonName=b'example.com',
+                                      digestAlgorithm='md5'):
     """
     Create a self-signed CA certificate and server certificate signed by the
     CA.
@@ -154,6 +157,10 @@ def certificatesForAuthorityAndServer(commonName=b'example.com'):
     @param commonName: The C{commonName} to embed in the certificate.
     @type commonName: L{bytes}
 
+    @param digestAlgorithm: The digest with which the certificates are
+        signed.
+    @type digestAlgorithm: L{str}
+
     @return: a 2-tuple of C{(certificate_authority_certificate,
         server_certificate)}
     @rtype: L{tuple} of (L{sslverify.Certificate},
@@ -167,11 +174,13 @@ def certificatesForAuthorityAndServer(commonName=b'example.com'):
     caKey= sslverify.KeyPair.generate()
     caCertReq = caKey.certificateRequest(caDN)
     caSelfCertData = caKey.signCertificateRequest(
-            caDN, caCertReq, lambda dn: True, 516)
+            caDN, caCertReq, lambda dn: True, 516,
+            digestAlgorithm=digestAlgorithm)
     caSelfCert = caKey.newCertificate(caSelfCertData)
 
     serverCertData = caKey.signCertificateRequest(
-            caDN, serverCertReq, lambda dn: True, 516)
+            caDN, serverCertReq, lambda dn: True, 516,
+            digestAlgorithm=digestAlgorithm)
     serverCert = serverKey.newCertificate(serverCertData)
     return caSelfCert, serverCert
 
@@ -419,6 +428,209 @@ class ClientOptions(unittest.SynchronousTestCase):
         self.assertEqual(str(error), expectedText)
 
 
+    def sessionKeyOf(self, hostname=u'example.com', **kw):
+        """
+        Find the key under which the connections created by the
+        L{IOpenSSLClientConnectionCreator} returned by
+        L{sslverify.optionsForClientTLS} look for a session to resume.
+
+        @param hostname: The C{hostname} to pass.
+
+        @param kw: The other arguments to pass.
+
+        @return: The key.
+        """
+        class RecordingCache(object):
+            def get(self, key):
+                self.key = key
+                return None
+
+        cache = RecordingCache()
+        sslverify.optionsForClientTLS(
+            hostname, sessionCache=cache, **kw).clientConnectionForTLS(None)
+        return cache.key
+
+
+    def test_sessionCache(self):
+        """
+        Connections created by the L{IOpenSSLClientConnectionCreator} returned
+        by L{sslverify.optionsForClientTLS} look for a session to resume in
+        the C{sessionCache} passed to it, under a key shared by those
+        connecting to the same host with the same trust root, client
+        certificate and protocol version.
+        """
+        serverCA = certificatesForAuthorityAndServer()[0]
+        otherCA = certificatesForAuthorityAndServer()[0]
+        key = self.sessionKeyOf
+        self.assertEqual(key(), key())
+        self.assertEqual(key(trustRoot=serverCA), key(trustRoot=serverCA))
+        self.assertEqual(
+            key(trustRoot=sslverify.OpenSSLCertificateAuthorities(
+                [serverCA.original])),
+            key(trustRoot=sslverify.OpenSSLCertificateAuthorities(
+                [serverCA.original])))
+        self.assertNotEqual(key(), key(u'example.org'))
+        self.assertNotEqual(key(trustRoot=serverCA), key(trustRoot=otherCA))
+        self.assertNotEqual(
+            key(),
+            key(extraCertificateOptions={'method': SSL.TLSv1_METHOD}))
+
+
+    def test_sessionCacheClientCertificate(self):
+        """
+        Connections created by the L{IOpenSSLClientConnectionCreator}s
+        returned by L{sslverify.optionsForClientTLS} with and without a
+        C{clientCertificate} keep their sessions under different keys.
+        """
+        serverCA = certificatesForAuthorityAndServer()[0]
+        clientCert = certificatesForAuthorityAndServer(
+            b'client', digestAlgorithm='sha256')[1]
+        self.assertNotEqual(
+            self.sessionKeyOf(trustRoot=serverCA),
+            self.sessionKeyOf(trustRoot=serverCA,
+                              clientCertificate=clientCert))
+
+
+    def test_sessionCacheOwnKey(self):
+        """
+        A L{sslverify.ClientTLSOptions} constructed without a C{sessionKey}
+        keeps its sessions under a key of its own.
+        """
+        ctx = SSL.Context(SSL.SSLv23_METHOD)
+        first = sslverify.ClientTLSOptions(u'example.com', ctx)
+        second = sslverify.ClientTLSOptions(u'example.com', ctx)
+        self.assertNotEqual(first._sessionKey, second._sessionKey)
+
+
+
+class ClientSessionCacheTests(unittest.SynchronousTestCase):
+    """
+    Tests for L{sslverify.ClientSessionCache}.
+    """
+    if skipSSL:
+        skip = skipSSL
+
+    def test_get(self):
+        """
+        L{sslverify.ClientSessionCache.get} returns the session stored under
+        a key, or L{None} if there is none.
+        """
+        cache = sslverify.ClientSessionCache()
+        session = object()
+        cache.store(b'a', session)
+        self.assertIs(session, cache.get(b'a'))
+        self.assertIs(None, cache.get(b'b'))
+
+
+    def test_replace(self):
+        """
+        Storing a session under a key already in the cache replaces the
+        session stored there.
+        """
+        cache = sslverify.ClientSessionCache()
+        session = object()
+        cache.store(b'a', object())
+        cache.store(b'a', session)
+        self.assertIs(session, cache.get(b'a'))
+        self.assertEqual(1, len(cache))
+
+
+    def test_maxSessions(self):
+        """
+        L{sslverify.ClientSessionCache} keeps at most C{maxSessions}
+        sessions, discarding the least recently used.
+        """
+        cache = sslverify.ClientSessionCache(maxSessions=2)
+        cache.store(b'a', object())
+        cache.store(b'b', object())
+        cache.get(b'a')
+        cache.store(b'c', object())
+        self.assertEqual(2, len(cache))
+        self.assertIs(None, cache.get(b'b'))
+        self.assertIsNot(None, cache.get(b'a'))
+        self.assertIsNot(None, cache.get(b'c'))
+
+
+    def test_locked(self):
+        """
+        L{sslverify.ClientSessionCache} only changes its sessions while
+        holding its lock, since sessions are stored from the threads
+        handshakes run in.
+        """
+        cache = sslverify.ClientSessionCache()
+        locked = []
+
+        class CheckedSessions(OrderedDict):
+            def __setitem__(self, key, value):
+                locked.append(cache._lock.locked())
+                OrderedDict.__setitem__(self, key, value)
+
+            def pop(self, *args):
+                locked.append(cache._lock.locked())
+                return OrderedDict.pop(self, *args)
+
+        cache._sessions = CheckedSessions()
+        cache.store(b'a', object())
+        cache.get(b'a')
+        self.assertEqual([True] * 4, locked)
+
+
+
+class SessionResumptionTests(unittest.SynchronousTestCase):
+    """
+    Tests for resuming TLS sessions with L{sslverify.ClientSessionCache}.
+    """
+    if skipSSL:
+        skip = skipSSL
+
+    def connect(self, serverFactory, clientFactory):
+        """
+        Connect a client to a server over TLS in memory, and let them
+        exchange everything they have to send.
+
+        @param serverFactory: The server's L{TLSMemoryBIOFactory}.
+
+        @param clientFactory: The client's L{TLSMemoryBIOFactory}.
+        """
+        server, client, pump = connectedServerAndClient(
+            lambda: serverFactory.buildProtocol(None),
+            lambda: clientFactory.buildProtocol(None))
+        client.write(b"x")
+        pump.flush()
+
+
+    def test_resumeSession(self):
+        """
+        A client which connects to a server again resumes the session it
+        established the first time, and the server's L{TLSMemoryBIOFactory}
+        counts the resumed handshake.
+        """
+        serverCA, serverCert = certificatesForAuthorityAndServer(
+            digestAlgorithm='sha256')
+        serverOpts = sslverify.OpenSSLCertificateOptions(
+            privateKey=serverCert.privateKey.original,
+            certificate=serverCert.original,
+            sessionContext=b"shared")
+        clientOpts = sslverify.optionsForClientTLS(
+            u"example.com", trustRoot=serverCA,
+            sessionCache=sslverify.ClientSessionCache())
+        serverFactory = TLSMemoryBIOFactory(
+            serverOpts, isClient=False,
+            wrappedFactory=protocol.Factory.forProtocol(protocol.Protocol))
+        clientFactory = TLSMemoryBIOFactory(
+            clientOpts, isClient=True,
+            wrappedFactory=protocol.Factory.forProtocol(protocol.Protocol))
+
+        self.connect(serverFactory, clientFactory)
+        self.assertEqual(
+            (1, 0),
+            (serverFactory.handshakes, serverFactory.resumedHandshakes))
+        self.connect(serverFactory, clientFactory)
+        self.assertEqual(
+            (2, 1),
+            (serverFactory.handshakes, serverFactory.resumedHandshakes))
+
+
 
 class OpenSSLOptions(unittest.TestCase):
     if skipSSL:
@@ -746,6 +958,25 @@ class OpenSSLOptions(unittest.TestCase):
         )
 
 
+    def test_sessionContext(self):
+        """
+        Contexts of L{sslverify.OpenSSLCertificateOptions} passed the same
+        C{sessionContext} share their session id context, while others each
+        get one of their own.
+        """
+        ids = []
+        for sessionContext in [b'a', b'a', None, None]:
+            opts = sslverify.OpenSSLCertificateOptions(
+                privateKey=self.sKey,
+                certificate=self.sCert,
+                sessionContext=sessionContext,
+            )
+            opts._contextFactory = FakeContext
+            ids.append(opts.getContext()._sessionID)
+        self.assertEqual(ids[0], ids[1])
+        self.assertEqual(3, len(set(ids)))
+
+
     def test_ecDoesNotBreakConstructor(self):
         """
         Missing ECC does not break the constructor and sets C{_ecCurve} to
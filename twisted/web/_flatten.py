@@ -15,6 +15,7 @@ from twisted.internet.defer import Deferred
 from twisted.web.error import UnfilledSlot, UnsupportedType, FlattenerError
 
 from twisted.web.iweb import IRenderable
+from twisted.web._element import Element
 from twisted.web._stan import (
     Tag, slot, voidElements, Comment, CDATA, CharRef)
 
@@ -167,8 +168,8 @@ def _getSlotValue(name, slotData, default=None):
     """
     Find the value of the named slot in the given stack of slot data.
     """
-    for slotFrame in slotData[::-1]:
-        if slotFrame is not None and name in slotFrame:
+    for slotFrame in reversed(slotData):
+        if name in slotFrame:
             return slotFrame[name]
     else:
         if default is not None:
@@ -177,6 +178,32 @@ def _getSlotValue(name, slotData, default=None):
 
 
 
+def _renderDocument(request, root):
+    """
+    Get the document an L{IRenderable} renders to.
+
+    An L{Element} which does not override L{Element.render} and whose loader
+    keeps a precompiled form of its document (as
+    L{twisted.web.template.XMLString} and L{twisted.web.template.XMLFile} do)
+    is flattened from that compiled form, so that the static parts of its
+    template are not serialized again on every render.
+
+    @param request: A request object which will be passed to
+        L{IRenderable.render}.
+
+    @param root: An L{IRenderable} provider.
+
+    @return: The document to flatten in place of C{root}.
+    """
+    if (isinstance(root, Element) and
+            type(root).render.__func__ is Element.render.__func__):
+        loadCompiled = getattr(root.loader, '_loadCompiled', None)
+        if loadCompiled is not None:
+            return loadCompiled()
+    return root.render(request)
+
+
+
 def _flattenElement(request, root, slotData, renderFactory, dataEscaper):
     """
     Make C{root} slightly more flat by yielding all its immediate contents as
@@ -231,7 +258,12 @@ def _flattenElement(request, root, slotData, renderFactory, dataEscaper):
         yield escapedComment(root.data)
         yield '-->'
     elif isinstance(root, Tag):
-        slotData.append(root.slotData)
+        # Only tags which actually fill slots need a frame on the slot stack;
+        # pushing one for every tag makes each slot lookup linear in the
+        # number of tags flattened so far.
+        hasSlotData = root.slotData is not None
+        if hasSlotData:
+            slotData.append(root.slotData)
         if root.render is not None:
             rendererName = root.render
             rootClone = root.clone(False)
@@ -239,7 +271,8 @@ def _flattenElement(request, root, slotData, renderFactory, dataEscaper):
             renderMethod = renderFactory.lookupRenderMethod(rendererName)
             result = renderMethod(request, rootClone)
             yield keepGoing(result)
-            slotData.pop()
+            if hasSlotData:
+                slotData.pop()
             return
 
         if not root.tagName:
@@ -280,16 +313,183 @@ def _flattenElement(request, root, slotData, renderFactory, dataEscaper):
             yield keepGoing(element)
     elif isinstance(root, CharRef):
         yield '&#%d;' % (root.ordinal,)
+    elif isinstance(root, _CompiledTemplate):
+        for part in root.parts:
+            if type(part) is str:
+                yield part
+            else:
+                node, context = part
+                if context is _CONTENT:
+                    yield keepGoing(node, escapeForContent)
+                elif context is _ATTRIBUTE:
+                    yield flattenWithAttributeEscaping(
+                        keepGoing(node, attributeEscapingDoneOutside))
+                else:
+                    yield keepGoing(node)
     elif isinstance(root, Deferred):
         yield root.addCallback(lambda result: (result, keepGoing(result)))
     elif IRenderable.providedBy(root):
-        result = root.render(request)
+        result = _renderDocument(request, root)
         yield keepGoing(result, renderFactory=root)
     else:
         raise UnsupportedType(root)
 
 
 
+# Contexts in which a dynamic part of a L{_CompiledTemplate} is flattened;
+# see L{_CompiledTemplate.parts}.
+_INHERIT = 'inherit'
+_CONTENT = 'content'
+_ATTRIBUTE = 'attribute'
+
+
+
+class _CompiledTemplate(object):
+    """
+    A stan document which has been pre-serialized as far as possible by
+    L{_compileTemplate}.
+
+    All the static markup of the document (tags without render directives or
+    slot data, their string attributes and text children, comments, CDATA and
+    character references) has been escaped and serialized once, ahead of time,
+    and adjacent runs of it joined into single strings.  Only the dynamic
+    parts (slots, tags with renderers, and anything else whose output depends
+    on the request) remain to be flattened on each render.
+
+    @ivar parts: The pieces of the document, in order.  A C{str} is markup
+        which is written out as-is.  Anything else is a 2-C{tuple} of a stan
+        object which still needs to be flattened and the context in which it
+        must be flattened: L{_CONTENT} for the contents of a tag,
+        L{_ATTRIBUTE} for the value of an attribute, or L{_INHERIT} for the
+        context in which the L{_CompiledTemplate} itself is being flattened.
+    @type parts: C{list}
+    """
+
+    def __init__(self, parts):
+        self.parts = parts
+
+
+    def __repr__(self):
+        return '_CompiledTemplate(%r)' % (self.parts,)
+
+
+
+def _isStaticTag(root):
+    """
+    Determine whether a L{Tag <twisted.web.template.Tag>}'s own markup (as
+    opposed to that of its children) can be serialized ahead of time.
+
+    @param root: The tag to examine.
+    @type root: L{Tag <twisted.web.template.Tag>}
+
+    @rtype: C{bool}
+    """
+    return root.render is None and root.slotData is None
+
+
+
+def _compileElement(root, inTag, parts):
+    """
+    Serialize as much of C{root} as possible into C{parts}, the way
+    L{_flattenElement} would, leaving the rest to be flattened at render time.
+
+    @param root: The stan object to compile.
+
+    @param inTag: C{True} if C{root} is inside a tag, and so will always be
+        flattened with L{escapeForContent}; C{False} if it is at the top level
+        of the document, where the escaping depends on where the document is
+        eventually flattened.
+
+    @param parts: A C{list} to which to append pre-escaped C{str}s and
+        C{(node, context)} tuples; see L{_CompiledTemplate.parts}.
+    """
+    if inTag:
+        context = _CONTENT
+    else:
+        context = _INHERIT
+
+    if isinstance(root, (bytes, unicode)):
+        if inTag:
+            parts.append(escapeForContent(root))
+        else:
+            parts.append((root, context))
+    elif isinstance(root, CDATA):
+        parts.append('<![CDATA[' + escapedCDATA(root.data) + ']]>')
+    elif isinstance(root, Comment):
+        parts.append('<!--' + escapedComment(root.data) + '-->')
+    elif isinstance(root, CharRef):
+        parts.append('&#%d;' % (root.ordinal,))
+    elif isinstance(root, (tuple, list)):
+        for element in root:
+            _compileElement(element, inTag, parts)
+    elif isinstance(root, Tag) and _isStaticTag(root):
+        if not root.tagName:
+            _compileElement(root.children, inTag, parts)
+            return
+        if isinstance(root.tagName, unicode):
+            tagName = root.tagName.encode('ascii')
+        else:
+            tagName = str(root.tagName)
+        parts.append('<' + tagName)
+        for k, v in root.attributes.iteritems():
+            if isinstance(k, unicode):
+                k = k.encode('ascii')
+            parts.append(' ' + k + '="')
+            if isinstance(v, (bytes, unicode)):
+                parts.append(
+                    escapeForContent(v).replace('"', '&quot;'))
+            else:
+                parts.append((v, _ATTRIBUTE))
+            parts.append('"')
+        if root.children or tagName not in voidElements:
+            parts.append('>')
+            _compileElement(root.children, True, parts)
+            parts.append('</' + tagName + '>')
+        else:
+            parts.append(' />')
+    else:
+        parts.append((root, context))
+
+
+
+def _compileTemplate(root):
+    """
+    Compile a stan document so that flattening it repeatedly only has to do
+    the work of flattening its dynamic parts.
+
+    The result flattens to exactly the same output as C{root} would have, in
+    any context.  C{root} is not modified; since tags with render directives
+    are left alone, render methods are still passed the same tags they would
+    have been passed had C{root} been flattened directly.
+
+    C{root} must not change after it has been compiled, since changes will
+    not be reflected in the result.
+
+    @param root: A stan document, such as the result of
+        L{ITemplateLoader.load}.
+
+    @return: The compiled document.
+    @rtype: L{_CompiledTemplate}
+    """
+    parts = []
+    _compileElement(root, False, parts)
+
+    compiled = []
+    markup = []
+    for part in parts:
+        if type(part) is str:
+            markup.append(part)
+        else:
+            if markup:
+                compiled.append(''.join(markup))
+                markup = []
+            compiled.append(part)
+    if markup:
+        compiled.append(''.join(markup))
+    return _CompiledTemplate(compiled)
+
+
+
 def _flattenTree(request, root):
     """
     Make C{root} into an iterable of L{bytes} and L{Deferred} by doing a depth
@@ -336,16 +536,28 @@ def _flattenTree(request, root):
                 stack.append(element)
 
 
+# The amount of flattened output which is collected before it is passed to
+# the writer given to flatten; see _writeFlattenedData.
+_BUFFER_SIZE = 2 ** 16
+
+
+
 def _writeFlattenedData(state, write, result):
     """
     Take strings from an iterator and pass them to a writer function.
 
+    Strings are collected and joined together so that C{write} is called with
+    a few large strings rather than with every small string produced by the
+    flattener.  Everything collected so far is passed to C{write} once at least
+    L{_BUFFER_SIZE} bytes have been collected, before waiting on a
+    L{Deferred}, and when C{state} is exhausted or fails.
+
     @param state: An iterator of C{str} and L{Deferred}.  C{str} instances will
         be passed to C{write}.  L{Deferred} instances will be waited on before
         resuming iteration of C{state}.
 
-    @param write: A callable which will be invoked with each C{str}
-        produced by iterating C{state}.
+    @param write: A callable which will be invoked with the C{str} produced by
+        iterating C{state}.
 
     @param result: A L{Deferred} which will be called back when C{state} has
         been completely flattened into C{write} or which will be errbacked if
@@ -354,18 +566,31 @@ def _writeFlattenedData(state, write, result):
 
     @return: C{None}
     """
+    buffered = []
+    bufferedLength = 0
     while True:
         try:
             element = state.next()
         except StopIteration:
+            if buffered:
+                write(''.join(buffered))
             result.callback(None)
         except:
+            if buffered:
+                write(''.join(buffered))
             result.errback()
         else:
             if type(element) is str:
-                write(element)
+                buffered.append(element)
+                bufferedLength += len(element)
+                if bufferedLength >= _BUFFER_SIZE:
+                    write(''.join(buffered))
+                    buffered = []
+                    bufferedLength = 0
                 continue
             else:
+                if buffered:
+                    write(''.join(buffered))
                 def cby(original):
                     _writeFlattenedData(state, write, result)
                     return original
@@ -390,8 +615,11 @@ def flatten(request, root, write):
         L{list}, L{GeneratorType}, L{Deferred}, or something that provides
         L{IRenderable}.
 
-    @param write: A callable which will be invoked with each L{bytes} produced
-        by flattening C{root}.
+    @param write: A callable which will be invoked with the L{bytes} produced
+        by flattening C{root}.  Consecutive output is joined together, up to
+        about 64KiB at a time, so that C{write} is called as few times as
+        possible; all output produced before C{root} must wait for a
+        L{Deferred} is written before waiting.
 
     @return: A L{Deferred} which will be called back when C{root} has been
         completely flattened into C{write} or which will be errbacked if an
@@ -0,0 +1,207 @@
+# -*- test-case-name: twisted.web.test.test_multipart -*-
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Incremental parsing of I{multipart} MIME bodies, such as the bodies of
+I{multipart/form-data} requests.
+"""
+
+from __future__ import division, absolute_import
+
+from twisted.web.http_headers import Headers
+
+
+__all__ = ['MalformedMultipartError', 'MultipartParser']
+
+
+
+class MalformedMultipartError(Exception):
+    """
+    L{MultipartParser} raises L{MalformedMultipartError} when the data given
+    to it is not a valid multipart body.
+    """
+
+
+
+class MultipartParser(object):
+    """
+    A parser for a I{multipart} MIME body, as defined by RFC 2046, section
+    5.1.1, which is given the body a piece at a time and delivers each part
+    a piece at a time, so that neither the body nor its parts ever need to be
+    held in memory.
+
+    Lines may be terminated by either CR LF or a bare LF.
+
+    @ivar partCallback: A one-argument callable which is invoked with the
+        headers of each part, as a L{Headers} instance, when they have been
+        received.
+
+    @ivar dataCallback: A one-argument callable which is invoked with each
+        piece of the content of the current part.
+
+    @ivar finishCallback: A no-argument callable which is invoked when the
+        content of the current part is complete.
+
+    @ivar maxHeaderSize: The largest number of bytes the headers of a part
+        may take up.
+    @type maxHeaderSize: C{int}
+
+    @ivar state: One of C{'PREAMBLE'}, C{'BOUNDARY'}, C{'HEADERS'},
+        C{'BODY'} or C{'FINISHED'}.  For C{'PREAMBLE'}, data before the first
+        boundary is being skipped.  For C{'BOUNDARY'}, the end of a boundary
+        line is being read.  For C{'HEADERS'}, the headers of a part are
+        being read.  For C{'BODY'}, the content of a part is being read.  For
+        C{'FINISHED'}, the close boundary has been read and any further data
+        is ignored.
+    """
+    state = 'PREAMBLE'
+    maxHeaderSize = 16384
+
+    def __init__(self, boundary, partCallback, dataCallback, finishCallback):
+        """
+        @param boundary: The boundary parameter of the body's
+            I{Content-Type}.
+        @type boundary: C{bytes}
+        """
+        self.partCallback = partCallback
+        self.dataCallback = dataCallback
+        self.finishCallback = finishCallback
+        self._delimiter = b'\n--' + boundary
+        # The first boundary may be at the very start of the body, without a
+        # line break in front of it.  Pretend there is one.
+        self._buffer = b'\n'
+        self._headerLines = []
+        self._headerSize = 0
+        self._partStart = False
+
+
+    def _findDelimiter(self, data):
+        """
+        Look for the next delimiter in C{data}.
+
+        @return: A two-tuple of the data before the delimiter and the data
+            after it, or of the data which certainly does not belong to a
+            delimiter and C{None} if there is no delimiter in C{data}.  The
+            rest of C{data} is kept in the buffer.
+        """
+        index = data.find(self._delimiter)
+        if index == -1:
+            # A delimiter might begin at the end of data, following a CR.
+            keep = len(self._delimiter)
+            if len(data) <= keep:
+                self._buffer = data
+                return b'', None
+            self._buffer = data[-keep:]
+            return data[:-keep], None
+        content = data[:index]
+        if content.endswith(b'\r'):
+            content = content[:-1]
+        return content, data[index + len(self._delimiter):]
+
+
+    def _dataReceived_PREAMBLE(self, data):
+        preamble, rest = self._findDelimiter(data)
+        if rest is None:
+            return b''
+        self.state = 'BOUNDARY'
+        return rest
+
+
+    def _dataReceived_BOUNDARY(self, data):
+        if data.startswith(b'--'):
+            self.state = 'FINISHED'
+            return b''
+        if len(data) < 2 and data in (b'', b'-'):
+            self._buffer = data
+            return b''
+        line, newline, rest = data.partition(b'\n')
+        if not newline:
+            if len(data) > self.maxHeaderSize:
+                raise MalformedMultipartError("Boundary line too long.")
+            self._buffer = data
+            return b''
+        if line.strip():
+            raise MalformedMultipartError(
+                "Unexpected data after boundary: %r" % (line,))
+        self.state = 'HEADERS'
+        return rest
+
+
+    def _dataReceived_HEADERS(self, data):
+        line, newline, rest = data.partition(b'\n')
+        if not newline:
+            if self._headerSize + len(data) > self.maxHeaderSize:
+                raise MalformedMultipartError("Part headers too long.")
+            self._buffer = data
+            return b''
+        self._headerSize += len(data) - len(rest)
+        if self._headerSize > self.maxHeaderSize:
+            raise MalformedMultipartError("Part headers too long.")
+        if line.endswith(b'\r'):
+            line = line[:-1]
+        if line:
+            if line[:1] in (b' ', b'\t') and self._headerLines:
+                self._headerLines[-1] += b' ' + line.strip()
+            else:
+                self._headerLines.append(line)
+            return rest
+
+        headers = Headers()
+        for header in self._headerLines:
+            name, colon, value = header.partition(b':')
+            if not colon:
+                raise MalformedMultipartError(
+                    "Invalid part header: %r" % (header,))
+            headers.addRawHeader(name.strip(), value.strip())
+        self._headerLines = []
+        self._headerSize = 0
+        self.state = 'BODY'
+        self.partCallback(headers)
+        # The line break ending the headers may also be the one in front of
+        # the next delimiter, if the part is empty.  Put it back, and remove
+        # it from the content of the part.
+        self._partStart = True
+        return b'\n' + rest
+
+
+    def _dataReceived_BODY(self, data):
+        content, rest = self._findDelimiter(data)
+        if content and self._partStart:
+            content = content[1:]
+            self._partStart = False
+        if content:
+            self.dataCallback(content)
+        if rest is None:
+            return b''
+        self.state = 'BOUNDARY'
+        self.finishCallback()
+        return rest
+
+
+    def _dataReceived_FINISHED(self, data):
+        return b''
+
+
+    def dataReceived(self, data):
+        """
+        Interpret the next piece of the body.
+
+        @raise MalformedMultipartError: If the body is not valid.
+        """
+        data = self._buffer + data
+        self._buffer = b''
+        while data:
+            data = getattr(self, '_dataReceived_%s' % (self.state,))(data)
+
+
+    def noMoreData(self):
+        """
+        The whole body has been given to this parser.
+
+        @raise MalformedMultipartError: If the close boundary has not been
+            received.
+        """
+        if self.state != 'FINISHED':
+            raise MalformedMultipartError(
+                "Multipart body ended in %r state." % (self.state,))
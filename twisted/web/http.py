@@ -60,6 +60,7 @@ import tempfile
 import base64, binascii
 import cgi
 import math
+import re
 import time
 import calendar
 import warnings
@@ -94,7 +95,8 @@ from twisted.internet.defer import Deferred
 from twisted.protocols import policies, basic
 
 from twisted.web.iweb import IRequest, IAccessLogFormatter
-from twisted.web.http_headers import _DictHeaders, Headers
+from twisted.web.http_headers import _DictHeaders, Headers, _lowercase
+from twisted.web._multipart import MultipartParser, MalformedMultipartError
 
 from twisted.web._responses import (
     SWITCHING,
@@ -357,6 +359,19 @@ def parseContentRange(header):
 
 
 
+def _stripWeakness(etag):
+    """
+    Remove the weakness indicator, if any, from an entity tag.
+
+    @type etag: C{bytes}
+    @rtype: C{bytes}
+    """
+    if etag.startswith(b'W/'):
+        return etag[2:]
+    return etag
+
+
+
 class StringTransport:
     """
     I am a StringIO wrapper that conforms for the transport API. I support
@@ -566,6 +581,15 @@ class Request:
         which this request was received is closed and which is C{True} after
         that.
     @type _disconnected: C{bool}
+
+    @ivar _bodyConsumer: The L{twisted.web.iweb.IRequestBodyConsumer}
+        provider returned by L{getRequestBodyConsumer} which the request body
+        is delivered to, or C{None} if the body is kept in C{content}.
+
+    @ivar _bodyBudget: The L{_BodyMemoryBudget} of the channel, if any, from
+        which memory was reserved to keep the request body in.
+
+    @ivar _bodyReserved: The number of bytes reserved from C{_bodyBudget}.
     """
     producer = None
     finished = 0
@@ -584,6 +608,9 @@ class Request:
     content = None
     _forceSSL = 0
     _disconnected = False
+    _bodyConsumer = None
+    _bodyBudget = None
+    _bodyReserved = 0
 
     def __init__(self, channel, queued):
         """
@@ -680,6 +707,7 @@ class Request:
             # win32 suckiness, no idea why it does this
             pass
         del self.content
+        self._releaseBody()
         for d in self.notifications:
             d.callback(None)
         self.notifications = []
@@ -723,10 +751,52 @@ class Request:
             request headers.  C{None} if the request headers do not indicate a
             length.
         """
+        if length != 0:
+            consumer = self.getRequestBodyConsumer()
+            if consumer is not None:
+                self._bodyConsumer = consumer
+                self.content = StringIO()
+                consumer.bodyStarted(
+                    proxyForInterface(interfaces.IPushProducer)(
+                        self.channel.transport))
+                return
+
         if length is not None and length < 100000:
-            self.content = StringIO()
-        else:
-            self.content = tempfile.TemporaryFile()
+            budget = getattr(self.channel, '_bodyBudget', None)
+            if budget is None or budget.reserve(length):
+                self._bodyBudget = budget
+                self._bodyReserved = length
+                self.content = StringIO()
+                return
+        self.content = tempfile.TemporaryFile()
+
+
+    def getRequestBodyConsumer(self):
+        """
+        Choose where the body of this request goes as it is received.
+
+        This is called once all headers of a request with a body have been
+        received, before any of its body.  C{method}, C{uri}, C{clientproto}
+        and C{requestHeaders} are available, but C{args} and C{path} are not.
+        Override it to process request bodies incrementally, for example to
+        write large uploads straight to their destination.
+
+        @return: C{None} to keep the body in C{content}, which is the
+            default, or an L{twisted.web.iweb.IRequestBodyConsumer} provider
+            to deliver the body to instead.  In that case C{content} is empty
+            and the body is not parsed into C{args}.
+        """
+        return None
+
+
+    def _releaseBody(self):
+        """
+        Give back the memory reserved for the request body, if any.
+        """
+        if self._bodyBudget is not None:
+            self._bodyBudget.release(self._bodyReserved)
+            self._bodyBudget = None
+            self._bodyReserved = 0
 
 
     def parseCookies(self):
@@ -757,7 +827,10 @@ class Request:
 
         This method is not intended for users.
         """
-        self.content.write(data)
+        if self._bodyConsumer is not None:
+            self._bodyConsumer.dataReceived(data)
+        else:
+            self.content.write(data)
 
 
     def requestReceived(self, command, path, version):
@@ -776,6 +849,11 @@ class Request:
         @type version: C{bytes}
         @param version: The HTTP version of this request.
         """
+        consumer = self._bodyConsumer
+        if consumer is not None:
+            self._bodyConsumer = None
+            consumer.bodyDone(None)
+
         self.content.seek(0,0)
         self.args = {}
 
@@ -800,24 +878,18 @@ class Request:
         if ctype is not None:
             ctype = ctype[0]
 
-        if self.method == b"POST" and ctype:
+        if self.method == b"POST" and ctype and consumer is None:
             mfd = b'multipart/form-data'
             key, pdict = _parseHeader(ctype)
             if key == b'application/x-www-form-urlencoded':
                 args.update(parse_qs(self.content.read(), 1))
             elif key == mfd:
                 try:
-                    args.update(cgi.parse_multipart(self.content, pdict))
-                except KeyError as e:
-                    if e.args[0] == b'content-disposition':
-                        # Parse_multipart can't cope with missing
-                        # content-disposition headers in multipart/form-data
-                        # parts, so we catch the exception and tell the client
-                        # it was a bad request.
-                        _respondToBadRequestAndDisconnect(
-                            self.channel.transport)
-                        return
-                    raise
+                    args.update(_parseFormData(
+                            self.content, pdict.get('boundary')))
+                except MalformedMultipartError:
+                    _respondToBadRequestAndDisconnect(self.channel.transport)
+                    return
             self.content.seek(0, 0)
 
         self.process()
@@ -946,6 +1018,34 @@ class Request:
             self._cleanup()
 
 
+    def _upgrade(self, protocol):
+        """
+        Send the status and headers of the response, which should have the
+        I{Switching Protocols} code, and hand the connection this request was
+        received over to C{protocol}.
+
+        The request is never finished.  It is told when the connection is
+        lost, like any unfinished request.
+
+        @param protocol: The protocol which all further data received over
+            the connection is delivered to.  It is connected to the
+            connection's transport.
+        @type protocol: L{IProtocol<twisted.internet.interfaces.IProtocol>}
+            provider
+
+        @raise RuntimeError: If the request is queued behind another request
+            or has already started writing its response.
+        """
+        if self.queued or self.startedWriting:
+            raise RuntimeError(
+                "Cannot switch protocols for a request which is queued or "
+                "has already started writing.")
+        self.write(b'')
+        if hasattr(self.channel, "factory"):
+            self.channel.factory.log(self)
+        self.channel._switchProtocol(protocol)
+
+
     def write(self, data):
         """
         Write some data as a result of an HTTP request.  The first
@@ -971,7 +1071,8 @@ class Request:
             # persistent connections.
             if ((version == b"HTTP/1.1") and
                 (self.responseHeaders.getRawHeaders(b'content-length') is None) and
-                self.method != b"HEAD" and self.code not in NO_BODY_CODES):
+                self.method != b"HEAD" and self.code not in NO_BODY_CODES and
+                self.code != SWITCHING):
                 l.append(b'Transfer-Encoding: chunked\r\n')
                 self.chunked = 1
 
@@ -987,23 +1088,27 @@ class Request:
             if self.etag is not None:
                 self.responseHeaders.setRawHeaders(b'ETag', [self.etag])
 
-            for name, values in self.responseHeaders.getAllRawHeaders():
-                for value in values:
-                    if not isinstance(value, bytes):
-                        warnings.warn(
-                            "Passing non-bytes header values is deprecated "
-                            "since Twisted 12.3. Pass only bytes instead.",
-                            category=DeprecationWarning, stacklevel=2)
-                        # Backward compatible cast for non-bytes values
-                        value = networkString('%s' % (value,))
-                    l.extend([name, b": ", value, b"\r\n"])
+            try:
+                l.append(self.responseHeaders._toWire())
+            except TypeError:
+                for name, values in self.responseHeaders.getAllRawHeaders():
+                    for value in values:
+                        if not isinstance(value, bytes):
+                            warnings.warn(
+                                "Passing non-bytes header values is "
+                                "deprecated since Twisted 12.3. Pass only "
+                                "bytes instead.",
+                                category=DeprecationWarning, stacklevel=2)
+                            # Backward compatible cast for non-bytes values
+                            value = networkString('%s' % (value,))
+                        l.extend([name, b": ", value, b"\r\n"])
 
             for cookie in self.cookies:
                 l.append(networkString('Set-Cookie: %s\r\n' % (cookie,)))
 
             l.append(b"\r\n")
 
-            self.transport.writeSequence(l)
+            self.transport.write(b"".join(l))
 
             # if this is a "HEAD" request, we shouldn't return any data
             if self.method == b"HEAD":
@@ -1110,6 +1215,11 @@ class Request:
         if (not self.lastModified) or (self.lastModified < when):
             self.lastModified = when
 
+        if self.getHeader(b'if-none-match'):
+            # An entity tag is a more accurate validator, so the
+            # If-Modified-Since header is ignored when both are sent (RFC
+            # 7232, section 6).
+            return None
         modifiedSince = self.getHeader(b'if-modified-since')
         if modifiedSince:
             firstPart = modifiedSince.split(b';', 1)[0]
@@ -1146,8 +1256,11 @@ class Request:
 
         tags = self.getHeader(b"if-none-match")
         if tags:
-            tags = tags.split()
-            if (etag in tags) or (b'*' in tags):
+            # If-None-Match uses the weak comparison function, which
+            # ignores the weakness indicator of both tags.
+            tags = [_stripWeakness(tag.strip())
+                    for tag in tags.replace(b',', b' ').split()]
+            if (etag and _stripWeakness(etag) in tags) or (b'*' in tags):
                 self.setResponseCode(((self.method in (b"HEAD", b"GET"))
                                       and NOT_MODIFIED)
                                      or PRECONDITION_FAILED)
@@ -1337,6 +1450,11 @@ class Request:
         self.channel = None
         if self.content is not None:
             self.content.close()
+        self._releaseBody()
+        consumer = self._bodyConsumer
+        if consumer is not None:
+            self._bodyConsumer = None
+            consumer.bodyDone(reason)
         for d in self.notifications:
             d.errback(reason)
         self.notifications = []
@@ -1346,6 +1464,65 @@ Request.getClient = deprecated(
     "Twisted Names to resolve hostnames")(Request.getClient)
 
 
+def _parseFormData(content, boundary):
+    """
+    Parse a I{multipart/form-data} request body, a piece at a time.
+
+    @param content: A file-like object holding the body.
+
+    @param boundary: The boundary parameter of the body's I{Content-Type}.
+    @type boundary: C{bytes} or C{str}
+
+    @return: A C{dict} mapping the names of the fields in the body to
+        C{list}s of their values, like L{cgi.parse_multipart}.  Parts which
+        are not form data or have no name are skipped.
+
+    @raise MalformedMultipartError: If the body is not valid, or a part has
+        no I{Content-Disposition}.
+    """
+    if not boundary:
+        raise MalformedMultipartError("No boundary given.")
+    if not isinstance(boundary, bytes):
+        boundary = boundary.encode('charmap')
+
+    args = {}
+    current = []
+
+    def partReceived(headers):
+        disposition = headers.getRawHeaders(b'content-disposition')
+        if disposition is None:
+            raise MalformedMultipartError("Part has no Content-Disposition.")
+        key, params = _parseHeader(disposition[0])
+        name = params.get('name')
+        if key != b'form-data' or name is None:
+            current[:] = [None]
+        else:
+            if not isinstance(name, bytes):
+                name = name.encode('charmap')
+            current[:] = [name]
+
+    def dataReceived(data):
+        if current[0] is not None:
+            current.append(data)
+
+    def partFinished():
+        name = current.pop(0)
+        if name is not None:
+            args.setdefault(name, []).append(b''.join(current))
+        del current[:]
+
+    parser = MultipartParser(
+        boundary, partReceived, dataReceived, partFinished)
+    while True:
+        data = content.read(2 ** 16)
+        if not data:
+            break
+        parser.dataReceived(data)
+    parser.noMoreData()
+    return args
+
+
+
 class _DataLoss(Exception):
     """
     L{_DataLoss} indicates that not all of a message body was received. This
@@ -1492,66 +1669,117 @@ class _ChunkedTransferDecoder(object):
         read. For C{'BODY'}, the contents of a chunk are being read. For
         C{'FINISHED'}, the last chunk has been completely read and no more
         input is valid.
+
+    @ivar _buffer: The part of a chunk length line received so far.
+    @type _buffer: C{bytearray}
+
+    @ivar _crlf: How many bytes of the CR LF pair being read in the
+        C{'CRLF'} or C{'TRAILER'} state have been received.
     """
     state = 'CHUNK_LENGTH'
 
     def __init__(self, dataCallback, finishCallback):
         self.dataCallback = dataCallback
         self.finishCallback = finishCallback
-        self._buffer = b''
-
-
-    def _dataReceived_CHUNK_LENGTH(self, data):
-        if b'\r\n' in data:
-            line, rest = data.split(b'\r\n', 1)
-            parts = line.split(b';')
-            try:
-                self.length = int(parts[0], 16)
-            except ValueError:
-                raise _MalformedChunkedDataError(
-                    "Chunk-size must be an integer.")
-            if self.length == 0:
-                self.state = 'TRAILER'
-            else:
-                self.state = 'BODY'
-            return rest
+        self._buffer = bytearray()
+        self._crlf = 0
+
+
+    # Each of the _dataReceived_ methods interprets data starting at
+    # position and returns the position of the first byte it did not
+    # interpret.  Tracking positions rather than slicing off what has been
+    # interpreted keeps the cost of a segment holding many small chunks
+    # linear in its size.
+
+    def _dataReceived_CHUNK_LENGTH(self, data, position):
+        buffer = self._buffer
+        if (buffer and buffer[-1:] == b'\r' and
+                data[position:position + 1] == b'\n'):
+            # The CR LF was split between two segments.
+            line = bytes(buffer[:-1])
+            end = position - 1
+        else:
+            end = data.find(b'\r\n', position)
+            if end == -1:
+                # Only the new data is searched next time, so a line which
+                # arrives a byte at a time does not cost quadratic time.
+                buffer.extend(data[position:])
+                return len(data)
+            line = data[position:end]
+            if buffer:
+                line = bytes(buffer) + line
+        del buffer[:]
+        try:
+            self.length = int(line.split(b';', 1)[0], 16)
+        except ValueError:
+            raise _MalformedChunkedDataError(
+                "Chunk-size must be an integer.")
+        if self.length == 0:
+            self.state = 'TRAILER'
         else:
-            self._buffer = data
-            return b''
+            self.state = 'BODY'
+        return end + 2
 
 
-    def _dataReceived_CRLF(self, data):
-        if data.startswith(b'\r\n'):
+    def _matchCRLF(self, data, position):
+        """
+        Match the CR LF pair which ends a chunk, or the chunked data, which
+        may be split between two segments.
+
+        @return: A two-tuple of whether the whole pair has been matched and
+            the position of the first byte after the matched part.
+        """
+        while self._crlf < 2 and position < len(data):
+            expected = b'\r\n'[self._crlf:self._crlf + 1]
+            if data[position:position + 1] != expected:
+                raise _MalformedChunkedDataError(
+                    "Chunk did not end with CRLF.")
+            self._crlf += 1
+            position += 1
+        if self._crlf == 2:
+            self._crlf = 0
+            return True, position
+        return False, position
+
+
+    def _dataReceived_CRLF(self, data, position):
+        matched, position = self._matchCRLF(data, position)
+        if matched:
             self.state = 'CHUNK_LENGTH'
-            return data[2:]
-        else:
-            self._buffer = data
-            return b''
+        return position
 
 
-    def _dataReceived_TRAILER(self, data):
-        if data.startswith(b'\r\n'):
-            data = data[2:]
+    def _dataReceived_TRAILER(self, data, position):
+        matched, position = self._matchCRLF(data, position)
+        if matched:
             self.state = 'FINISHED'
-            self.finishCallback(data)
-        else:
-            self._buffer = data
-        return b''
+            self.finishCallback(data[position:])
+        return len(data)
 
 
-    def _dataReceived_BODY(self, data):
-        if len(data) >= self.length:
-            chunk, data = data[:self.length], data[self.length:]
-            self.dataCallback(chunk)
-            self.state = 'CRLF'
-            return data
-        elif len(data) < self.length:
-            self.length -= len(data)
+    def _dataReceived_BODY(self, data, position):
+        available = len(data) - position
+        if available <= self.length:
+            if position:
+                data = data[position:]
+            # When a segment holds nothing but chunk data, it is delivered
+            # without being copied.
             self.dataCallback(data)
-            return b''
+            self.length -= available
+            if not self.length:
+                self.state = 'CRLF'
+            return position + available
+        end = position + self.length
+        self.dataCallback(data[position:end])
+        self.length = 0
+        if data[end:end + 2] == b'\r\n':
+            self.state = 'CHUNK_LENGTH'
+            return end + 2
+        self.state = 'CRLF'
+        return end
 
 
-    def _dataReceived_FINISHED(self, data):
+    def _dataReceived_FINISHED(self, data, position):
         raise RuntimeError(
             "_ChunkedTransferDecoder.dataReceived called after last "
             "chunk was processed")
@@ -1562,10 +1790,11 @@ class _ChunkedTransferDecoder(object):
         Interpret data from a request or response body which uses the
         I{chunked} Transfer-Encoding.
         """
-        data = self._buffer + data
-        self._buffer = b''
-        while data:
-            data = getattr(self, '_dataReceived_%s' % (self.state,))(data)
+        position = 0
+        end = len(data)
+        while position < end:
+            position = getattr(self, '_dataReceived_%s' % (self.state,))(
+                data, position)
 
 
     def noMoreData(self):
@@ -1580,6 +1809,51 @@ class _ChunkedTransferDecoder(object):
 
 
 
+class _BodyMemoryBudget(object):
+    """
+    The amount of memory which the bodies of all the requests received by
+    the channels of one L{HTTPFactory} may be kept in.  Bodies which do not
+    fit are kept in temporary files instead.
+
+    @ivar limit: The number of bytes available.
+    @type limit: C{int}
+
+    @ivar used: The number of bytes reserved.
+    @type used: C{int}
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+
+
+    def reserve(self, size):
+        """
+        Reserve memory for a request body.
+
+        @param size: The number of bytes wanted.
+        @type size: C{int}
+
+        @return: C{True} if they were reserved, C{False} if there is not
+            enough memory available.
+        """
+        if self.used + size > self.limit:
+            return False
+        self.used += size
+        return True
+
+
+    def release(self, size):
+        """
+        Give back memory reserved with L{reserve}.
+
+        @param size: The number of bytes reserved.
+        @type size: C{int}
+        """
+        self.used -= size
+
+
+
 class HTTPChannel(basic.LineReceiver, policies.TimeoutMixin):
     """
     A receiver for HTTP requests.
@@ -1600,6 +1874,13 @@ class HTTPChannel(basic.LineReceiver, policies.TimeoutMixin):
 
     @ivar _receivedHeaderSize: Bytes received so far for the header.
     @type _receivedHeaderSize: C{int}
+
+    @ivar _bodyBudget: The L{_BodyMemoryBudget} shared with the other
+        channels of the factory, or C{None} if the memory request bodies are
+        kept in is not limited.
+
+    @ivar _upgradedProtocol: The protocol this connection was handed over to
+        by L{_switchProtocol}, or C{None} while it is used for HTTP.
     """
 
     maxHeaders = 500
@@ -1617,6 +1898,8 @@ class HTTPChannel(basic.LineReceiver, policies.TimeoutMixin):
     _savedTimeOut = None
     _receivedHeaderCount = 0
     _receivedHeaderSize = 0
+    _bodyBudget = None
+    _upgradedProtocol = None
 
     def __init__(self):
         # the request queue
@@ -1690,7 +1973,11 @@ class HTTPChannel(basic.LineReceiver, policies.TimeoutMixin):
 
     def _finishRequestBody(self, data):
         self.allContentReceived()
-        self.setLineMode(data)
+        if self._upgradedProtocol is not None:
+            if data:
+                self._upgradedProtocol.dataReceived(data)
+        else:
+            self.setLineMode(data)
 
 
     def headerReceived(self, line):
@@ -1703,7 +1990,7 @@ class HTTPChannel(basic.LineReceiver, policies.TimeoutMixin):
             line delimiter.
         """
         header, data = line.split(b':', 1)
-        header = header.lower()
+        header = _lowercase(header)
         data = data.strip()
         if header == b'content-length':
             try:
@@ -1720,12 +2007,7 @@ class HTTPChannel(basic.LineReceiver, policies.TimeoutMixin):
             self.length = None
             self._transferDecoder = _ChunkedTransferDecoder(
                 self.requests[-1].handleContentChunk, self._finishRequestBody)
-        reqHeaders = self.requests[-1].requestHeaders
-        values = reqHeaders.getRawHeaders(header)
-        if values is not None:
-            values.append(data)
-        else:
-            reqHeaders.setRawHeaders(header, [data])
+        self.requests[-1].requestHeaders.addRawHeader(header, data)
 
         self._receivedHeaderCount += 1
         if self._receivedHeaderCount > self.maxHeaders:
@@ -1756,6 +2038,9 @@ class HTTPChannel(basic.LineReceiver, policies.TimeoutMixin):
 
 
     def rawDataReceived(self, data):
+        if self._upgradedProtocol is not None:
+            self._upgradedProtocol.dataReceived(data)
+            return
         self.resetTimeout()
         try:
             self._transferDecoder.dataReceived(data)
@@ -1767,6 +2052,8 @@ class HTTPChannel(basic.LineReceiver, policies.TimeoutMixin):
         req = self.requests[-1]
         req.parseCookies()
         self.persistent = self.checkPersistence(req, self._version)
+        req.method, req.uri = self._command, self._path
+        req.clientproto = self._version
         req.gotLength(self.length)
         # Handle 'Expect: 100-continue' with automated 100 response code,
         # a simplistic implementation of RFC 2686 8.2.3:
@@ -1841,10 +2128,29 @@ class HTTPChannel(basic.LineReceiver, policies.TimeoutMixin):
         log.msg("Timing out client: %s" % str(self.transport.getPeer()))
         policies.TimeoutMixin.timeoutConnection(self)
 
+
+    def _switchProtocol(self, protocol):
+        """
+        Stop interpreting data received over this connection as HTTP, and
+        deliver it to C{protocol} instead, for example once a request to
+        upgrade to the WebSocket protocol has been accepted.
+
+        @param protocol: The protocol to connect to this channel's transport.
+        @type protocol: L{IProtocol<twisted.internet.interfaces.IProtocol>}
+            provider
+        """
+        self._upgradedProtocol = protocol
+        self.setTimeout(None)
+        self.setRawMode()
+        protocol.makeConnection(self.transport)
+
+
     def connectionLost(self, reason):
         self.setTimeout(None)
         for request in self.requests:
             request.connectionLost(reason)
+        if self._upgradedProtocol is not None:
+            self._upgradedProtocol.connectionLost(reason)
 
 
 
@@ -1864,6 +2170,12 @@ def _respondToBadRequestAndDisconnect(transport):
 
 
 
+# Bytes which _escape must transform: anything outside printable ASCII, the
+# double quote and the backslash.
+_needsEscape = re.compile(b'[^\x20-\x7e]|["\\\\]').search
+
+
+
 def _escape(s):
     """
     Return a string like python repr, but always escaped as if surrounding
@@ -1878,6 +2190,10 @@ def _escape(s):
     if not isinstance(s, bytes):
         s = s.encode("ascii")
 
+    if _needsEscape(s) is None:
+        # The common case: nothing to escape.
+        return s.decode("ascii")
+
     r = repr(s)
     if not isinstance(r, unicode):
         r = r.decode("ascii")
@@ -1889,6 +2205,48 @@ def _escape(s):
 
 
 
+def _combinedLogFields(request):
+    """
+    Collect the values which a combined log format line records about a
+    request, before they are escaped.
+
+    @return: A C{dict} with the keys C{ip}, C{method}, C{uri}, C{protocol},
+        C{code}, C{length}, C{referrer} and C{agent}.
+    """
+    return dict(
+        ip=request.getClientIP() or b"-",
+        method=request.method,
+        uri=request.uri,
+        protocol=request.clientproto,
+        code=request.code,
+        length=request.sentLength or u"-",
+        referrer=request.getHeader(b"referer") or b"-",
+        agent=request.getHeader(b"user-agent") or b"-")
+
+
+
+def _formatCombinedLogLine(timestamp, fields):
+    """
+    Format a combined log format line, escaping the fields which need it.
+
+    @param fields: The fields returned by L{_combinedLogFields}.
+
+    @rtype: L{unicode}
+    """
+    return u'"%s" - - %s "%s %s %s" %d %s "%s" "%s"' % (
+        _escape(fields["ip"]),
+        timestamp,
+        _escape(fields["method"]),
+        _escape(fields["uri"]),
+        _escape(fields["protocol"]),
+        fields["code"],
+        fields["length"],
+        _escape(fields["referrer"]),
+        _escape(fields["agent"]),
+        )
+
+
+
 @provider(IAccessLogFormatter)
 def combinedLogFormatter(timestamp, request):
     """
@@ -1896,22 +2254,33 @@ def combinedLogFormatter(timestamp, request):
 
     @see: L{IAccessLogFormatter}
     """
-    referrer = _escape(request.getHeader(b"referer") or b"-")
-    agent = _escape(request.getHeader(b"user-agent") or b"-")
-    line = (
-        u'"%(ip)s" - - %(timestamp)s "%(method)s %(uri)s %(protocol)s" '
-        u'%(code)d %(length)s "%(referrer)s" "%(agent)s"' % dict(
-            ip=_escape(request.getClientIP() or b"-"),
-            timestamp=timestamp,
-            method=_escape(request.method),
-            uri=_escape(request.uri),
-            protocol=_escape(request.clientproto),
-            code=request.code,
-            length=request.sentLength or u"-",
-            referrer=referrer,
-            agent=agent,
-            ))
-    return line
+    return _formatCombinedLogLine(timestamp, _combinedLogFields(request))
+
+
+
+class _EscapedLogFields(object):
+    """
+    The fields of an access log event, escaped as the event's format is
+    rendered, so that the event itself keeps the values as they were.
+
+    @ivar _fields: The fields returned by L{_combinedLogFields}.
+    """
+
+    def __init__(self, fields):
+        self._fields = fields
+
+
+    def __getitem__(self, name):
+        return _escape(self._fields[name])
+
+
+
+# The format of the events emitted by HTTPFactory when it is given an
+# accessLogger; it renders as a combined log format line.
+_accessLogEventFormat = (
+    u'"{escaped[ip]}" - - {timestamp} "{escaped[method]} {escaped[uri]} '
+    u'{escaped[protocol]}" {code} {length} "{escaped[referrer]}" '
+    u'"{escaped[agent]}"')
 
 
 
@@ -1990,6 +2359,19 @@ class HTTPFactory(protocol.ServerFactory):
 
     @ivar _reactor: An L{IReactorTime} provider used to compute logging
         timestamps.
+
+    @ivar _logBufferSize: See the C{logBufferSize} parameter to L{__init__}.
+
+    @ivar _logBuffer: Formatted access log lines not yet written to
+        C{logFile}.
+    @type _logBuffer: C{list}
+
+    @ivar _logBuffered: The total length of the lines in C{_logBuffer}.
+
+    @ivar _accessLogger: See the C{accessLogger} parameter to L{__init__}.
+
+    @ivar _bodyBudget: A L{_BodyMemoryBudget} for the C{bodyMemoryLimit}
+        parameter to L{__init__}, or C{None}.
     """
 
     protocol = HTTPChannel
@@ -1999,12 +2381,35 @@ class HTTPFactory(protocol.ServerFactory):
     timeOut = 60 * 60 * 12
 
     _reactor = reactor
+    _bodyBudget = None
 
-    def __init__(self, logPath=None, timeout=60*60*12, logFormatter=None):
+    def __init__(self, logPath=None, timeout=60*60*12, logFormatter=None,
+                 logBufferSize=0, accessLogger=None, bodyMemoryLimit=None):
         """
         @param logFormatter: An object to format requests into log lines for
             the access log.
         @type logFormatter: L{IAccessLogFormatter} provider
+
+        @param logBufferSize: If non-zero, access log lines are collected and
+            written to the log file together once their total length reaches
+            this many characters, once a second, and when the factory is
+            stopped, rather than written one at a time.
+        @type logBufferSize: C{int}
+
+        @param accessLogger: If not C{None}, each request is logged as a
+            structured event emitted at the info level of this logger, with
+            the fields C{ip}, C{timestamp}, C{method}, C{uri}, C{protocol},
+            C{code}, C{length}, C{referrer} and C{agent}, which are not
+            escaped; the event's format renders it as a combined log format
+            line, escaping them.  Lines are then only written to a log file if
+            C{logPath} is given.
+        @type accessLogger: L{twisted.logger.Logger}
+
+        @param bodyMemoryLimit: If not C{None}, the number of bytes of memory
+            which the bodies of all requests being handled at once may be
+            kept in.  Request bodies are then kept in temporary files when
+            they would not fit, as well as when they are large.
+        @type bodyMemoryLimit: C{int}
         """
         if logPath is not None:
             logPath = os.path.abspath(logPath)
@@ -2013,6 +2418,14 @@ class HTTPFactory(protocol.ServerFactory):
         if logFormatter is None:
             logFormatter = combinedLogFormatter
         self._logFormatter = logFormatter
+        self._logBufferSize = logBufferSize
+        self._logBuffer = []
+        self._logBuffered = 0
+        self._accessLogger = accessLogger
+        if bodyMemoryLimit is None:
+            self._bodyBudget = None
+        else:
+            self._bodyBudget = _BodyMemoryBudget(bodyMemoryLimit)
 
         # For storing the cached log datetime and the callback to update it
         self._logDateTime = None
@@ -2022,7 +2435,9 @@ class HTTPFactory(protocol.ServerFactory):
     def _updateLogDateTime(self):
         """
         Update log datetime periodically, so we aren't always recalculating it.
+        Buffered access log lines are written out at the same time.
         """
+        self._flushLog()
         self._logDateTime = datetimeToLogString(self._reactor.seconds())
         self._logDateTimeCall = self._reactor.callLater(1, self._updateLogDateTime)
 
@@ -2032,6 +2447,7 @@ class HTTPFactory(protocol.ServerFactory):
         # timeOut needs to be on the Protocol instance cause
         # TimeoutMixin expects it there
         p.timeOut = self.timeOut
+        p._bodyBudget = self._bodyBudget
         return p
 
 
@@ -2045,12 +2461,13 @@ class HTTPFactory(protocol.ServerFactory):
         if self.logPath:
             self._nativeize = False
             self.logFile = self._openLogFile(self.logPath)
-        else:
+        elif self._accessLogger is None:
             self._nativeize = True
             self.logFile = log.logfile
 
 
     def stopFactory(self):
+        self._flushLog()
         if hasattr(self, "logFile"):
             if self.logFile != log.logfile:
                 self.logFile.close()
@@ -2073,17 +2490,50 @@ class HTTPFactory(protocol.ServerFactory):
         """
         Write a line representing C{request} to the access log file.
 
+        If the factory has an C{accessLogger}, also emit an event describing
+        C{request} to it.
+
         @param request: The request object about which to log.
         @type request: L{Request}
         """
+        fields = None
+        if self._accessLogger is not None:
+            fields = _combinedLogFields(request)
+            self._accessLogger.info(
+                _accessLogEventFormat, timestamp=self._logDateTime,
+                escaped=_EscapedLogFields(fields), **fields)
+
         try:
             logFile = self.logFile
         except AttributeError:
             pass
         else:
-            line = self._logFormatter(self._logDateTime, request) + u"\n"
+            if self._logFormatter is combinedLogFormatter:
+                if fields is None:
+                    fields = _combinedLogFields(request)
+                line = _formatCombinedLogLine(self._logDateTime, fields)
+            else:
+                line = self._logFormatter(self._logDateTime, request)
+            line += u"\n"
             if self._nativeize:
                 line = nativeString(line)
             else:
                 line = line.encode("utf-8")
-            logFile.write(line)
+            if self._logBufferSize:
+                self._logBuffer.append(line)
+                self._logBuffered += len(line)
+                if self._logBuffered >= self._logBufferSize:
+                    self._flushLog()
+            else:
+                logFile.write(line)
+
+
+    def _flushLog(self):
+        """
+        Write any buffered access log lines to the log file in one call.
+        """
+        if self._logBuffer:
+            lines = self._logBuffer
+            self._logBuffer = []
+            self._logBuffered = 0
+            self.logFile.write(lines[0][:0].join(lines))
@@ -27,6 +27,41 @@ def _dashCapitalize(name):
 
 
 
+# Header names are mostly drawn from a small set, so the results of
+# lowercasing and capitalizing them are cached.  Since names come from the
+# network, each cache stops growing once it holds this many entries.
+_MAX_CACHED_NAMES = 1024
+
+# Maps header names, as given, to their lowercase form.  Every name used as
+# a key in Headers._rawHeaders passes through this table, so those for
+# common headers are all the same object.
+_lowercaseNames = {}
+
+# Maps lowercase header names to the start of their header lines on the
+# wire, the canonically capitalized name followed by b": ".
+_wirePrefixes = {}
+
+
+
+def _lowercase(name):
+    """
+    Return the lowercase form of a header name, interning it if there is
+    space.
+
+    @type name: C{bytes}
+    @rtype: C{bytes}
+    """
+    try:
+        return _lowercaseNames[name]
+    except KeyError:
+        lower = name.lower()
+        if len(_lowercaseNames) < _MAX_CACHED_NAMES:
+            lower = _lowercaseNames.setdefault(lower, lower)
+            _lowercaseNames[name] = lower
+        return lower
+
+
+
 class _DictHeaders(MutableMapping):
     """
     A C{dict}-like wrapper around L{Headers} to provide backwards compatibility
@@ -112,7 +147,8 @@ class Headers(object):
         to their canonicalized representation.
 
     @ivar _rawHeaders: A C{dict} mapping header names as C{bytes} to C{lists} of
-        header values as C{bytes}.
+        header values as C{bytes}.  The names are lowercase and, for common
+        headers, interned.
     """
     _caseMappings = {
         b'content-md5': b'Content-MD5',
@@ -166,7 +202,7 @@ class Headers(object):
         @rtype: C{bool}
         @return: C{True} if the header exists, otherwise C{False}.
         """
-        return name.lower() in self._rawHeaders
+        return _lowercase(name) in self._rawHeaders
 
 
     def removeHeader(self, name):
@@ -178,7 +214,7 @@ class Headers(object):
 
         @return: C{None}
         """
-        self._rawHeaders.pop(name.lower(), None)
+        self._rawHeaders.pop(_lowercase(name), None)
 
 
     def setRawHeaders(self, name, values):
@@ -197,7 +233,7 @@ class Headers(object):
         if not isinstance(values, list):
             raise TypeError("Header entry %r should be list but found "
                             "instance of %r instead" % (name, type(values)))
-        self._rawHeaders[name.lower()] = values
+        self._rawHeaders[_lowercase(name)] = values
 
 
     def addRawHeader(self, name, value):
@@ -210,9 +246,10 @@ class Headers(object):
         @type value: C{bytes}
         @param value: The value to set for the named header.
         """
-        values = self.getRawHeaders(name)
+        name = _lowercase(name)
+        values = self._rawHeaders.get(name)
         if values is None:
-            self.setRawHeaders(name, [value])
+            self._rawHeaders[name] = [value]
         else:
             values.append(value)
 
@@ -231,7 +268,7 @@ class Headers(object):
         @rtype: C{list}
         @return: A C{list} of values for the given header.
         """
-        return self._rawHeaders.get(name.lower(), default)
+        return self._rawHeaders.get(_lowercase(name), default)
 
 
     def getAllRawHeaders(self):
@@ -255,7 +292,55 @@ class Headers(object):
         @rtype: C{bytes}
         @return: The canonical name of the header.
         """
-        return self._caseMappings.get(name, _dashCapitalize(name))
+        return self._caseMappings.get(name) or _dashCapitalize(name)
+
+
+    def _wirePrefix(self, name):
+        """
+        Return the start of the lines for the given header in an HTTP
+        message.
+
+        @type name: C{bytes}
+        @param name: The all-lowercase header name.
+
+        @rtype: C{bytes}
+        @return: The canonical name of the header followed by C{b": "}.
+        """
+        if self._caseMappings is not Headers._caseMappings:
+            # The cache only holds the default capitalization.
+            return self._canonicalNameCaps(name) + b": "
+        try:
+            return _wirePrefixes[name]
+        except KeyError:
+            prefix = self._canonicalNameCaps(name) + b": "
+            if len(_wirePrefixes) < _MAX_CACHED_NAMES:
+                _wirePrefixes[name] = prefix
+            return prefix
+
+
+    def _toWire(self):
+        """
+        Serialize all of the headers as they appear in an HTTP message, one
+        line for each value, each terminated with C{b"\\r\\n"}.
+
+        @rtype: C{bytes}
+        @return: The serialized headers.
+
+        @raise TypeError: If any header value is not C{bytes}.
+        """
+        lines = []
+        append = lines.append
+        for name, values in self._rawHeaders.items():
+            prefix = self._wirePrefix(name)
+            for value in values:
+                append(prefix)
+                append(value)
+                append(b"\r\n")
+        block = b"".join(lines)
+        if not isinstance(block, bytes):
+            # Python 2 joins bytes and text into text.
+            raise TypeError("Header values must be bytes")
+        return block
 
 
 __all__ = ['Headers']
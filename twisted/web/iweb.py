@@ -602,8 +602,11 @@ class _IRequestEncoder(Interface):
         Callback called when the request is closing.
 
         @return: If necessary, the pending data accumulated from previous
-            C{encode} calls.
-        @rtype: C{str}
+            C{encode} calls.  An encoder which writes some of its output to
+            the request asynchronously may instead return a L{Deferred}
+            which fires with that data once its earlier output has been
+            written; the request is finished when it fires.
+        @rtype: C{str} or L{Deferred}
         """
 
 
@@ -777,11 +780,140 @@ class IAgentEndpointFactory(Interface):
 
 
 
+class IRequestBodyConsumer(Interface):
+    """
+    An object which is given the body of a request as it is received, rather
+    than having it kept in the request's C{content}.
+
+    @see: L{twisted.web.http.Request.getRequestBodyConsumer}
+
+    @since: 15.2
+    """
+
+    def bodyStarted(producer):
+        """
+        Called before any of the body is delivered.
+
+        @param producer: A producer which can be paused to stop more of the
+            body from being received until it is resumed, for example while
+            earlier data is being written somewhere slow.
+        @type producer: L{twisted.internet.interfaces.IPushProducer}
+            provider
+        """
+
+
+    def dataReceived(data):
+        """
+        Called with each piece of the body.
+
+        @type data: L{bytes}
+        """
+
+
+    def bodyDone(reason):
+        """
+        Called when no more of the body will be delivered.
+
+        @param reason: C{None} if the whole body has been delivered, or a
+            L{Failure<twisted.python.failure.Failure>} if the connection was
+            lost first.
+        """
+
+
+
+class IStreamingBodyResource(Interface):
+    """
+    A resource which may process the bodies of requests for it as they are
+    received, if the L{twisted.web.server.Site} it is part of has
+    C{streamRequestBodies} set.
+
+    @since: 15.2
+    """
+
+    def getRequestBodyConsumer(request):
+        """
+        Choose where the body of a request for this resource goes.
+
+        This is called before the body is received.  The request has not been
+        rendered yet, and its C{args} do not include any arguments from the
+        body.
+
+        @param request: The request.
+        @type request: L{twisted.web.server.Request}
+
+        @return: An L{IRequestBodyConsumer} provider to deliver the body to,
+            or C{None} to keep it in C{request.content} as usual.
+        """
+
+
+
+class ISessionStore(Interface):
+    """
+    A collection of the L{twisted.web.server.Session}s of a
+    L{twisted.web.server.Site}, responsible for creating, finding and expiring
+    them.
+
+    @since: 15.2
+    """
+
+    def makeSession(site, uid):
+        """
+        Create a new session and remember it.
+
+        @param site: The site the session is for.  The session is created by
+            calling its C{sessionFactory} with C{site} and C{uid}.
+        @type site: L{twisted.web.server.Site}
+
+        @param uid: The unique identifier of the new session.
+        @type uid: L{bytes}
+
+        @return: The new session.
+        @rtype: L{twisted.web.server.Session}
+        """
+
+
+    def getSession(site, uid):
+        """
+        Find a session which has not expired.
+
+        @param site: The site the session is for.
+        @type site: L{twisted.web.server.Site}
+
+        @param uid: The unique identifier of the session.
+        @type uid: L{bytes}
+
+        @return: The session.
+        @rtype: L{twisted.web.server.Session}
+
+        @raise KeyError: If there is no such session, or it has expired.
+        """
+
+
+    def touchSession(session):
+        """
+        Record that a session has been used, postponing its expiration.
+
+        @param session: The session which was used.
+        @type session: L{twisted.web.server.Session}
+        """
+
+
+    def removeSession(session):
+        """
+        Forget a session, because it has expired.
+
+        @param session: The session to forget.
+        @type session: L{twisted.web.server.Session}
+        """
+
+
+
 UNKNOWN_LENGTH = u"twisted.web.iweb.UNKNOWN_LENGTH"
 
 __all__ = [
     "IUsernameDigestHash", "ICredentialFactory", "IRequest",
     "IBodyProducer", "IRenderable", "IResponse", "_IRequestEncoder",
-    "_IRequestEncoderFactory", "IClientRequest",
+    "_IRequestEncoderFactory", "IClientRequest", "ISessionStore",
+    "IRequestBodyConsumer", "IStreamingBodyResource",
 
     "UNKNOWN_LENGTH"]
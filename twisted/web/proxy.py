@@ -22,11 +22,21 @@ ReverseProxy is used on the server end.
 import urlparse
 from urllib import quote as urlquote
 
+from zope.interface import implementer
+
+from twisted.python import log
 from twisted.internet import reactor
-from twisted.internet.protocol import ClientFactory
+from twisted.internet.defer import Deferred
+from twisted.internet.protocol import ClientFactory, Protocol
 from twisted.web.resource import Resource
 from twisted.web.server import NOT_DONE_YET
 from twisted.web.http import HTTPClient, Request, HTTPChannel
+from twisted.web.http import BAD_GATEWAY, PotentialDataLoss
+from twisted.web.http_headers import Headers
+from twisted.web.client import Agent, HTTPConnectionPool, FileBodyProducer
+from twisted.web.client import ResponseDone
+from twisted.web.iweb import IBodyProducer, IRequestBodyConsumer
+from twisted.web.iweb import IStreamingBodyResource, UNKNOWN_LENGTH
 
 
 
@@ -301,3 +311,527 @@ class ReverseProxyResource(Resource):
             request.getAllHeaders(), request.content.read(), request)
         self.reactor.connectTCP(self.host, self.port, clientFactory)
         return NOT_DONE_YET
+
+
+
+# Headers which only apply to a single connection, and so are never
+# forwarded by a proxy; see RFC 2616, section 13.5.1.
+_hopByHopHeaders = frozenset([
+        'connection', 'keep-alive', 'proxy-authenticate',
+        'proxy-authorization', 'te', 'trailers', 'transfer-encoding',
+        'upgrade'])
+
+
+
+def _copyEndToEndHeaders(source, destination, exclude=()):
+    """
+    Copy the headers of a message which a proxy should forward, omitting
+    hop-by-hop headers, including any named by the I{Connection} header.
+
+    @param source: The headers to copy.
+    @type source: L{Headers}
+
+    @param destination: The headers to copy them to.
+    @type destination: L{Headers}
+
+    @param exclude: Lower-case names of further headers not to copy.
+    """
+    connectionTokens = set()
+    for value in source.getRawHeaders('connection', []):
+        for token in value.split(','):
+            connectionTokens.add(token.strip().lower())
+    for name, values in source.getAllRawHeaders():
+        name = name.lower()
+        if (name in _hopByHopHeaders or name in connectionTokens or
+                name in exclude):
+            continue
+        destination.setRawHeaders(name, values)
+
+
+
+class _Upstream(object):
+    """
+    A server proxied to by L{StreamingReverseProxyResource}.
+
+    @ivar host: The host name or address of the server.
+    @ivar port: The port number of the server.
+    @ivar active: The number of requests currently proxied to this server.
+    @ivar hostHeader: The value of the I{Host} header for requests to it.
+    @ivar baseURI: The URI of its root, without a trailing slash.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.active = 0
+        # RFC 2616 tells us that we can omit the port if it's the default
+        # port, but we have to provide it otherwise
+        if port == 80:
+            self.hostHeader = host
+        else:
+            self.hostHeader = "%s:%d" % (host, port)
+        self.baseURI = "http://%s:%d" % (host, port)
+
+
+    def __repr__(self):
+        return "<Upstream %s:%d active=%d>" % (
+            self.host, self.port, self.active)
+
+
+
+class LeastConnectionsBalancer(object):
+    """
+    Distribute requests between several upstream servers, choosing the one
+    with the fewest requests in progress.  Ties are broken round-robin, so
+    that idle servers share the load evenly.
+
+    @ivar upstreams: The servers requests are distributed between.
+    @type upstreams: C{list} of L{_Upstream}
+    """
+
+    def __init__(self, upstreams):
+        """
+        @param upstreams: The servers to distribute requests between.
+        @type upstreams: iterable of C{(host, port)} tuples
+        """
+        self.upstreams = [_Upstream(host, port) for (host, port) in upstreams]
+        if not self.upstreams:
+            raise ValueError("At least one upstream server is required")
+        self._next = 0
+
+
+    def acquire(self):
+        """
+        Choose a server for a new request.  The caller must pass the result
+        to L{release} once the request is complete.
+
+        @rtype: L{_Upstream}
+        """
+        count = len(self.upstreams)
+        chosen = None
+        for i in range(count):
+            index = (self._next + i) % count
+            candidate = self.upstreams[index]
+            if chosen is None or candidate.active < chosen.active:
+                chosen, chosenIndex = candidate, index
+        self._next = (chosenIndex + 1) % count
+        chosen.active += 1
+        return chosen
+
+
+    def release(self, upstream):
+        """
+        Record that a request to C{upstream} is complete.
+
+        @type upstream: L{_Upstream}
+        """
+        upstream.active -= 1
+
+
+
+class _DiscardedResponseBody(Protocol):
+    """
+    Stop the delivery of a proxied response body as soon as it starts,
+    because the client it was for has gone away.
+    """
+
+    def connectionMade(self):
+        self.transport.stopProducing()
+
+
+
+class _UnclosableFile(object):
+    """
+    A wrapper around a file which ignores attempts to close it.
+
+    L{FileBodyProducer} closes its file when it finishes or is stopped; this
+    keeps a request's C{content} open for the code which owns it.
+
+    @ivar _file: The wrapped file.
+    """
+
+    def __init__(self, file):
+        self._file = file
+
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+    def close(self):
+        """
+        Do nothing.
+        """
+
+
+
+@implementer(IBodyProducer, IRequestBodyConsumer)
+class _StreamedRequestBody(object):
+    """
+    Send the body of a request upstream as it is received.
+
+    The client connection is paused until the upstream request starts, and
+    whenever the upstream connection is slow to take the body.  If the
+    upstream request is abandoned, the rest of the body is read and
+    discarded.
+
+    @ivar length: The length of the body, or L{UNKNOWN_LENGTH}.
+
+    @ivar _producer: The producer the body is received from, until it is
+        complete.
+    @ivar _consumer: The consumer the body is written to, once the upstream
+        request has started.
+    @ivar _buffer: A C{list} of the data received before the upstream request
+        started.
+    @ivar _finished: The L{Deferred} returned by L{startProducing}, until it
+        is fired.
+    @ivar _done: C{True} once the whole body has been received or its
+        delivery failed.
+    @ivar _failure: The reason delivery of the body failed, or C{None}.
+    @ivar _stopped: C{True} once the upstream request has been abandoned.
+    """
+
+    _producer = None
+    _consumer = None
+    _finished = None
+    _done = False
+    _failure = None
+    _stopped = False
+
+    def __init__(self, length):
+        self.length = length
+        self._buffer = []
+
+
+    def bodyStarted(self, producer):
+        self._producer = producer
+        if self._consumer is None:
+            producer.pauseProducing()
+
+
+    def dataReceived(self, data):
+        if self._stopped:
+            return
+        if self._consumer is None:
+            self._buffer.append(data)
+        else:
+            self._consumer.write(data)
+
+
+    def bodyDone(self, reason):
+        self._producer = None
+        self._done = True
+        self._failure = reason
+        if self._finished is not None:
+            self._finish()
+
+
+    def _finish(self):
+        """
+        Fire the L{Deferred} returned by L{startProducing} with the outcome of
+        receiving the body.
+        """
+        finished, self._finished = self._finished, None
+        if self._failure is None:
+            finished.callback(None)
+        else:
+            finished.errback(self._failure)
+
+
+    def startProducing(self, consumer):
+        self._consumer = consumer
+        self._finished = Deferred()
+        if self._buffer:
+            consumer.write(b''.join(self._buffer))
+            self._buffer = []
+        if self._done:
+            self._finish()
+        elif self._producer is not None:
+            self._producer.resumeProducing()
+        return self._finished
+
+
+    def pauseProducing(self):
+        if self._producer is not None:
+            self._producer.pauseProducing()
+
+
+    def resumeProducing(self):
+        if self._producer is not None:
+            self._producer.resumeProducing()
+
+
+    def stopProducing(self):
+        self._stopped = True
+        self._finished = None
+        self._buffer = []
+        if self._producer is not None:
+            self._producer.resumeProducing()
+
+
+
+class _ProxyResponseBody(Protocol):
+    """
+    Relay the body of a proxied response to the original request.
+
+    The upstream connection is registered as a streaming producer with the
+    request, so that it is paused while the client is slow to read.
+
+    @ivar exchange: The L{_ProxyExchange} the response is for.
+    """
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+
+
+    def connectionMade(self):
+        self.exchange.request.registerProducer(self.transport, True)
+
+
+    def dataReceived(self, data):
+        if not self.exchange.clientGone:
+            self.exchange.request.write(data)
+
+
+    def connectionLost(self, reason):
+        self.exchange.bodyDone(reason)
+
+
+
+class _ProxyExchange(object):
+    """
+    A single request proxied by L{StreamingReverseProxyResource}.
+
+    @ivar request: The request being proxied.
+    @ivar balancer: The balancer C{upstream} was acquired from.
+    @ivar upstream: The server the request is proxied to.
+    @ivar clientGone: C{True} once the client connection has been lost.
+    """
+
+    clientGone = False
+    _released = False
+    _relayed = False
+    _requesting = None
+    _body = None
+
+    def __init__(self, request, balancer, upstream):
+        self.request = request
+        self.balancer = balancer
+        self.upstream = upstream
+        request.notifyFinish().addErrback(self._clientLost)
+
+
+    def start(self, agent, uri, headers, bodyProducer):
+        """
+        Issue the request upstream.  The response is not relayed to the
+        client until L{relay} is called.
+
+        If the request fails, C{bodyProducer} is stopped, so that the rest
+        of a streamed request body is discarded.
+        """
+        self._requesting = agent.request(
+            self.request.method, uri, headers, bodyProducer)
+        if bodyProducer is not None:
+            def stopBody(reason):
+                bodyProducer.stopProducing()
+                return reason
+            self._requesting.addErrback(stopBody)
+
+
+    def relay(self):
+        """
+        Relay the upstream response to the client once it arrives.
+        """
+        if self._relayed:
+            return
+        self._relayed = True
+        requesting = self._requesting
+        requesting.addCallbacks(self._gotResponse, self._failed)
+        requesting.addErrback(log.err, "Relaying proxied response failed")
+
+
+    def _release(self):
+        if not self._released:
+            self._released = True
+            self.balancer.release(self.upstream)
+
+
+    def _clientLost(self, reason):
+        """
+        The client went away; stop talking to the upstream server.
+        """
+        self.clientGone = True
+        if self._requesting is not None:
+            self._requesting.cancel()
+            self.relay()
+        elif self._body is not None and self._body.transport is not None:
+            self._body.transport.stopProducing()
+
+
+    def _gotResponse(self, response):
+        self._requesting = None
+        if self.clientGone:
+            self._release()
+            response.deliverBody(_DiscardedResponseBody())
+            return
+        self.request.setResponseCode(response.code, response.phrase)
+        _copyEndToEndHeaders(response.headers, self.request.responseHeaders)
+        self._body = _ProxyResponseBody(self)
+        response.deliverBody(self._body)
+
+
+    def _failed(self, reason):
+        self._requesting = None
+        self._release()
+        if self.clientGone:
+            return
+        log.err(reason, "Proxied request to %r failed" % (self.upstream,))
+        self.request.setResponseCode(BAD_GATEWAY, "Bad gateway")
+        self.request.responseHeaders.addRawHeader("Content-Type", "text/html")
+        self.request.write("<H1>Could not connect</H1>")
+        self.request.finish()
+
+
+    def bodyDone(self, reason):
+        """
+        The body of the response has been relayed, or its delivery failed.
+        """
+        self._release()
+        if self.clientGone:
+            return
+        self.request.unregisterProducer()
+        if reason.check(ResponseDone, PotentialDataLoss):
+            self.request.finish()
+        else:
+            # The response is truncated; the client can only learn that from
+            # the connection closing.
+            log.err(reason, "Proxied response from %r failed" % (
+                    self.upstream,))
+            self.request.transport.loseConnection()
+
+
+
+@implementer(IStreamingBodyResource)
+class StreamingReverseProxyResource(Resource):
+    """
+    Resource that relays requests to one of several other servers, using
+    L{Agent} and persistent connections.
+
+    Unlike L{ReverseProxyResource}, response bodies are streamed to the
+    client as they arrive, with the upstream connection paused while the
+    client is slow to read.  If the L{Site} has C{streamRequestBodies} set,
+    request bodies are also streamed upstream as they are received, with the
+    client connection paused while the upstream connection is slow to take
+    them; otherwise they are sent from the request's content file once they
+    have been received.  Upstream connections are reused through an
+    L{HTTPConnectionPool}, and requests are distributed between upstream
+    servers by a L{LeastConnectionsBalancer}.
+
+    @ivar path: The base path requests are relayed to.
+    @type path: C{str}
+
+    @ivar agent: The agent used to make upstream requests.
+    @type agent: L{twisted.web.iweb.IAgent} provider
+
+    @ivar balancer: The balancer choosing the server for each request.
+    @type balancer: L{LeastConnectionsBalancer}
+
+    @ivar reactor: The reactor used to create connections.
+    """
+
+    def __init__(self, upstreams, path, reactor=reactor, agent=None,
+                 balancer=None):
+        """
+        @param upstreams: The servers to proxy to, as C{(host, port)}
+            tuples.  Ignored if C{balancer} is given.
+
+        @param path: The base path to fetch data from, as for
+            L{ReverseProxyResource}.
+        @type path: C{str}
+
+        @param agent: The agent used to make upstream requests.  If C{None},
+            an L{Agent} with a persistent L{HTTPConnectionPool} is created.
+
+        @param balancer: The balancer choosing the server for each request.
+            If C{None}, a L{LeastConnectionsBalancer} over C{upstreams} is
+            created.
+        """
+        Resource.__init__(self)
+        if balancer is None:
+            balancer = LeastConnectionsBalancer(upstreams)
+        if agent is None:
+            agent = Agent(reactor, pool=HTTPConnectionPool(reactor))
+        self.path = path
+        self.reactor = reactor
+        self.agent = agent
+        self.balancer = balancer
+
+
+    def getChild(self, path, request):
+        """
+        Create and return a proxy resource sharing this one's agent and
+        balancer, with a path extended by the segment C{path}.
+        """
+        return StreamingReverseProxyResource(
+            None, self.path + '/' + urlquote(path, safe=""), self.reactor,
+            self.agent, self.balancer)
+
+
+    def _start(self, request, bodyProducer):
+        """
+        Start forwarding a request to the least busy upstream server.
+
+        @param bodyProducer: The producer of the request body, or C{None}.
+
+        @rtype: L{_ProxyExchange}
+        """
+        upstream = self.balancer.acquire()
+        headers = Headers()
+        _copyEndToEndHeaders(request.requestHeaders, headers,
+                             exclude=('host', 'content-length'))
+        headers.setRawHeaders('host', [upstream.hostHeader])
+
+        qs = urlparse.urlparse(request.uri)[4]
+        if qs:
+            rest = self.path + '?' + qs
+        else:
+            rest = self.path
+
+        exchange = _ProxyExchange(request, self.balancer, upstream)
+        exchange.start(self.agent, upstream.baseURI + rest, headers,
+                       bodyProducer)
+        return exchange
+
+
+    def getRequestBodyConsumer(self, request):
+        """
+        Start forwarding a request before its body is received, and stream
+        the body upstream as it arrives.  The response is relayed once the
+        request is rendered.
+        """
+        if request.requestHeaders.hasHeader('transfer-encoding'):
+            length = UNKNOWN_LENGTH
+        else:
+            length = int(request.requestHeaders.getRawHeaders(
+                    'content-length')[0])
+        body = _StreamedRequestBody(length)
+        request._proxyExchange = self._start(request, body)
+        return body
+
+
+    def render(self, request):
+        """
+        Render a request by forwarding it to the least busy upstream server,
+        unless that was started when its body began to arrive.
+        """
+        exchange = getattr(request, '_proxyExchange', None)
+        if exchange is None:
+            bodyProducer = None
+            request.content.seek(0, 2)
+            if request.content.tell():
+                request.content.seek(0, 0)
+                bodyProducer = FileBodyProducer(
+                    _UnclosableFile(request.content))
+            exchange = self._start(request, bodyProducer)
+        exchange.relay()
+        return NOT_DONE_YET
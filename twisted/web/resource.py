@@ -9,7 +9,7 @@ Implementation of the lowest-level Resource class.
 from __future__ import division, absolute_import
 
 __all__ = [
-    'IResource', 'getChildForRequest',
+    'IResource', 'getChildForRequest', 'RoutingIndex',
     'Resource', 'ErrorPage', 'NoResource', 'ForbiddenResource',
     'EncodingResourceWrapper']
 
@@ -100,6 +100,149 @@ def getChildForRequest(resource, request):
 
 
 
+def _hasStaticChildren(resource):
+    """
+    Determine whether looking up a child of C{resource} is exactly a lookup in
+    its C{children} dictionary, falling back to C{getChildWithDefault} only for
+    names which are not in it.
+
+    @param resource: The resource to examine.
+    @type resource: L{IResource} provider
+
+    @rtype: C{bool}
+    """
+    if not isinstance(resource, Resource) or resource.isLeaf:
+        return False
+    if 'getChildWithDefault' in getattr(resource, '__dict__', {}):
+        return False
+    method = resource.__class__.getChildWithDefault
+    return (getattr(method, '__func__', method) is
+            _resourceGetChildWithDefault)
+
+
+
+class RoutingIndex(object):
+    """
+    A precomputed index of the static children of a resource hierarchy, which
+    finds the resource for a request the same way L{getChildForRequest} does,
+    but without calling C{getChildWithDefault} for each path segment which
+    leads to a child added with L{Resource.putChild}.
+
+    The index follows the C{children} of each L{Resource} which does not
+    override C{getChildWithDefault} and is not a leaf, so looking up a static
+    path costs one dictionary lookup per segment.  Traversal falls back to
+    L{getChildForRequest} at the first segment which is not a static child,
+    so dynamic children (from C{getChild}), leaf resources, and resources
+    which customize child lookup (such as
+    L{twisted.web.vhost.NameVirtualHost}) behave exactly as they otherwise
+    would.
+
+    The index is rebuilt when a request is traversed through a resource on
+    which L{Resource.putChild}, L{Resource.reallyPutEntity} or
+    L{Resource.delEntity} has been called since the index was built; changes
+    to resources elsewhere in the process do not affect it.  Changes made by
+    modifying a C{children} dictionary directly are not noticed.
+
+    @ivar root: The root of the resource hierarchy.
+    @type root: L{IResource} provider
+
+    @ivar _rootNode: The node for C{root}, or C{None} if the index has not
+        been built.  Each node is a 3-C{list} of a resource; either C{None}, if
+        children of that resource cannot be looked up in the index, or a
+        C{dict} mapping the names of its static children to their nodes; and
+        the C{_childrenGeneration} of the resource when the node was built.
+        A resource found at more than one path, or in a cycle, has a single
+        node.
+    """
+
+    def __init__(self, root):
+        """
+        @param root: The root of the resource hierarchy to index.
+        @type root: L{IResource} provider
+        """
+        self.root = root
+        self._rootNode = None
+
+
+    def _build(self):
+        """
+        Build the index from the current children of the resource hierarchy.
+        """
+        rootNode = [self.root, None, None]
+        nodes = {id(self.root): rootNode}
+        pending = [rootNode]
+        while pending:
+            node = pending.pop()
+            parent = node[0]
+            if not _hasStaticChildren(parent):
+                continue
+            children = {}
+            for name, child in parent.children.items():
+                childNode = nodes.get(id(child))
+                if childNode is None:
+                    childNode = nodes[id(child)] = [child, None, None]
+                    pending.append(childNode)
+                children[name] = childNode
+            node[1] = children
+            node[2] = parent._childrenGeneration
+        self._rootNode = rootNode
+
+
+    def _walk(self, postpath):
+        """
+        Follow the static children in the index along C{postpath}.
+
+        @param postpath: The path segments to follow.
+        @type postpath: C{list} of C{bytes}
+
+        @return: C{None} if a resource along the path has changed its children
+            since the index was built, otherwise a 2-C{tuple} of the last node
+            reached and the number of segments of C{postpath} followed to
+            reach it.
+        """
+        node = self._rootNode
+        consumed = 0
+        for segment in postpath:
+            children = node[1]
+            if children is None or node[0].isLeaf:
+                break
+            if node[2] != node[0]._childrenGeneration:
+                return None
+            child = children.get(segment)
+            if child is None:
+                break
+            node = child
+            consumed += 1
+        return node, consumed
+
+
+    def getChildForRequest(self, request):
+        """
+        Traverse the resource hierarchy to find the resource which will handle
+        C{request}, updating its C{prepath} and C{postpath} exactly as
+        L{getChildForRequest} would.
+
+        @param request: The request to find a resource for.
+        @type request: L{twisted.web.server.Request}
+
+        @return: The resource which will handle C{request}.
+        @rtype: L{IResource} provider
+        """
+        postpath = request.postpath
+        walked = None
+        if self._rootNode is not None:
+            walked = self._walk(postpath)
+        if walked is None:
+            self._build()
+            walked = self._walk(postpath)
+        node, consumed = walked
+        if consumed:
+            request.prepath.extend(postpath[:consumed])
+            del postpath[:consumed]
+        return getChildForRequest(node[0], request)
+
+
+
 @implementer(IResource)
 class Resource:
     """
@@ -113,6 +256,10 @@ class Resource:
 
     server = None
 
+    # Incremented whenever the static children of this resource change, so
+    # that RoutingIndex instances know to rebuild themselves.
+    _childrenGeneration = 0
+
     def __init__(self):
         """
         Initialize.
@@ -152,9 +299,11 @@ class Resource:
 
     def delEntity(self, name):
         del self.children[name]
+        self._childrenGeneration += 1
 
     def reallyPutEntity(self, name, entity):
         self.children[name] = entity
+        self._childrenGeneration += 1
 
     # Concrete HTTP interface
 
@@ -218,6 +367,7 @@ class Resource:
         """
         self.children[path] = child
         child.server = self.server
+        self._childrenGeneration += 1
 
 
     def render(self, request):
@@ -261,6 +411,11 @@ class Resource:
 
 
 
+_resourceGetChildWithDefault = getattr(
+    Resource.getChildWithDefault, '__func__', Resource.getChildWithDefault)
+
+
+
 def _computeAllowedMethods(resource):
     """
     Compute the allowed methods on a C{Resource} based on defined render_FOO
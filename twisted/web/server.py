@@ -11,6 +11,10 @@ from __future__ import division, absolute_import
 
 import copy
 import os
+import pickle
+import warnings
+from collections import OrderedDict
+from weakref import WeakKeyDictionary
 try:
     from urllib import quote
 except ImportError:
@@ -31,10 +35,12 @@ if _PY3:
         """
 else:
     from twisted.spread.pb import Copyable, ViewPoint
-from twisted.internet import address
+from twisted.internet import address, defer
+from twisted.internet.threads import deferToThreadPool
 from twisted.web import iweb, http, html
 from twisted.web.http import unquote
 from twisted.python import log, reflect, failure, components
+from twisted.python.runtime import platform
 from twisted import copyright
 # Re-enable as part of #6178 when twisted.web.util is ported to Python 3:
 if not _PY3:
@@ -58,6 +64,8 @@ __all__ = [
     'supportedMethods',
     'Request',
     'Session',
+    'MemorySessionStore',
+    'FileSessionStore',
     'Site',
     'version',
     'NOT_DONE_YET',
@@ -101,6 +109,19 @@ class Request(Copyable, http.Request, components.Componentized):
     @ivar defaultContentType: A C{bytes} giving the default I{Content-Type}
         value to send in responses if no other value is set.  C{None} disables
         the default.
+
+    @ivar _bodyResource: The resource found for this request by
+        L{getRequestBodyConsumer}, which is rendered without looking it up
+        again, or C{None}.
+
+    @ivar _bodyResourceFailure: A L{failure.Failure} describing why
+        L{getRequestBodyConsumer} could not find the resource for this request
+        or its consumer, which is reported when the request is processed, or
+        C{None}.
+
+    @ivar _finishing: C{True} once L{finish} has been called but is waiting for
+        an encoder to deliver its remaining data before the request is really
+        finished.
     """
 
     defaultContentType = b"text/html"
@@ -110,6 +131,9 @@ class Request(Copyable, http.Request, components.Componentized):
     __pychecker__ = 'unusednames=issuer'
     _inFakeHead = False
     _encoder = None
+    _bodyResource = None
+    _bodyResourceFailure = None
+    _finishing = False
 
     def __init__(self, *args, **kw):
         http.Request.__init__(self, *args, **kw)
@@ -123,6 +147,8 @@ class Request(Copyable, http.Request, components.Componentized):
         del x['channel']
         del x['content']
         del x['site']
+        x.pop('_bodyResource', None)
+        x.pop('_bodyBudget', None)
         self.content.seek(0, 0)
         x['content_data'] = self.content.read()
         x['remote'] = ViewPoint(issuer, self)
@@ -164,6 +190,39 @@ class Request(Copyable, http.Request, components.Componentized):
                 return name
 
 
+    def getRequestBodyConsumer(self):
+        """
+        If the site has C{streamRequestBodies} set, find the resource for
+        this request now, and if it provides L{iweb.IStreamingBodyResource},
+        let it choose where the request body goes.
+
+        The resource is rendered by L{process} without being looked up again,
+        whether or not it consumes the body.  If looking it up fails, the
+        failure is reported by L{process} instead.
+
+        @see: L{http.Request.getRequestBodyConsumer}
+        """
+        site = self.channel.site
+        if not site.streamRequestBodies:
+            return None
+
+        self.site = site
+        self.prepath = []
+        self.postpath = list(map(
+                unquote, self.uri.split(b'?', 1)[0][1:].split(b'/')))
+        try:
+            resrc = site.getResourceFor(self)
+            if iweb.IStreamingBodyResource.providedBy(resrc):
+                consumer = resrc.getRequestBodyConsumer(self)
+            else:
+                consumer = None
+        except:
+            self._bodyResourceFailure = failure.Failure()
+            return None
+        self._bodyResource = resrc
+        return consumer
+
+
     def process(self):
         """
         Process a request.
@@ -176,12 +235,19 @@ class Request(Copyable, http.Request, components.Componentized):
         self.setHeader(b'server', version)
         self.setHeader(b'date', http.datetimeToString())
 
+        if self._bodyResourceFailure is not None:
+            self.processingFailed(self._bodyResourceFailure)
+            return
+
         # Resource Identification
-        self.prepath = []
-        self.postpath = list(map(unquote, self.path[1:].split(b'/')))
+        resrc = self._bodyResource
+        if resrc is None:
+            self.prepath = []
+            self.postpath = list(map(unquote, self.path[1:].split(b'/')))
 
         try:
-            resrc = self.site.getResourceFor(self)
+            if resrc is None:
+                resrc = self.site.getResourceFor(self)
             if resource._IEncodingResource.providedBy(resrc):
                 encoder = resrc.getEncoder(self)
                 if encoder is not None:
@@ -197,6 +263,9 @@ class Request(Copyable, http.Request, components.Componentized):
 
         @param data: A string to write to the response.
         """
+        if self._finishing:
+            raise RuntimeError('Request.write called on a request after '
+                               'Request.finish was called.')
         if not self.startedWriting:
             # Before doing the first write, check to see if a default
             # Content-Type header should be supplied.
@@ -221,13 +290,34 @@ class Request(Copyable, http.Request, components.Componentized):
         """
         Override C{http.Request.finish} for possible encoding.
         """
+        if self._finishing:
+            warnings.warn("Warning! request.finish called twice.", stacklevel=2)
+            return
         if self._encoder:
             data = self._encoder.finish()
+            if isinstance(data, defer.Deferred):
+                # The request is finished once the encoder is done; until
+                # then, behave as if it already were.
+                self._finishing = True
+                data.addCallback(self._finishEncoded)
+                return
             if data:
                 http.Request.write(self, data)
         return http.Request.finish(self)
 
 
+    def _finishEncoded(self, data):
+        """
+        Finish the request once an encoder which works asynchronously has
+        delivered its remaining data.
+        """
+        if self._disconnected:
+            return
+        if data:
+            http.Request.write(self, data)
+        http.Request.finish(self)
+
+
     def render(self, resrc):
         """
         Ask a resource to render itself.
@@ -395,6 +485,10 @@ class Request(Copyable, http.Request, components.Componentized):
             if not self.session:
                 self.session = self.site.makeSession()
                 self.addCookie(cookiename, self.session.uid, path=b'/')
+            if getattr(self.site, 'sessionStore', None) is not None:
+                # Let the store record changes made while rendering.
+                session = self.session
+                self.notifyFinish().addBoth(lambda ignored: session.touch())
         self.session.touch()
         if sessionInterface:
             return self.session.getComponent(sessionInterface)
@@ -446,11 +540,31 @@ class GzipEncoderFactory(object):
     @cvar compressLevel: The compression level used by the compressor, default
         to 9 (highest).
 
+    @ivar threadpool: If not C{None}, a L{ThreadPool} in which writes of at
+        least C{threshold} bytes are compressed, so that large responses do
+        not block the reactor.  zlib releases the GIL while compressing.
+    @type threadpool: L{twisted.python.threadpool.ThreadPool}
+
+    @ivar threshold: The size, in bytes, of the smallest write compressed in
+        C{threadpool}.  Smaller writes are compressed in the reactor thread
+        unless earlier data is still being compressed in the pool.
+    @type threshold: C{int}
+
     @since: 12.3
     """
 
     compressLevel = 9
 
+    def __init__(self, threadpool=None, threshold=2 ** 16, reactor=None):
+        """
+        @param reactor: The reactor to deliver compressed data from
+            C{threadpool} in.  If C{None}, the global reactor is used.
+        """
+        self.threadpool = threadpool
+        self.threshold = threshold
+        self._reactor = reactor
+
+
     def encoderForRequest(self, request):
         """
         Check the headers if the client accepts gzip encoding, and encodes the
@@ -469,6 +583,13 @@ class GzipEncoderFactory(object):
 
             request.responseHeaders.setRawHeaders('content-encoding',
                                                   [encoding])
+            if self.threadpool is not None:
+                reactor = self._reactor
+                if reactor is None:
+                    from twisted.internet import reactor
+                return _ThreadedGzipEncoder(
+                    self.compressLevel, request, reactor, self.threadpool,
+                    self.threshold)
             return _GzipEncoder(self.compressLevel, request)
 
 
@@ -516,6 +637,133 @@ class _GzipEncoder(object):
 
 
 
+@implementer(iweb._IRequestEncoder)
+class _ThreadedGzipEncoder(_GzipEncoder):
+    """
+    A gzip encoder which compresses large writes in a thread pool.
+
+    A zlib compressor is stateful, so once a write has been handed to the
+    pool every later write, and the final flush, is queued behind it.  The
+    compressed data is written to the request in the reactor thread, in the
+    order the original data was given, as each compression completes; the
+    transport's usual flow control applies to any producer registered with
+    the request.
+
+    @ivar _reactor: The reactor compressed data is delivered in.
+
+    @ivar _threadpool: The L{ThreadPool} compression runs in.
+
+    @ivar _threshold: The size of the smallest write compressed in
+        C{_threadpool} when no other compression is queued.
+
+    @ivar _pending: A L{Deferred} to which queued compressions are chained,
+        or C{None} if nothing is queued.
+
+    @ivar _queued: The number of compressions chained to C{_pending}.
+
+    @ivar _aborted: C{True} if a compression failed, after which no more
+        data is compressed or written.
+    """
+
+    _pending = None
+    _queued = 0
+    _aborted = False
+
+    def __init__(self, compressLevel, request, reactor, threadpool,
+                 threshold):
+        _GzipEncoder.__init__(self, compressLevel, request)
+        self._reactor = reactor
+        self._threadpool = threadpool
+        self._threshold = threshold
+
+
+    def encode(self, data):
+        """
+        Compress C{data} in the reactor thread if it is small and nothing is
+        queued, otherwise queue it for compression in the thread pool.
+
+        @return: The compressed data, or C{b''} if compression was queued.
+        """
+        if self._pending is None and len(data) < self._threshold:
+            return _GzipEncoder.encode(self, data)
+        if not self._request.startedWriting:
+            self._request.responseHeaders.removeHeader(b'content-length')
+        self._enqueue(self._zlibCompressor.compress, data)
+        return b''
+
+
+    def finish(self):
+        """
+        Flush the compressor, after any queued compression.
+
+        @return: The remaining compressed data if nothing is queued,
+            otherwise a L{Deferred} which fires with C{b''} once all
+            compressed data has been written to the request.
+        """
+        if self._pending is None:
+            return _GzipEncoder.finish(self)
+        pending = self._enqueue(self._zlibCompressor.flush)
+        self._zlibCompressor = None
+        finished = defer.Deferred()
+        def cbFlushed(ignored):
+            if not self._aborted:
+                finished.callback(b'')
+        pending.addCallback(cbFlushed)
+        return finished
+
+
+    def _enqueue(self, compress, *args):
+        """
+        Chain a call to C{compress} in the thread pool, and the write of its
+        result, to the queued work.
+
+        @return: The L{Deferred} the work was chained to.
+        """
+        if self._pending is None:
+            self._pending = defer.succeed(None)
+        pending = self._pending
+        self._queued += 1
+        pending.addCallback(self._compressInThread, compress, args)
+        pending.addCallback(self._written)
+        pending.addErrback(self._failed)
+        pending.addBoth(self._dequeued)
+        return pending
+
+
+    def _compressInThread(self, ignored, compress, args):
+        if self._aborted or self._request._disconnected:
+            return None
+        return deferToThreadPool(
+            self._reactor, self._threadpool, compress, *args)
+
+
+    def _written(self, data):
+        if data and not self._request._disconnected:
+            http.Request.write(self._request, data)
+
+
+    def _failed(self, reason):
+        """
+        Compression failed, so the rest of the response cannot be sent; log
+        the error and drop the connection.
+        """
+        log.err(reason, "Compressing response failed")
+        self._aborted = True
+        if not self._request._disconnected:
+            self._request.transport.loseConnection()
+
+
+    def _dequeued(self, ignored):
+        """
+        One queued compression, and the write of its result, has completed or
+        failed.
+        """
+        self._queued -= 1
+        if not self._queued:
+            self._pending = None
+
+
+
 class _RemoteProducerWrapper:
     def __init__(self, remote):
         self.resumeProducing = remote.remoteMethod("resumeProducing")
@@ -552,7 +800,9 @@ class Session(components.Componentized):
         self.site = site
         self.uid = uid
         self.expireCallbacks = []
-        self.touch()
+        # Not touch(), which would tell the site's session store about a
+        # session it may not have been given yet.
+        self.lastModified = self._reactor.seconds()
         self.sessionNamespaces = {}
 
 
@@ -577,7 +827,11 @@ class Session(components.Componentized):
         """
         Expire/logout of the session.
         """
-        del self.site.sessions[self.uid]
+        store = getattr(self.site, 'sessionStore', None)
+        if store is None:
+            del self.site.sessions[self.uid]
+        else:
+            store.removeSession(self)
         for c in self.expireCallbacks:
             c()
         self.expireCallbacks = []
@@ -594,6 +848,383 @@ class Session(components.Componentized):
         self.lastModified = self._reactor.seconds()
         if self._expireCall is not None:
             self._expireCall.reset(self.sessionTimeout)
+        store = getattr(self.site, 'sessionStore', None)
+        if store is not None:
+            store.touchSession(self)
+
+
+@implementer(iweb.ISessionStore)
+class MemorySessionStore(object):
+    """
+    An L{iweb.ISessionStore} which keeps sessions in memory, forgetting the
+    least recently used ones once there are too many.
+
+    Rather than each session scheduling its own expiration, a single timer
+    periodically expires all the sessions which have not been used for their
+    C{sessionTimeout}.
+
+    @ivar maxSessions: The number of sessions to keep, or C{None} to keep all
+        sessions until they expire.
+    @type maxSessions: C{int} or C{NoneType}
+
+    @ivar sweepInterval: The number of seconds between checks for expired
+        sessions.
+    @type sweepInterval: C{int} or C{float}
+
+    @ivar _sessions: An ordered mapping of session uids to 2-C{list}s of the
+        session and the time it was last used, least recently used first.
+    @type _sessions: L{collections.OrderedDict}
+
+    @ivar _sweepCall: The L{IDelayedCall} for the next check for expired
+        sessions, or C{None} if there are no sessions.
+    """
+    _sweepCall = None
+
+    def __init__(self, maxSessions=None, sweepInterval=60, reactor=None):
+        """
+        @param maxSessions: See L{MemorySessionStore.maxSessions}.
+        @param sweepInterval: See L{MemorySessionStore.sweepInterval}.
+        @param reactor: An L{IReactorTime} provider used to schedule expiration
+            checks, or C{None} to use the global reactor.
+        """
+        if reactor is None:
+            from twisted.internet import reactor
+        self._reactor = reactor
+        self.maxSessions = maxSessions
+        self.sweepInterval = sweepInterval
+        self._sessions = OrderedDict()
+
+
+    def __len__(self):
+        """
+        @return: The number of sessions in the store.
+        """
+        return len(self._sessions)
+
+
+    def makeSession(self, site, uid):
+        """
+        Create a session with C{site}'s C{sessionFactory}, expiring the least
+        recently used session if there are now more than C{maxSessions}.
+
+        @see: L{iweb.ISessionStore.makeSession}
+        """
+        session = site.sessionFactory(site, uid)
+        self._sessions[uid] = [session, self._reactor.seconds()]
+        if self.maxSessions is not None:
+            while len(self._sessions) > self.maxSessions:
+                oldest = next(iter(self._sessions.values()))[0]
+                oldest.expire()
+        if self._sweepCall is None:
+            self._sweepCall = self._reactor.callLater(
+                self.sweepInterval, self._sweep)
+        return session
+
+
+    def getSession(self, site, uid):
+        """
+        @see: L{iweb.ISessionStore.getSession}
+        """
+        entry = self._sessions[uid]
+        session, lastUsed = entry
+        if lastUsed + session.sessionTimeout <= self._reactor.seconds():
+            session.expire()
+            raise KeyError(uid)
+        return session
+
+
+    def touchSession(self, session):
+        """
+        Record the current time as the last use of C{session}, and make it the
+        most recently used session.
+
+        @see: L{iweb.ISessionStore.touchSession}
+        """
+        entry = self._sessions.pop(session.uid, None)
+        if entry is not None:
+            entry[1] = self._reactor.seconds()
+            self._sessions[session.uid] = entry
+
+
+    def removeSession(self, session):
+        """
+        @see: L{iweb.ISessionStore.removeSession}
+        """
+        self._sessions.pop(session.uid, None)
+        if not self._sessions:
+            self.stopSweeping()
+
+
+    def stopSweeping(self):
+        """
+        Stop checking for expired sessions, until another session is made.
+        """
+        if self._sweepCall is not None:
+            if self._sweepCall.active():
+                self._sweepCall.cancel()
+            self._sweepCall = None
+
+
+    def _sweep(self):
+        """
+        Expire all the sessions which have not been used for their
+        C{sessionTimeout}, and check again after C{sweepInterval} if any
+        sessions remain.
+        """
+        self._sweepCall = None
+        now = self._reactor.seconds()
+        for session, lastUsed in list(self._sessions.values()):
+            if lastUsed + session.sessionTimeout <= now:
+                session.expire()
+        if self._sessions:
+            self._sweepCall = self._reactor.callLater(
+                self.sweepInterval, self._sweep)
+
+
+
+@implementer(iweb.ISessionStore)
+class FileSessionStore(object):
+    """
+    An L{iweb.ISessionStore} which keeps sessions in files in a directory, so
+    that they can be shared between several processes serving the same site.
+
+    Only the C{sessionNamespaces} of each session are stored, since
+    components and expiration callbacks cannot be shared with other
+    processes; a new L{Session} is created each time a session is looked up.
+    The C{sessionNamespaces} must be picklable.  When a session is touched
+    (which happens when L{Request.getSession} is called and again when the
+    request finishes), its file is written out if its C{sessionNamespaces}
+    have changed since it was read or last written, or if its timestamp is
+    more than C{touchInterval} seconds old.  Each write replaces the file
+    atomically, so a process never reads a partially written session.
+
+    Since session files are unpickled, only the user running the processes
+    may be able to write to the directory: the store refuses a directory
+    which is owned by another user or which other users can write to, and
+    ignores session files which are owned by another user or which other
+    users can write to.
+
+    Each process which uses the store periodically removes the files of
+    sessions which have expired, until L{stopSweeping} is called; expiration
+    callbacks registered with L{Session.notifyOnExpire} are only called if
+    the session is expired by the process in which they were registered.
+
+    @ivar directory: The directory containing a file for each session.
+    @type directory: L{FilePath}
+
+    @ivar sweepInterval: The number of seconds between checks for expired
+        sessions.
+    @type sweepInterval: C{int} or C{float}
+
+    @ivar touchInterval: The number of seconds for which a session's
+        timestamp is not updated when it is touched without changing its
+        C{sessionNamespaces}, so sessions may expire up to this long before
+        their C{sessionTimeout} has passed since their last use.
+    @type touchInterval: C{int} or C{float}
+
+    @ivar _saved: A mapping from the sessions found or made by this store to
+        2-C{tuple}s of the time their file was last written and the pickled
+        C{sessionNamespaces} it contains.
+    @type _saved: L{WeakKeyDictionary}
+    """
+    _sweepCall = None
+
+    def __init__(self, directory, sweepInterval=60, touchInterval=60,
+                 reactor=None):
+        """
+        @param directory: See L{FileSessionStore.directory}.  It is created,
+            readable and writable only by the current user, if it does not
+            exist.
+        @param sweepInterval: See L{FileSessionStore.sweepInterval}.
+        @param touchInterval: See L{FileSessionStore.touchInterval}.
+        @param reactor: An L{IReactorTime} provider used to schedule expiration
+            checks and to timestamp sessions, or C{None} to use the global
+            reactor.
+
+        @raise ValueError: If C{directory} is owned by another user or other
+            users can write to it.
+        """
+        if reactor is None:
+            from twisted.internet import reactor
+        self._reactor = reactor
+        self.directory = directory
+        self.sweepInterval = sweepInterval
+        self.touchInterval = touchInterval
+        self._saved = WeakKeyDictionary()
+        if not directory.exists():
+            os.makedirs(directory.path, 0o700)
+        if not self._trusted(os.stat(directory.path)):
+            raise ValueError(
+                "%s must be owned by the current user and not writable by "
+                "other users" % (directory.path,))
+
+
+    def _trusted(self, status):
+        """
+        Determine whether a file could only have been written by the current
+        user.
+
+        @param status: The result of C{os.stat} for the file.
+
+        @return: C{True} if the file is owned by the current user and cannot
+            be written by other users, otherwise C{False}.  Always C{True} on
+            platforms without user ids.
+        @rtype: C{bool}
+        """
+        getuid = getattr(os, 'getuid', None)
+        if getuid is None:
+            return True
+        return status.st_uid == getuid() and not status.st_mode & 0o022
+
+
+    def _sessionPath(self, uid):
+        """
+        @return: The file holding the session with the given uid.
+        @rtype: L{FilePath}
+
+        @raise KeyError: If C{uid} could not have been generated by
+            L{Site._mkuid}, so that cookies cannot refer to other files.
+        """
+        if not uid or not uid.isalnum():
+            raise KeyError(uid)
+        return self.directory.child(nativeString(uid))
+
+
+    def _save(self, session, namespaces):
+        """
+        Write out the pickled C{sessionNamespaces} of C{session} and the
+        current time.
+
+        @param namespaces: The pickled C{sessionNamespaces} of C{session}.
+        @type namespaces: C{bytes}
+        """
+        now = self._reactor.seconds()
+        path = self._sessionPath(session.uid)
+        # Like FilePath.setContent, but only readable and writable by the
+        # current user whatever the umask is.
+        temporary = path.temporarySibling(b'.new')
+        fd = os.open(temporary.path,
+                     os.O_WRONLY | os.O_CREAT | os.O_EXCL |
+                     getattr(os, 'O_BINARY', 0), 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pickle.dumps((now, namespaces), pickle.HIGHEST_PROTOCOL))
+        if platform.isWindows() and path.exists():
+            path.remove()
+        os.rename(temporary.path, path.path)
+        self._saved[session] = (now, namespaces)
+
+
+    def _load(self, path):
+        """
+        Read a session file written by L{_save}.
+
+        @return: The time the session was last used and its pickled
+            C{sessionNamespaces}.
+        @rtype: 2-C{tuple}
+
+        @raise KeyError: If the file does not exist, or could have been
+            written by another user.
+        """
+        try:
+            with open(path.path, 'rb') as f:
+                if not self._trusted(os.fstat(f.fileno())):
+                    raise KeyError(path.basename())
+                content = f.read()
+        except (IOError, OSError):
+            raise KeyError(path.basename())
+        return pickle.loads(content)
+
+
+    def makeSession(self, site, uid):
+        """
+        @see: L{iweb.ISessionStore.makeSession}
+        """
+        session = site.sessionFactory(site, uid)
+        self._save(session, pickle.dumps(
+            session.sessionNamespaces, pickle.HIGHEST_PROTOCOL))
+        if self._sweepCall is None:
+            self._sweepCall = self._reactor.callLater(
+                self.sweepInterval, self._sweep, site.sessionFactory)
+        return session
+
+
+    def getSession(self, site, uid):
+        """
+        @see: L{iweb.ISessionStore.getSession}
+        """
+        lastUsed, namespaces = self._load(self._sessionPath(uid))
+        session = site.sessionFactory(site, uid)
+        session.sessionNamespaces = pickle.loads(namespaces)
+        if lastUsed + session.sessionTimeout <= self._reactor.seconds():
+            session.expire()
+            raise KeyError(uid)
+        self._saved[session] = (lastUsed, namespaces)
+        return session
+
+
+    def touchSession(self, session):
+        """
+        Write out the C{sessionNamespaces} of C{session} and the current time,
+        unless neither has changed enough to be worth writing.
+
+        @see: L{iweb.ISessionStore.touchSession}
+        """
+        namespaces = pickle.dumps(
+            session.sessionNamespaces, pickle.HIGHEST_PROTOCOL)
+        saved = self._saved.get(session)
+        if saved is not None:
+            lastSaved, savedNamespaces = saved
+            if (namespaces == savedNamespaces and
+                    self._reactor.seconds() < lastSaved + self.touchInterval):
+                return
+        self._save(session, namespaces)
+
+
+    def removeSession(self, session):
+        """
+        @see: L{iweb.ISessionStore.removeSession}
+        """
+        try:
+            self._sessionPath(session.uid).remove()
+        except (IOError, OSError):
+            pass
+
+
+    def stopSweeping(self):
+        """
+        Stop removing the files of expired sessions, until another session is
+        made.
+        """
+        if self._sweepCall is not None:
+            if self._sweepCall.active():
+                self._sweepCall.cancel()
+            self._sweepCall = None
+
+
+    def _sweep(self, sessionFactory):
+        """
+        Remove the files of all the sessions which have not been used for the
+        C{sessionTimeout} of C{sessionFactory}, and check again after
+        C{sweepInterval}.
+        """
+        self._sweepCall = None
+        now = self._reactor.seconds()
+        for path in self.directory.children():
+            if not path.basename().isalnum():
+                # Not a session, such as a file _save is still writing.
+                continue
+            try:
+                lastUsed, namespaces = self._load(path)
+            except KeyError:
+                continue
+            if lastUsed + sessionFactory.sessionTimeout <= now:
+                try:
+                    path.remove()
+                except (IOError, OSError):
+                    pass
+        self._sweepCall = self._reactor.callLater(
+            self.sweepInterval, self._sweep, sessionFactory)
+
 
 
 version = networkString("TwistedWeb/%s" % (copyright.version,))
@@ -610,12 +1241,28 @@ class Site(http.HTTPFactory):
         rendered pages. Default to C{True}.
     @ivar sessionFactory: factory for sessions objects. Default to L{Session}.
     @ivar sessionCheckTime: Deprecated.  See L{Session.sessionTimeout} instead.
+    @ivar sessionStore: If not C{None}, an L{iweb.ISessionStore} provider
+        which creates, keeps and expires the sessions of this site, instead of
+        keeping them in C{sessions} and having each session schedule its own
+        expiration.  Default to C{None}.
+    @ivar routingIndex: If not C{None}, a L{resource.RoutingIndex} of
+        C{resource} which is used to find the resource for each request,
+        instead of calling C{getChildWithDefault} on each resource along the
+        way.  Default to C{None}.
+    @ivar streamRequestBodies: if set, the resource for each request with a
+        body is found before the body is received, and if it provides
+        L{iweb.IStreamingBodyResource} it may have the body delivered to it
+        as it arrives rather than kept in C{request.content}.  Default to
+        C{False}.
     """
     counter = 0
     requestFactory = Request
     displayTracebacks = True
     sessionFactory = Session
     sessionCheckTime = 1800
+    sessionStore = None
+    routingIndex = None
+    streamRequestBodies = False
 
     def __init__(self, resource, requestFactory=None, *args, **kwargs):
         """
@@ -659,6 +1306,8 @@ class Site(http.HTTPFactory):
         Generate a new Session instance, and store it for future reference.
         """
         uid = self._mkuid()
+        if self.sessionStore is not None:
+            return self.sessionStore.makeSession(self, uid)
         session = self.sessions[uid] = self.sessionFactory(self, uid)
         session.startCheckingExpiration()
         return session
@@ -668,6 +1317,8 @@ class Site(http.HTTPFactory):
         Get a previously generated session, by its unique ID.
         This raises a KeyError if the session is not found.
         """
+        if self.sessionStore is not None:
+            return self.sessionStore.getSession(self, uid)
         return self.sessions[uid]
 
     def buildProtocol(self, addr):
@@ -707,4 +1358,6 @@ class Site(http.HTTPFactory):
         # Sitepath is used to determine cookie names between distributed
         # servers and disconnected sites.
         request.sitepath = copy.copy(request.prepath)
+        if self.routingIndex is not None:
+            return self.routingIndex.getChildForRequest(request)
         return resource.getChildForRequest(self.resource, request)
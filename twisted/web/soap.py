@@ -19,8 +19,9 @@ Pluggable method lookup policies.
 import SOAPpy
 
 # twisted imports
-from twisted.web import server, resource, client
-from twisted.internet import defer
+from twisted.web import server, resource, client, http
+from twisted.internet import defer, reactor
+from twisted.internet.threads import deferToThreadPool
 
 
 class SOAPPublisher(resource.Resource):
@@ -36,6 +37,15 @@ class SOAPPublisher(resource.Resource):
     # override to change the encoding used for responses
     encoding = "UTF-8"
 
+    # set to a started ThreadPool to parse requests and build responses
+    # outside of the reactor thread
+    threadpool = None
+
+    # set to refuse request bodies larger than this many bytes
+    maxRequestSize = None
+
+    _reactor = reactor
+
     def lookupFunction(self, functionName):
         """Lookup published SOAP function.
 
@@ -50,7 +60,29 @@ class SOAPPublisher(resource.Resource):
         """Handle a SOAP command."""
         data = request.content.read()
 
-        p, header, body, attrs = SOAPpy.parseSOAPRPC(data, 1, 1, 1)
+        if self.maxRequestSize is not None and len(data) > self.maxRequestSize:
+            request.setResponseCode(http.REQUEST_ENTITY_TOO_LARGE)
+            request.setHeader("Content-type", "text/plain")
+            return "Request body too large"
+
+        d = self._marshal(SOAPpy.parseSOAPRPC, data, 1, 1, 1)
+        d.addCallback(self._gotRequest, request)
+        d.addErrback(request.processingFailed)
+        return server.NOT_DONE_YET
+
+    def _marshal(self, f, *args, **kwargs):
+        """Call f, which parses or builds a SOAP message, in the thread pool
+        if there is one.
+
+        @return: a Deferred firing with the result of f.
+        """
+        if self.threadpool is None:
+            return defer.maybeDeferred(f, *args, **kwargs)
+        return deferToThreadPool(
+            self._reactor, self.threadpool, f, *args, **kwargs)
+
+    def _gotRequest(self, parsed, request):
+        p, header, body, attrs = parsed
 
         methodName, args, kwargs = p._name, p._aslist, p._asdict
 
@@ -64,7 +96,7 @@ class SOAPPublisher(resource.Resource):
 
         if not function:
             self._methodNotFound(request, methodName)
-            return server.NOT_DONE_YET
+            return
         else:
             if hasattr(function, "useKeywords"):
                 keywords = {}
@@ -76,20 +108,23 @@ class SOAPPublisher(resource.Resource):
 
         d.addCallback(self._gotResult, request, methodName)
         d.addErrback(self._gotError, request, methodName)
-        return server.NOT_DONE_YET
 
     def _methodNotFound(self, request, methodName):
-        response = SOAPpy.buildSOAP(SOAPpy.faultType("%s:Client" %
+        d = self._marshal(SOAPpy.buildSOAP, SOAPpy.faultType("%s:Client" %
             SOAPpy.NS.ENV_T, "Method %s not found" % methodName),
             encoding=self.encoding)
-        self._sendResponse(request, response, status=500)
+        d.addCallback(
+            lambda response: self._sendResponse(request, response, 500))
+        return d
 
     def _gotResult(self, result, request, methodName):
         if not isinstance(result, SOAPpy.voidType):
             result = {"Result": result}
-        response = SOAPpy.buildSOAP(kw={'%sResponse' % methodName: result},
-                                  encoding=self.encoding)
-        self._sendResponse(request, response)
+        d = self._marshal(SOAPpy.buildSOAP,
+                          kw={'%sResponse' % methodName: result},
+                          encoding=self.encoding)
+        d.addCallback(lambda response: self._sendResponse(request, response))
+        return d
 
     def _gotError(self, failure, request, methodName):
         e = failure.value
@@ -98,8 +133,10 @@ class SOAPPublisher(resource.Resource):
         else:
             fault = SOAPpy.faultType("%s:Server" % SOAPpy.NS.ENV_T,
                 "Method %s failed." % methodName)
-        response = SOAPpy.buildSOAP(fault, encoding=self.encoding)
-        self._sendResponse(request, response, status=500)
+        d = self._marshal(SOAPpy.buildSOAP, fault, encoding=self.encoding)
+        d.addCallback(
+            lambda response: self._sendResponse(request, response, 500))
+        return d
 
     def _sendResponse(self, request, response, status=200):
         request.setResponseCode(status)
@@ -14,6 +14,10 @@ import itertools
 import time
 import errno
 import mimetypes
+import zlib
+
+from collections import OrderedDict
+from io import BytesIO
 
 from zope.interface import implementer
 
@@ -36,6 +40,11 @@ else:
     from urllib import quote, unquote
     from cgi import escape
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 dangerousPathError = resource.NoResource("Invalid request URL.")
 
 def isDangerous(path):
@@ -150,6 +159,341 @@ def getTypeAndEncoding(filename, types, encodings, defaultType):
 
 
 
+def _acceptedEncodings(header):
+    """
+    Parse the value of an I{Accept-Encoding} header.
+
+    @param header: The header value, or C{None} if the request had none.
+    @type header: C{bytes}
+
+    @return: The lower-cased content-codings the client accepts with a
+        non-zero quality value.
+    @rtype: C{set} of C{bytes}
+    """
+    accepted = set()
+    if not header:
+        return accepted
+    for item in header.split(b','):
+        parameters = item.split(b';')
+        coding = parameters[0].strip().lower()
+        quality = 1.0
+        for parameter in parameters[1:]:
+            name, _, value = parameter.partition(b'=')
+            if name.strip().lower() == b'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            accepted.add(coding)
+    return accepted
+
+
+
+class CompressionCache(object):
+    """
+    A byte-bounded, least-recently-used cache of compressed file contents.
+
+    A single instance may be shared by any number of L{File} resources (see
+    L{File.compressionCache}) so that a frequently requested asset is only
+    compressed once for each encoding, rather than once per response.
+    Entries are keyed on the path, modification time, size and encoding of
+    the file, so a file which changes on disk is compressed again on its
+    next request and the stale entry ages out of the cache.
+
+    @ivar maxSize: The total number of bytes of compressed data to retain.
+    @type maxSize: C{int}
+
+    @ivar maxFileSize: The size, in bytes, of the largest file which will be
+        compressed.  Larger files are served unencoded.
+    @type maxFileSize: C{int}
+
+    @ivar compressLevel: The zlib compression level used for I{gzip}.
+    @type compressLevel: C{int}
+
+    @ivar encodings: The content-codings this cache can produce, in order of
+        preference.  I{br} is only included if the C{brotli} module is
+        available.
+    @type encodings: C{tuple} of C{bytes}
+
+    @ivar compressibleTypes: Prefixes of the content types worth
+        compressing.  Most other types (images, archives) are already
+        compressed.
+    @type compressibleTypes: C{tuple} of C{str}
+
+    @ivar size: The number of bytes of compressed data currently cached.
+    @type size: C{int}
+    """
+
+    compressibleTypes = (
+        'text/', 'application/javascript', 'application/x-javascript',
+        'application/json', 'application/xml', 'application/xhtml+xml',
+        'application/rss+xml', 'application/atom+xml', 'image/svg+xml')
+
+    def __init__(self, maxSize=2 ** 24, maxFileSize=2 ** 20, compressLevel=9):
+        self.maxSize = maxSize
+        self.maxFileSize = maxFileSize
+        self.compressLevel = compressLevel
+        if brotli is not None:
+            self.encodings = (b'br', b'gzip')
+        else:
+            self.encodings = (b'gzip',)
+        self.size = 0
+        self._entries = OrderedDict()
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def isCompressible(self, contentType):
+        """
+        Determine whether content of the given type should be compressed.
+
+        @param contentType: A I{major/minor} content type, or C{None}.
+        @type contentType: C{str}
+
+        @rtype: C{bool}
+        """
+        if not contentType:
+            return False
+        return contentType.lower().startswith(self.compressibleTypes)
+
+
+    def getEncoded(self, path, contentType, encoding):
+        """
+        Get the contents of a file compressed with the given encoding,
+        compressing it if no current copy is cached.
+
+        @param path: The file to compress.
+        @type path: L{FilePath}
+
+        @param contentType: The content type the file is served as.
+        @type contentType: C{str}
+
+        @param encoding: The content-coding to apply, one of L{encodings}.
+        @type encoding: C{bytes}
+
+        @return: The compressed contents, or C{None} if the file should not
+            be compressed with that encoding.
+        @rtype: C{bytes}
+
+        @raise IOError: If the file cannot be read.
+        """
+        if encoding not in self.encodings:
+            return None
+        if not self.isCompressible(contentType):
+            return None
+        size = path.getsize()
+        if size > self.maxFileSize:
+            return None
+        key = (path.path, path.getModificationTime(), size, encoding)
+        data = self._entries.pop(key, None)
+        if data is None:
+            data = self._compress(path.getContent(), encoding)
+            self.size += len(data)
+        self._entries[key] = data
+        while self.size > self.maxSize:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+        return data
+
+
+    def _compress(self, data, encoding):
+        """
+        Compress C{data} with the given content-coding.
+        """
+        if encoding == b'br':
+            return brotli.compress(data)
+        compressor = zlib.compressobj(
+            self.compressLevel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+
+
+
+class MetadataCache(object):
+    """
+    A cache of the results of C{stat} for the files served by L{File}
+    resources, and of the contents of small files.
+
+    A single instance may be shared by any number of L{File} resources (see
+    L{File.metadataCache}).  Cached metadata is trusted for C{ttl} seconds,
+    after which the file is examined again; a file whose modification time,
+    size or inode has changed then has its cached contents discarded.  So a
+    file changed on disk is served unchanged for at most C{ttl} seconds.
+    L{invalidate} may be called, for example from an
+    L{inotify<twisted.internet.inotify>} watch, to notice a change sooner.
+
+    @ivar ttl: The number of seconds for which the metadata of a file is
+        trusted.
+    @type ttl: C{float}
+
+    @ivar maxEntries: The number of files for which metadata is retained.
+    @type maxEntries: C{int}
+
+    @ivar maxFileSize: The size, in bytes, of the largest file whose
+        contents will be kept in memory.
+    @type maxFileSize: C{int}
+
+    @ivar maxSize: The total number of bytes of file contents to retain.
+    @type maxSize: C{int}
+
+    @ivar size: The number of bytes of file contents currently cached.
+    @type size: C{int}
+    """
+
+    def __init__(self, ttl=1.0, maxEntries=10000, maxFileSize=2 ** 16,
+                 maxSize=2 ** 24, reactor=None):
+        """
+        @param reactor: The reactor whose clock decides when metadata
+            expires.  By default, the global reactor.
+        @type reactor: L{IReactorTime} provider
+        """
+        if reactor is None:
+            from twisted.internet import reactor
+        self._reactor = reactor
+        self.ttl = ttl
+        self.maxEntries = maxEntries
+        self.maxFileSize = maxFileSize
+        self.maxSize = maxSize
+        self.size = 0
+        self._entries = OrderedDict()
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def lookup(self, path):
+        """
+        Find the metadata of a file, examining the file again if the cached
+        metadata has expired.
+
+        @param path: The file.
+        @type path: L{FilePath}
+
+        @return: The metadata, with C{statinfo} set to the result of
+            C{os.stat}, or C{0} if the file does not exist, and C{etag} set
+            to a strong entity tag for the current contents of the file, or
+            C{None} if it does not exist.
+        @rtype: L{_Metadata}
+        """
+        now = self._reactor.seconds()
+        entry = self._entries.pop(path.path, None)
+        if entry is None or entry.expires <= now:
+            try:
+                statinfo = os.stat(path.path)
+            except OSError:
+                statinfo = 0
+            if entry is None or not entry.sameFile(statinfo):
+                if entry is not None:
+                    self._dropContent(entry)
+                entry = _Metadata(statinfo)
+            entry.expires = now + self.ttl
+        self._entries[path.path] = entry
+        while len(self._entries) > self.maxEntries:
+            self._dropContent(self._entries.popitem(last=False)[1])
+        return entry
+
+
+    def getContent(self, path, entry):
+        """
+        Get the contents of a file, reading it if they are not cached.
+
+        @param path: The file, which will be read using its
+            C{openForReading} method.
+        @type path: L{File}
+
+        @param entry: The metadata of the file, as returned by L{lookup}.
+        @type entry: L{_Metadata}
+
+        @return: The contents of the file, or C{None} if it is too large to
+            cache.
+        @rtype: C{bytes}
+
+        @raise IOError: If the file cannot be read.
+        """
+        if entry.content is not None:
+            return entry.content
+        if not entry.statinfo or entry.statinfo.st_size > self.maxFileSize:
+            return None
+        fileForReading = path.openForReading()
+        try:
+            content = fileForReading.read()
+        finally:
+            fileForReading.close()
+        if len(content) != entry.statinfo.st_size:
+            # The file changed since it was examined.
+            return None
+        entry.content = content
+        self.size += len(content)
+        while self.size > self.maxSize:
+            self._dropContent(self._entries.popitem(last=False)[1])
+        return content
+
+
+    def invalidate(self, path):
+        """
+        Forget the cached metadata and contents of a file.
+
+        @type path: L{FilePath}
+        """
+        entry = self._entries.pop(path.path, None)
+        if entry is not None:
+            self._dropContent(entry)
+
+
+    def _dropContent(self, entry):
+        if entry.content is not None:
+            self.size -= len(entry.content)
+            entry.content = None
+
+
+
+class _Metadata(object):
+    """
+    The cached metadata of one file.
+
+    @ivar statinfo: The result of C{os.stat} for the file, or C{0} if it
+        does not exist.
+
+    @ivar etag: A strong entity tag derived from the inode, size and
+        modification time of the file, or C{None} if it does not exist.
+    @type etag: C{bytes}
+
+    @ivar content: The contents of the file, or C{None} if they are not
+        cached.
+    @type content: C{bytes}
+
+    @ivar expires: The time at which the metadata must be checked again.
+    @type expires: C{float}
+    """
+    content = None
+    expires = 0
+
+    def __init__(self, statinfo):
+        self.statinfo = statinfo
+        if statinfo:
+            self.etag = networkString('"%x-%x-%x"' % (
+                    statinfo.st_ino, statinfo.st_size,
+                    int(statinfo.st_mtime * 1000000)))
+        else:
+            self.etag = None
+
+
+    def sameFile(self, statinfo):
+        """
+        Determine whether C{statinfo} describes the same contents as this
+        metadata.
+        """
+        if not statinfo or not self.statinfo:
+            return statinfo == self.statinfo
+        return ((statinfo.st_ino, statinfo.st_size, statinfo.st_mtime) ==
+                (self.statinfo.st_ino, self.statinfo.st_size,
+                 self.statinfo.st_mtime))
+
+
+
 class File(resource.Resource, filepath.FilePath):
     """
     File is a resource that represents a plain non-interpreted file
@@ -169,6 +513,25 @@ class File(resource.Resource, filepath.FilePath):
 
     @cvar childNotFound: L{Resource} used to render 404 Not Found error pages.
     @cvar forbidden: L{Resource} used to render 403 Forbidden error pages.
+
+    @ivar precompressedEncodings: The content-codings, in order of
+        preference, for which a pre-compressed sibling of this file may be
+        served.  For example, with C{(b'br', b'gzip')} a request for
+        C{app.js} from a client accepting I{gzip} is answered with the
+        contents of C{app.js.gz}, if that file exists and is no older than
+        C{app.js}.
+    @type precompressedEncodings: C{tuple} of C{bytes}
+
+    @ivar compressionCache: A L{CompressionCache} used to compress this file
+        when the client accepts an encoding for which there is no
+        pre-compressed sibling, or C{None} to only serve files as they are
+        found on disk.
+
+    @ivar metadataCache: A L{MetadataCache} used to avoid examining this
+        file on every request, and to keep its contents in memory if it is
+        small, or C{None} to examine and open the file for every request.
+        With a cache, responses carry a strong I{ETag} and I{If-None-Match}
+        requests are answered with I{Not Modified} when it matches.
     """
 
     contentTypes = loadMimeTypes()
@@ -184,6 +547,17 @@ class File(resource.Resource, filepath.FilePath):
 
     type = None
 
+    precompressedEncodings = ()
+
+    compressionCache = None
+
+    metadataCache = None
+
+    _precompressedExtensions = {
+        b'gzip': '.gz',
+        b'br': '.br',
+        }
+
     def __init__(self, path, defaultType="text/html", ignoredExts=(), registry=None, allowExt=0):
         """
         Create a file with the given path.
@@ -563,7 +937,15 @@ class File(resource.Resource, filepath.FilePath):
         Begin sending the contents of this L{File} (or a subset of the
         contents, based on the 'range' header) to the given request.
         """
-        self.restat(False)
+        cache = self.metadataCache
+        if cache is None:
+            metadata = None
+            etag = None
+            self.restat(False)
+        else:
+            metadata = cache.lookup(self)
+            etag = metadata.etag
+            self._statinfo = metadata.statinfo
 
         if self.type is None:
             self.type, self.encoding = getTypeAndEncoding(self.basename(),
@@ -577,20 +959,32 @@ class File(resource.Resource, filepath.FilePath):
         if self.isdir():
             return self.redirect(request)
 
+        if self._negotiatesEncoding():
+            request.setHeader(b'vary', b'accept-encoding')
+            encoded = self._getEncodedRepresentation(request)
+            if encoded is not None:
+                return self._renderEncoded(request, *encoded, etag=etag)
+
         request.setHeader(b'accept-ranges', b'bytes')
 
         try:
-            fileForReading = self.openForReading()
+            content = None
+            if metadata is not None:
+                content = cache.getContent(self, metadata)
+            if content is None:
+                fileForReading = self.openForReading()
+            else:
+                fileForReading = BytesIO(content)
         except IOError as e:
             if e.errno == errno.EACCES:
                 return self.forbidden.render(request)
             else:
                 raise
 
-        if request.setLastModified(self.getModificationTime()) is http.CACHED:
-            # `setLastModified` also sets the response code for us, so if the
-            # request is cached, we close the file now that we've made sure that
-            # the request would otherwise succeed and return an empty body.
+        if self._checkConditions(request, etag) is http.CACHED:
+            # The response code has been set for us, so if the request is
+            # cached, we close the file now that we've made sure that the
+            # request would otherwise succeed and return an empty body.
             fileForReading.close()
             return b''
 
@@ -610,6 +1004,111 @@ class File(resource.Resource, filepath.FilePath):
     render_HEAD = render_GET
 
 
+    def _negotiatesEncoding(self):
+        """
+        Determine whether the response for this file may depend on the
+        request's I{Accept-Encoding} header.
+        """
+        if self.encoding is not None:
+            # Already compressed on disk; serve it as it is.
+            return False
+        return bool(self.precompressedEncodings or
+                    self.compressionCache is not None)
+
+
+    def _getEncodedRepresentation(self, request):
+        """
+        Find a compressed representation of this file which is acceptable to
+        the client, either a pre-compressed sibling file or an entry in
+        L{compressionCache}.
+
+        Range requests are always answered from the unencoded file.
+
+        @return: C{None} if there is no acceptable representation, otherwise
+            a three-tuple of the content-coding, a file-like object holding
+            the encoded contents and its size.
+        """
+        if request.getHeader(b'range') is not None:
+            return None
+        accepted = _acceptedEncodings(request.getHeader(b'accept-encoding'))
+        if not accepted:
+            return None
+
+        modified = self.getModificationTime()
+        for encoding in self.precompressedEncodings:
+            if encoding not in accepted:
+                continue
+            extension = self._precompressedExtensions.get(encoding)
+            if extension is None:
+                continue
+            sibling = filepath.FilePath(
+                self.path +
+                filepath._coerceToFilesystemEncoding(self.path, extension))
+            try:
+                if sibling.getModificationTime() < modified:
+                    continue
+                return encoding, sibling.open(), sibling.getsize()
+            except (IOError, OSError):
+                continue
+
+        cache = self.compressionCache
+        if cache is not None:
+            for encoding in cache.encodings:
+                if encoding not in accepted:
+                    continue
+                try:
+                    data = cache.getEncoded(self, self.type, encoding)
+                except (IOError, OSError):
+                    # Let the unencoded path report the error.
+                    return None
+                if data is not None:
+                    return encoding, BytesIO(data), len(data)
+        return None
+
+
+    def _checkConditions(self, request, etag):
+        """
+        Set the I{ETag} and I{Last-Modified} of the response, and find
+        whether the client already has the representation they describe.
+
+        @param etag: The entity tag of the representation, or C{None}.
+        @type etag: C{bytes}
+
+        @return: L{http.CACHED} if the response should have no body,
+            otherwise C{None}.
+        """
+        if etag is not None and request.setETag(etag) is http.CACHED:
+            request.setLastModified(self.getModificationTime())
+            return http.CACHED
+        return request.setLastModified(self.getModificationTime())
+
+
+    def _renderEncoded(self, request, encoding, fileForReading, size,
+                       etag=None):
+        """
+        Send an encoded representation of this file, as found by
+        L{_getEncodedRepresentation}, to the given request.
+
+        @param etag: The entity tag of the unencoded file, or C{None}.  The
+            encoded representation is tagged with it and the encoding.
+        """
+        if etag is not None:
+            etag = etag[:-1] + b'-' + encoding + b'"'
+        if self._checkConditions(request, etag) is http.CACHED:
+            fileForReading.close()
+            return b''
+
+        self._setContentHeaders(request, size)
+        request.setHeader(b'content-encoding', encoding)
+
+        if request.method == b'HEAD':
+            fileForReading.close()
+            return b''
+
+        NoRangeStaticProducer(request, fileForReading).start()
+        return server.NOT_DONE_YET
+
+
     def redirect(self, request):
         return redirectTo(addSlash(request), request)
 
@@ -631,6 +1130,9 @@ class File(resource.Resource, filepath.FilePath):
         f.processors = self.processors
         f.indexNames = self.indexNames[:]
         f.childNotFound = self.childNotFound
+        f.precompressedEncodings = self.precompressedEncodings
+        f.compressionCache = self.compressionCache
+        f.metadataCache = self.metadataCache
         return f
 
 
@@ -353,6 +353,33 @@ def _flatsaxParse(fl):
     return s.document
 
 
+class _CompilingLoaderMixin(object):
+    """
+    Mixin for L{ITemplateLoader}s whose documents never change once loaded,
+    which caches a compiled form of the document for L{Element.render} to
+    flatten instead of the document itself.
+
+    @ivar _compiledTemplate: The compiled document, or C{None} if it has not
+        been compiled yet.
+    @type _compiledTemplate: L{twisted.web._flatten._CompiledTemplate} or
+        C{None}
+    """
+    _compiledTemplate = None
+
+    def _loadCompiled(self):
+        """
+        Return the document, compiling it first if necessary.
+
+        @return: The compiled form of the result of C{load}, which flattens to
+            the same output.
+        @rtype: L{twisted.web._flatten._CompiledTemplate}
+        """
+        if self._compiledTemplate is None:
+            self._compiledTemplate = _compileTemplate(self.load())
+        return self._compiledTemplate
+
+
+
 class TagLoader(object):
     """
     An L{ITemplateLoader} that loads existing L{IRenderable} providers.
@@ -375,7 +402,7 @@ class TagLoader(object):
 
 
 
-class XMLString(object):
+class XMLString(_CompilingLoaderMixin):
     """
     An L{ITemplateLoader} that loads and parses XML from a string.
 
@@ -405,7 +432,7 @@ class XMLString(object):
 
 
 
-class XMLFile(object):
+class XMLFile(_CompilingLoaderMixin):
     """
     An L{ITemplateLoader} that loads and parses XML from a file.
 
@@ -536,8 +563,7 @@ def renderElement(request, element,
     @since: 12.1
     """
     if doctype is not None:
-        request.write(doctype)
-        request.write('\n')
+        request.write(doctype + '\n')
 
     if _failElement is None:
         _failElement = twisted.web.util.FailureElement
@@ -562,5 +588,5 @@ def renderElement(request, element,
 
 
 from twisted.web._element import Element, renderer
-from twisted.web._flatten import flatten, flattenString
+from twisted.web._flatten import flatten, flattenString, _compileTemplate
 import twisted.web.util
@@ -51,6 +51,9 @@ class DummyChannel:
         def registerProducer(self, producer, streaming):
             self.producers.append((producer, streaming))
 
+        def unregisterProducer(self):
+            self.producers.pop()
+
         def loseConnection(self):
             self.disconnected = True
 
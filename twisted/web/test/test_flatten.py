@@ -16,7 +16,7 @@ from zope.interface import implements, implementer
 from twisted.trial.unittest import TestCase
 from twisted.test.testutils import XMLAssertionMixin
 
-from twisted.internet.defer import passthru, succeed, gatherResults
+from twisted.internet.defer import passthru, succeed, gatherResults, Deferred
 
 from twisted.web.iweb import IRenderable
 from twisted.web.error import UnfilledSlot, UnsupportedType, FlattenerError
@@ -24,6 +24,10 @@ from twisted.web.error import UnfilledSlot, UnsupportedType, FlattenerError
 from twisted.web.template import tags, Tag, Comment, CDATA, CharRef, slot
 from twisted.web.template import Element, renderer, TagLoader, flattenString
 
+from twisted.web.template import XMLString, flatten
+from twisted.web._flatten import (
+    _compileTemplate, _CompiledTemplate, _renderDocument)
+from twisted.web import _flatten
 from twisted.web.test._util import FlattenTestCase
 
 
@@ -426,6 +430,194 @@ class SerializationTests(FlattenTestCase, XMLAssertionMixin):
 HERE = (lambda: None).func_code.co_filename
 
 
+class CompiledTemplateTests(FlattenTestCase):
+    """
+    Tests for L{_compileTemplate} and the flattening of the
+    L{_CompiledTemplate}s it returns.
+    """
+    template = (
+        '<html xmlns:t="http://twistedmatrix.com/ns/twisted.web.template/0.1">'
+        '<head><title>A &amp; B</title></head><body class="x&quot;y">'
+        '<!-- note --><p t:render="greeting">Hello</p>'
+        '<br /><t:slot name="content" default="nothing" />'
+        '<a><t:attr name="href"><t:slot name="link" /></t:attr>link</a>'
+        '</body></html>')
+
+    def assertCompiledFlattensLikeOriginal(self, root, request=None):
+        """
+        Assert that C{root} flattens to the same output whether or not it has
+        been compiled with L{_compileTemplate}.
+
+        @return: The flattened output.
+        @rtype: C{bytes}
+        """
+        original = self.successResultOf(flattenString(request, root))
+        compiled = self.successResultOf(
+            flattenString(request, _compileTemplate(root)))
+        self.assertEqual(original, compiled)
+        return compiled
+
+
+    def test_staticMarkupJoined(self):
+        """
+        A document with no dynamic parts is compiled into a single string of
+        pre-escaped markup.
+        """
+        root = [tags.div(tags.p('a < b'), Comment('c'), CDATA('d'),
+                         CharRef(10), tags.br(), id='"e"')]
+        compiled = _compileTemplate(root)
+        self.assertEqual(len(compiled.parts), 1)
+        self.assertEqual(
+            self.assertCompiledFlattensLikeOriginal(root),
+            '<div id="&quot;e&quot;"><p>a &lt; b</p><!--c-->'
+            '<![CDATA[d]]>&#10;<br /></div>')
+
+
+    def test_dynamicPartsPreserved(self):
+        """
+        Slots and tags with render directives are left in the compiled
+        document unchanged, so that render methods receive the same tags they
+        would if the document had not been compiled.
+        """
+        rendered = tags.span(render='foo')
+        filled = tags.p(slot('bar')).fillSlots(bar='baz')
+        root = tags.div(slot('bar'), rendered, filled)
+        compiled = _compileTemplate(root)
+        self.assertEqual(
+            [part for part in compiled.parts if type(part) is not str],
+            [(root.children[0], 'content'), (rendered, 'content'),
+             (filled, 'content')])
+
+
+    def test_realisticTemplate(self):
+        """
+        A parsed template with renderers, slots and attribute slots flattens
+        to the same output when compiled.
+        """
+        class CompiledElement(Element):
+            @renderer
+            def greeting(self, request, tag):
+                return tag(', world.')
+
+        element = CompiledElement(loader=XMLString(self.template))
+        root = element.loader.load()
+        uncompiled = CompiledElement(loader=TagLoader(tags.transparent(root)))
+        self.assertIsInstance(
+            _renderDocument(None, element), _CompiledTemplate)
+        slots = dict(content='<stuff>', link='/a?b&c')
+        expected = self.assertFlattensImmediately(
+            tags.transparent(uncompiled).fillSlots(**slots),
+            '<html><head><title>A &amp; B</title></head>'
+            '<body class="x&quot;y"><!-- note --><p>Hello, world.</p><br />'
+            '&lt;stuff&gt;<a href="/a?b&amp;c">link</a></body></html>')
+        self.assertFlattensImmediately(
+            tags.transparent(element).fillSlots(**slots), expected)
+        self.assertIs(element.loader.load(), root)
+
+
+    def test_renderOverridden(self):
+        """
+        An L{Element} subclass which overrides C{render} is flattened from
+        what its C{render} returns rather than from its loader's compiled
+        document.
+        """
+        document = tags.p('Overridden.')
+
+        class OverridingElement(Element):
+            def render(self, request):
+                return document
+
+        element = OverridingElement(loader=XMLString(self.template))
+        self.assertIs(_renderDocument(None, element), document)
+        self.assertFlattensImmediately(element, '<p>Overridden.</p>')
+
+
+    def test_withinAttribute(self):
+        """
+        A compiled document flattened within an attribute is quoted exactly
+        as the original document would be, including text at the top level of
+        the document, text inside its tags and dynamic parts in both places.
+        """
+        root = ['<top>', tags.b('<inner>', slot('s')), slot('s')]
+        compiled = _compileTemplate(root)
+        original = self.successResultOf(flattenString(
+            None, tags.a(href=tags.transparent(root).fillSlots(s='&'))))
+        self.assertEqual(
+            original,
+            '<a href="&lt;top&gt;&lt;b&gt;&amp;lt;inner&amp;gt;'
+            '&amp;amp;&lt;/b&gt;&amp;"></a>')
+        self.assertFlattensImmediately(
+            tags.a(href=tags.transparent(compiled).fillSlots(s='&')),
+            original)
+
+
+    def test_rootNotModified(self):
+        """
+        L{_compileTemplate} does not modify the document it compiles.
+        """
+        child = tags.p('x')
+        root = tags.div(child, tags.span(render='foo'))
+        _compileTemplate(root)
+        self.assertEqual(root.children[0], child)
+        self.assertEqual(child.children, ['x'])
+
+
+
+class WriteCoalescingTests(TestCase):
+    """
+    Tests for the joining of output by L{flatten} into as few calls to its
+    C{write} argument as possible.
+    """
+    def test_joined(self):
+        """
+        Output which is produced without waiting on a L{Deferred} is passed to
+        C{write} all at once.
+        """
+        written = []
+        d = flatten(None, tags.ul([tags.li(str(i)) for i in range(3)]),
+                    written.append)
+        self.successResultOf(d)
+        self.assertEqual(
+            written, ['<ul><li>0</li><li>1</li><li>2</li></ul>'])
+
+
+    def test_flushedBeforeDeferred(self):
+        """
+        Output collected before waiting on a L{Deferred} is written before
+        waiting, and output after it is collected separately.
+        """
+        written = []
+        pending = Deferred()
+        d = flatten(None, tags.p('a', pending, 'c'), written.append)
+        self.assertEqual(written, ['<p>a'])
+        pending.callback('b')
+        self.successResultOf(d)
+        self.assertEqual(written, ['<p>a', 'bc</p>'])
+
+
+    def test_bufferSize(self):
+        """
+        Once at least L{_flatten._BUFFER_SIZE} bytes of output have been
+        collected, they are written.
+        """
+        self.patch(_flatten, '_BUFFER_SIZE', 4)
+        written = []
+        self.successResultOf(flatten(None, ['ab', 'cd', 'e'], written.append))
+        self.assertEqual(written, ['abcd', 'e'])
+
+
+    def test_flushedBeforeFailure(self):
+        """
+        Output collected before flattening fails is written before the
+        L{Deferred} returned by L{flatten} fails.
+        """
+        written = []
+        d = flatten(None, ['a', slot('missing')], written.append)
+        self.failureResultOf(d, FlattenerError)
+        self.assertEqual(written, ['a'])
+
+
+
 class FlattenerErrorTests(TestCase):
     """
     Tests for L{FlattenerError}.
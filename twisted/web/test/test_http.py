@@ -6,6 +6,7 @@ Test HTTP support.
 """
 
 import random, cgi, base64
+from io import BytesIO
 
 try:
     from urlparse import urlparse, urlunsplit, clear_cache
@@ -22,7 +23,7 @@ from twisted.web.http import _IdentityTransferDecoder
 from twisted.internet.task import Clock
 from twisted.internet.error import ConnectionLost
 from twisted.protocols import loopback
-from twisted.test.proto_helpers import StringTransport
+from twisted.test.proto_helpers import StringTransport, AccumulatingProtocol
 from twisted.test.test_internet import DummyProducer
 from twisted.web.test.requesthelper import DummyChannel
 
@@ -623,6 +624,59 @@ class ChunkedTransferEncodingTests(unittest.TestCase):
         self.assertEqual(successes, [True])
 
 
+    def test_lengthLineSplit(self):
+        """
+        L{_ChunkedTransferDecoder.dataReceived} decodes a chunk length line
+        delivered in pieces, including one whose CR LF is split between
+        two calls.
+        """
+        L = []
+        p = http._ChunkedTransferDecoder(L.append, None)
+        p.dataReceived(b'1')
+        p.dataReceived(b'0; ext')
+        p.dataReceived(b'=1\r')
+        p.dataReceived(b'\n' + b'x' * 16 + b'\r\n')
+        self.assertEqual(b''.join(L), b'x' * 16)
+        self.assertEqual(p.state, 'CHUNK_LENGTH')
+
+
+    def test_manyChunks(self):
+        """
+        L{_ChunkedTransferDecoder.dataReceived} decodes many chunks delivered
+        in a single call.
+        """
+        L = []
+        finished = []
+        p = http._ChunkedTransferDecoder(L.append, finished.append)
+        p.dataReceived(b'1\r\nx\r\n' * 1000 + b'0\r\n\r\nextra')
+        self.assertEqual(L, [b'x'] * 1000)
+        self.assertEqual(finished, [b'extra'])
+
+
+    def test_chunkDataNotCopied(self):
+        """
+        L{_ChunkedTransferDecoder.dataReceived} passes data which belongs
+        entirely to the current chunk to the data callback unchanged.
+        """
+        L = []
+        p = http._ChunkedTransferDecoder(L.append, None)
+        p.dataReceived(b'100\r\n')
+        data = b'x' * 128
+        p.dataReceived(data)
+        self.assertIs(L[0], data)
+
+
+    def test_missingCRLF(self):
+        """
+        L{_ChunkedTransferDecoder.dataReceived} raises
+        L{_MalformedChunkedDataError} if a chunk is not followed by CR LF.
+        """
+        p = http._ChunkedTransferDecoder(lambda data: None, None)
+        p.dataReceived(b'3\r\nabc\r')
+        self.assertRaises(
+            http._MalformedChunkedDataError, p.dataReceived, b'x')
+
+
 
 class ChunkingTests(unittest.TestCase):
 
@@ -1039,6 +1093,84 @@ abasdfg
             "See http://bugs.python.org/issue12411 and #5511.")
 
 
+    def test_multipartFormData(self):
+        """
+        The request body of a I{POST} request with a I{Content-Type} header
+        of I{multipart/form-data} is parsed into the C{args} attribute of the
+        request object, skipping parts which have no name.  The original
+        bytes of the request may still be read from the C{content}
+        attribute.
+        """
+        body = (
+            b'--AaB03x\r\n'
+            b'Content-Disposition: form-data; name="field"\r\n'
+            b'\r\n'
+            b'one\r\n'
+            b'--AaB03x\r\n'
+            b'Content-Disposition: form-data; name="field"\r\n'
+            b'\r\n'
+            b'two\r\n'
+            b'--AaB03x\r\n'
+            b'Content-Disposition: form-data; name="file"; filename="a"\r\n'
+            b'Content-Type: application/octet-stream\r\n'
+            b'\r\n'
+            b'\x00\r\n\x01\r\n'
+            b'--AaB03x\r\n'
+            b'Content-Disposition: attachment\r\n'
+            b'\r\n'
+            b'skipped\r\n'
+            b'--AaB03x--\r\n')
+        httpRequest = (
+            b'POST / HTTP/1.0\r\n'
+            b'Content-Type: multipart/form-data; boundary=AaB03x\r\n'
+            b'Content-Length: ' + intToBytes(len(body)) + b'\r\n'
+            b'\r\n' + body)
+
+        args = []
+        content = []
+        testcase = self
+        class MyRequest(http.Request):
+            def process(self):
+                args.append(self.args)
+                content.append(self.content.read())
+                testcase.didRequest = True
+                self.finish()
+
+        # runRequest would turn the bare LFs in the body into CR LFs.
+        channel = http.HTTPChannel()
+        channel.requestFactory = MyRequest
+        channel.makeConnection(StringTransport())
+        channel.dataReceived(httpRequest)
+        channel.connectionLost(IOError("all done"))
+
+        self.assertEqual(
+            args, [{b'field': [b'one', b'two'],
+                    b'file': [b'\x00\r\n\x01']}])
+        self.assertEqual(content, [body])
+
+
+    def test_malformedMultipartFormData(self):
+        """
+        If the request body of a I{POST} request with a I{Content-Type} header
+        of I{multipart/form-data} is not a valid multipart body, the request
+        fails with a 400 error.
+        """
+        req = b'''\
+POST / HTTP/1.0
+Content-Type: multipart/form-data; boundary=AaB03x
+Content-Length: 59
+
+--AaB03x
+Content-Disposition: form-data; name="a"
+
+abasdfg
+'''
+        channel = self.runRequest(req, http.Request, success=False)
+        self.assertEqual(
+            channel.transport.value(),
+            b"HTTP/1.1 400 Bad Request\r\n\r\n")
+
+
     def test_chunkedEncoding(self):
         """
         If a request uses the I{chunked} transfer encoding, the request body is
@@ -1120,6 +1252,217 @@ Hello,
 
 
 
+class RecordingBodyConsumer(object):
+    """
+    An L{iweb.IRequestBodyConsumer} which records what it is given.
+
+    @ivar events: A C{list} of the calls made, as tuples of method name and
+        argument.
+    """
+    def __init__(self):
+        self.events = []
+
+
+    def bodyStarted(self, producer):
+        self.producer = producer
+        self.events.append(('bodyStarted', producer))
+
+
+    def dataReceived(self, data):
+        self.events.append(('dataReceived', data))
+
+
+    def bodyDone(self, reason):
+        self.events.append(('bodyDone', reason))
+
+
+
+class RequestBodyTests(unittest.TestCase):
+    """
+    Tests for where L{http.Request} keeps its body.
+    """
+    def setUp(self):
+        self.consumer = RecordingBodyConsumer()
+        self.processed = []
+        consumer = self.consumer
+        processed = self.processed
+
+        class StreamingRequest(http.Request):
+            def getRequestBodyConsumer(self):
+                processed.append((self.method, self.uri))
+                return consumer
+
+            def process(self):
+                processed.append(self.content.read())
+                self.finish()
+
+        self.channel = http.HTTPChannel()
+        self.channel.requestFactory = StreamingRequest
+        self.transport = StringTransport()
+        self.channel.makeConnection(self.transport)
+
+
+    def test_streamingBody(self):
+        """
+        If L{http.Request.getRequestBodyConsumer} returns an object, the
+        request body is delivered to it as it is received and is not kept in
+        C{content}.  The request is processed once the whole body has been
+        delivered.
+        """
+        self.channel.dataReceived(
+            b'POST /upload?x=y HTTP/1.1\r\n'
+            b'Content-Type: application/x-www-form-urlencoded\r\n'
+            b'Content-Length: 10\r\n'
+            b'\r\n'
+            b'hello')
+        self.assertEqual(self.processed, [(b'POST', b'/upload?x=y')])
+        self.assertEqual(
+            self.consumer.events[1:], [('dataReceived', b'hello')])
+        self.channel.dataReceived(b'world')
+        self.assertEqual(
+            self.consumer.events[1:],
+            [('dataReceived', b'hello'), ('dataReceived', b'world'),
+             ('bodyDone', None)])
+        self.assertEqual(self.processed[1:], [b''])
+
+
+    def test_pauseBody(self):
+        """
+        The producer given to L{iweb.IRequestBodyConsumer.bodyStarted} pauses
+        and resumes reading from the connection.
+        """
+        self.channel.dataReceived(
+            b'PUT / HTTP/1.1\r\n'
+            b'Content-Length: 10\r\n'
+            b'\r\n')
+        self.consumer.producer.pauseProducing()
+        self.assertEqual(self.transport.producerState, 'paused')
+        self.consumer.producer.resumeProducing()
+        self.assertEqual(self.transport.producerState, 'producing')
+
+
+    def test_connectionLost(self):
+        """
+        If the connection is lost before the whole body is received, the
+        consumer's C{bodyDone} is called with the reason.
+        """
+        self.channel.dataReceived(
+            b'PUT / HTTP/1.1\r\n'
+            b'Content-Length: 10\r\n'
+            b'\r\n'
+            b'hello')
+        reason = Failure(ConnectionLost())
+        self.channel.connectionLost(reason)
+        self.assertEqual(self.consumer.events[-1], ('bodyDone', reason))
+        self.assertEqual(len(self.processed), 1)
+
+
+    def test_noBody(self):
+        """
+        L{http.Request.getRequestBodyConsumer} is not called for a request
+        without a body.
+        """
+        self.channel.dataReceived(b'GET / HTTP/1.1\r\n\r\n')
+        self.assertEqual(self.processed, [b''])
+        self.assertEqual(self.consumer.events, [])
+
+
+    def test_bodyMemoryLimit(self):
+        """
+        When L{http.HTTPFactory} is given a C{bodyMemoryLimit}, small request
+        bodies are kept in memory only while the total size of those being
+        handled by all its channels fits in it, and in temporary files
+        otherwise.  The memory is given back when a request is finished.
+        """
+        factory = http.HTTPFactory(bodyMemoryLimit=100)
+        budget = factory.buildProtocol(None)._bodyBudget
+        self.assertIs(factory.buildProtocol(None)._bodyBudget, budget)
+
+        channel = DummyChannel()
+        channel._bodyBudget = budget
+        first = http.Request(channel, False)
+        first.gotLength(60)
+        second = http.Request(channel, False)
+        second.gotLength(60)
+        self.assertIsInstance(first.content, BytesIO)
+        self.assertIsInstance(second.content.fileno(), int)
+        self.assertEqual(budget.used, 60)
+
+        first.finish()
+        self.assertEqual(budget.used, 0)
+        third = http.Request(channel, False)
+        third.gotLength(60)
+        self.assertEqual(budget.used, 60)
+        third.connectionLost(Failure(ConnectionLost()))
+        self.assertEqual(budget.used, 0)
+
+
+
+class ProtocolSwitchTests(unittest.TestCase):
+    """
+    Tests for L{http.Request._upgrade}, which hands a connection over from
+    HTTP to another protocol.
+    """
+    def setUp(self):
+        self.upgraded = AccumulatingProtocol()
+        upgraded = self.upgraded
+
+        class UpgradingRequest(http.Request):
+            def process(self):
+                self.setResponseCode(http.SWITCHING)
+                self.setHeader(b'upgrade', b'example')
+                self._upgrade(upgraded)
+
+        self.channel = http.HTTPChannel()
+        self.channel.requestFactory = UpgradingRequest
+        self.transport = StringTransport()
+        self.channel.makeConnection(self.transport)
+
+
+    def test_switch(self):
+        """
+        L{http.Request._upgrade} writes the response headers, without a
+        body, and delivers all further data received to the new protocol,
+        including any received along with the request.
+        """
+        self.channel.dataReceived(
+            b'GET / HTTP/1.1\r\n'
+            b'Upgrade: example\r\n'
+            b'\r\n'
+            b'early')
+        self.channel.dataReceived(b'\r\nlater\r\n')
+        self.assertEqual(
+            self.transport.value(),
+            b'HTTP/1.1 101 Switching Protocols\r\n'
+            b'Upgrade: example\r\n'
+            b'\r\n')
+        self.assertTrue(self.upgraded.made)
+        self.assertIs(self.upgraded.transport, self.transport)
+        self.assertEqual(self.upgraded.data, b'early\r\nlater\r\n')
+
+
+    def test_connectionLost(self):
+        """
+        When the connection is lost, the new protocol is told so.
+        """
+        self.channel.dataReceived(b'GET / HTTP/1.1\r\n\r\n')
+        reason = Failure(ConnectionLost())
+        self.channel.connectionLost(reason)
+        self.assertTrue(self.upgraded.closed)
+        self.assertIs(self.upgraded.closedReason, reason)
+
+
+    def test_queued(self):
+        """
+        L{http.Request._upgrade} raises L{RuntimeError} for a request which
+        is queued behind another.
+        """
+        request = http.Request(DummyChannel(), True)
+        self.assertRaises(
+            RuntimeError, request._upgrade, AccumulatingProtocol())
+
+
+
 class QueryArgumentsTests(unittest.TestCase):
     def testParseqs(self):
         self.assertEqual(
@@ -1948,6 +2291,48 @@ class RequestTests(unittest.TestCase, ResponseTestMixin):
         self.assertEqual((None, existing), (req.producer, transport.producer))
 
 
+    def test_setETagIfNoneMatch(self):
+        """
+        L{http.Request.setETag} returns L{http.CACHED} and sets the response
+        code to I{Not Modified} if the tag is one of a comma separated list
+        in the I{If-None-Match} header, compared weakly.
+        """
+        for header in [b'"a", "b"', b'"x",W/"b"', b'*']:
+            req = http.Request(DummyChannel(), False)
+            req.method = b"GET"
+            req.requestHeaders.setRawHeaders(b"if-none-match", [header])
+            self.assertIs(req.setETag(b'"b"'), http.CACHED)
+            self.assertEqual(req.code, http.NOT_MODIFIED)
+            self.assertEqual(req.etag, b'"b"')
+
+
+    def test_setETagNoMatch(self):
+        """
+        L{http.Request.setETag} returns C{None} if the tag is not listed in
+        the I{If-None-Match} header.
+        """
+        req = http.Request(DummyChannel(), False)
+        req.method = b"GET"
+        req.requestHeaders.setRawHeaders(b"if-none-match", [b'"a", "bc"'])
+        self.assertIs(req.setETag(b'"b"'), None)
+        self.assertEqual(req.code, http.OK)
+
+
+    def test_ifNoneMatchOverridesIfModifiedSince(self):
+        """
+        L{http.Request.setLastModified} ignores the I{If-Modified-Since}
+        header of a request which also has an I{If-None-Match} header.
+        """
+        req = http.Request(DummyChannel(), False)
+        req.method = b"GET"
+        req.requestHeaders.setRawHeaders(
+            b"if-modified-since", [http.datetimeToString(100)])
+        req.requestHeaders.setRawHeaders(b"if-none-match", [b'"a"'])
+        self.assertIs(req.setLastModified(50), None)
+        self.assertEqual(req.code, http.OK)
+        self.assertEqual(req.lastModified, 50)
+
+
 
 class MultilineHeadersTests(unittest.TestCase):
     """
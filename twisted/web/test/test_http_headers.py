@@ -7,8 +7,9 @@ Tests for L{twisted.web.http_headers}.
 
 from __future__ import division, absolute_import
 
-from twisted.python.compat import _PY3
+from twisted.python.compat import _PY3, intToBytes
 from twisted.trial.unittest import TestCase
+from twisted.web import http_headers
 from twisted.web.http_headers import _DictHeaders, Headers
 
 class HeadersTests(TestCase):
@@ -238,6 +239,79 @@ class HeadersTests(TestCase):
         self.assertEqual(h.getRawHeaders(b'test'), [b'foo', b'bar'])
 
 
+    def test_internedNames(self):
+        """
+        Header names are stored in their lowercase form, and all spellings of
+        a common name map to the same object.
+        """
+        h = Headers()
+        h.setRawHeaders(b"Content-Type", [b"text/plain"])
+        i = Headers()
+        i.addRawHeader(b"CONTENT-TYPE", b"text/html")
+        [first] = h._rawHeaders.keys()
+        [second] = i._rawHeaders.keys()
+        self.assertEqual(first, b"content-type")
+        self.assertIs(first, second)
+
+
+    def test_nameCacheBounded(self):
+        """
+        The cache of lowercase header names stops growing once it holds
+        L{http_headers._MAX_CACHED_NAMES} entries, after which names are
+        still lowercased correctly.
+        """
+        self.patch(http_headers, "_lowercaseNames", {})
+        self.patch(http_headers, "_MAX_CACHED_NAMES", 4)
+        h = Headers()
+        for i in range(10):
+            h.setRawHeaders(b"X-Header-" + intToBytes(i), [b"value"])
+        self.assertEqual(len(http_headers._lowercaseNames), 4)
+        self.assertEqual(
+            sorted(h._rawHeaders.keys()),
+            sorted([b"x-header-" + intToBytes(i) for i in range(10)]))
+
+
+    def test_toWire(self):
+        """
+        L{Headers._toWire} serializes all headers as header lines with their
+        canonical names, one line for each value.
+        """
+        h = Headers()
+        h.setRawHeaders(b"test", [b"lemurs", b"koalas"])
+        h.setRawHeaders(b"www-authenticate", [b"basic"])
+        lines = h._toWire().split(b"\r\n")
+        self.assertEqual(lines[-1], b"")
+        self.assertEqual(
+            sorted(lines[:-1]),
+            [b"Test: koalas", b"Test: lemurs", b"WWW-Authenticate: basic"])
+        self.assertEqual(Headers()._toWire(), b"")
+
+
+    def test_toWireCaseMappings(self):
+        """
+        L{Headers._toWire} honours C{_caseMappings} overridden by a subclass,
+        without affecting other L{Headers} instances.
+        """
+        class ShoutingHeaders(Headers):
+            _caseMappings = {b"test": b"TEST"}
+        h = ShoutingHeaders({b"test": [b"lemurs"]})
+        self.assertEqual(h._toWire(), b"TEST: lemurs\r\n")
+        h = Headers({b"test": [b"lemurs"]})
+        self.assertEqual(h._toWire(), b"Test: lemurs\r\n")
+
+
+    def test_toWireNonBytes(self):
+        """
+        L{Headers._toWire} raises L{TypeError} if a header value is not
+        C{bytes}.
+        """
+        h = Headers()
+        h.setRawHeaders(b"test", [10])
+        self.assertRaises(TypeError, h._toWire)
+        h.setRawHeaders(b"test", [u"lemurs"])
+        self.assertRaises(TypeError, h._toWire)
+
+
 
 class HeaderDictTests(TestCase):
     """
@@ -0,0 +1,180 @@
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Tests for L{twisted.web._multipart}.
+"""
+
+from __future__ import division, absolute_import
+
+from twisted.trial.unittest import TestCase
+from twisted.web._multipart import MultipartParser, MalformedMultipartError
+
+
+BODY = (
+    b'This is the preamble.\r\n'
+    b'--AaB03x\r\n'
+    b'Content-Disposition: form-data; name="field"\r\n'
+    b'\r\n'
+    b'value\r\n'
+    b'--AaB03x\r\n'
+    b'Content-Disposition: form-data; name="file"; filename="a.txt"\r\n'
+    b'Content-Type: text/plain\r\n'
+    b'\r\n'
+    b'first line\r\n'
+    b'\r\n'
+    b'--AaB03 is not the boundary\r\n'
+    b'--AaB03x--\r\n'
+    b'This is the epilogue.\r\n')
+
+PARTS = [
+    ([(b'Content-Disposition', [b'form-data; name="field"'])], b'value'),
+    ([(b'Content-Disposition', [b'form-data; name="file"; filename="a.txt"']),
+      (b'Content-Type', [b'text/plain'])],
+     b'first line\r\n\r\n--AaB03 is not the boundary')]
+
+
+
+class MultipartParserTests(TestCase):
+    """
+    Tests for L{MultipartParser}.
+    """
+    def setUp(self):
+        self.parts = []
+        self.finished = []
+        self.parser = MultipartParser(
+            b'AaB03x', self._partReceived, self._dataReceived,
+            self._partFinished)
+
+
+    def _partReceived(self, headers):
+        self.parts.append((sorted(headers.getAllRawHeaders()), []))
+
+
+    def _dataReceived(self, data):
+        self.assertTrue(data)
+        self.parts[-1][1].append(data)
+
+
+    def _partFinished(self):
+        self.finished.append(len(self.parts))
+
+
+    def _results(self):
+        return [(headers, b''.join(data)) for (headers, data) in self.parts]
+
+
+    def test_wholeBody(self):
+        """
+        L{MultipartParser} delivers the headers and content of each part of a
+        body given to it at once, skipping the preamble and the epilogue.
+        """
+        self.parser.dataReceived(BODY)
+        self.parser.noMoreData()
+        self.assertEqual(self._results(), PARTS)
+        self.assertEqual(self.finished, [1, 2])
+
+
+    def test_byteAtATime(self):
+        """
+        L{MultipartParser} delivers the same parts when the body is given to
+        it one byte at a time.
+        """
+        for i in range(len(BODY)):
+            self.parser.dataReceived(BODY[i:i + 1])
+        self.parser.noMoreData()
+        self.assertEqual(self._results(), PARTS)
+        self.assertEqual(self.finished, [1, 2])
+
+
+    def test_contentDelivered(self):
+        """
+        L{MultipartParser} delivers the content of a part as it is received,
+        holding back only what might be the start of a delimiter.
+        """
+        self.parser.dataReceived(
+            b'--AaB03x\r\n'
+            b'Content-Disposition: form-data; name="big"\r\n'
+            b'\r\n' + b'x' * 1000)
+        self.assertEqual(
+            len(b''.join(self.parts[0][1])), 1000 - len(b'\n--AaB03x'))
+
+
+    def test_bareLineFeeds(self):
+        """
+        Lines in the body may be terminated by a bare LF.
+        """
+        self.parser.dataReceived(BODY.replace(b'\r\n', b'\n'))
+        self.parser.noMoreData()
+        self.assertEqual(
+            self._results(),
+            [(headers, content.replace(b'\r\n', b'\n'))
+             for (headers, content) in PARTS])
+
+
+    def test_emptyPart(self):
+        """
+        A part may have no headers and no content.
+        """
+        self.parser.dataReceived(b'--AaB03x\r\n\r\n\r\n--AaB03x--')
+        self.parser.noMoreData()
+        self.assertEqual(self._results(), [([], b'')])
+        self.assertEqual(self.finished, [1])
+
+
+    def test_continuationLine(self):
+        """
+        A part header may be continued on following lines which begin with
+        whitespace.
+        """
+        self.parser.dataReceived(
+            b'--AaB03x\r\n'
+            b'Content-Disposition: form-data;\r\n'
+            b'\tname="field"\r\n'
+            b'\r\n'
+            b'value\r\n'
+            b'--AaB03x--\r\n')
+        self.assertEqual(
+            self._results(),
+            [([(b'Content-Disposition', [b'form-data; name="field"'])],
+              b'value')])
+
+
+    def test_missingCloseBoundary(self):
+        """
+        L{MultipartParser.noMoreData} raises L{MalformedMultipartError} if
+        the close boundary has not been received.
+        """
+        self.parser.dataReceived(BODY[:BODY.index(b'--AaB03x--')])
+        self.assertRaises(MalformedMultipartError, self.parser.noMoreData)
+
+
+    def test_invalidHeader(self):
+        """
+        L{MultipartParser.dataReceived} raises L{MalformedMultipartError} for
+        a part header line without a colon.
+        """
+        self.assertRaises(
+            MalformedMultipartError, self.parser.dataReceived,
+            b'--AaB03x\r\nnot a header\r\n\r\n')
+
+
+    def test_headersTooLong(self):
+        """
+        L{MultipartParser.dataReceived} raises L{MalformedMultipartError} if
+        the headers of a part are longer than C{maxHeaderSize}.
+        """
+        self.parser.maxHeaderSize = 100
+        self.assertRaises(
+            MalformedMultipartError, self.parser.dataReceived,
+            b'--AaB03x\r\nX-Long: ' + b'x' * 100)
+
+
+    def test_dataAfterBoundary(self):
+        """
+        L{MultipartParser.dataReceived} raises L{MalformedMultipartError} if
+        a boundary line continues with anything but whitespace.
+        """
+        self.assertRaises(
+            MalformedMultipartError, self.parser.dataReceived,
+            b'--AaB03x junk\r\n\r\n')
@@ -6,14 +6,25 @@ Test for L{twisted.web.proxy}.
 """
 
 from twisted.trial.unittest import TestCase
+from twisted.python.failure import Failure
+from twisted.internet.defer import Deferred
+from twisted.internet.error import ConnectionDone, ConnectionRefusedError
 from twisted.test.proto_helpers import StringTransportWithDisconnection
+from twisted.test.proto_helpers import StringTransport
 from twisted.test.proto_helpers import MemoryReactor
 
 from twisted.web.resource import Resource
-from twisted.web.server import Site
+from twisted.web.server import Site, Request
+from twisted.web.http_headers import Headers
+from twisted.web.iweb import UNKNOWN_LENGTH
+from twisted.web.client import Response
+from twisted.web._newclient import TransportProxyProducer
 from twisted.web.proxy import ReverseProxyResource, ProxyClientFactory
 from twisted.web.proxy import ProxyClient, ProxyRequest, ReverseProxyRequest
+from twisted.web.proxy import StreamingReverseProxyResource
+from twisted.web.proxy import LeastConnectionsBalancer
 from twisted.web.test.test_web import DummyRequest
+from twisted.web.test import requesthelper
 
 
 class ReverseProxyResourceTests(TestCase):
@@ -98,6 +109,435 @@ class ReverseProxyResourceTests(TestCase):
 
 
 
+class LeastConnectionsBalancerTests(TestCase):
+    """
+    Tests for L{LeastConnectionsBalancer}.
+    """
+
+    def test_noUpstreams(self):
+        """
+        A balancer needs at least one upstream server.
+        """
+        self.assertRaises(ValueError, LeastConnectionsBalancer, [])
+
+
+    def test_roundRobinWhenEqual(self):
+        """
+        Servers with the same number of active requests are chosen in turn.
+        """
+        balancer = LeastConnectionsBalancer([("a", 80), ("b", 80), ("c", 80)])
+        chosen = []
+        for i in range(6):
+            upstream = balancer.acquire()
+            chosen.append(upstream.host)
+            balancer.release(upstream)
+        self.assertEqual(chosen, ["a", "b", "c", "a", "b", "c"])
+
+
+    def test_leastConnections(self):
+        """
+        The server with the fewest active requests is chosen.
+        """
+        balancer = LeastConnectionsBalancer([("a", 80), ("b", 80)])
+        first = balancer.acquire()
+        second = balancer.acquire()
+        balancer.acquire()
+        balancer.release(second)
+        self.assertEqual(
+            [u.active for u in balancer.upstreams], [2, 0])
+        self.assertIs(balancer.acquire(), second)
+        self.assertIs(balancer.acquire(), second)
+        self.assertEqual(
+            [u.active for u in balancer.upstreams], [2, 2])
+        balancer.release(first)
+        self.assertIs(balancer.acquire(), first)
+
+
+
+class FakeAgent(object):
+    """
+    An agent which records requests and returns L{Deferred}s for the test to
+    fire.
+
+    @ivar requests: A C{list} of C{(method, uri, headers, bodyProducer,
+        deferred)} tuples.
+
+    @ivar cancelled: A C{list} of the L{Deferred}s which were cancelled.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.cancelled = []
+
+
+    def request(self, method, uri, headers=None, bodyProducer=None):
+        d = Deferred(self.cancelled.append)
+        self.requests.append((method, uri, headers, bodyProducer, d))
+        return d
+
+
+
+class StreamingReverseProxyResourceTests(TestCase):
+    """
+    Tests for L{StreamingReverseProxyResource}.
+    """
+
+    def setUp(self):
+        self.agent = FakeAgent()
+        self.resource = StreamingReverseProxyResource(
+            [("127.0.0.1", 1234), ("127.0.0.2", 80)], "/path",
+            MemoryReactor(), self.agent)
+        root = Resource()
+        root.putChild('index', self.resource)
+        self.site = Site(root)
+        self.channel = self.site.buildProtocol(None)
+        self.transport = StringTransportWithDisconnection()
+        self.transport.protocol = self.channel
+        self.channel.makeConnection(self.transport)
+        self.addCleanup(
+            self.channel.connectionLost, Failure(ConnectionDone()))
+
+
+    def _respond(self, headers=None):
+        """
+        Answer the oldest upstream request with a response whose body the
+        test delivers.
+        """
+        upstreamTransport = StringTransport()
+        response = Response(
+            ('HTTP', 1, 1), 200, 'OK', Headers(headers or {}),
+            TransportProxyProducer(upstreamTransport))
+        self.agent.requests.pop(0)[-1].callback(response)
+        return response, upstreamTransport
+
+
+    def test_request(self):
+        """
+        L{StreamingReverseProxyResource.render} requests the corresponding
+        path and query from an upstream server through its agent, with the
+        end-to-end request headers and the upstream I{Host}.
+        """
+        self.channel.dataReceived(
+            "GET /index/foo?bar=baz HTTP/1.1\r\nAccept: text/html\r\n"
+            "Connection: keep-alive, X-Private\r\nX-Private: 1\r\n\r\n")
+        [(method, uri, headers, body, d)] = self.agent.requests
+        self.assertEqual(method, "GET")
+        self.assertEqual(uri, "http://127.0.0.1:1234/path/foo?bar=baz")
+        self.assertEqual(
+            sorted(headers.getAllRawHeaders()),
+            [("Accept", ["text/html"]), ("Host", ["127.0.0.1:1234"])])
+        self.assertIdentical(body, None)
+
+
+    def test_requestBody(self):
+        """
+        If the site does not stream request bodies, a request body is sent
+        upstream from the request's content file.
+        """
+        self.channel.dataReceived(
+            "POST /index HTTP/1.1\r\nContent-Length: 5\r\n\r\nhello")
+        [(method, uri, headers, body, d)] = self.agent.requests
+        self.assertEqual(method, "POST")
+        self.assertEqual(body.length, 5)
+        self.assertEqual(body._inputFile.read(), "hello")
+        self.assertFalse(headers.hasHeader("content-length"))
+
+
+    def test_requestContentNotClosed(self):
+        """
+        The request's content file is left open when the producer sending it
+        upstream closes its file.
+        """
+        request = self._makeRequest()
+        request.method = "POST"
+        request.content.write("hello")
+        self.resource.render(request)
+        [(method, uri, headers, body, d)] = self.agent.requests
+        body._inputFile.close()
+        self.assertFalse(request.content.closed)
+
+
+    def test_balanced(self):
+        """
+        Concurrent requests are distributed between upstream servers.
+        """
+        self.resource.render(self._makeRequest())
+        self.resource.render(self._makeRequest())
+        self.assertEqual(
+            [request[1] for request in self.agent.requests],
+            ["http://127.0.0.1:1234/path", "http://127.0.0.2:80/path"])
+        self.assertEqual(
+            [u.active for u in self.resource.balancer.upstreams], [1, 1])
+
+
+    def _makeRequest(self):
+        request = Request(requesthelper.DummyChannel(), False)
+        request.gotLength(0)
+        request.method = "GET"
+        request.uri = "/index"
+        request.clientproto = "HTTP/1.1"
+        return request
+
+
+    def test_streamResponse(self):
+        """
+        The response status, end-to-end headers and body are relayed to the
+        client as the body arrives, the upstream connection is registered as
+        a producer with the request, and the upstream server is released
+        once the body is complete.
+        """
+        self.channel.dataReceived("GET /index HTTP/1.1\r\n\r\n")
+        response, upstreamTransport = self._respond(
+            {"content-type": ["text/plain"], "keep-alive": ["timeout=5"]})
+        self.assertIdentical(
+            self.transport.producer._producer, upstreamTransport)
+        response._bodyDataReceived("first ")
+        self.assertIn("first ", self.transport.value())
+        response._bodyDataReceived("second")
+        response._bodyDataFinished()
+        written = self.transport.value()
+        self.assertTrue(written.startswith("HTTP/1.1 200 OK\r\n"))
+        self.assertIn("Content-Type: text/plain\r\n", written)
+        self.assertNotIn("Keep-Alive", written)
+        self.assertTrue(written.endswith(
+            "6\r\nfirst \r\n6\r\nsecond\r\n0\r\n\r\n"))
+        self.assertIdentical(self.transport.producer, None)
+        self.assertEqual(
+            [u.active for u in self.resource.balancer.upstreams], [0, 0])
+
+
+    def test_backPressure(self):
+        """
+        When the client transport pauses the request's producer, the
+        upstream connection is paused.
+        """
+        self.channel.dataReceived("GET /index HTTP/1.1\r\n\r\n")
+        response, upstreamTransport = self._respond()
+        self.transport.producer.pauseProducing()
+        self.assertEqual(upstreamTransport.producerState, 'paused')
+        self.transport.producer.resumeProducing()
+        self.assertEqual(upstreamTransport.producerState, 'producing')
+
+
+    def test_truncatedResponse(self):
+        """
+        If the upstream response body fails, the client connection is closed
+        so the client does not mistake the response for a complete one.
+        """
+        self.channel.dataReceived("GET /index HTTP/1.1\r\n\r\n")
+        response, upstreamTransport = self._respond()
+        response._bodyDataReceived("partial")
+        response._bodyDataFinished(Failure(ConnectionRefusedError()))
+        self.assertEqual(len(self.flushLoggedErrors(ConnectionRefusedError)),
+                         1)
+        self.assertFalse(self.transport.connected)
+        self.assertTrue(self.transport.value().endswith("7\r\npartial\r\n"))
+        self.assertEqual(
+            [u.active for u in self.resource.balancer.upstreams], [0, 0])
+
+
+    def test_upstreamFailure(self):
+        """
+        If the upstream request fails, a I{Bad Gateway} response is sent and
+        the upstream server is released.
+        """
+        self.channel.dataReceived("GET /index HTTP/1.1\r\n\r\n")
+        self.agent.requests.pop()[-1].errback(ConnectionRefusedError())
+        self.assertEqual(len(self.flushLoggedErrors(ConnectionRefusedError)),
+                         1)
+        self.assertTrue(self.transport.value().startswith(
+                "HTTP/1.1 502 Bad gateway\r\n"))
+        self.assertEqual(
+            [u.active for u in self.resource.balancer.upstreams], [0, 0])
+
+
+    def test_clientLostBeforeResponse(self):
+        """
+        If the client goes away before the upstream response arrives, the
+        upstream request is cancelled.
+        """
+        self.channel.dataReceived("GET /index HTTP/1.1\r\n\r\n")
+        d = self.agent.requests[0][-1]
+        self.channel.connectionLost(Failure(ConnectionDone()))
+        self.assertEqual(self.agent.cancelled, [d])
+        self.assertEqual(
+            [u.active for u in self.resource.balancer.upstreams], [0, 0])
+
+
+    def test_responseAfterClientLost(self):
+        """
+        If the upstream response arrives even though the client has gone
+        away, delivery of its body is stopped.
+        """
+        self.channel.dataReceived("GET /index HTTP/1.1\r\n\r\n")
+        upstreamTransport = StringTransport()
+        response = Response(
+            ('HTTP', 1, 1), 200, 'OK', Headers(),
+            TransportProxyProducer(upstreamTransport))
+        self.agent.requests[0][-1]._canceller = (
+            lambda d: d.callback(response))
+        self.channel.connectionLost(Failure(ConnectionDone()))
+        self.assertEqual(upstreamTransport.producerState, 'stopped')
+        self.assertEqual(
+            [u.active for u in self.resource.balancer.upstreams], [0, 0])
+
+
+    def test_clientLostDuringBody(self):
+        """
+        If the client goes away while the response body is being relayed,
+        the upstream connection is stopped.
+        """
+        self.channel.dataReceived("GET /index HTTP/1.1\r\n\r\n")
+        response, upstreamTransport = self._respond()
+        response._bodyDataReceived("partial")
+        self.channel.connectionLost(Failure(ConnectionDone()))
+        self.assertEqual(upstreamTransport.producerState, 'stopped')
+
+
+    def _startStreaming(self, body=""):
+        """
+        Send the headers of a request with a ten byte body, and C{body}, to a
+        site which streams request bodies.
+
+        @return: The producer of the upstream request body.
+        """
+        self.site.streamRequestBodies = True
+        self.channel.dataReceived(
+            "POST /index HTTP/1.1\r\nContent-Length: 10\r\n\r\n" + body)
+        [(method, uri, headers, bodyProducer, d)] = self.agent.requests
+        self.assertEqual(method, "POST")
+        self.assertEqual(uri, "http://127.0.0.1:1234/path")
+        self.assertFalse(headers.hasHeader("content-length"))
+        return bodyProducer
+
+
+    def test_streamRequestBody(self):
+        """
+        If the site streams request bodies, the upstream request starts
+        before the body is received, and the body is sent upstream as it
+        arrives.  The client connection is paused until the upstream request
+        starts, and the response is relayed once the whole body is received.
+        """
+        bodyProducer = self._startStreaming("hello")
+        self.assertEqual(bodyProducer.length, 10)
+        self.assertEqual(self.transport.producerState, 'paused')
+
+        upstream = StringTransport()
+        finished = bodyProducer.startProducing(upstream)
+        self.assertEqual(upstream.value(), "hello")
+        self.assertEqual(self.transport.producerState, 'producing')
+        self.channel.dataReceived("world")
+        self.assertEqual(upstream.value(), "helloworld")
+        self.assertEqual(self.successResultOf(finished), None)
+
+        response, upstreamTransport = self._respond()
+        response._bodyDataReceived("done")
+        response._bodyDataFinished()
+        written = self.transport.value()
+        self.assertTrue(written.startswith("HTTP/1.1 200 OK\r\n"))
+        self.assertTrue(written.endswith("4\r\ndone\r\n0\r\n\r\n"))
+        self.assertEqual(
+            [u.active for u in self.resource.balancer.upstreams], [0, 0])
+
+
+    def test_streamChunkedRequestBody(self):
+        """
+        A chunked request body is streamed upstream with an unknown length.
+        """
+        self.site.streamRequestBodies = True
+        self.channel.dataReceived(
+            "POST /index HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n"
+            "5\r\nhello\r\n")
+        [(method, uri, headers, bodyProducer, d)] = self.agent.requests
+        self.assertIdentical(bodyProducer.length, UNKNOWN_LENGTH)
+        upstream = StringTransport()
+        finished = bodyProducer.startProducing(upstream)
+        self.channel.dataReceived("0\r\n\r\n")
+        self.assertEqual(upstream.value(), "hello")
+        self.assertEqual(self.successResultOf(finished), None)
+
+
+    def test_responseWaitsForRequestBody(self):
+        """
+        A response which arrives before the whole request body is received
+        is relayed once the request is rendered.
+        """
+        bodyProducer = self._startStreaming()
+        bodyProducer.startProducing(StringTransport())
+        response, upstreamTransport = self._respond()
+        response._bodyDataReceived("done")
+        response._bodyDataFinished()
+        self.assertEqual(self.transport.value(), "")
+        self.channel.dataReceived("helloworld")
+        written = self.transport.value()
+        self.assertTrue(written.startswith("HTTP/1.1 200 OK\r\n"))
+        self.assertTrue(written.endswith("4\r\ndone\r\n0\r\n\r\n"))
+
+
+    def test_streamRequestBodyBackPressure(self):
+        """
+        When the upstream connection pauses the request body producer, the
+        client connection is paused.
+        """
+        bodyProducer = self._startStreaming()
+        finished = bodyProducer.startProducing(StringTransport())
+        bodyProducer.pauseProducing()
+        self.assertEqual(self.transport.producerState, 'paused')
+        bodyProducer.resumeProducing()
+        self.assertEqual(self.transport.producerState, 'producing')
+        self.channel.dataReceived("helloworld")
+        self.assertEqual(self.successResultOf(finished), None)
+
+
+    def test_streamRequestBodyUpstreamFailure(self):
+        """
+        If the upstream request fails while the request body is being
+        received, the rest of the body is discarded and a I{Bad Gateway}
+        response is sent once it has been received.
+        """
+        bodyProducer = self._startStreaming("hello")
+        self.agent.requests.pop()[-1].errback(ConnectionRefusedError())
+        self.assertEqual(self.transport.producerState, 'producing')
+        self.assertEqual(bodyProducer._buffer, [])
+        self.assertEqual(self.transport.value(), "")
+
+        self.channel.dataReceived("world")
+        self.assertEqual(len(self.flushLoggedErrors(ConnectionRefusedError)),
+                         1)
+        self.assertTrue(self.transport.value().startswith(
+                "HTTP/1.1 502 Bad gateway\r\n"))
+        self.assertEqual(
+            [u.active for u in self.resource.balancer.upstreams], [0, 0])
+
+
+    def test_clientLostDuringRequestBody(self):
+        """
+        If the client goes away while the request body is being streamed
+        upstream, the upstream request body fails, the upstream request is
+        cancelled and the upstream server is released.
+        """
+        bodyProducer = self._startStreaming("hello")
+        d = self.agent.requests[0][-1]
+        finished = bodyProducer.startProducing(StringTransport())
+        self.channel.connectionLost(Failure(ConnectionDone()))
+        self.failureResultOf(finished, ConnectionDone)
+        self.assertEqual(self.agent.cancelled, [d])
+        self.assertEqual(
+            [u.active for u in self.resource.balancer.upstreams], [0, 0])
+
+
+    def test_getChild(self):
+        """
+        Children share the agent and balancer of their parent and extend its
+        path.
+        """
+        child = self.resource.getChild('a b', None)
+        self.assertEqual(child.path, "/path/a%20b")
+        self.assertIdentical(child.agent, self.agent)
+        self.assertIdentical(child.balancer, self.resource.balancer)
+
+
+
 class DummyChannel(object):
     """
     A dummy HTTP channel, that does nothing but holds a transport and saves
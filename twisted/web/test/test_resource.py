@@ -10,7 +10,7 @@ from twisted.trial.unittest import TestCase
 from twisted.web.error import UnsupportedMethod
 from twisted.web.resource import (
     NOT_FOUND, FORBIDDEN, Resource, ErrorPage, NoResource, ForbiddenResource,
-    getChildForRequest)
+    getChildForRequest, RoutingIndex)
 from twisted.web.test.requesthelper import DummyRequest
 
 
@@ -259,3 +259,151 @@ class GetChildForRequestTests(TestCase):
         self.assertIdentical(child, getChildForRequest(root, request))
         self.assertEqual(request.prepath, [b"foo"])
         self.assertEqual(request.postpath, [b"bar"])
+
+
+
+class CountingResource(Resource):
+    """
+    A L{Resource} which counts calls to its C{getChildWithDefault} method.
+
+    @ivar lookups: The number of calls to C{getChildWithDefault}.
+    """
+    lookups = 0
+
+    def getChildWithDefault(self, path, request):
+        self.lookups += 1
+        return Resource.getChildWithDefault(self, path, request)
+
+
+
+class RoutingIndexTests(TestCase):
+    """
+    Tests for L{RoutingIndex}.
+    """
+    def setUp(self):
+        """
+        Create a hierarchy with static children two levels deep, below which
+        children are created dynamically.
+        """
+        self.root = Resource()
+        self.foo = Resource()
+        self.bar = DynamicChildren()
+        self.root.putChild(b"foo", self.foo)
+        self.foo.putChild(b"bar", self.bar)
+        self.index = RoutingIndex(self.root)
+
+
+    def test_staticPath(self):
+        """
+        L{RoutingIndex.getChildForRequest} finds static children and moves the
+        traversed segments from C{postpath} to C{prepath}.
+        """
+        request = DummyRequest([b"foo", b"bar"])
+        self.assertIdentical(
+            self.index.getChildForRequest(request), self.bar)
+        self.assertEqual(request.prepath, [b"foo", b"bar"])
+        self.assertEqual(request.postpath, [])
+
+
+    def test_dynamicChild(self):
+        """
+        Traversal falls back to C{getChildWithDefault} at the first segment
+        which is not a static child.
+        """
+        request = DummyRequest([b"foo", b"bar", b"baz"])
+        child = self.index.getChildForRequest(request)
+        self.assertIsInstance(child, DynamicChild)
+        self.assertEqual(child.path, b"baz")
+        self.assertEqual(request.prepath, [b"foo", b"bar", b"baz"])
+
+
+    def test_missingChild(self):
+        """
+        A segment which is not a static child of a L{Resource} which does not
+        override C{getChild} leads to a L{NoResource}, as it does without an
+        index.
+        """
+        request = DummyRequest([b"quux", b"foo"])
+        self.assertIsInstance(
+            self.index.getChildForRequest(request), NoResource)
+        self.assertEqual(request.prepath, [b"quux", b"foo"])
+
+
+    def test_leafResource(self):
+        """
+        Traversal stops at the first leaf resource, leaving the remaining
+        segments in C{postpath}.
+        """
+        self.foo.isLeaf = True
+        request = DummyRequest([b"foo", b"bar"])
+        self.assertIdentical(
+            self.index.getChildForRequest(request), self.foo)
+        self.assertEqual(request.prepath, [b"foo"])
+        self.assertEqual(request.postpath, [b"bar"])
+
+
+    def test_customLookup(self):
+        """
+        The C{getChildWithDefault} method of resources which override it is
+        called, rather than looking their children up in the index.
+        """
+        counting = CountingResource()
+        counting.putChild(b"child", self.foo)
+        self.root.putChild(b"counting", counting)
+        request = DummyRequest([b"counting", b"child", b"bar"])
+        self.assertIdentical(
+            self.index.getChildForRequest(request), self.bar)
+        self.assertEqual(counting.lookups, 1)
+        self.assertEqual(request.prepath, [b"counting", b"child", b"bar"])
+
+
+    def test_putChildInvalidates(self):
+        """
+        Children added with L{Resource.putChild} after the index has been used
+        are found by it.
+        """
+        self.index.getChildForRequest(DummyRequest([b"foo"]))
+        baz = Resource()
+        self.foo.putChild(b"baz", baz)
+        self.assertIdentical(
+            self.index.getChildForRequest(DummyRequest([b"foo", b"baz"])),
+            baz)
+
+
+    def test_delEntityInvalidates(self):
+        """
+        Children removed with L{Resource.delEntity} after the index has been
+        used are no longer found by it.
+        """
+        self.index.getChildForRequest(DummyRequest([b"foo"]))
+        self.root.delEntity(b"foo")
+        self.assertIsInstance(
+            self.index.getChildForRequest(DummyRequest([b"foo"])), NoResource)
+
+
+    def test_otherResourceChanged(self):
+        """
+        Adding a child to a resource which is not on the path being traversed
+        does not cause the index to be rebuilt.
+        """
+        other = Resource()
+        self.root.putChild(b"other", other)
+        self.index.getChildForRequest(DummyRequest([b"foo", b"bar"]))
+        rootNode = self.index._rootNode
+        other.putChild(b"baz", Resource())
+        Resource().putChild(b"baz", Resource())
+        self.assertIdentical(
+            self.index.getChildForRequest(DummyRequest([b"foo", b"bar"])),
+            self.bar)
+        self.assertIdentical(self.index._rootNode, rootNode)
+
+
+    def test_cycle(self):
+        """
+        A resource which is its own descendant can be indexed and traversed.
+        """
+        self.foo.putChild(b"", self.root)
+        request = DummyRequest([b"foo", b"", b"foo", b"bar"])
+        self.assertIdentical(
+            self.index.getChildForRequest(request), self.bar)
+        self.assertEqual(request.postpath, [])
@@ -9,6 +9,7 @@ import inspect
 import mimetypes
 import os
 import re
+import zlib
 
 
 from io import BytesIO as StringIO
@@ -16,6 +17,7 @@ from io import BytesIO as StringIO
 from zope.interface.verify import verifyObject
 
 from twisted.internet import abstract, interfaces
+from twisted.internet.task import Clock
 from twisted.python.runtime import platform
 from twisted.python.filepath import FilePath
 from twisted.python import log
@@ -420,6 +422,384 @@ class StaticFileTests(TestCase):
 
 
 
+class EncodedRepresentationTests(TestCase):
+    """
+    Tests for L{File}'s serving of pre-compressed and cached compressed
+    representations.
+    """
+    content = b"body { color: black; }\n" * 100
+
+    def setUp(self):
+        self.base = FilePath(self.mktemp())
+        self.base.makedirs()
+        self.path = self.base.child("style.css")
+        self.path.setContent(self.content)
+        self.compressed = self.base.child("style.css.gz")
+        self.compressed.setContent(b"precompressed")
+
+
+    def _request(self, acceptEncoding=None, method=b'GET'):
+        request = DummyRequest([b''])
+        request.method = method
+        if acceptEncoding is not None:
+            request.headers[b'accept-encoding'] = acceptEncoding
+        return request
+
+
+    def _get(self, file, request):
+        self.successResultOf(_render(file, request))
+        return b''.join(request.written)
+
+
+    def test_precompressedSibling(self):
+        """
+        If the client accepts an encoding listed in
+        L{File.precompressedEncodings} and a sibling file with the matching
+        extension exists, its contents are served with the corresponding
+        I{Content-Encoding}.
+        """
+        file = static.File(self.path.path)
+        file.precompressedEncodings = (b'gzip',)
+        request = self._request(b'deflate, gzip')
+        self.assertEqual(self._get(file, request), b"precompressed")
+        self.assertEqual(request.outgoingHeaders[b'content-encoding'], b'gzip')
+        self.assertEqual(request.outgoingHeaders[b'content-type'], b'text/css')
+        self.assertEqual(request.outgoingHeaders[b'content-length'], b'13')
+        self.assertEqual(request.outgoingHeaders[b'vary'], b'accept-encoding')
+
+
+    def test_precompressedNotAccepted(self):
+        """
+        The unencoded file is served if the client does not accept the
+        encoding of the sibling file, or explicitly refuses it.
+        """
+        file = static.File(self.path.path)
+        file.precompressedEncodings = (b'gzip',)
+        for acceptEncoding in [None, b'deflate', b'gzip;q=0']:
+            request = self._request(acceptEncoding)
+            self.assertEqual(self._get(file, request), self.content)
+            self.assertNotIn(b'content-encoding', request.outgoingHeaders)
+            self.assertEqual(
+                request.outgoingHeaders[b'vary'], b'accept-encoding')
+
+
+    def test_precompressedDisabled(self):
+        """
+        By default sibling files are not considered.
+        """
+        file = static.File(self.path.path)
+        request = self._request(b'gzip')
+        self.assertEqual(self._get(file, request), self.content)
+        self.assertNotIn(b'content-encoding', request.outgoingHeaders)
+        self.assertNotIn(b'vary', request.outgoingHeaders)
+
+
+    def test_stalePrecompressed(self):
+        """
+        A sibling file older than the file itself is ignored.
+        """
+        self.compressed.changed()
+        os.utime(self.compressed.path, (0, 0))
+        file = static.File(self.path.path)
+        file.precompressedEncodings = (b'gzip',)
+        request = self._request(b'gzip')
+        self.assertEqual(self._get(file, request), self.content)
+
+
+    def test_rangeIgnoresEncoding(self):
+        """
+        Range requests are answered from the unencoded file.
+        """
+        file = static.File(self.path.path)
+        file.precompressedEncodings = (b'gzip',)
+        request = self._request(b'gzip')
+        request.headers[b'range'] = b'bytes=0-3'
+        self.assertEqual(self._get(file, request), self.content[:4])
+        self.assertNotIn(b'content-encoding', request.outgoingHeaders)
+
+
+    def test_precompressedHEAD(self):
+        """
+        A I{HEAD} request for a pre-compressed representation gets the
+        headers of that representation and no body.
+        """
+        file = static.File(self.path.path)
+        file.precompressedEncodings = (b'gzip',)
+        request = self._request(b'gzip', b'HEAD')
+        self.assertEqual(self._get(file, request), b'')
+        self.assertEqual(request.outgoingHeaders[b'content-encoding'], b'gzip')
+        self.assertEqual(request.outgoingHeaders[b'content-length'], b'13')
+
+
+    def test_compressionCache(self):
+        """
+        When no sibling file is available, a file is compressed through
+        L{File.compressionCache}, and a second request is served from the
+        cache without compressing the file again.
+        """
+        self.compressed.remove()
+        cache = static.CompressionCache()
+        compressions = []
+        original = cache._compress
+        def compress(data, encoding):
+            compressions.append(encoding)
+            return original(data, encoding)
+        cache._compress = compress
+
+        file = static.File(self.path.path)
+        file.compressionCache = cache
+        for i in range(2):
+            request = self._request(b'gzip')
+            body = self._get(file, request)
+            self.assertEqual(
+                zlib.decompress(body, 16 + zlib.MAX_WBITS), self.content)
+            self.assertEqual(
+                request.outgoingHeaders[b'content-encoding'], b'gzip')
+        self.assertEqual(compressions, [b'gzip'])
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.size, len(body))
+
+
+    def test_compressionCacheModified(self):
+        """
+        A change to the file on disk causes it to be compressed again.
+        """
+        cache = static.CompressionCache()
+        file = static.File(self.path.path)
+        file.compressionCache = cache
+        self._get(file, self._request(b'gzip'))
+        self.path.setContent(b"p { margin: 0; }")
+        os.utime(self.path.path, (1, 1))
+        body = self._get(file, self._request(b'gzip'))
+        self.assertEqual(
+            zlib.decompress(body, 16 + zlib.MAX_WBITS), b"p { margin: 0; }")
+
+
+    def test_compressionCacheIncompressible(self):
+        """
+        Files whose type is not listed in
+        L{CompressionCache.compressibleTypes}, or which are larger than
+        L{CompressionCache.maxFileSize}, are served unencoded.
+        """
+        cache = static.CompressionCache(maxFileSize=10)
+        file = static.File(self.path.path)
+        file.compressionCache = cache
+        request = self._request(b'gzip')
+        self.assertEqual(self._get(file, request), self.content)
+
+        image = self.base.child("image.png")
+        image.setContent(b"PNG")
+        file = static.File(image.path)
+        file.compressionCache = cache
+        request = self._request(b'gzip')
+        self.assertEqual(self._get(file, request), b"PNG")
+        self.assertEqual(len(cache), 0)
+
+
+    def test_compressionCacheBounded(self):
+        """
+        L{CompressionCache} discards the least recently used entries to keep
+        the total size of the compressed data within C{maxSize}.
+        """
+        cache = static.CompressionCache(maxSize=60)
+        first = self.base.child("first.txt")
+        first.setContent(os.urandom(30))
+        second = self.base.child("second.txt")
+        second.setContent(os.urandom(30))
+
+        cache.getEncoded(first, "text/plain", b'gzip')
+        encoded = cache.getEncoded(second, "text/plain", b'gzip')
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.size, len(encoded))
+        self.assertIs(cache.getEncoded(second, "text/plain", b'gzip'), encoded)
+
+
+
+    def test_createSimilarFile(self):
+        """
+        Children of a L{File} inherit its encoding configuration.
+        """
+        cache = static.CompressionCache()
+        file = static.File(self.base.path)
+        file.precompressedEncodings = (b'gzip',)
+        file.compressionCache = cache
+        child = file.getChild(b"style.css", DummyRequest([b'']))
+        self.assertEqual(child.precompressedEncodings, (b'gzip',))
+        self.assertIs(child.compressionCache, cache)
+
+
+
+class MetadataCacheTests(TestCase):
+    """
+    Tests for L{File}'s use of a L{MetadataCache}.
+    """
+    content = b"hello, world\n"
+
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = static.MetadataCache(ttl=5, reactor=self.clock)
+        self.base = FilePath(self.mktemp())
+        self.base.makedirs()
+        self.path = self.base.child("hello.txt")
+        self.path.setContent(self.content)
+        self.file = static.File(self.path.path)
+        self.file.metadataCache = self.cache
+        self.opened = []
+        original = self.file.openForReading
+        def openForReading():
+            self.opened.append(True)
+            return original()
+        self.file.openForReading = openForReading
+
+
+    def _get(self, method=b'GET'):
+        request = DummyRequest([b''])
+        request.method = method
+        self.tags = []
+        request.setETag = self.tags.append
+        self.successResultOf(_render(self.file, request))
+        return request, b''.join(request.written)
+
+
+    def test_contentCached(self):
+        """
+        The contents of a small file are read once and then served from
+        memory.
+        """
+        for i in range(2):
+            request, body = self._get()
+            self.assertEqual(body, self.content)
+            self.assertEqual(
+                request.outgoingHeaders[b'content-length'],
+                intToBytes(len(self.content)))
+        self.assertEqual(self.opened, [True])
+        self.assertEqual(self.cache.size, len(self.content))
+
+
+    def test_ttl(self):
+        """
+        A change to a file is noticed once its metadata has been cached for
+        longer than C{ttl} seconds.
+        """
+        self._get()
+        self.path.setContent(b"goodbye, world, for now\n")
+        self.assertEqual(self._get()[1], self.content)
+        self.clock.advance(5)
+        self.assertEqual(self._get()[1], b"goodbye, world, for now\n")
+        self.assertEqual(self.cache.size, 24)
+
+
+    def test_invalidate(self):
+        """
+        L{MetadataCache.invalidate} forgets what is cached about a file.
+        """
+        self._get()
+        self.path.setContent(b"changed")
+        self.cache.invalidate(self.path)
+        self.assertEqual(self._get()[1], b"changed")
+        self.assertEqual(self.cache.size, len(b"changed"))
+
+
+    def test_missing(self):
+        """
+        A file which does not exist is answered with I{Not Found}, also from
+        the cache, until it is created and C{ttl} seconds have passed.
+        """
+        self.path.remove()
+        for i in range(2):
+            request, body = self._get()
+            self.assertEqual(request.responseCode, http.NOT_FOUND)
+        self.path.setContent(self.content)
+        self.clock.advance(5)
+        self.assertEqual(self._get()[1], self.content)
+
+
+    def test_largeFile(self):
+        """
+        Files larger than C{maxFileSize} are opened for each request.
+        """
+        self.cache.maxFileSize = 4
+        self._get()
+        self._get()
+        self.assertEqual(self.opened, [True, True])
+        self.assertEqual(self.cache.size, 0)
+
+
+    def test_maxSize(self):
+        """
+        The least recently used files are discarded to keep the size of the
+        cached contents within C{maxSize}.
+        """
+        self.cache.maxSize = len(self.content) + 5
+        files = []
+        for name, content in [("other.txt", b"other"), ("third.txt", b"3")]:
+            path = self.base.child(name)
+            path.setContent(content)
+            files.append(static.File(path.path))
+        self._get()
+        self.cache.getContent(files[0], self.cache.lookup(files[0]))
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.size, len(self.content) + 5)
+        self.cache.getContent(files[1], self.cache.lookup(files[1]))
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.size, 6)
+
+
+    def test_etag(self):
+        """
+        Responses are tagged with a strong entity tag which changes when the
+        file does.
+        """
+        self._get()
+        [first] = self.tags
+        self.assertTrue(first.startswith(b'"'))
+        self._get()
+        self.assertEqual(self.tags, [first])
+        self.path.setContent(b"goodbye, world, for now\n")
+        self.clock.advance(5)
+        self._get()
+        self.assertNotEqual(self.tags, [first])
+
+
+    def test_notModified(self):
+        """
+        When L{http.Request.setETag} finds the entity tag matches, the
+        response has no body.
+        """
+        request = DummyRequest([b''])
+        request.setETag = lambda tag: http.CACHED
+        self.successResultOf(_render(self.file, request))
+        self.assertEqual(b''.join(request.written), b'')
+
+
+    def test_encodedETag(self):
+        """
+        An encoded representation is tagged with the entity tag of the file
+        and its encoding.
+        """
+        self.file.compressionCache = static.CompressionCache()
+        self.file.type = "text/plain"
+        self.file.encoding = None
+        request = DummyRequest([b''])
+        request.headers[b'accept-encoding'] = b'gzip'
+        tags = []
+        request.setETag = tags.append
+        self.successResultOf(_render(self.file, request))
+        etag = self.cache.lookup(self.path).etag
+        self.assertEqual(tags, [etag[:-1] + b'-gzip"'])
+
+
+    def test_createSimilarFile(self):
+        """
+        Children of a L{File} share its L{MetadataCache}.
+        """
+        file = static.File(self.base.path)
+        file.metadataCache = self.cache
+        child = file.getChild(b"hello.txt", DummyRequest([b'']))
+        self.assertIs(child.metadataCache, self.cache)
+
+
+
 class StaticMakeProducerTests(TestCase):
     """
     Tests for L{File.makeProducer}.
@@ -22,7 +22,7 @@ from twisted.web.iweb import ITemplateLoader
 from twisted.web.error import (FlattenerError, MissingTemplateLoader,
     MissingRenderMethod)
 
-from twisted.web.template import renderElement
+from twisted.web.template import renderElement, flattenString
 from twisted.web._element import UnexposedMethodError
 from twisted.web.test._util import FlattenTestCase
 from twisted.web.test.test_web import DummyRequest
@@ -256,6 +256,25 @@ class XMLLoaderTestsMixin(object):
     test_loadTwice.suppress = [_xmlFileSuppress]
 
 
+    def test_loadCompiled(self):
+        """
+        The loader compiles its document once and caches the result, which
+        is flattened in place of an L{Element}'s document, while
+        L{Element.render} still returns the loaded document.
+        """
+        loader = self.loaderFactory()
+        compiled = loader._loadCompiled()
+        self.assertEqual(compiled.parts, ['<p>Hello, world.</p>'])
+        self.assertIs(loader._loadCompiled(), compiled)
+        element = Element(loader=loader)
+        self.assertEqual(element.render(None), loader.load())
+        compiled.parts = ['<p>Compiled.</p>']
+        self.assertEqual(
+            self.successResultOf(flattenString(None, element)),
+            '<p>Compiled.</p>')
+    test_loadCompiled.suppress = [_xmlFileSuppress]
+
+
 
 class XMLStringLoaderTests(TestCase, XMLLoaderTestsMixin):
     """
@@ -715,6 +734,19 @@ class RenderElementTests(TestCase):
         return d
 
 
+    def test_fewWrites(self):
+        """
+        L{renderElement} writes the doctype in one call to the request's
+        C{write} method and the rendered L{Element} in another, rather than
+        writing each piece of the document separately.
+        """
+        element = TestElement()
+        renderElement(self.request, element)
+        self.assertEqual(
+            self.request.written,
+            ["<!DOCTYPE html>\n", "<p>Hello, world.</p>"])
+
+
     def test_simpleFailure(self):
         """
         L{renderElement} handles failures by writing a minimal
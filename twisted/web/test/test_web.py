@@ -13,10 +13,14 @@ from zope.interface.verify import verifyObject
 
 from twisted.python.compat import _PY3
 from twisted.python.filepath import FilePath
+from twisted.python.runtime import platform
+from twisted.python import failure
 from twisted.trial import unittest
 from twisted.internet import reactor
 from twisted.internet.address import IPv4Address
 from twisted.internet.task import Clock
+from twisted.test.proto_helpers import StringTransport
+from twisted.logger import Logger, LogLevel, formatEvent
 from twisted.web import server, resource
 from twisted.web import iweb, http, error
 
@@ -73,6 +77,27 @@ class SiteTest(unittest.TestCase):
             sres2, "Got the wrong resource.")
 
 
+    def test_routingIndex(self):
+        """
+        If L{Site.routingIndex} is set, L{Site.getResourceFor} uses it to find
+        the resource for the request.
+        """
+        sres1 = SimpleResource()
+        sres2 = SimpleResource()
+        sres1.putChild(b"", sres2)
+        site = server.Site(sres1)
+        site.routingIndex = resource.RoutingIndex(sres1)
+        found = []
+        def getChildForRequest(request):
+            found.append(request)
+            return resource.RoutingIndex.getChildForRequest(
+                site.routingIndex, request)
+        site.routingIndex.getChildForRequest = getChildForRequest
+        request = DummyRequest([b''])
+        self.assertIdentical(site.getResourceFor(request), sres2)
+        self.assertEqual(found, [request])
+
+
     def test_defaultRequestFactory(self):
         """
         L{server.Request} is the default request factory.
@@ -208,6 +233,270 @@ class SessionTests(unittest.TestCase):
 
 
 
+class SessionStoreTestsMixin(object):
+    """
+    Tests for L{iweb.ISessionStore} implementations.
+
+    Subclasses must implement C{makeStore}, returning a store which uses
+    C{self.clock}.
+    """
+    def setUp(self):
+        """
+        Create a site which uses the store under test.
+        """
+        self.clock = Clock()
+        self.site = server.Site(resource.Resource())
+        self.store = self.site.sessionStore = self.makeStore()
+
+
+    def test_interface(self):
+        """
+        The store provides L{iweb.ISessionStore}.
+        """
+        self.assertTrue(verifyObject(iweb.ISessionStore, self.store))
+
+
+    def test_makeAndGetSession(self):
+        """
+        L{server.Site.makeSession} creates a session with the store which
+        L{server.Site.getSession} can then find by its uid.
+        """
+        session = self.site.makeSession()
+        self.assertIsInstance(session, server.Session)
+        found = self.site.getSession(session.uid)
+        self.assertEqual(found.uid, session.uid)
+        self.assertEqual(self.site.sessions, {})
+
+
+    def test_unknownSession(self):
+        """
+        L{server.Site.getSession} raises L{KeyError} for an unknown uid.
+        """
+        self.assertRaises(KeyError, self.site.getSession, b'unknown')
+
+
+    def test_expire(self):
+        """
+        L{server.Session.expire} removes the session from the store.
+        """
+        session = self.site.makeSession()
+        session.expire()
+        self.assertRaises(KeyError, self.site.getSession, session.uid)
+
+
+    def test_timeout(self):
+        """
+        A session which has not been touched for its C{sessionTimeout} is no
+        longer found, and touching it postpones that.
+        """
+        session = self.site.makeSession()
+        self.clock.advance(session.sessionTimeout - 1)
+        self.site.getSession(session.uid).touch()
+        self.clock.advance(session.sessionTimeout - 1)
+        self.site.getSession(session.uid)
+        self.clock.advance(1)
+        self.assertRaises(KeyError, self.site.getSession, session.uid)
+
+
+    def test_noTimerPerSession(self):
+        """
+        Sessions in the store do not schedule their own expiration; a single
+        timer is used however many sessions there are.
+        """
+        for i in range(10):
+            self.site.makeSession()
+        self.assertEqual(len(self.clock.calls), 1)
+
+
+    def test_sweep(self):
+        """
+        The store's timer removes sessions which have timed out even if they
+        are never looked up again.
+        """
+        session = self.site.makeSession()
+        self.clock.pump([self.store.sweepInterval] *
+                        (session.sessionTimeout // self.store.sweepInterval))
+        self.assertRaises(KeyError, self.store.getSession,
+                          self.site, session.uid)
+
+
+    def test_stopSweeping(self):
+        """
+        C{stopSweeping} cancels the store's timer.
+        """
+        self.site.makeSession()
+        self.store.stopSweeping()
+        self.assertEqual(self.clock.calls, [])
+
+
+    def test_requestGetSession(self):
+        """
+        L{server.Request.getSession} creates a session in the store and sets a
+        cookie for it, and a later request with that cookie gets the same
+        session.
+        """
+        request = server.Request(DummyChannel(), False)
+        request.site = self.site
+        request.sitepath = []
+        session = request.getSession()
+        self.assertEqual(len(request.cookies), 1)
+
+        request = server.Request(DummyChannel(), False)
+        request.site = self.site
+        request.sitepath = []
+        request.received_cookies[b'TWISTED_SESSION'] = session.uid
+        self.assertEqual(request.getSession().uid, session.uid)
+
+
+
+class MemorySessionStoreTests(SessionStoreTestsMixin, unittest.TestCase):
+    """
+    Tests for L{server.MemorySessionStore}.
+    """
+    def makeStore(self):
+        """
+        @return: A L{server.MemorySessionStore} which uses C{self.clock}.
+        """
+        return server.MemorySessionStore(maxSessions=3, reactor=self.clock)
+
+
+    def test_maxSessions(self):
+        """
+        Creating more than C{maxSessions} sessions expires the least recently
+        used session.
+        """
+        expired = []
+        sessions = [self.site.makeSession() for i in range(3)]
+        for session in sessions:
+            session.notifyOnExpire(lambda session=session: expired.append(
+                    session))
+        sessions[0].touch()
+        self.site.makeSession()
+        self.assertEqual(expired, [sessions[1]])
+        self.assertEqual(len(self.store), 3)
+
+
+    def test_sameSession(self):
+        """
+        L{server.Site.getSession} returns the same L{server.Session} instance
+        which was created, with its components.
+        """
+        session = self.site.makeSession()
+        self.assertIdentical(self.site.getSession(session.uid), session)
+
+
+    def test_noSweepWhenEmpty(self):
+        """
+        Once all sessions have expired, the store's timer is cancelled.
+        """
+        self.site.makeSession().expire()
+        self.assertEqual(self.clock.calls, [])
+
+
+
+class FileSessionStoreTests(SessionStoreTestsMixin, unittest.TestCase):
+    """
+    Tests for L{server.FileSessionStore}.
+    """
+    def makeStore(self):
+        """
+        @return: A L{server.FileSessionStore} which uses C{self.clock} and a
+            new directory.
+        """
+        return server.FileSessionStore(
+            FilePath(self.mktemp()), reactor=self.clock)
+
+
+    def test_namespacesShared(self):
+        """
+        C{sessionNamespaces} saved by touching a session are seen by another
+        store, with another site, using the same directory.
+        """
+        session = self.site.makeSession()
+        session.sessionNamespaces[b'user'] = b'alice'
+        session.touch()
+
+        otherSite = server.Site(resource.Resource())
+        otherSite.sessionStore = server.FileSessionStore(
+            self.store.directory, reactor=self.clock)
+        found = otherSite.getSession(session.uid)
+        self.assertEqual(found.sessionNamespaces, {b'user': b'alice'})
+
+
+    def test_invalidUID(self):
+        """
+        A uid which could not have been generated by the site, such as one
+        which refers to a file outside the store's directory, is not found.
+        """
+        self.assertRaises(KeyError, self.site.getSession, b'../foo')
+        self.assertRaises(KeyError, self.site.getSession, b'')
+
+
+    def test_touchUnchanged(self):
+        """
+        Touching a session whose C{sessionNamespaces} have not changed does
+        not write its file until C{touchInterval} has passed since it was
+        last written, while touching a changed session writes it at once.
+        """
+        uid = self.site.makeSession().uid
+        path = self.store.directory.child(uid)
+        content = path.getContent()
+        self.clock.advance(self.store.touchInterval - 1)
+        session = self.site.getSession(uid)
+        session.touch()
+        self.assertEqual(path.getContent(), content)
+
+        session.sessionNamespaces[b'user'] = b'alice'
+        session.touch()
+        self.assertNotEqual(path.getContent(), content)
+        content = path.getContent()
+        self.clock.advance(self.store.touchInterval - 1)
+        session.touch()
+        self.assertEqual(path.getContent(), content)
+        self.clock.advance(1)
+        session.touch()
+        self.assertNotEqual(path.getContent(), content)
+
+
+    def test_privateFiles(self):
+        """
+        The directory created by the store, and the session files it writes,
+        are only readable and writable by the current user.
+        """
+        session = self.site.makeSession()
+        self.assertEqual(self.store.directory.getPermissions().shorthand(),
+                         'rwx------')
+        self.assertEqual(
+            self.store.directory.child(session.uid).getPermissions(
+                ).shorthand(),
+            'rw-------')
+
+
+    def test_untrustedDirectory(self):
+        """
+        The store refuses a directory which other users can write to.
+        """
+        directory = FilePath(self.mktemp())
+        directory.makedirs()
+        directory.chmod(0o777)
+        self.assertRaises(ValueError, server.FileSessionStore, directory)
+
+
+    def test_untrustedFile(self):
+        """
+        A session file which other users can write to is ignored.
+        """
+        session = self.site.makeSession()
+        self.store.directory.child(session.uid).chmod(0o666)
+        self.assertRaises(KeyError, self.site.getSession, session.uid)
+
+    if platform.isWindows():
+        test_privateFiles.skip = "Permissions are not used on Windows"
+        test_untrustedDirectory.skip = "Permissions are not checked on Windows"
+        test_untrustedFile.skip = "Permissions are not checked on Windows"
+
+
+
 # Conditional requests:
 # If-None-Match, If-Modified-Since
 
@@ -390,6 +679,128 @@ class ConditionalTests(unittest.TestCase):
 
 
 
+@implementer(iweb.IStreamingBodyResource, iweb.IRequestBodyConsumer)
+class UploadResource(resource.Resource):
+    """
+    A resource which counts the bytes of the bodies of requests for it as
+    they are received.
+    """
+    isLeaf = True
+
+    def __init__(self):
+        resource.Resource.__init__(self)
+        self.received = []
+
+
+    def getRequestBodyConsumer(self, request):
+        return self
+
+
+    def bodyStarted(self, producer):
+        pass
+
+
+    def dataReceived(self, data):
+        self.received.append(data)
+
+
+    def bodyDone(self, reason):
+        self.received.append(reason)
+
+
+    def render_PUT(self, request):
+        return (b'/'.join(request.prepath) + b' ' +
+                request.content.read())
+
+
+
+class StreamingRequestBodyTests(unittest.TestCase):
+    """
+    Tests for L{server.Site.streamRequestBodies}.
+    """
+    def setUp(self):
+        self.lookups = []
+        lookups = self.lookups
+        self.upload = UploadResource()
+
+        class Root(resource.Resource):
+            def getChildWithDefault(self, name, request):
+                lookups.append(name)
+                if name == b'broken':
+                    raise ZeroDivisionError()
+                return resource.Resource.getChildWithDefault(
+                    self, name, request)
+
+        class Plain(resource.Resource):
+            isLeaf = True
+            def render_PUT(self, request):
+                return b'plain ' + request.content.read()
+
+        root = Root()
+        root.putChild(b'upload', self.upload)
+        root.putChild(b'plain', Plain())
+        self.site = server.Site(root)
+        self.channel = self.site.buildProtocol(None)
+        self.transport = StringTransport()
+        self.channel.makeConnection(self.transport)
+        self.addCleanup(self.channel.connectionLost, None)
+
+
+    def _put(self, path=b'/upload'):
+        self.channel.dataReceived(
+            b'PUT ' + path + b' HTTP/1.1\r\n'
+            b'Content-Length: 5\r\n'
+            b'\r\n'
+            b'hello')
+        return self.transport.value()
+
+
+    def test_streamed(self):
+        """
+        If C{streamRequestBodies} is set, a resource which provides
+        L{iweb.IStreamingBodyResource} receives the body of a request for it
+        as it arrives, and is then rendered without being looked up again.
+        """
+        self.site.streamRequestBodies = True
+        self.assertEqual(httpBody(self._put()), b'upload ')
+        self.assertEqual(self.upload.received, [b'hello', None])
+        self.assertEqual(self.lookups, [b'upload'])
+
+
+    def test_notStreamingResource(self):
+        """
+        If C{streamRequestBodies} is set, a resource which does not provide
+        L{iweb.IStreamingBodyResource} is looked up once, before the body
+        arrives, and rendered with the body in C{request.content}.
+        """
+        self.site.streamRequestBodies = True
+        self.assertEqual(httpBody(self._put(b'/plain')), b'plain hello')
+        self.assertEqual(self.lookups, [b'plain'])
+
+
+    def test_lookupFails(self):
+        """
+        If C{streamRequestBodies} is set and looking up the resource fails,
+        it is not looked up again, and the failure is reported once, as the
+        response to the request.
+        """
+        self.site.streamRequestBodies = True
+        self.assertEqual(httpCode(self._put(b'/broken')), 500)
+        self.assertEqual(self.lookups, [b'broken'])
+        self.assertEqual(len(self.flushLoggedErrors(ZeroDivisionError)), 1)
+
+
+    def test_notStreamed(self):
+        """
+        If C{streamRequestBodies} is not set, request bodies are kept in
+        C{request.content}, even for a resource which provides
+        L{iweb.IStreamingBodyResource}.
+        """
+        self.assertEqual(httpBody(self._put()), b'upload hello')
+        self.assertEqual(self.upload.received, [])
+
+
+
 class RequestTests(unittest.TestCase):
     """
     Tests for the HTTP request class, L{server.Request}.
@@ -619,6 +1030,211 @@ class GzipEncoderTests(unittest.TestCase):
 
 
 
+class QueueingThreadPool(object):
+    """
+    An implementation of the part of the L{ThreadPool} interface used by
+    L{deferToThreadPool} which keeps calls until the test runs them, and
+    delivers their results synchronously.
+
+    @ivar calls: A C{list} of C{(onResult, f, a, kw)} tuples for calls which
+        have not been run yet.
+    """
+    def __init__(self):
+        self.calls = []
+
+
+    def callInThreadWithCallback(self, onResult, f, *a, **kw):
+        self.calls.append((onResult, f, a, kw))
+
+
+    def callFromThread(self, f, *a, **kw):
+        """
+        Stand in for the reactor's C{callFromThread}; C{run} is always called
+        in the reactor thread.
+        """
+        f(*a, **kw)
+
+
+    def run(self):
+        """
+        Run the oldest call which has not been run yet.
+        """
+        onResult, f, a, kw = self.calls.pop(0)
+        try:
+            result = f(*a, **kw)
+        except:
+            onResult(False, failure.Failure())
+        else:
+            onResult(True, result)
+
+
+
+class ThreadedGzipEncoderTests(unittest.TestCase):
+    """
+    Tests for L{server.GzipEncoderFactory} configured with a thread pool.
+    """
+
+    if _PY3:
+        skip = "GzipEncoder not ported to Python 3 yet."
+
+    def setUp(self):
+        self.pool = QueueingThreadPool()
+        self.factory = server.GzipEncoderFactory(
+            threadpool=self.pool, threshold=10, reactor=self.pool)
+        self.channel = DummyChannel()
+        self.request = server.Request(self.channel, False)
+        self.request.gotLength(0)
+        self.request.requestHeaders.setRawHeaders(
+            b"Accept-Encoding", [b"gzip"])
+        self.request.method = b'GET'
+        self.request.clientproto = b'HTTP/1.0'
+        self.request._encoder = self.factory.encoderForRequest(self.request)
+
+
+    def _body(self):
+        data = self.channel.transport.written.getvalue()
+        return data[data.find(b"\r\n\r\n") + 4:]
+
+
+    def test_interfaces(self):
+        """
+        The encoder returned by L{server.GzipEncoderFactory} when it is
+        given a thread pool implements L{iweb._IRequestEncoder}.
+        """
+        self.assertTrue(
+            verifyObject(iweb._IRequestEncoder, self.request._encoder))
+
+
+    def test_smallWritesInline(self):
+        """
+        Writes smaller than the threshold are compressed immediately.
+        """
+        self.request.write(b"short")
+        self.request.finish()
+        self.assertEqual(self.pool.calls, [])
+        self.assertTrue(self.request.finished)
+        self.assertEqual(
+            zlib.decompress(self._body(), 16 + zlib.MAX_WBITS), b"short")
+
+
+    def test_largeWritesInPool(self):
+        """
+        Writes of at least the threshold are compressed in the thread pool,
+        as is everything after them, and the request is only finished once
+        the compressed data has been written, in order.
+        """
+        self.request.write(b"a long piece of data")
+        self.request.write(b"tiny")
+        self.request.finish()
+        self.assertFalse(self.request.finished)
+        self.assertEqual(len(self.pool.calls), 1)
+        self.pool.run()
+        self.pool.run()
+        self.assertFalse(self.request.finished)
+        self.pool.run()
+        self.assertEqual(self.pool.calls, [])
+        self.assertTrue(self.request.finished)
+        self.assertEqual(
+            zlib.decompress(self._body(), 16 + zlib.MAX_WBITS),
+            b"a long piece of datatiny")
+
+
+    def test_inlineAfterDrained(self):
+        """
+        Once queued compression completes, small writes are compressed in the
+        reactor thread again.
+        """
+        self.request.write(b"a long piece of data")
+        self.pool.run()
+        self.request.write(b"tiny")
+        self.assertEqual(self.pool.calls, [])
+        self.request.finish()
+        self.assertTrue(self.request.finished)
+        self.assertEqual(
+            zlib.decompress(self._body(), 16 + zlib.MAX_WBITS),
+            b"a long piece of datatiny")
+
+
+    def test_disconnected(self):
+        """
+        If the connection is lost while data is queued, no further data is
+        compressed or written and the request is not finished.
+        """
+        self.request.write(b"a long piece of data")
+        self.request.write(b"more data to compress")
+        self.request.finish()
+        self.request.connectionLost(failure.Failure(Exception("gone")))
+        self.pool.run()
+        self.assertEqual(self.pool.calls, [])
+        self.assertFalse(self.request.finished)
+
+
+    def test_compressionFails(self):
+        """
+        If compression fails the error is logged, the connection is dropped
+        and the request is not finished.
+        """
+        self.request.write(b"a long piece of data")
+        self.request.finish()
+        self.pool.calls[0] = self.pool.calls[0][:1] + (
+            lambda: 1 // 0, (), {})
+        self.pool.run()
+        self.assertEqual(self.pool.calls, [])
+        self.assertEqual(len(self.flushLoggedErrors(ZeroDivisionError)), 1)
+        self.assertFalse(self.request.finished)
+        self.assertTrue(self.channel.transport.disconnected)
+
+
+    def test_writeFails(self):
+        """
+        If writing compressed data fails the error is logged once, the
+        connection is dropped and the encoder forgets the queued work, so
+        later writes are compressed inline again.
+        """
+        encoder = self.request._encoder
+        self.request.write(b"a long piece of data")
+        self.channel.transport.write = lambda data: 1 // 0
+        self.pool.run()
+        self.assertEqual(len(self.flushLoggedErrors(ZeroDivisionError)), 1)
+        self.assertTrue(self.channel.transport.disconnected)
+        self.assertEqual(encoder._queued, 0)
+        self.assertIdentical(encoder._pending, None)
+
+
+    def test_writeWhileFinishing(self):
+        """
+        Once L{server.Request.finish} has been called, writing to the request
+        raises L{RuntimeError} even though the request is not finished until
+        queued compression completes.
+        """
+        self.request.write(b"a long piece of data")
+        self.request.finish()
+        self.assertFalse(self.request.finished)
+        self.assertRaises(RuntimeError, self.request.write, b"more")
+
+
+    def test_finishTwice(self):
+        """
+        Calling L{server.Request.finish} again while queued compression
+        completes warns, as it does once the request is finished, and the
+        request is still finished once.
+        """
+        self.request.write(b"a long piece of data")
+        self.request.finish()
+        self.request.finish()
+        warnings = self.flushWarnings([self.test_finishTwice])
+        self.assertEqual(len(warnings), 1)
+        self.assertEqual(warnings[0]['message'],
+                         "Warning! request.finish called twice.")
+        self.pool.run()
+        self.pool.run()
+        self.assertTrue(self.request.finished)
+        self.assertEqual(
+            zlib.decompress(self._body(), 16 + zlib.MAX_WBITS),
+            b"a long piece of data")
+
+
+
 class RootResource(resource.Resource):
     isLeaf=0
     def getChildWithDefault(self, name, request):
@@ -943,6 +1559,148 @@ class AccessLogTestsMixin(object):
             FilePath(logPath).getContent())
 
 
+    def _bufferedFactory(self, logBufferSize):
+        """
+        Create and start a factory which buffers access log lines, and log a
+        request to it.
+        """
+        reactor = Clock()
+        reactor.advance(1234567890)
+        logPath = self.mktemp()
+        factory = self.factory(logPath=logPath, logBufferSize=logBufferSize)
+        factory._reactor = reactor
+        factory.startFactory()
+        self.addCleanup(factory.stopFactory)
+        factory.log(DummyRequestForLogTest(factory))
+        return factory, reactor, FilePath(logPath)
+
+
+    def test_bufferedUntilStopped(self):
+        """
+        If the factory is initialized with a C{logBufferSize}, lines are not
+        written to the log file until their total length reaches it, or the
+        factory is stopped.
+        """
+        factory, reactor, logPath = self._bufferedFactory(2 ** 16)
+        factory.log(DummyRequestForLogTest(factory))
+        self.assertEqual(logPath.getContent(), b"")
+        factory.stopFactory()
+        lines = logPath.getContent().split(self.linesep)
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[0], lines[1])
+        self.assertTrue(lines[0].startswith(b'"1.2.3.4" - - '))
+
+
+    def test_bufferedUntilSize(self):
+        """
+        Buffered lines are written to the log file once their total length
+        reaches C{logBufferSize}.
+        """
+        factory, reactor, logPath = self._bufferedFactory(150)
+        self.assertEqual(logPath.getContent(), b"")
+        factory.log(DummyRequestForLogTest(factory))
+        self.assertEqual(
+            logPath.getContent().count(self.linesep), 2)
+
+
+    def test_bufferedUntilInterval(self):
+        """
+        Buffered lines are written to the log file when the cached log
+        timestamp is next updated.
+        """
+        factory, reactor, logPath = self._bufferedFactory(2 ** 16)
+        reactor.advance(1)
+        self.assertEqual(logPath.getContent().count(self.linesep), 1)
+
+
+    def test_accessLogger(self):
+        """
+        If the factory is initialized with an C{accessLogger}, it emits an
+        event describing each request to that logger, with the values as they
+        were and a format which renders as a combined log format line,
+        escaping them.  Without a C{logPath} it writes no log file.
+        """
+        events = []
+        reactor = Clock()
+        reactor.advance(1234567890)
+        factory = self.factory(accessLogger=Logger(observer=events.append))
+        factory._reactor = reactor
+        factory.startFactory()
+        self.addCleanup(factory.stopFactory)
+        self.assertFalse(hasattr(factory, "logFile"))
+
+        request = DummyRequestForLogTest(factory)
+        request.sentLength = 10
+        request.headers[b"user-agent"] = b'agent "x"'
+        factory.log(request)
+
+        [event] = events
+        self.assertEqual(event["log_level"], LogLevel.info)
+        self.assertEqual(
+            (event["ip"], event["method"], event["uri"], event["protocol"],
+             event["code"], event["length"], event["referrer"],
+             event["agent"]),
+            (b"1.2.3.4", b"GET", b"/dummy", b"HTTP/1.0", 123, 10, b"-",
+             b'agent "x"'))
+        self.assertEqual(
+            formatEvent(event),
+            http.combinedLogFormatter(factory._logDateTime, request))
+        self.assertIn(u'"agent \\"x\\""', formatEvent(event))
+
+
+    def test_accessLoggerAndLogFile(self):
+        """
+        If the factory has both an C{accessLogger} and a C{logPath}, the line
+        written to the log file is the one the event renders as, with each
+        value escaped once, and the values are only looked up once.
+        """
+        events = []
+        logPath = FilePath(self.mktemp())
+        factory = self.factory(logPath=logPath.path,
+                               accessLogger=Logger(observer=events.append))
+        factory._reactor = Clock()
+        factory.startFactory()
+
+        request = DummyRequestForLogTest(factory)
+        request.headers[b"user-agent"] = b'agent "x"'
+        clientIPs = []
+        getClientIP = request.getClientIP
+        def countingGetClientIP():
+            clientIPs.append(None)
+            return getClientIP()
+        request.getClientIP = countingGetClientIP
+        factory.log(request)
+        factory.stopFactory()
+
+        [event] = events
+        self.assertEqual(
+            logPath.getContent(),
+            formatEvent(event).encode("utf-8") + self.linesep)
+        self.assertIn(b'"agent \\"x\\""', logPath.getContent())
+        self.assertEqual(len(clientIPs), 1)
+
+
+    def test_accessLoggerEmptyResponse(self):
+        """
+        The C{length} of the event emitted for a response without a body is
+        C{u"-"}, as in the combined log format line.
+        """
+        events = []
+        factory = self.factory(accessLogger=Logger(observer=events.append))
+        factory._reactor = Clock()
+        factory.startFactory()
+        self.addCleanup(factory.stopFactory)
+
+        request = DummyRequestForLogTest(factory)
+        factory.log(request)
+
+        [event] = events
+        self.assertEqual(event["length"], u"-")
+        self.assertEqual(
+            formatEvent(event),
+            http.combinedLogFormatter(factory._logDateTime, request))
+
+
 
 class HTTPFactoryAccessLogTests(AccessLogTestsMixin, unittest.TestCase):
     """
@@ -0,0 +1,539 @@
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Tests for L{twisted.web.websocket}.
+"""
+
+from __future__ import division, absolute_import
+
+import struct
+import zlib
+
+from twisted.internet.error import ConnectionLost
+from twisted.internet.protocol import Factory
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+from twisted.test.proto_helpers import StringTransport
+from twisted.trial.unittest import TestCase
+from twisted.web import server, resource
+from twisted.web.websocket import (
+    WebSocketProtocol, WebSocketResource, broadcast,
+    CLOSE_PROTOCOL_ERROR, CLOSE_INVALID_DATA, CLOSE_MESSAGE_TOO_BIG)
+from twisted.web.websocket import _unmask
+
+
+# The example handshake of RFC 6455, section 1.3.
+KEY = b"dGhlIHNhbXBsZSBub25jZQ=="
+ACCEPT = b"s3pPLMBiTxaQ9kYGzzhZRbK+xOo="
+
+MASK = b"\x37\xfa\x21\x3d"
+
+
+
+def clientFrame(opcode, payload, fin=True, rsv1=False, mask=MASK):
+    """
+    Build a frame as a client sends it.
+
+    @param mask: The masking key, or C{None} to send the frame unmasked.
+    """
+    first = opcode | (0x80 if fin else 0) | (0x40 if rsv1 else 0)
+    masked = 0x80 if mask is not None else 0
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", first, masked | length)
+    elif length < 0x10000:
+        header = struct.pack("!BBH", first, masked | 126, length)
+    else:
+        header = struct.pack("!BBQ", first, masked | 127, length)
+    if mask is None:
+        return header + payload
+    return header + mask + _unmask(payload, mask)
+
+
+
+def parseFrames(data):
+    """
+    Split the data a server sent into frames.
+
+    @return: A C{list} of three-tuples of the first byte of each frame, its
+        opcode, and its payload.
+    """
+    frames = []
+    while data:
+        first, length = struct.unpack("!BB", data[:2])
+        data = data[2:]
+        if length == 126:
+            length, = struct.unpack("!H", data[:2])
+            data = data[2:]
+        elif length == 127:
+            length, = struct.unpack("!Q", data[:8])
+            data = data[8:]
+        frames.append((first & 0xF0, first & 0x0F, data[:length]))
+        data = data[length:]
+    return frames
+
+
+
+def inflate(data, decompressor=None):
+    """
+    Decompress a message compressed with the I{permessage-deflate}
+    extension.
+    """
+    if decompressor is None:
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    return decompressor.decompress(data + b"\x00\x00\xff\xff")
+
+
+
+class RecordingProtocol(WebSocketProtocol):
+    """
+    A L{WebSocketProtocol} which records the messages it receives.
+    """
+    def connectionMade(self):
+        self.messages = []
+        self.lost = None
+
+
+    def messageReceived(self, message):
+        self.messages.append(message)
+
+
+    def connectionLost(self, reason):
+        WebSocketProtocol.connectionLost(self, reason)
+        self.lost = reason
+
+
+
+class HandshakeTests(TestCase):
+    """
+    Tests for the opening handshake of L{WebSocketResource}.
+    """
+    def setUp(self):
+        self.factory = Factory.forProtocol(RecordingProtocol)
+        self.resource = WebSocketResource(self.factory)
+        root = resource.Resource()
+        root.putChild(b"ws", self.resource)
+        self.site = server.Site(root, timeout=None)
+        self.channel = self.site.buildProtocol(None)
+        self.transport = StringTransport()
+        self.channel.makeConnection(self.transport)
+
+
+    def connect(self, extraHeaders=b"", version=b"HTTP/1.1", key=KEY):
+        self.channel.dataReceived(
+            b"GET /ws " + version + b"\r\n"
+            b"Host: example.com\r\n"
+            b"Upgrade: websocket\r\n"
+            b"Connection: keep-alive, Upgrade\r\n"
+            b"Sec-WebSocket-Key: " + key + b"\r\n" +
+            extraHeaders +
+            b"\r\n")
+        response = self.transport.value()
+        self.transport.clear()
+        return response
+
+
+    def test_accept(self):
+        """
+        A valid handshake is answered with the I{Switching Protocols} status
+        and the accept value derived from the key, and the connection is
+        handed over to a protocol built by the factory.
+        """
+        response = self.connect(b"Sec-WebSocket-Version: 13\r\n")
+        self.assertTrue(
+            response.startswith(b"HTTP/1.1 101 Switching Protocols\r\n"))
+        self.assertIn(b"Sec-Websocket-Accept: " + ACCEPT + b"\r\n", response)
+        self.assertIn(b"Upgrade: websocket\r\n", response)
+        self.assertNotIn(b"Content-Type", response)
+        self.assertNotIn(b"Transfer-Encoding", response)
+        self.assertTrue(response.endswith(b"\r\n\r\n"))
+        self.assertNotIn(b"Sec-Websocket-Extensions", response)
+
+        [proto] = self.resource.connections
+        self.assertIsInstance(proto, RecordingProtocol)
+        self.channel.dataReceived(clientFrame(0x1, u"hello".encode("utf-8")))
+        self.assertEqual(proto.messages, [u"hello"])
+
+
+    def test_badVersion(self):
+        """
+        A handshake for any version but 13 is answered with I{Bad Request}
+        and the supported version.
+        """
+        response = self.connect(b"Sec-WebSocket-Version: 8\r\n")
+        self.assertTrue(response.startswith(b"HTTP/1.1 400 Bad Request\r\n"))
+        self.assertIn(b"Sec-Websocket-Version: 13\r\n", response)
+        self.assertEqual(self.resource.connections, set())
+
+
+    def test_badKey(self):
+        """
+        A handshake whose key is not 16 bytes of base64 is answered with
+        I{Bad Request}.
+        """
+        response = self.connect(
+            b"Sec-WebSocket-Version: 13\r\n", key=b"c2hvcnQ=")
+        self.assertTrue(response.startswith(b"HTTP/1.1 400 Bad Request\r\n"))
+
+
+    def test_notUpgrade(self):
+        """
+        A request which does not ask to upgrade to the WebSocket protocol is
+        answered with I{Bad Request}.
+        """
+        self.channel.dataReceived(b"GET /ws HTTP/1.1\r\n\r\n")
+        self.assertTrue(self.transport.value().startswith(
+                b"HTTP/1.1 400 Bad Request\r\n"))
+
+
+    def test_oldHTTP(self):
+        """
+        A handshake over HTTP/1.0 is answered with I{Bad Request}.
+        """
+        response = self.connect(
+            b"Sec-WebSocket-Version: 13\r\n", version=b"HTTP/1.0")
+        self.assertTrue(response.startswith(b"HTTP/1.0 400 Bad Request\r\n"))
+
+
+    def test_refused(self):
+        """
+        If the factory returns C{None}, the handshake is answered with
+        I{Forbidden}.
+        """
+        self.factory.buildProtocol = lambda addr: None
+        response = self.connect(b"Sec-WebSocket-Version: 13\r\n")
+        self.assertTrue(response.startswith(b"HTTP/1.1 403 Forbidden\r\n"))
+
+
+    def test_deflate(self):
+        """
+        An offer of the I{permessage-deflate} extension is accepted, after
+        declining offers of unknown extensions and invalid parameters.
+        """
+        response = self.connect(
+            b"Sec-WebSocket-Version: 13\r\n"
+            b"Sec-WebSocket-Extensions: x-unknown, "
+            b"permessage-deflate; server_max_window_bits=8\r\n"
+            b"Sec-WebSocket-Extensions: permessage-deflate; "
+            b"client_max_window_bits; server_no_context_takeover\r\n")
+        self.assertIn(
+            b"Sec-Websocket-Extensions: permessage-deflate; "
+            b"server_no_context_takeover\r\n", response)
+
+        [proto] = self.resource.connections
+        message = u"compress me " * 10
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        payload = (compressor.compress(message.encode("utf-8")) +
+                   compressor.flush(zlib.Z_SYNC_FLUSH))[:-4]
+        self.channel.dataReceived(clientFrame(0x1, payload, rsv1=True))
+        self.assertEqual(proto.messages, [message])
+
+        proto.sendMessage(message)
+        proto.sendMessage(message)
+        frames = parseFrames(self.transport.value())
+        self.assertEqual(len(frames), 2)
+        for flags, opcode, payload in frames:
+            self.assertEqual((flags, opcode), (0xC0, 0x1))
+            # Without context takeover, each message decompresses alone.
+            self.assertEqual(inflate(payload), message.encode("utf-8"))
+
+
+    def test_connectionLost(self):
+        """
+        When the connection is lost, the protocol is told so and is no longer
+        one of the resource's connections.
+        """
+        self.connect(b"Sec-WebSocket-Version: 13\r\n")
+        [proto] = self.resource.connections
+        self.channel.connectionLost(Failure(ConnectionLost()))
+        self.assertIsInstance(proto.lost, Failure)
+        self.assertEqual(self.resource.connections, set())
+
+
+
+class ProtocolTests(TestCase):
+    """
+    Tests for L{WebSocketProtocol}.
+    """
+    def setUp(self):
+        self.proto = RecordingProtocol()
+        self.transport = StringTransport()
+        self.proto.makeConnection(self.transport)
+
+
+    def sent(self):
+        frames = parseFrames(self.transport.value())
+        self.transport.clear()
+        return frames
+
+
+    def test_messages(self):
+        """
+        Text frames are delivered as C{unicode} and binary frames as
+        C{bytes}, whether they arrive whole or a byte at a time.
+        """
+        data = (clientFrame(0x1, u"\N{SNOWMAN}".encode("utf-8")) +
+                clientFrame(0x2, b"\x00\xff" * 100) +
+                clientFrame(0x2, b"x" * 70000))
+        self.proto.dataReceived(data[:3])
+        for i in range(3, len(data), 1000):
+            self.proto.dataReceived(data[i:i + 1000])
+        self.assertEqual(
+            self.proto.messages,
+            [u"\N{SNOWMAN}", b"\x00\xff" * 100, b"x" * 70000])
+
+
+    def test_messagesByteByByte(self):
+        """
+        Frames of every header size are delivered when they arrive a byte at
+        a time, and the data of an incomplete frame is only joined together
+        once the whole frame has arrived.
+        """
+        data = (clientFrame(0x2, b"a" * 10) + clientFrame(0x2, b"b" * 300) +
+                clientFrame(0x2, b"c" * 70000))
+        for i in range(len(data) - 1):
+            self.proto.dataReceived(data[i:i + 1])
+        self.assertEqual(self.proto._buffered, 70013)
+        self.assertEqual(len(self.proto._buffer), 70004)
+        self.proto.dataReceived(data[-1:])
+        self.assertEqual(
+            self.proto.messages, [b"a" * 10, b"b" * 300, b"c" * 70000])
+        self.assertEqual(self.proto._buffer, [])
+
+
+    def test_fragments(self):
+        """
+        A message fragmented over several frames is delivered whole, and
+        control frames may arrive between its fragments.
+        """
+        self.proto.dataReceived(
+            clientFrame(0x1, b"hel", fin=False) +
+            clientFrame(0x9, b"ping") +
+            clientFrame(0x0, b"lo", fin=False) +
+            clientFrame(0x0, b"", fin=True))
+        self.assertEqual(self.proto.messages, [u"hello"])
+        self.assertEqual(self.sent(), [(0x80, 0xA, b"ping")])
+
+
+    def test_sendMessage(self):
+        """
+        L{WebSocketProtocol.sendMessage} sends C{unicode} as a text frame and
+        C{bytes} as a binary frame, in fragments of at most C{fragmentSize}.
+        """
+        self.proto.sendMessage(u"hi")
+        self.proto.sendMessage(b"x" * 300)
+        self.proto.fragmentSize = 100
+        self.proto.sendMessage(b"y" * 250)
+        self.assertEqual(
+            self.sent(),
+            [(0x80, 0x1, b"hi"), (0x80, 0x2, b"x" * 300),
+             (0x00, 0x2, b"y" * 100), (0x00, 0x0, b"y" * 100),
+             (0x80, 0x0, b"y" * 50)])
+
+
+    def test_unmasked(self):
+        """
+        An unmasked frame closes the connection with
+        L{CLOSE_PROTOCOL_ERROR}.
+        """
+        self.proto.dataReceived(clientFrame(0x1, b"hi", mask=None))
+        [(flags, opcode, payload)] = self.sent()
+        self.assertEqual(opcode, 0x8)
+        self.assertEqual(
+            struct.unpack("!H", payload[:2])[0], CLOSE_PROTOCOL_ERROR)
+        self.assertTrue(self.transport.disconnecting)
+        self.assertEqual(self.proto.messages, [])
+
+
+    def test_invalidText(self):
+        """
+        A text message which is not UTF-8 closes the connection with
+        L{CLOSE_INVALID_DATA}.
+        """
+        self.proto.dataReceived(clientFrame(0x1, b"\xff"))
+        [(flags, opcode, payload)] = self.sent()
+        self.assertEqual(
+            struct.unpack("!H", payload[:2])[0], CLOSE_INVALID_DATA)
+
+
+    def test_tooBig(self):
+        """
+        A message larger than C{maxMessageSize}, whole or in fragments,
+        closes the connection with L{CLOSE_MESSAGE_TOO_BIG}.
+        """
+        self.proto.maxMessageSize = 10
+        self.proto.dataReceived(
+            clientFrame(0x2, b"x" * 6, fin=False) +
+            clientFrame(0x0, b"x" * 6))
+        [(flags, opcode, payload)] = self.sent()
+        self.assertEqual(
+            struct.unpack("!H", payload[:2])[0], CLOSE_MESSAGE_TOO_BIG)
+        self.assertEqual(self.proto.messages, [])
+
+
+    def test_clientClose(self):
+        """
+        A close frame from the client is answered with the same code, and
+        the connection is closed.
+        """
+        self.proto.dataReceived(
+            clientFrame(0x8, struct.pack("!H", 1001) + b"bye"))
+        self.assertEqual(self.proto.closeCode, 1001)
+        self.assertEqual(self.proto.closeReason, u"bye")
+        self.assertEqual(self.sent(), [(0x80, 0x8, struct.pack("!H", 1001))])
+        self.assertTrue(self.transport.disconnecting)
+
+
+    def test_clientCloseInvalidCode(self):
+        """
+        A close frame from the client with a code which may not be sent, such
+        as one reserved by RFC 6455 or outside the ranges it defines, closes
+        the connection with L{CLOSE_PROTOCOL_ERROR}.
+        """
+        for code in [0, 999, 1004, 1005, 1006, 1015, 2000, 5000]:
+            self.setUp()
+            self.proto.dataReceived(
+                clientFrame(0x8, struct.pack("!H", code)))
+            [(flags, opcode, payload)] = self.sent()
+            self.assertEqual(
+                struct.unpack("!H", payload[:2])[0], CLOSE_PROTOCOL_ERROR)
+            self.assertTrue(self.transport.disconnecting)
+
+
+    def test_clientCloseValidCodes(self):
+        """
+        Close codes defined by RFC 6455 or registered with IANA, and those
+        for applications, are accepted from the client.
+        """
+        for code in [1000, 1003, 1007, 1011, 1014, 3000, 4999]:
+            self.setUp()
+            self.proto.dataReceived(
+                clientFrame(0x8, struct.pack("!H", code)))
+            self.assertEqual(self.proto.closeCode, code)
+            self.assertEqual(
+                self.sent(), [(0x80, 0x8, struct.pack("!H", code))])
+
+
+    def test_closeInvalidCode(self):
+        """
+        L{WebSocketProtocol.close} raises L{ValueError} for a close code which
+        may not be sent, and sends nothing.
+        """
+        self.assertRaises(ValueError, self.proto.close, 1005)
+        self.assertEqual(self.sent(), [])
+
+
+    def test_serverClose(self):
+        """
+        L{WebSocketProtocol.close} sends a close frame, after which no more
+        messages are sent, and the connection is closed once the client
+        answers.
+        """
+        self.proto.close(1000, u"done")
+        self.proto.sendMessage(u"ignored")
+        self.assertEqual(
+            self.sent(), [(0x80, 0x8, struct.pack("!H", 1000) + b"done")])
+        self.assertFalse(self.transport.disconnecting)
+        self.proto.dataReceived(clientFrame(0x8, struct.pack("!H", 1000)))
+        self.assertEqual(self.sent(), [])
+        self.assertTrue(self.transport.disconnecting)
+
+
+
+class KeepAliveTests(TestCase):
+    """
+    Tests for the keep-alive timer of L{WebSocketResource}.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.resource = WebSocketResource(
+            Factory.forProtocol(RecordingProtocol), keepAliveInterval=10,
+            reactor=self.clock)
+        self.protos = []
+        for i in range(2):
+            proto = RecordingProtocol()
+            proto.makeConnection(StringTransport())
+            self.resource._keepAlive.add(proto)
+            self.protos.append(proto)
+
+
+    def test_pingIdle(self):
+        """
+        Connections which received nothing since the last check are pinged,
+        and are dropped if they received nothing by the next check.  One
+        timer serves all the connections.
+        """
+        active, idle = self.protos
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        active.dataReceived(clientFrame(0x1, b"hi"))
+        self.clock.advance(10)
+        self.assertEqual(active.transport.value(), b"")
+        self.assertEqual(parseFrames(idle.transport.value()),
+                         [(0x80, 0x9, b"")])
+
+        self.clock.advance(10)
+        self.assertEqual(parseFrames(active.transport.value()),
+                         [(0x80, 0x9, b"")])
+        self.assertTrue(idle.transport.disconnecting)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+
+
+    def test_pong(self):
+        """
+        A connection which answers a ping is not dropped.
+        """
+        proto = self.protos[0]
+        self.clock.advance(10)
+        proto.dataReceived(clientFrame(0xA, b""))
+        self.clock.advance(10)
+        self.assertFalse(proto.transport.disconnecting)
+
+
+    def test_stop(self):
+        """
+        The timer stops once there are no connections left.
+        """
+        for proto in self.protos:
+            self.resource._keepAlive.remove(proto)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+
+class BroadcastTests(TestCase):
+    """
+    Tests for L{broadcast}.
+    """
+    def connect(self, deflate=None):
+        proto = RecordingProtocol()
+        proto._deflate = deflate
+        proto.makeConnection(StringTransport())
+        return proto
+
+
+    def test_broadcast(self):
+        """
+        L{broadcast} sends a message to each open connection, compressed for
+        those which compress each message on their own, and uncompressed for
+        the others.
+        """
+        from twisted.web.websocket import _PerMessageDeflate
+        plain = self.connect()
+        shared = [self.connect(_PerMessageDeflate(True)) for i in range(2)]
+        context = self.connect(_PerMessageDeflate(False))
+        closed = self.connect()
+        closed.close()
+        closed.transport.clear()
+
+        message = u"news " * 20
+        broadcast([plain, context, closed] + shared, message)
+        encoded = message.encode("utf-8")
+        for proto in [plain, context]:
+            self.assertEqual(parseFrames(proto.transport.value()),
+                             [(0x80, 0x1, encoded)])
+        self.assertEqual(shared[0].transport.value(),
+                         shared[1].transport.value())
+        [(flags, opcode, payload)] = parseFrames(shared[0].transport.value())
+        self.assertEqual((flags, opcode), (0xC0, 0x1))
+        self.assertEqual(inflate(payload), encoded)
+        self.assertEqual(closed.transport.value(), b"")
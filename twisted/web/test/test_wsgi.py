@@ -10,6 +10,7 @@ __metaclass__ = type
 from sys import exc_info
 from urllib import quote
 from thread import get_ident
+from threading import Condition, Event
 import StringIO, cStringIO, tempfile
 
 from zope.interface.verify import verifyObject
@@ -20,8 +21,9 @@ from twisted.python.threadpool import ThreadPool
 from twisted.internet.defer import Deferred, gatherResults
 from twisted.internet import reactor
 from twisted.internet.error import ConnectionLost
+from twisted.internet.interfaces import IPushProducer
 from twisted.trial.unittest import TestCase
-from twisted.web import http
+from twisted.web import http, wsgi
 from twisted.web.resource import IResource, Resource
 from twisted.web.server import Request, Site, version
 from twisted.web.wsgi import WSGIResource
@@ -107,8 +109,11 @@ class WSGITestsMixin:
     """
     @ivar channelFactory: A no-argument callable which will be invoked to
         create a new HTTP channel to associate with request objects.
+
+    @ivar bufferSize: The C{bufferSize} to pass to L{WSGIResource}.
     """
     channelFactory = DummyChannel
+    bufferSize = None
 
     def setUp(self):
         self.threadpool = SynchronousThreadPool()
@@ -147,7 +152,8 @@ class WSGITestsMixin:
             start_response callable).
         """
         root = WSGIResource(
-            self.reactor, self.threadpool, applicationFactory())
+            self.reactor, self.threadpool, applicationFactory(),
+            self.bufferSize)
         resourceSegments.reverse()
         for seg in resourceSegments:
             tmp = Resource()
@@ -1569,3 +1575,223 @@ class ApplicationTests(WSGITestsMixin, TestCase):
                 raise RuntimeError("This application had some error.")
 
         return self._connectionClosedTest(Application, responseContent)
+
+
+
+class QueueingReactorThreads:
+    """
+    An implementation of part of the L{IReactorThreads} interface which keeps
+    the calls scheduled with it until the test runs them.
+
+    @ivar calls: A C{list} of C{(f, a, kw)} tuples for each call to
+        C{callFromThread} which has not been run yet.
+    """
+    def __init__(self):
+        self.calls = []
+
+
+    def callFromThread(self, f, *a, **kw):
+        """
+        Remember the call to make it later.  This may be called in any thread.
+        """
+        self.calls.append((f, a, kw))
+
+
+    def runCalls(self):
+        """
+        Run all the calls scheduled so far, in order.
+        """
+        calls, self.calls = self.calls, []
+        for f, a, kw in calls:
+            f(*a, **kw)
+
+
+
+class WaitingCondition:
+    """
+    A wrapper around a L{Condition} which records when a thread starts
+    waiting on it.
+
+    @ivar waiting: An L{Event} which is set when a thread calls L{wait}, before
+        it releases the lock.
+    """
+    def __init__(self):
+        self._condition = Condition()
+        self.waiting = Event()
+        self.acquire = self._condition.acquire
+        self.release = self._condition.release
+        self.notifyAll = self._condition.notifyAll
+
+
+    def wait(self):
+        """
+        Set C{waiting}, then wait on the wrapped condition.
+        """
+        self.waiting.set()
+        self._condition.wait()
+
+
+
+class BufferedApplicationTests(ApplicationTests):
+    """
+    Tests for the behavior of L{WSGIResource} towards the application object
+    when a C{bufferSize} is given.
+    """
+    bufferSize = 4
+
+    def _threadedRender(self, application):
+        """
+        Render a request with C{application} run in a real thread pool and
+        calls from that thread kept until the test runs them.
+
+        @return: A C{tuple} of the L{Deferred} which fires when the request
+            finishes, the L{DummyChannel} for the request and the
+            L{WaitingCondition} used by the response.
+        """
+        self.reactor = QueueingReactorThreads()
+        self.threadpool = ThreadPool()
+        self.threadpool.start()
+        self.addCleanup(self.threadpool.stop)
+        conditions = []
+        def condition():
+            conditions.append(WaitingCondition())
+            return conditions[-1]
+        self.patch(wsgi, 'Condition', condition)
+        channel = DummyChannel()
+
+        d, requestFactory = self.requestFactoryFactory()
+        self.lowLevelRender(
+            requestFactory, lambda: application,
+            lambda: channel, 'GET', '1.1', [], [''], None, [])
+        return d, channel, conditions[0]
+
+
+    def _finishThreaded(self, channel):
+        """
+        Wait for the application thread to exit, then run everything it
+        scheduled in the I/O thread.
+
+        @return: The response body written to C{channel}.
+        """
+        self.threadpool.stop()
+        self.reactor.runCalls()
+        return self.getContentFromResponse(
+            channel.transport.written.getvalue())
+
+
+    def test_registersProducer(self):
+        """
+        The response is registered with the request as a streaming producer
+        while the application runs, and unregistered before the request is
+        finished.
+        """
+        producers = []
+        channel = DummyChannel()
+
+        def applicationFactory():
+            def application(environ, startResponse):
+                producers.extend(channel.transport.producers)
+                startResponse('200 OK', [])
+                return iter(())
+            return application
+
+        d, requestFactory = self.requestFactoryFactory()
+        self.lowLevelRender(
+            requestFactory, applicationFactory,
+            lambda: channel, 'GET', '1.1', [], [''], None, [])
+        self.assertEqual(len(producers), 1)
+        producer, streaming = producers[0]
+        self.assertTrue(streaming)
+        self.assertTrue(verifyObject(IPushProducer, producer))
+        self.assertEqual(channel.transport.producers, [])
+        return d
+
+    def test_writesJoined(self):
+        """
+        Strings written by the application while an earlier write is waiting
+        to be passed to the request are passed to the request together.
+        """
+        self.reactor = QueueingReactorThreads()
+        channel = DummyChannel()
+
+        def applicationFactory():
+            def application(environ, startResponse):
+                write = startResponse('200 OK', [])
+                write('a')
+                write('b')
+                return iter(['c'])
+            return application
+
+        written = []
+        class RecordingRequest(Request):
+            def write(self, bytes):
+                written.append(bytes)
+                return Request.write(self, bytes)
+
+        d, requestFactory = self.requestFactoryFactory(RecordingRequest)
+        self.lowLevelRender(
+            requestFactory, applicationFactory,
+            lambda: channel, 'GET', '1.1', [], [''], None, [])
+        self.assertEqual(len(self.reactor.calls), 2)
+        self.reactor.runCalls()
+        self.assertEqual(written, ['abc'])
+        return d
+
+
+    def test_writeBlocksWhenFull(self):
+        """
+        Once C{bufferSize} bytes have been written by the application and not
+        yet passed to the request, the application's next write blocks until
+        the I/O thread has passed them on.
+        """
+        secondWriteDone = Event()
+
+        def application(environ, startResponse):
+            write = startResponse('200 OK', [])
+            write('abcd')
+            write('efgh')
+            secondWriteDone.set()
+            return iter(())
+
+        d, channel, condition = self._threadedRender(application)
+        condition.waiting.wait(5)
+        self.assertFalse(secondWriteDone.isSet())
+
+        self.reactor.runCalls()
+        secondWriteDone.wait(5)
+        self.assertTrue(secondWriteDone.isSet())
+        self.assertEqual(
+            self._finishThreaded(channel),
+            '4\r\nabcd\r\n4\r\nefgh\r\n0\r\n\r\n')
+        return d
+
+
+    def test_writeBlocksWhilePaused(self):
+        """
+        While the transport has paused the response, the application's writes
+        block, even if the buffer has room, until it resumes the response.
+        """
+        paused = Event()
+        writeDone = Event()
+
+        def application(environ, startResponse):
+            write = startResponse('200 OK', [])
+            paused.wait(5)
+            write('a')
+            writeDone.set()
+            return iter(())
+
+        d, channel, condition = self._threadedRender(application)
+        [(producer, streaming)] = channel.transport.producers
+        producer.pauseProducing()
+        paused.set()
+        condition.waiting.wait(5)
+        self.assertFalse(writeDone.isSet())
+
+        producer.resumeProducing()
+        writeDone.wait(5)
+        self.assertTrue(writeDone.isSet())
+        self.assertEqual(
+            self._finishThreaded(channel), '1\r\na\r\n0\r\n\r\n')
+        self.assertEqual(channel.transport.producers, [])
+        return d
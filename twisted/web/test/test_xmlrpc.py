@@ -385,7 +385,9 @@ class XMLRPCTests(unittest.TestCase):
         If it is not possible to encode a response to the request (for example,
         because L{xmlrpclib.dumps} raises an exception when encoding a
         L{Fault}) the exception which prevents the response from being
-        generated is logged and the request object is finished anyway.
+        generated is logged, as is the exception which prevents a L{Fault}
+        from being sent instead, and an I{Internal Server Error} response is
+        sent.
         """
         d = self.proxy().callRemote("echo", "")
 
@@ -399,9 +401,10 @@ class XMLRPCTests(unittest.TestCase):
         # something suitable as part of a public interface.
         d = self.assertFailure(d, Exception)
 
-        def cbFailed(ignored):
-            # The fakeDumps exception should have been logged.
-            self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 1)
+        def cbFailed(exc):
+            # The fakeDumps exceptions should have been logged.
+            self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 2)
+            self.assertEqual(exc.args[0], str(http.INTERNAL_SERVER_ERROR))
         d.addCallback(cbFailed)
         return d
 
@@ -817,3 +820,213 @@ class XMLRPCWithRequestTests(unittest.TestCase):
         d = request.notifyFinish().addCallback(valid, request)
         self.resource.render_POST(request)
         return d
+
+
+
+class ImmediateThreadPool(object):
+    """
+    A thread pool stand-in which records each call made in it and runs it
+    immediately.
+    """
+    def __init__(self):
+        self.calls = []
+
+
+    def callInThreadWithCallback(self, onResult, f, *args, **kwargs):
+        self.calls.append(f)
+        try:
+            result = f(*args, **kwargs)
+        except:
+            onResult(False, failure.Failure())
+        else:
+            onResult(True, result)
+
+
+
+class FailingThreadPool(ImmediateThreadPool):
+    """
+    A thread pool stand-in which fails to run one function, as if the pool
+    had been stopped.
+
+    @ivar failing: The function which is not run.
+    """
+    def __init__(self, failing):
+        ImmediateThreadPool.__init__(self)
+        self.failing = failing
+
+
+    def callInThreadWithCallback(self, onResult, f, *args, **kwargs):
+        if f == self.failing:
+            self.calls.append(f)
+            onResult(False, failure.Failure(RuntimeError("pool stopped")))
+        else:
+            ImmediateThreadPool.callInThreadWithCallback(
+                self, onResult, f, *args, **kwargs)
+
+
+
+class ImmediateReactor(object):
+    """
+    A reactor stand-in which runs C{callFromThread} calls immediately.
+    """
+    def callFromThread(self, f, *args, **kwargs):
+        f(*args, **kwargs)
+
+
+
+class XMLRPCMarshallingTests(unittest.TestCase):
+    """
+    Tests for how L{XMLRPC} parses requests and serializes responses.
+    """
+    def setUp(self):
+        self.resource = Test()
+
+
+    def _request(self, payload):
+        request = DummyRequest([''])
+        request.method = 'POST'
+        request.content = StringIO(payload)
+        return request
+
+
+    def test_fastArrayMarshalling(self):
+        """
+        L{xmlrpc._dumpResponse} serializes arrays exactly like
+        L{xmlrpclib.dumps}.
+        """
+        values = [
+            [1, -2, 3.5, 'a<b&c', u'\N{SNOWMAN}', None, True, {'x': [1]}],
+            (xmlrpclib.MAXINT, xmlrpclib.MININT, 0),
+            [[1, 2], ['x', '<&>'], [1e100, -0.5], [True, False], []]]
+        for value in values:
+            self.assertEqual(
+                xmlrpc._dumpResponse((value,), True),
+                xmlrpclib.dumps((value,), methodresponse=True,
+                                allow_none=True))
+
+
+    def test_fastArrayMarshallingErrors(self):
+        """
+        L{xmlrpc._dumpResponse} rejects integers outside of the XML-RPC range
+        and recursive arrays, like L{xmlrpclib.dumps}.
+        """
+        self.assertRaises(
+            OverflowError, xmlrpc._dumpResponse, ([xmlrpclib.MAXINT + 1],),
+            False)
+        recursive = [1]
+        recursive.append(recursive)
+        self.assertRaises(
+            TypeError, xmlrpc._dumpResponse, (recursive,), False)
+
+
+    def test_arrayResult(self):
+        """
+        A method returning a list produces a response which L{xmlrpclib}
+        parses back into the same list.
+        """
+        request = self._request(xmlrpclib.dumps(([1, 'two', 3.0],), 'echo'))
+        self.resource.render_POST(request)
+        self.assertEqual(
+            xmlrpclib.loads("".join(request.written)),
+            (([1, 'two', 3.0],), None))
+        self.assertEqual(request.finished, 1)
+
+
+    def test_requestTooLarge(self):
+        """
+        A request body larger than L{XMLRPC.maxRequestSize} is refused with
+        a I{Request Entity Too Large} response without being parsed.
+        """
+        payload = xmlrpclib.dumps(("x" * 100,), 'echo')
+        self.resource.maxRequestSize = len(payload) - 1
+        request = self._request(payload)
+        result = self.resource.render_POST(request)
+        self.assertEqual(request.responseCode, http.REQUEST_ENTITY_TOO_LARGE)
+        self.assertIsInstance(result, str)
+
+
+    def test_requestAtSizeLimit(self):
+        """
+        A request body no larger than L{XMLRPC.maxRequestSize} is handled
+        normally.
+        """
+        payload = xmlrpclib.dumps(("x",), 'echo')
+        resource = Test(maxRequestSize=len(payload))
+        request = self._request(payload)
+        resource.render_POST(request)
+        self.assertEqual(
+            xmlrpclib.loads("".join(request.written)), (('x',), None))
+
+
+    def test_threadpool(self):
+        """
+        If L{XMLRPC.threadpool} is set, the request is parsed and the
+        response is serialized in it.
+        """
+        pool = ImmediateThreadPool()
+        resource = Test(threadpool=pool)
+        resource._reactor = ImmediateReactor()
+        request = self._request(xmlrpclib.dumps(("x",), 'echo'))
+        resource.render_POST(request)
+        self.assertEqual(
+            xmlrpclib.loads("".join(request.written)), (('x',), None))
+        self.assertEqual(pool.calls, [xmlrpclib.loads, resource._dumpResult])
+
+
+    def test_threadpoolParseError(self):
+        """
+        If the request cannot be parsed in L{XMLRPC.threadpool}, the response
+        is a L{Fault}.
+        """
+        resource = Test(threadpool=ImmediateThreadPool())
+        resource._reactor = ImmediateReactor()
+        request = self._request("not xml")
+        resource.render_POST(request)
+        self.assertRaises(
+            xmlrpclib.Fault, xmlrpclib.loads, "".join(request.written))
+        self.assertEqual(request.finished, 1)
+
+
+    def _failingSerializationResource(self):
+        """
+        Make a resource whose thread pool cannot serialize responses.
+        """
+        resource = Test()
+        resource.threadpool = FailingThreadPool(resource._dumpResult)
+        resource._reactor = ImmediateReactor()
+        return resource
+
+
+    def test_threadpoolSerializeError(self):
+        """
+        If the response cannot be serialized in L{XMLRPC.threadpool}, the
+        failure is logged and the response is a L{Fault}.
+        """
+        resource = self._failingSerializationResource()
+        request = self._request(xmlrpclib.dumps(("x",), 'echo'))
+        resource.render_POST(request)
+        self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 1)
+        exc = self.assertRaises(
+            xmlrpclib.Fault, xmlrpclib.loads, "".join(request.written))
+        self.assertEqual(exc.faultCode, resource.FAILURE)
+        self.assertIn("pool stopped", exc.faultString)
+        self.assertEqual(request.responseCode, None)
+        self.assertEqual(request.finished, 1)
+
+
+    def test_threadpoolSerializeFaultError(self):
+        """
+        If neither the response nor a L{Fault} can be serialized, an
+        I{Internal Server Error} response is sent.
+        """
+        resource = self._failingSerializationResource()
+        request = self._request(xmlrpclib.dumps(("x",), 'echo'))
+        def dumps(*args, **kwargs):
+            raise ValueError("cannot serialize")
+        self.patch(xmlrpclib, 'dumps', dumps)
+        resource.render_POST(request)
+        self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 1)
+        self.assertEqual(len(self.flushLoggedErrors(ValueError)), 1)
+        self.assertEqual(request.responseCode, http.INTERNAL_SERVER_ERROR)
+        self.assertEqual(request.written, [])
+        self.assertEqual(request.finished, 1)
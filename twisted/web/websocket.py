@@ -0,0 +1,897 @@
+# -*- test-case-name: twisted.web.test.test_websocket -*-
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+The WebSocket protocol, as defined by RFC 6455, served from a
+L{twisted.web.server.Site}.
+
+A L{WebSocketResource} accepts requests to upgrade to the WebSocket protocol
+and hands each connection over to a L{WebSocketProtocol} built by a factory,
+which sends and receives whole messages::
+
+    class Echo(WebSocketProtocol):
+        def messageReceived(self, message):
+            self.sendMessage(message)
+
+    root.putChild(b"echo", WebSocketResource(Factory.forProtocol(Echo)))
+
+The I{permessage-deflate} extension of RFC 7692 is supported.
+"""
+
+from __future__ import division, absolute_import
+
+import base64
+import binascii
+import hashlib
+import struct
+import zlib
+
+from twisted.internet import protocol
+from twisted.python.compat import unicode
+from twisted.web import http, resource
+from twisted.web.server import NOT_DONE_YET
+
+
+__all__ = [
+    'WebSocketProtocol', 'WebSocketResource', 'broadcast',
+
+    'CLOSE_NORMAL', 'CLOSE_GOING_AWAY', 'CLOSE_PROTOCOL_ERROR',
+    'CLOSE_UNSUPPORTED_DATA', 'CLOSE_INVALID_DATA', 'CLOSE_POLICY_VIOLATION',
+    'CLOSE_MESSAGE_TOO_BIG',
+    ]
+
+
+_ACCEPT_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# Frame opcodes.
+_CONTINUATION = 0x0
+_TEXT = 0x1
+_BINARY = 0x2
+_CLOSE = 0x8
+_PING = 0x9
+_PONG = 0xA
+
+_FIN = 0x80
+_RSV1 = 0x40
+_RSV2_3 = 0x30
+_MASKED = 0x80
+
+# The trailer which permessage-deflate strips from compressed messages.
+_DEFLATE_TRAILER = b"\x00\x00\xff\xff"
+
+# Close codes.
+CLOSE_NORMAL = 1000
+CLOSE_GOING_AWAY = 1001
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_UNSUPPORTED_DATA = 1003
+CLOSE_INVALID_DATA = 1007
+CLOSE_POLICY_VIOLATION = 1008
+CLOSE_MESSAGE_TOO_BIG = 1009
+
+
+
+def _validCloseCode(code):
+    """
+    Determine whether a close code may be sent in a close frame, as described
+    by section 7.4 of RFC 6455.
+
+    Codes below 1000, and 1004, 1005, 1006 and 1015, are reserved or only
+    meaningful locally; codes from 1000 to 2999 are only valid if they are
+    registered with IANA; codes from 3000 to 4999 are for libraries,
+    frameworks and applications.
+
+    @param code: The close code.
+    @type code: C{int}
+
+    @rtype: C{bool}
+    """
+    return 1000 <= code <= 1003 or 1007 <= code <= 1014 or 3000 <= code <= 4999
+
+
+
+def _makeFrame(opcode, payload, fin=True, rsv1=False):
+    """
+    Build the header of an unmasked frame, as sent by a server.
+
+    @param opcode: The opcode of the frame.
+    @type opcode: C{int}
+
+    @param payload: The payload the header is for.
+    @type payload: C{bytes}
+
+    @param fin: Whether this is the last frame of a message.
+    @type fin: C{bool}
+
+    @param rsv1: Whether the payload is compressed.
+    @type rsv1: C{bool}
+
+    @rtype: C{bytes}
+    """
+    first = opcode
+    if fin:
+        first |= _FIN
+    if rsv1:
+        first |= _RSV1
+    length = len(payload)
+    if length < 126:
+        return struct.pack("!BB", first, length)
+    elif length < 0x10000:
+        return struct.pack("!BBH", first, 126, length)
+    return struct.pack("!BBQ", first, 127, length)
+
+
+
+def _encodeMessage(opcode, payload, compressed, fragmentSize):
+    """
+    Split a message into frames.
+
+    @param fragmentSize: The largest payload of any frame, or C{None} to
+        send the whole message as one frame.
+
+    @return: A C{list} of alternating frame headers and payloads.
+    """
+    if fragmentSize is None or len(payload) <= fragmentSize:
+        return [_makeFrame(opcode, payload, rsv1=compressed), payload]
+    frames = []
+    last = len(payload) - fragmentSize
+    for offset in range(0, len(payload), fragmentSize):
+        fragment = payload[offset:offset + fragmentSize]
+        frames.append(_makeFrame(
+                opcode, fragment, fin=offset >= last,
+                rsv1=compressed and offset == 0))
+        frames.append(fragment)
+        opcode = _CONTINUATION
+    return frames
+
+
+
+def _unmask(data, key):
+    """
+    Apply a frame's masking key to its payload.
+
+    The payload and the repeated key are XORed as two long integers, which
+    is much faster than XORing them a byte at a time in Python.
+
+    @type data: C{bytes}
+
+    @param key: The four byte masking key.
+    @type key: C{bytes}
+
+    @rtype: C{bytes}
+    """
+    length = len(data)
+    if not length:
+        return data
+    mask = (key * (length // 4 + 1))[:length]
+    unmasked = (int(binascii.hexlify(data), 16) ^
+                int(binascii.hexlify(mask), 16))
+    return binascii.unhexlify('%0*x' % (length * 2, unmasked))
+
+
+
+class _MessageTooBig(Exception):
+    """
+    A compressed message decompresses to more than the largest message
+    allowed.
+    """
+
+
+
+class _PerMessageDeflate(object):
+    """
+    The compression state of a connection which negotiated the
+    I{permessage-deflate} extension.
+
+    @ivar serverNoContextTakeover: Whether each message sent is compressed
+        on its own, rather than with the messages sent before it as context.
+        Messages compressed this way can be sent to every connection with
+        the same window size.
+    @type serverNoContextTakeover: C{bool}
+
+    @ivar clientNoContextTakeover: Whether each message received was
+        compressed on its own.
+    @type clientNoContextTakeover: C{bool}
+
+    @ivar serverMaxWindowBits: The base two logarithm of the window size
+        used to compress messages.
+    @type serverMaxWindowBits: C{int}
+    """
+    _compressor = None
+    _decompressor = None
+
+    def __init__(self, serverNoContextTakeover=False,
+                 clientNoContextTakeover=False, serverMaxWindowBits=15,
+                 compressLevel=6):
+        self.serverNoContextTakeover = serverNoContextTakeover
+        self.clientNoContextTakeover = clientNoContextTakeover
+        self.serverMaxWindowBits = serverMaxWindowBits
+        self._compressLevel = compressLevel
+
+
+    def compress(self, data):
+        """
+        Compress a message.
+
+        @type data: C{bytes}
+        @rtype: C{bytes}
+        """
+        if self._compressor is None or self.serverNoContextTakeover:
+            self._compressor = zlib.compressobj(
+                self._compressLevel, zlib.DEFLATED, -self.serverMaxWindowBits)
+        data = (self._compressor.compress(data) +
+                self._compressor.flush(zlib.Z_SYNC_FLUSH))
+        return data[:-len(_DEFLATE_TRAILER)]
+
+
+    def decompress(self, data, maxSize):
+        """
+        Decompress a message.
+
+        @type data: C{bytes}
+
+        @param maxSize: The largest size the message may decompress to, or
+            C{None} if it is not limited.
+
+        @rtype: C{bytes}
+
+        @raise _MessageTooBig: If the message decompresses to more than
+            C{maxSize} bytes.
+        """
+        if self._decompressor is None or self.clientNoContextTakeover:
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        if maxSize is None:
+            return self._decompressor.decompress(data + _DEFLATE_TRAILER)
+        result = self._decompressor.decompress(
+            data + _DEFLATE_TRAILER, maxSize + 1)
+        if len(result) > maxSize:
+            raise _MessageTooBig()
+        return result
+
+
+
+def _parseExtensions(headers):
+    """
+    Parse the values of I{Sec-WebSocket-Extensions} headers.
+
+    @param headers: The header values.
+    @type headers: C{list} of C{bytes}
+
+    @return: The offered extensions, in order of preference, as a C{list}
+        of two-tuples of extension name and a C{list} of two-tuples of
+        parameter name and value, which is C{None} for parameters without
+        one.
+    """
+    offers = []
+    for header in headers:
+        for offer in header.split(b","):
+            parts = [part.strip() for part in offer.split(b";")]
+            if not parts[0]:
+                continue
+            params = []
+            for part in parts[1:]:
+                name, equals, value = part.partition(b"=")
+                if equals:
+                    value = value.strip().strip(b'"')
+                else:
+                    value = None
+                params.append((name.strip().lower(), value))
+            offers.append((parts[0].lower(), params))
+    return offers
+
+
+
+def _negotiateDeflate(params, forceNoContextTakeover):
+    """
+    Decide whether to accept an offer of the I{permessage-deflate}
+    extension.
+
+    @param params: The parameters of the offer, as returned by
+        L{_parseExtensions}.
+
+    @param forceNoContextTakeover: Whether to compress each message on its
+        own even if the client does not ask for it.
+
+    @return: C{None} if the offer is declined, otherwise a two-tuple of the
+        L{_PerMessageDeflate} to use and the response to the offer.
+    """
+    names = [name for (name, value) in params]
+    if len(set(names)) != len(names):
+        return None
+    options = dict(params)
+    serverNoContextTakeover = forceNoContextTakeover
+    clientNoContextTakeover = False
+    serverMaxWindowBits = 15
+    response = [b"permessage-deflate"]
+    for name, value in options.items():
+        if name == b"server_no_context_takeover":
+            if value is not None:
+                return None
+            serverNoContextTakeover = True
+        elif name == b"client_no_context_takeover":
+            if value is not None:
+                return None
+            clientNoContextTakeover = True
+            response.append(b"client_no_context_takeover")
+        elif name == b"server_max_window_bits":
+            try:
+                serverMaxWindowBits = int(value)
+            except (TypeError, ValueError):
+                return None
+            # zlib cannot produce raw deflate data for a window of 2 ** 8.
+            if not 9 <= serverMaxWindowBits <= 15:
+                return None
+            response.append(
+                b"server_max_window_bits=" + value)
+        elif name == b"client_max_window_bits":
+            if value is not None:
+                try:
+                    if not 8 <= int(value) <= 15:
+                        return None
+                except ValueError:
+                    return None
+        else:
+            return None
+    if serverNoContextTakeover:
+        response.insert(1, b"server_no_context_takeover")
+    deflate = _PerMessageDeflate(
+        serverNoContextTakeover, clientNoContextTakeover, serverMaxWindowBits)
+    return deflate, b"; ".join(response)
+
+
+
+class WebSocketProtocol(protocol.Protocol):
+    """
+    One end of a WebSocket connection, which sends and receives whole
+    messages.
+
+    Override L{messageReceived} to handle messages, and L{connectionMade}
+    and L{connectionLost} as for any protocol.
+
+    @ivar maxMessageSize: The largest message, in bytes, which will be
+        received.  The connection is closed with L{CLOSE_MESSAGE_TOO_BIG} if
+        a larger message is sent to it.
+    @type maxMessageSize: C{int}
+
+    @ivar fragmentSize: If not C{None}, messages larger than this many bytes
+        are sent in fragments of at most this size.
+    @type fragmentSize: C{int}
+
+    @ivar closeCode: The close code the peer sent, or C{None}.
+
+    @ivar closeReason: The close reason the peer sent, or C{None}.
+
+    @ivar _deflate: The L{_PerMessageDeflate} of this connection, or
+        C{None} if it does not use the I{permessage-deflate} extension.
+
+    @ivar _state: C{'OPEN'} while messages may be sent, C{'CLOSING'} once a
+        close frame has been sent, and C{'CLOSED'} once the closing handshake
+        is done or the connection is lost.
+
+    @ivar _buffer: A C{list} of the C{bytes} received which are not a whole
+        frame yet.
+
+    @ivar _buffered: The total length of the strings in C{_buffer}.
+
+    @ivar _needed: The number of bytes C{_buffer} must hold before a frame
+        can be parsed from it, so that data is only joined together once a
+        whole frame, or more of its header, has arrived.
+
+    @ivar _fragments: The payloads of the frames of a fragmented message
+        received so far, or C{None}.
+
+    @ivar _receivedSinceCheck: Whether data has been received since the
+        last keep-alive check.
+
+    @ivar _pingOutstanding: Whether the last keep-alive check sent a ping
+        which has not been answered yet.
+    """
+    maxMessageSize = 2 ** 24
+    fragmentSize = None
+
+    closeCode = None
+    closeReason = None
+
+    _deflate = None
+    _state = 'OPEN'
+    _fragments = None
+    _receivedSinceCheck = False
+    _pingOutstanding = False
+
+    def makeConnection(self, transport):
+        self._buffer = []
+        self._buffered = 0
+        self._needed = 2
+        protocol.Protocol.makeConnection(self, transport)
+
+
+    def messageReceived(self, message):
+        """
+        Called with each message received.
+
+        @param message: The message, which is C{unicode} for a text message
+            and C{bytes} for a binary message.
+        """
+
+
+    def sendMessage(self, message):
+        """
+        Send a message.
+
+        @param message: The message; C{unicode} is sent as a text message
+            and C{bytes} as a binary message.
+        """
+        if self._state != 'OPEN':
+            return
+        opcode, payload = _messagePayload(message)
+        compressed = self._deflate is not None
+        if compressed:
+            payload = self._deflate.compress(payload)
+        self.transport.writeSequence(
+            _encodeMessage(opcode, payload, compressed, self.fragmentSize))
+
+
+    def ping(self, data=b""):
+        """
+        Send a ping, which the peer answers with a pong.
+
+        @param data: Application data for the ping, at most 125 bytes.
+        @type data: C{bytes}
+        """
+        if self._state == 'OPEN':
+            self.transport.write(_makeFrame(_PING, data) + data)
+
+
+    def close(self, code=CLOSE_NORMAL, reason=u""):
+        """
+        Start the closing handshake.  The connection is closed once the peer
+        answers.
+
+        @param code: The close code.
+        @type code: C{int}
+
+        @param reason: A short explanation.
+        @type reason: C{unicode}
+
+        @raise ValueError: If C{code} may not be sent in a close frame.
+        """
+        if not _validCloseCode(code):
+            raise ValueError("Invalid close code %r" % (code,))
+        if self._state != 'OPEN':
+            return
+        payload = struct.pack("!H", code) + reason.encode("utf-8")
+        self.transport.write(_makeFrame(_CLOSE, payload) + payload)
+        self._state = 'CLOSING'
+
+
+    def connectionLost(self, reason):
+        self._state = 'CLOSED'
+
+
+    def _failConnection(self, code, reason):
+        """
+        Close the connection because the peer did something wrong.
+        """
+        self.close(code, reason)
+        self._state = 'CLOSED'
+        self.transport.loseConnection()
+
+
+    def dataReceived(self, data):
+        self._receivedSinceCheck = True
+        if self._buffer:
+            self._buffer.append(data)
+            self._buffered += len(data)
+            if self._buffered < self._needed:
+                return
+            data = b"".join(self._buffer)
+        end = len(data)
+        offset = 0
+        needed = 2
+        unpack = struct.unpack_from
+        while self._state != 'CLOSED':
+            if end - offset < 2:
+                needed = 2
+                break
+            first, second = unpack("!BB", data, offset)
+            position = offset + 2
+            length = second & 0x7F
+            if length == 126:
+                if end - position < 2:
+                    needed = 4
+                    break
+                length, = unpack("!H", data, position)
+                position += 2
+            elif length == 127:
+                if end - position < 8:
+                    needed = 10
+                    break
+                length, = unpack("!Q", data, position)
+                position += 8
+            if not second & _MASKED:
+                self._failConnection(
+                    CLOSE_PROTOCOL_ERROR, u"Frames must be masked")
+                break
+            if length > self.maxMessageSize:
+                self._failConnection(
+                    CLOSE_MESSAGE_TOO_BIG, u"Message too big")
+                break
+            if end - position < length + 4:
+                needed = position + length + 4 - offset
+                break
+            key = data[position:position + 4]
+            position += 4
+            payload = _unmask(data[position:position + length], key)
+            offset = position + length
+            self._frameReceived(first, payload)
+        if offset < end:
+            data = data[offset:]
+            self._buffer = [data]
+            self._buffered = len(data)
+        else:
+            self._buffer = []
+            self._buffered = 0
+        self._needed = needed
+
+
+    def _frameReceived(self, first, payload):
+        """
+        Handle a frame.
+
+        @param first: The first byte of the frame, with its flags and
+            opcode.
+        @type first: C{int}
+
+        @param payload: The unmasked payload of the frame.
+        @type payload: C{bytes}
+        """
+        opcode = first & 0x0F
+        fin = first & _FIN
+        if first & _RSV2_3:
+            return self._failConnection(
+                CLOSE_PROTOCOL_ERROR, u"Unexpected reserved bits")
+
+        if opcode >= _CLOSE:
+            if not fin or len(payload) > 125 or first & _RSV1:
+                return self._failConnection(
+                    CLOSE_PROTOCOL_ERROR, u"Invalid control frame")
+            if opcode == _CLOSE:
+                return self._closeReceived(payload)
+            elif opcode == _PING:
+                if self._state == 'OPEN':
+                    self.transport.write(_makeFrame(_PONG, payload) + payload)
+                return
+            elif opcode == _PONG:
+                self._pingOutstanding = False
+                return
+            return self._failConnection(
+                CLOSE_PROTOCOL_ERROR, u"Unknown opcode")
+
+        if opcode == _CONTINUATION:
+            if self._fragments is None or first & _RSV1:
+                return self._failConnection(
+                    CLOSE_PROTOCOL_ERROR, u"Unexpected continuation frame")
+            self._fragments.append(payload)
+            self._fragmentsSize += len(payload)
+            if self._fragmentsSize > self.maxMessageSize:
+                return self._failConnection(
+                    CLOSE_MESSAGE_TOO_BIG, u"Message too big")
+            if not fin:
+                return
+            payload = b"".join(self._fragments)
+            opcode = self._messageOpcode
+            compressed = self._messageCompressed
+            self._fragments = None
+        elif opcode in (_TEXT, _BINARY):
+            if self._fragments is not None:
+                return self._failConnection(
+                    CLOSE_PROTOCOL_ERROR, u"Expected a continuation frame")
+            compressed = bool(first & _RSV1)
+            if compressed and self._deflate is None:
+                return self._failConnection(
+                    CLOSE_PROTOCOL_ERROR, u"Unexpected reserved bits")
+            if not fin:
+                self._fragments = [payload]
+                self._fragmentsSize = len(payload)
+                self._messageOpcode = opcode
+                self._messageCompressed = compressed
+                return
+        else:
+            return self._failConnection(
+                CLOSE_PROTOCOL_ERROR, u"Unknown opcode")
+
+        if compressed:
+            try:
+                payload = self._deflate.decompress(
+                    payload, self.maxMessageSize)
+            except _MessageTooBig:
+                return self._failConnection(
+                    CLOSE_MESSAGE_TOO_BIG, u"Message too big")
+            except zlib.error:
+                return self._failConnection(
+                    CLOSE_INVALID_DATA, u"Invalid compressed data")
+        if opcode == _TEXT:
+            try:
+                payload = payload.decode("utf-8")
+            except UnicodeDecodeError:
+                return self._failConnection(
+                    CLOSE_INVALID_DATA, u"Text must be UTF-8")
+        if self._state == 'OPEN':
+            self.messageReceived(payload)
+
+
+    def _closeReceived(self, payload):
+        """
+        Handle a close frame, answering it if this side did not start the
+        closing handshake, and then close the connection.
+        """
+        if len(payload) == 1:
+            return self._failConnection(
+                CLOSE_PROTOCOL_ERROR, u"Invalid close frame")
+        if payload:
+            self.closeCode, = struct.unpack("!H", payload[:2])
+            if not _validCloseCode(self.closeCode):
+                return self._failConnection(
+                    CLOSE_PROTOCOL_ERROR, u"Invalid close code")
+            try:
+                self.closeReason = payload[2:].decode("utf-8")
+            except UnicodeDecodeError:
+                return self._failConnection(
+                    CLOSE_INVALID_DATA, u"Close reason must be UTF-8")
+        if self._state == 'OPEN':
+            # Answer with the same code, and without the reason.
+            self.transport.write(_makeFrame(_CLOSE, payload[:2]) +
+                                 payload[:2])
+        self._state = 'CLOSED'
+        self.transport.loseConnection()
+
+
+
+def _messagePayload(message):
+    """
+    Find the opcode and payload of a message.
+
+    @param message: C{unicode} for a text message or C{bytes} for a binary
+        message.
+
+    @return: A two-tuple of opcode and C{bytes} payload.
+    """
+    if isinstance(message, unicode):
+        return _TEXT, message.encode("utf-8")
+    return _BINARY, message
+
+
+
+def broadcast(protocols, message):
+    """
+    Send a message to many connections, building each distinct frame it is
+    sent as only once.
+
+    Connections which compress each message on its own with the same window
+    size share one compressed frame.  Other connections which use the
+    I{permessage-deflate} extension are sent the message uncompressed, since
+    compressing it for them would mean compressing it once for each.
+
+    @param protocols: The L{WebSocketProtocol}s to send the message to.
+        Those which are closing or closed are skipped.
+
+    @param message: The message; C{unicode} is sent as a text message and
+        C{bytes} as a binary message.
+    """
+    opcode, payload = _messagePayload(message)
+    frames = {}
+    for proto in protocols:
+        if proto._state != 'OPEN':
+            continue
+        deflate = proto._deflate
+        if deflate is not None and deflate.serverNoContextTakeover:
+            key = (deflate.serverMaxWindowBits, proto.fragmentSize)
+        else:
+            key = (None, proto.fragmentSize)
+        frame = frames.get(key)
+        if frame is None:
+            if key[0] is None:
+                frame = b"".join(
+                    _encodeMessage(opcode, payload, False, key[1]))
+            else:
+                frame = b"".join(_encodeMessage(
+                        opcode, deflate.compress(payload), True, key[1]))
+            frames[key] = frame
+        proto.transport.write(frame)
+
+
+
+class _KeepAlive(object):
+    """
+    One timer which keeps many WebSocket connections alive, and drops those
+    whose peer has gone away.
+
+    Every C{interval} seconds, each connection which has received nothing
+    since the last check is sent a ping, and each connection which has not
+    received anything, including a pong, since the ping sent at the last
+    check is dropped.
+
+    @ivar interval: The number of seconds between checks.
+
+    @ivar _protocols: The connections being kept alive.
+    @type _protocols: C{set} of L{WebSocketProtocol}
+
+    @ivar _call: The L{IDelayedCall} for the next check, or C{None} when
+        there are no connections.
+    """
+    _call = None
+
+    def __init__(self, reactor, interval):
+        self._reactor = reactor
+        self.interval = interval
+        self._protocols = set()
+
+
+    def add(self, proto):
+        """
+        Start keeping a connection alive.
+        """
+        self._protocols.add(proto)
+        if self._call is None:
+            self._call = self._reactor.callLater(self.interval, self._check)
+
+
+    def remove(self, proto):
+        """
+        Stop keeping a connection alive.
+        """
+        self._protocols.discard(proto)
+        if not self._protocols and self._call is not None:
+            self._call.cancel()
+            self._call = None
+
+
+    def _check(self):
+        self._call = None
+        for proto in list(self._protocols):
+            if proto._receivedSinceCheck:
+                proto._receivedSinceCheck = False
+                proto._pingOutstanding = False
+            elif proto._pingOutstanding:
+                abort = getattr(proto.transport, "abortConnection",
+                                proto.transport.loseConnection)
+                abort()
+            else:
+                proto._pingOutstanding = True
+                proto.ping()
+        if self._protocols:
+            self._call = self._reactor.callLater(self.interval, self._check)
+
+
+
+class WebSocketResource(resource.Resource):
+    """
+    A resource which accepts requests to upgrade to the WebSocket protocol.
+
+    @ivar connections: The open connections accepted by this resource.
+    @type connections: C{set} of L{WebSocketProtocol}
+    """
+    isLeaf = True
+
+    def __init__(self, factory, compress=True, noContextTakeover=False,
+                 keepAliveInterval=None, reactor=None):
+        """
+        @param factory: A factory which builds a L{WebSocketProtocol} for
+            each connection, or returns C{None} to refuse it.
+        @type factory: L{twisted.internet.protocol.Factory}
+
+        @param compress: Whether to accept the I{permessage-deflate}
+            extension.
+        @type compress: C{bool}
+
+        @param noContextTakeover: Whether to compress each message on its own,
+            rather than with earlier messages as context.  This compresses
+            less well, but saves the memory of a compressor for each
+            connection between messages, and lets L{broadcast} send one
+            compressed frame to all of them.
+        @type noContextTakeover: C{bool}
+
+        @param keepAliveInterval: If not C{None}, the number of seconds
+            between checks which ping idle connections and drop those which
+            did not answer the previous ping.  One timer checks all the
+            connections of this resource.
+
+        @param reactor: The reactor the keep-alive timer uses.  By default,
+            the global reactor.
+        @type reactor: L{IReactorTime} provider
+        """
+        resource.Resource.__init__(self)
+        self._factory = factory
+        self._compress = compress
+        self._noContextTakeover = noContextTakeover
+        self.connections = set()
+        if keepAliveInterval is None:
+            self._keepAlive = None
+        else:
+            if reactor is None:
+                from twisted.internet import reactor
+            self._keepAlive = _KeepAlive(reactor, keepAliveInterval)
+
+
+    def _badRequest(self, request, message):
+        request.setResponseCode(http.BAD_REQUEST)
+        request.setHeader(b"content-type", b"text/plain")
+        return message
+
+
+    def render(self, request):
+        """
+        Upgrade the connection if the request is a valid WebSocket opening
+        handshake, and respond with I{Bad Request} otherwise.
+        """
+        headers = request.requestHeaders
+        upgrade = b",".join(headers.getRawHeaders(b"upgrade", []))
+        connection = b",".join(headers.getRawHeaders(b"connection", []))
+        if (request.method != b"GET" or
+                request.clientproto != b"HTTP/1.1" or
+                b"websocket" not in
+                [t.strip().lower() for t in upgrade.split(b",")] or
+                b"upgrade" not in
+                [t.strip().lower() for t in connection.split(b",")]):
+            return self._badRequest(request, b"Expected a WebSocket upgrade")
+
+        if headers.getRawHeaders(b"sec-websocket-version") != [b"13"]:
+            request.setHeader(b"sec-websocket-version", b"13")
+            return self._badRequest(
+                request, b"Unsupported WebSocket version")
+
+        key = headers.getRawHeaders(b"sec-websocket-key", [b""])[0].strip()
+        try:
+            valid = len(base64.b64decode(key)) == 16
+        except (TypeError, ValueError, binascii.Error):
+            valid = False
+        if not valid or request.queued:
+            return self._badRequest(request, b"Invalid WebSocket handshake")
+
+        proto = self._factory.buildProtocol(request.transport.getPeer())
+        if proto is None:
+            request.setResponseCode(http.FORBIDDEN)
+            return b""
+
+        if self._compress:
+            offers = _parseExtensions(
+                headers.getRawHeaders(b"sec-websocket-extensions", []))
+            for name, params in offers:
+                if name != b"permessage-deflate":
+                    continue
+                negotiated = _negotiateDeflate(
+                    params, self._noContextTakeover)
+                if negotiated is not None:
+                    proto._deflate, response = negotiated
+                    request.setHeader(b"sec-websocket-extensions", response)
+                    break
+
+        accept = base64.b64encode(
+            hashlib.sha1(key + _ACCEPT_GUID).digest())
+        request.setResponseCode(http.SWITCHING)
+        request.setHeader(b"upgrade", b"websocket")
+        request.setHeader(b"connection", b"Upgrade")
+        request.setHeader(b"sec-websocket-accept", accept)
+        request.defaultContentType = None
+
+        self.connections.add(proto)
+        if self._keepAlive is not None:
+            self._keepAlive.add(proto)
+        request.notifyFinish().addErrback(self._connectionLost, proto)
+        request._upgrade(proto)
+        return NOT_DONE_YET
+
+
+    def _connectionLost(self, reason, proto):
+        self.connections.discard(proto)
+        if self._keepAlive is not None:
+            self._keepAlive.remove(proto)
+
+
+    def broadcast(self, message):
+        """
+        Send a message to all the open connections of this resource.
+
+        @see: L{broadcast}
+        """
+        broadcast(self.connections, message)
@@ -9,11 +9,13 @@ U{Web Resource Gateway Interface<http://www.python.org/dev/peps/pep-0333/>}.
 __metaclass__ = type
 
 from sys import exc_info
+from threading import Condition
 
 from zope.interface import implements
 
 from twisted.python.log import msg, err
 from twisted.python.failure import Failure
+from twisted.internet.interfaces import IPushProducer
 from twisted.web.resource import IResource
 from twisted.web.server import NOT_DONE_YET
 from twisted.web.http import INTERNAL_SERVER_ERROR
@@ -161,12 +163,43 @@ class _WSGIResponse:
     @ivar _requestFinished: A flag which indicates whether it is possible to
         generate more response data or not.  This is C{False} until
         L{Request.notifyFinish} tells us the request is done, then C{True}.
+
+    @ivar _bufferSize: If not C{None}, the number of bytes of response body
+        which may be written by the application and not yet passed to the
+        request before the application thread blocks in C{write}; see
+        L{WSGIResource}.
+
+    @ivar _buffer: A C{list} of C{str} written by the application which have
+        not been passed to the request yet.  Only used if C{_bufferSize} is not
+        C{None}, and only accessed with C{_bufferCondition} held.
+
+    @ivar _bufferedLength: The total length of the strings in C{_buffer}.
+
+    @ivar _flushScheduled: C{True} if L{_flush} has been scheduled to run in
+        the I/O thread and has not run yet, otherwise C{False}.
+
+    @ivar _paused: C{True} if the request has asked this response, registered
+        with it as a streaming producer, to stop producing, otherwise
+        C{False}.
+
+    @ivar _bufferCondition: A L{Condition} which protects C{_buffer},
+        C{_bufferedLength}, C{_flushScheduled} and C{_paused}, and which is
+        notified when the buffer has been emptied, production has been resumed
+        or the request has finished.
     """
+    implements(IPushProducer)
 
     _requestFinished = False
+    _paused = False
 
-    def __init__(self, reactor, threadpool, application, request):
+    def __init__(self, reactor, threadpool, application, request,
+                 bufferSize=None):
         self.started = False
+        self._bufferSize = bufferSize
+        self._buffer = []
+        self._bufferedLength = 0
+        self._flushScheduled = False
+        self._bufferCondition = Condition()
         self.reactor = reactor
         self.threadpool = threadpool
         self.application = application
@@ -241,9 +274,14 @@ class _WSGIResponse:
     def _finished(self, ignored):
         """
         Record the end of the response generation for the request being
-        serviced.
+        serviced, waking the application thread if it is waiting to write.
         """
-        self._requestFinished = True
+        self._bufferCondition.acquire()
+        try:
+            self._requestFinished = True
+            self._bufferCondition.notifyAll()
+        finally:
+            self._bufferCondition.release()
 
 
     def startResponse(self, status, headers, excInfo=None):
@@ -268,6 +306,9 @@ class _WSGIResponse:
 
         This will be called in a non-I/O thread.
         """
+        if self._bufferSize is not None:
+            self._bufferedWrite(bytes)
+            return
         def wsgiWrite(started):
             if not started:
                 self._sendResponseHeaders()
@@ -276,6 +317,63 @@ class _WSGIResponse:
         self.started = True
 
 
+    def _bufferedWrite(self, bytes):
+        """
+        Add the given bytes to the buffer of response body waiting to be
+        written, scheduling a call to L{_flush} in the I/O thread unless one is
+        already pending.  If C{_bufferSize} bytes are already waiting, block
+        until the I/O thread has taken them, and while the request has paused
+        production, block until it resumes production (in either case, stop
+        blocking if the request finishes).
+
+        Writes made while a flush is pending are passed to the request
+        together, so a streaming application costs one reactor wakeup per
+        batch of writes rather than one per write.
+
+        This will be called in a non-I/O thread.
+        """
+        self._bufferCondition.acquire()
+        try:
+            while ((self._paused or
+                    self._bufferedLength >= self._bufferSize) and
+                   not self._requestFinished):
+                self._bufferCondition.wait()
+            self._buffer.append(bytes)
+            self._bufferedLength += len(bytes)
+            schedule = not self._flushScheduled
+            self._flushScheduled = True
+        finally:
+            self._bufferCondition.release()
+        if schedule:
+            self.reactor.callFromThread(self._flush, self.started)
+        self.started = True
+
+
+    def _flush(self, started):
+        """
+        Pass everything written by the application since the last flush to
+        the request, first sending the response headers if C{started} is
+        C{False}, and wake the application thread if it is waiting for room in
+        the buffer.
+
+        This must be called in the I/O thread.
+        """
+        self._bufferCondition.acquire()
+        try:
+            data = ''.join(self._buffer)
+            self._buffer = []
+            self._bufferedLength = 0
+            self._flushScheduled = False
+            self._bufferCondition.notifyAll()
+        finally:
+            self._bufferCondition.release()
+        if self._requestFinished:
+            return
+        if not started:
+            self._sendResponseHeaders()
+        self.request.write(data)
+
+
     def _sendResponseHeaders(self):
         """
         Set the response code and response headers on the request object, but
@@ -299,11 +397,63 @@ class _WSGIResponse:
         """
         Start the WSGI application in the threadpool.
 
+        If a C{bufferSize} was given, register with the request as a streaming
+        producer, so that the application thread is blocked while the
+        transport is not accepting more data.
+
         This must be called in the I/O thread.
         """
+        if self._bufferSize is not None:
+            self.request.registerProducer(self, True)
         self.threadpool.callInThread(self.run)
 
 
+    def pauseProducing(self):
+        """
+        Block the application thread in its next C{write} until
+        L{resumeProducing} is called.
+
+        This must be called in the I/O thread.
+        """
+        self._bufferCondition.acquire()
+        try:
+            self._paused = True
+        finally:
+            self._bufferCondition.release()
+
+
+    def resumeProducing(self):
+        """
+        Let the application thread write again, waking it if it is blocked
+        because production was paused.
+
+        This must be called in the I/O thread.
+        """
+        self._bufferCondition.acquire()
+        try:
+            self._paused = False
+            self._bufferCondition.notifyAll()
+        finally:
+            self._bufferCondition.release()
+
+
+    def stopProducing(self):
+        """
+        Do nothing; the request's C{notifyFinish} L{Deferred} fires when the
+        connection is lost, which stops the application.
+        """
+
+
+    def _unregisterProducer(self):
+        """
+        Unregister from the request if L{start} registered as its producer.
+
+        This must be called in the I/O thread.
+        """
+        if self._bufferSize is not None:
+            self.request.unregisterProducer()
+
+
     def run(self):
         """
         Call the WSGI application object, iterate it, and handle its output.
@@ -324,6 +474,7 @@ class _WSGIResponse:
         except:
             def wsgiError(started, type, value, traceback):
                 err(Failure(value, type, traceback), "WSGI application error")
+                self._unregisterProducer()
                 if started:
                     self.request.transport.loseConnection()
                 else:
@@ -335,6 +486,7 @@ class _WSGIResponse:
                 if not self._requestFinished:
                     if not started:
                         self._sendResponseHeaders()
+                    self._unregisterProducer()
                     self.request.finish()
             self.reactor.callFromThread(wsgiFinish, self.started)
         self.started = True
@@ -353,6 +505,8 @@ class WSGIResource:
         L{_WSGIResponse} to run the WSGI application object.
 
     @ivar _application: The WSGI application object.
+
+    @ivar _bufferSize: The C{bufferSize} passed to L{WSGIResource.__init__}.
     """
     implements(IResource)
 
@@ -360,10 +514,27 @@ class WSGIResource:
     # handle.
     isLeaf = True
 
-    def __init__(self, reactor, threadpool, application):
+    def __init__(self, reactor, threadpool, application, bufferSize=None):
+        """
+        @param bufferSize: If C{None}, each string the application writes is
+            passed to the request by its own call into the I/O thread, and the
+            application is never made to wait for the strings to be written.
+            Otherwise, strings written by the application while one of those
+            calls is pending are passed to the request together, and once
+            C{bufferSize} bytes are waiting to be passed to the request, the
+            application thread blocks until the I/O thread has taken them.
+            The response is also registered with the request as a streaming
+            producer, and the application thread blocks while the transport
+            has paused it.  This limits the memory used by applications which
+            produce output faster than the connection sends it, and reduces
+            the number of times the I/O thread has to be woken up for
+            streaming responses.
+        @type bufferSize: C{int} or C{NoneType}
+        """
         self._reactor = reactor
         self._threadpool = threadpool
         self._application = application
+        self._bufferSize = bufferSize
 
 
     def render(self, request):
@@ -377,7 +548,8 @@ class WSGIResource:
         will the status, headers, and the response body.
         """
         response = _WSGIResponse(
-            self._reactor, self._threadpool, self._application, request)
+            self._reactor, self._threadpool, self._application, request,
+            self._bufferSize)
         response.start()
         return NOT_DONE_YET
 
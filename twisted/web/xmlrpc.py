@@ -16,6 +16,7 @@ import urlparse
 # Sibling Imports
 from twisted.web import resource, server, http
 from twisted.internet import defer, protocol, reactor
+from twisted.internet.threads import deferToThreadPool
 from twisted.python import log, reflect, failure
 
 # These are deprecated, use the class level definitions
@@ -56,6 +57,65 @@ class NoSuchFunction(Fault):
     """
 
 
+
+class _Marshaller(xmlrpclib.Marshaller):
+    """
+    An XML-RPC marshaller which serializes arrays holding only integers, only
+    floats or only byte strings with a few bulk string operations, rather
+    than dispatching on the type of each element.
+    """
+
+    dispatch = xmlrpclib.Marshaller.dispatch.copy()
+
+    _homogeneous = {
+        int: ("<value><int>", "</int></value>\n", str),
+        float: ("<value><double>", "</double></value>\n", repr),
+        str: ("<value><string>", "</string></value>\n", xmlrpclib.escape),
+        }
+
+    def dump_array(self, value, write):
+        types = set(map(type, value))
+        if len(types) != 1:
+            return xmlrpclib.Marshaller.dump_array(self, value, write)
+        elementType = types.pop()
+        if elementType not in self._homogeneous:
+            return xmlrpclib.Marshaller.dump_array(self, value, write)
+        if elementType is int and (max(value) > xmlrpclib.MAXINT or
+                                   min(value) < xmlrpclib.MININT):
+            raise OverflowError("int exceeds XML-RPC limits")
+        start, end, convert = self._homogeneous[elementType]
+        write("<value><array><data>\n")
+        write(start)
+        write((end + start).join(map(convert, value)))
+        write(end)
+        write("</data></array></value>\n")
+    dispatch[tuple] = dump_array
+    dispatch[list] = dump_array
+
+
+
+def _dumpResponse(params, allowNone):
+    """
+    Serialize an XML-RPC method response.
+
+    This produces the same result as C{xmlrpclib.dumps(params,
+    methodresponse=True, allow_none=allowNone)}, using L{_Marshaller}.
+
+    @param params: A singleton C{tuple} holding the result of a method, or a
+        L{Fault}.
+
+    @param allowNone: Permit XML translating of Python constant None.
+    @type allowNone: C{bool}
+
+    @rtype: C{str}
+    """
+    return "".join([
+            "<?xml version='1.0'?>\n<methodResponse>\n",
+            _Marshaller("utf-8", allowNone).dumps(params),
+            "</methodResponse>\n"])
+
+
+
 class Handler:
     """
     Handle a XML-RPC request and store the state for a request in progress.
@@ -105,6 +165,17 @@ class XMLRPC(resource.Resource):
     @ivar useDateTime: Present C{datetime} values as C{datetime.datetime}
         objects?
     @type useDateTime: C{bool}
+
+    @ivar threadpool: If not C{None}, requests are parsed and responses are
+        serialized in this thread pool, so that large payloads do not block
+        the reactor.  The pool must be started and stopped by the
+        application.
+    @type threadpool: L{twisted.python.threadpool.ThreadPool}
+
+    @ivar maxRequestSize: If not C{None}, the size in bytes of the largest
+        request body which will be parsed.  Larger requests are refused with
+        a I{Request Entity Too Large} response.
+    @type maxRequestSize: C{int}
     """
 
     # Error codes for Twisted, if they conflict with yours then
@@ -116,11 +187,20 @@ class XMLRPC(resource.Resource):
     separator = '.'
     allowedMethods = ('POST',)
 
-    def __init__(self, allowNone=False, useDateTime=False):
+    threadpool = None
+    maxRequestSize = None
+    _reactor = reactor
+
+    def __init__(self, allowNone=False, useDateTime=False, threadpool=None,
+                 maxRequestSize=None):
         resource.Resource.__init__(self)
         self.subHandlers = {}
         self.allowNone = allowNone
         self.useDateTime = useDateTime
+        if threadpool is not None:
+            self.threadpool = threadpool
+        if maxRequestSize is not None:
+            self.maxRequestSize = maxRequestSize
 
 
     def __setattr__(self, name, value):
@@ -139,30 +219,64 @@ class XMLRPC(resource.Resource):
     def render_POST(self, request):
         request.content.seek(0, 0)
         request.setHeader("content-type", "text/xml")
+        if self.maxRequestSize is not None:
+            request.content.seek(0, 2)
+            size = request.content.tell()
+            request.content.seek(0, 0)
+            if size > self.maxRequestSize:
+                request.setResponseCode(http.REQUEST_ENTITY_TOO_LARGE)
+                request.setHeader("content-type", "text/plain")
+                return "Request body too large"
+
+        # Use this list to track whether the response has failed or not.
+        # This will be used later on to decide if the result of the
+        # Deferred should be written out and Request.finish called.
+        responseFailed = []
+        request.notifyFinish().addErrback(responseFailed.append)
+        d = self._marshal(xmlrpclib.loads, request.content.read(),
+                          use_datetime=self.useDateTime)
+        d.addCallbacks(
+            self._cbParsed, self._ebParsed,
+            callbackArgs=(request, responseFailed),
+            errbackArgs=(request, responseFailed))
+        d.addErrback(request.processingFailed)
+        return server.NOT_DONE_YET
+
+
+    def _marshal(self, f, *args, **kwargs):
+        """
+        Call C{f}, which parses or serializes XML-RPC data, in
+        L{threadpool} if there is one.
+
+        @return: A L{Deferred} which fires with the result of C{f}.  Without
+            a thread pool it has already fired.
+        """
+        if self.threadpool is None:
+            return defer.maybeDeferred(f, *args, **kwargs)
+        return deferToThreadPool(
+            self._reactor, self.threadpool, f, *args, **kwargs)
+
+
+    def _ebParsed(self, reason, request, responseFailed):
+        reason.trap(Exception)
+        f = Fault(self.FAILURE, "Can't deserialize input: %s" % (
+                reason.value,))
+        self._cbRender(f, request, responseFailed)
+
+
+    def _cbParsed(self, parsed, request, responseFailed):
+        args, functionPath = parsed
         try:
-            args, functionPath = xmlrpclib.loads(request.content.read(),
-                use_datetime=self.useDateTime)
-        except Exception, e:
-            f = Fault(self.FAILURE, "Can't deserialize input: %s" % (e,))
-            self._cbRender(f, request)
+            function = self.lookupProcedure(functionPath)
+        except Fault, f:
+            self._cbRender(f, request, responseFailed)
         else:
-            try:
-                function = self.lookupProcedure(functionPath)
-            except Fault, f:
-                self._cbRender(f, request)
+            if getattr(function, 'withRequest', False):
+                d = defer.maybeDeferred(function, request, *args)
             else:
-                # Use this list to track whether the response has failed or not.
-                # This will be used later on to decide if the result of the
-                # Deferred should be written out and Request.finish called.
-                responseFailed = []
-                request.notifyFinish().addErrback(responseFailed.append)
-                if getattr(function, 'withRequest', False):
-                    d = defer.maybeDeferred(function, request, *args)
-                else:
-                    d = defer.maybeDeferred(function, *args)
-                d.addErrback(self._ebRender)
-                d.addCallback(self._cbRender, request, responseFailed)
-        return server.NOT_DONE_YET
+                d = defer.maybeDeferred(function, *args)
+            d.addErrback(self._ebRender)
+            d.addCallback(self._cbRender, request, responseFailed)
 
 
     def _cbRender(self, result, request, responseFailed=None):
@@ -173,16 +287,34 @@ class XMLRPC(resource.Resource):
             result = result.result
         if not isinstance(result, Fault):
             result = (result,)
+        d = self._marshal(self._dumpResult, result)
+        d.addCallbacks(
+            self._cbSerialized, self._ebSerialized,
+            callbackArgs=(request, responseFailed),
+            errbackArgs=(request, responseFailed))
+
+
+    def _dumpResult(self, result):
+        """
+        Serialize the result of a method, or a L{Fault} describing why that
+        is not possible.  Arrays are serialized with L{_Marshaller}.
+        """
         try:
-            try:
-                content = xmlrpclib.dumps(
-                    result, methodresponse=True,
-                    allow_none=self.allowNone)
-            except Exception, e:
-                f = Fault(self.FAILURE, "Can't serialize output: %s" % (e,))
-                content = xmlrpclib.dumps(f, methodresponse=True,
-                                          allow_none=self.allowNone)
+            if (not isinstance(result, Fault) and
+                    isinstance(result[0], (list, tuple))):
+                return _dumpResponse(result, self.allowNone)
+            return xmlrpclib.dumps(
+                result, methodresponse=True, allow_none=self.allowNone)
+        except Exception, e:
+            f = Fault(self.FAILURE, "Can't serialize output: %s" % (e,))
+            return xmlrpclib.dumps(f, methodresponse=True,
+                                   allow_none=self.allowNone)
+
 
+    def _cbSerialized(self, content, request, responseFailed):
+        if responseFailed:
+            return
+        try:
             request.setHeader("content-length", str(len(content)))
             request.write(content)
         except:
@@ -190,6 +322,29 @@ class XMLRPC(resource.Resource):
         request.finish()
 
 
+    def _ebSerialized(self, reason, request, responseFailed):
+        """
+        Serializing the response failed outside of L{_dumpResult}, for
+        example because L{threadpool} could not run it.  Log the failure and
+        send a L{Fault} instead, or an I{Internal Server Error} response if
+        even that cannot be serialized.
+        """
+        log.err(reason, "Serializing XML-RPC response failed")
+        if responseFailed:
+            return
+        try:
+            content = xmlrpclib.dumps(
+                Fault(self.FAILURE, "Can't serialize output: %s" % (
+                        reason.value,)),
+                methodresponse=True)
+        except:
+            log.err(None, "Serializing XML-RPC fault failed")
+            request.setResponseCode(http.INTERNAL_SERVER_ERROR)
+            request.finish()
+        else:
+            self._cbSerialized(content, request, responseFailed)
+
+
     def _ebRender(self, failure):
         if isinstance(failure.value, Fault):
             return failure.value